@@ -32,7 +32,7 @@ from dataactcore.models.domainModels import (CGAC, FREC, SubTierAgency, States,
                                              Office, DUNS)
 from dataactcore.models.jobModels import (Job, Submission, Comment, SubmissionSubTierAffiliation,
                                           RevalidationThreshold, CertifyHistory, CertifiedFilesHistory, FileGeneration,
-                                          FileType, CertifiedComment)
+                                          FileType, CertifiedComment, JobPhase)
 from dataactcore.models.lookups import (
     FILE_TYPE_DICT, FILE_TYPE_DICT_LETTER, FILE_TYPE_DICT_LETTER_ID, PUBLISH_STATUS_DICT, JOB_TYPE_DICT,
     JOB_STATUS_DICT, JOB_STATUS_DICT_ID, PUBLISH_STATUS_DICT_ID, FILE_TYPE_DICT_LETTER_NAME)
@@ -1152,8 +1152,10 @@ def update_submission_comments(submission, comment_request, is_local):
 
     # Preparing for the comments file
     filename = 'submission_{}_comments.csv'.format(submission.submission_id)
-    local_file = "".join([CONFIG_BROKER['broker_files'], filename])
-    file_path = local_file if is_local else '{}/{}'.format(str(submission.submission_id), filename)
+    if is_local:
+        file_path = "".join([CONFIG_BROKER['broker_files'], filename])
+    else:
+        file_path = '{}/{}'.format(str(submission.submission_id), filename)
     headers = ['File', 'Comment']
 
     # Generate a file containing all the comments for a given submission
@@ -1161,8 +1163,8 @@ def update_submission_comments(submission, comment_request, is_local):
         join(FileType, Comment.file_type_id == FileType.file_type_id).\
         filter(Comment.submission_id == submission.submission_id)
 
-    # Generate the file locally, then place in S3
-    write_stream_query(sess, comment_query, local_file, file_path, is_local, header=headers)
+    # Generate the file, streaming it to S3 when not local
+    write_stream_query(sess, comment_query, file_path, is_local, header=headers)
 
     return JsonResponse.create(StatusCode.OK, {})
 
@@ -1215,7 +1217,8 @@ def create_fabs_published_file(sess, submission_id, new_route):
     # write file and stream to S3
     fabs_query = published_fabs_query({"sess": sess, "submission_id": submission_id})
     headers = [key for key in fileD2.mapping]
-    write_stream_query(sess, fabs_query, local_filename, upload_name, g.is_local, header=headers, is_certified=True)
+    write_stream_query(sess, fabs_query, local_filename if g.is_local else upload_name, g.is_local, header=headers,
+                       is_certified=True)
     return local_filename if g.is_local else upload_name
 
 
@@ -1298,9 +1301,9 @@ def get_status(submission, file_type=''):
 
         Returns:
             A flask response object to be sent back to client, holds a JSON where each file type (or the requested type)
-            is a key to an object that holds status, has_errors, has_warnings, and message. If the user requests an
-            invalid file type or the type requested is not valid for the submission type, returns a JSON response with
-            a client error.
+            is a key to an object that holds status, has_errors, has_warnings, message, and the progress of its
+            validation (current_phase, rows_processed, and elapsed_time). If the user requests an invalid file type or
+            the type requested is not valid for the submission type, returns a JSON response with a client error.
     """
     sess = GlobalDB.db().session
     file_type = file_type.lower()
@@ -1317,7 +1320,8 @@ def get_status(submission, file_type=''):
 
     # Set up a dictionary to store the jobs we want to look at and limit it to only the file types we care about. Also
     # setting up the response dict here because we need the same keys.
-    response_template = {'status': 'ready', 'has_errors': False, 'has_warnings': False, 'message': ''}
+    response_template = {'status': 'ready', 'has_errors': False, 'has_warnings': False, 'message': '',
+                         'current_phase': '', 'rows_processed': 0, 'elapsed_time': 0}
     job_dict = {}
     response_dict = {}
 
@@ -1339,6 +1343,13 @@ def get_status(submission, file_type=''):
     # We don't need to filter on file type, that will be handled by the dictionaries
     all_jobs = sess.query(Job).filter_by(submission_id=submission.submission_id)
 
+    # The phases each validation job has been through, in order
+    job_phases = {}
+    phase_query = sess.query(JobPhase).join(Job, JobPhase.job_id == Job.job_id).\
+        filter(Job.submission_id == submission.submission_id).order_by(JobPhase.start_time, JobPhase.job_phase_id)
+    for phase in phase_query:
+        job_phases.setdefault(phase.job_id, []).append(phase)
+
     for job in all_jobs:
         dict_key = 'cross'
         if job.file_type:
@@ -1352,15 +1363,45 @@ def get_status(submission, file_type=''):
                 'job_type': job.job_type_id,
                 'error_message': job.error_message,
                 'errors': job.number_of_errors,
-                'warnings': job.number_of_warnings
+                'warnings': job.number_of_warnings,
+                'progress': get_phase_progress(job_phases.get(job.job_id, []),
+                                               job.job_status_id == JOB_STATUS_DICT['running'], job.updated_at)
             })
 
     for job_file_type, job_data in job_dict.items():
         response_dict[job_file_type] = process_job_status(job_data, response_dict[job_file_type])
+        # Only the validation job is split into phases
+        for job in job_data:
+            if job['job_type'] != JOB_TYPE_DICT['file_upload']:
+                response_dict[job_file_type].update(job['progress'])
 
     return JsonResponse.create(StatusCode.OK, response_dict)
 
 
+def get_phase_progress(phases, running, last_updated):
+    """ Work out how far a validation job has got from the phases it has been through
+
+        Args:
+            phases: list of the job's JobPhases, in the order they started
+            running: whether the job is running
+            last_updated: when the job was last updated, taken as the end of a job that stopped without finishing its
+                phase
+
+        Returns:
+            A dict of the phase the job is in (empty when it isn't running), the number of rows that phase has worked
+            through, and the seconds the job has been running for, or ran for once it's done
+    """
+    if not phases:
+        return {'current_phase': '', 'rows_processed': 0, 'elapsed_time': 0}
+    last_phase = phases[-1]
+    end_time = last_phase.end_time or (datetime.utcnow() if running else last_updated or last_phase.start_time)
+    return {
+        'current_phase': last_phase.phase if running and last_phase.end_time is None else '',
+        'rows_processed': last_phase.rows_processed,
+        'elapsed_time': round(max((end_time - phases[0].start_time).total_seconds(), 0), 1)
+    }
+
+
 def process_job_status(jobs, response_content):
     """ Process the status of a job type provided and update the response content provided with the new information.
 
@@ -8,6 +8,7 @@ from sqlalchemy.sql.expression import case
 from dataactcore.interfaces.db import GlobalDB
 from dataactcore.interfaces.function_bag import (sum_number_of_errors_for_job_list, get_last_validated_date,
                                                  get_fabs_meta, get_error_type, get_error_metrics_by_job_id)
+from dataactcore.interfaces.staging_partitions import drop_submission_partitions, release_submission_partitions
 
 from dataactcore.models.lookups import (JOB_STATUS_DICT, PUBLISH_STATUS_DICT, JOB_TYPE_DICT, RULE_SEVERITY_DICT,
                                         FILE_TYPE_DICT)
@@ -370,6 +371,8 @@ def delete_all_submission_data(submission):
         "submission_id": submission.submission_id
     })
 
+    # Staging partitions aren't tied to the submission by a foreign key, so they have to be dropped directly
+    drop_submission_partitions(sess, submission.submission_id)
     sess.query(SubmissionSubTierAffiliation).\
         filter(SubmissionSubTierAffiliation.submission_id == submission.submission_id).\
         delete(synchronize_session=False)
@@ -596,6 +599,8 @@ def move_certified_data(sess, submission_id):
         column_list.remove('updated_at')
         if 'display_tas' in column_list:
             column_list.remove('display_tas')
+        if 'previous_job_id' in column_list:
+            column_list.remove('previous_job_id')
         column_list.remove(table_type + '_id')
 
         col_string = ", ".join(column_list)
@@ -616,6 +621,17 @@ def move_certified_data(sess, submission_id):
         # Move the certified data
         sess.execute(insert_string)
 
+    # Flex fields stored as one document per row are expanded back out to one certified row per cell
+    sess.execute("""
+        INSERT INTO certified_flex_field (created_at, updated_at, submission_id, job_id, row_number, header, cell,
+                                          file_type_id)
+        SELECT NOW() AS created_at, NOW() AS updated_at, submission_id, job_id, row_number, cells.pair ->> 0,
+            cells.pair ->> 1, file_type_id
+        FROM flex_field_row
+        CROSS JOIN LATERAL JSONB_ARRAY_ELEMENTS(flex_field_row.cells) AS cells (pair)
+        WHERE submission_id={}
+    """.format(submission_id))
+
 
 def certify_dabs_submission(submission, file_manager):
     """ Certify a DABS submission
@@ -700,4 +716,9 @@ def certify_dabs_submission(submission, file_manager):
         submission.publish_status_id = PUBLISH_STATUS_DICT['published']
         sess.commit()
 
+        # The staging rows are in the certified tables now. Dropping the staging partitions locks the staging tables,
+        # so it's done in a transaction of its own
+        release_submission_partitions(sess, submission.submission_id)
+        sess.commit()
+
     return response
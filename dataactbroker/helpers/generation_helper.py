@@ -7,10 +7,10 @@ from flask import g
 from sqlalchemy import or_
 
 from dataactcore.aws.s3Handler import S3Handler
-from dataactcore.aws.sqsHandler import sqs_queue
 from dataactcore.config import CONFIG_BROKER
 from dataactcore.interfaces.db import GlobalDB
 from dataactcore.interfaces.function_bag import mark_job_status
+from dataactcore.interfaces.job_lanes import send_job_message
 from dataactcore.models import lookups
 from dataactcore.models.jobModels import FileGeneration, FPDSUpdate, Job, Submission
 from dataactcore.utils import fileA
@@ -82,9 +82,8 @@ def start_d_generation(job, start_date, end_date, agency_type, agency_code=None,
                          'submission_id': job.submission_id, 'file_generation_id': file_generation.file_generation_id})
 
             # Add file_generation_id to the SQS job queue
-            queue = sqs_queue()
             message_attr = {"validation_type": {"DataType": "String", "StringValue": "generation"}}
-            queue.send_message(MessageBody=str(file_generation.file_generation_id), MessageAttributes=message_attr)
+            send_job_message(file_generation.file_generation_id, message_attr)
         except Exception as e:
             logger.error(traceback.format_exc())
 
@@ -109,8 +108,7 @@ def start_e_f_generation(job):
     logger.info(log_data)
 
     # Add job_id to the SQS job queue
-    queue = sqs_queue()
-    msg_response = queue.send_message(MessageBody=str(job.job_id), MessageAttributes={})
+    msg_response = send_job_message(job.job_id)
 
     log_data['message'] = 'SQS message response: {}'.format(msg_response)
     logger.debug(log_data)
@@ -146,8 +144,7 @@ def start_a_generation(job, start_date, end_date, agency_code):
     message_attr = {'agency_code': {'DataType': 'String', 'StringValue': agency_code}}
 
     # Add job_id to the SQS job queue
-    queue = sqs_queue()
-    msg_response = queue.send_message(MessageBody=str(job.job_id), MessageAttributes=message_attr)
+    msg_response = send_job_message(job.job_id, message_attr)
 
     log_data['message'] = 'SQS message response: {}'.format(msg_response)
     logger.debug(log_data)
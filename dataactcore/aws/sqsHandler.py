@@ -12,30 +12,40 @@ from dataactcore.interfaces.db import GlobalDB
 class SQSMockQueue:
     UNITTEST_MOCK_DEAD_LETTER_QUEUE = "unittest-mock-dead-letter-queue"
 
-    def __init__(self, max_receive_count=1):
+    def __init__(self, max_receive_count=1, queue_name=CONFIG_BROKER['sqs_queue_name']):
         self.max_receive_count = max_receive_count
+        # Messages of each queue are kept apart in the SQS table by the name of their queue
+        self.queue_name = queue_name
 
-    @staticmethod
-    def send_message(MessageBody, MessageAttributes=None):  # noqa
+    def send_message(self, MessageBody, MessageAttributes=None):  # noqa
         sess = GlobalDB.db().session
-        sess.add(SQS(message=int(MessageBody), attributes=str(MessageAttributes) if MessageAttributes else None))
+        sess.add(SQS(message=int(MessageBody), attributes=str(MessageAttributes) if MessageAttributes else None,
+                     queue_name=self.queue_name))
         sess.commit()
         return {"ResponseMetadata": {"HTTPStatusCode": 200}}
 
-    @staticmethod
-    def receive_messages(WaitTimeSeconds, AttributeNames=None, MessageAttributeNames=None,   # noqa
+    def send_messages(self, Entries):  # noqa
+        sess = GlobalDB.db().session
+        sess.add_all([SQS(message=int(entry['MessageBody']),
+                          attributes=str(entry['MessageAttributes']) if entry.get('MessageAttributes') else None,
+                          queue_name=self.queue_name) for entry in Entries])
+        sess.commit()
+        return {"Successful": [{"Id": entry['Id']} for entry in Entries], "Failed": [],
+                "ResponseMetadata": {"HTTPStatusCode": 200}}
+
+    def receive_messages(self, WaitTimeSeconds, AttributeNames=None, MessageAttributeNames=None,   # noqa
                          VisibilityTimeout=30, MaxNumberOfMessages=1):  # noqa
         sess = GlobalDB.db().session
         messages = []
         # Limit returned messages by MaxNumberOfMessages: start=0, stop=MaxNumberOfMessages
-        for sqs in islice(sess.query(SQS).order_by(SQS.sqs_id), 0, MaxNumberOfMessages):
+        query = sess.query(SQS).filter(SQS.queue_name == self.queue_name).order_by(SQS.sqs_id)
+        for sqs in islice(query, 0, MaxNumberOfMessages):
             messages.append(SQSMockMessage(sqs))
         return messages
 
-    @staticmethod
-    def purge():
+    def purge(self):
         sess = GlobalDB.db().session
-        sess.query(SQS).delete()
+        sess.query(SQS).filter(SQS.queue_name == self.queue_name).delete(synchronize_session=False)
         sess.commit()
 
     @property
@@ -79,6 +89,10 @@ class SQSMockMessage:
         # Do nothing
         pass
 
+    @property
+    def message_id(self):
+        return self.sqs.sqs_id
+
     @property
     def attributes(self):
         # This is where more SQS message `attributes` can be mocked, e.g. ApproximateReceiveCount and others
@@ -89,7 +103,7 @@ def sqs_queue(region_name=CONFIG_BROKER['aws_region'], queue_name=CONFIG_BROKER[
     if CONFIG_BROKER['local']:
         if queue_name == SQSMockQueue.UNITTEST_MOCK_DEAD_LETTER_QUEUE:
             return SQSMockDeadLetterQueue()
-        return SQSMockQueue()
+        return SQSMockQueue(queue_name=queue_name)
     else:
         # stuff that's in get_queue
         sqs = boto3.resource('sqs', region_name)
@@ -1,24 +1,26 @@
 import logging
+from datetime import datetime
 from operator import attrgetter
 import time
 import uuid
 
 from sqlalchemy import func, or_
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import aliased, joinedload
 from sqlalchemy.orm.exc import NoResultFound
 
 from dataactcore.aws.s3Handler import S3Handler
 from dataactcore.config import CONFIG_BROKER
 from dataactcore.models.errorModels import ErrorMetadata, File
-from dataactcore.models.jobModels import Job, Submission, JobDependency, CertifyHistory, CertifiedFilesHistory
+from dataactcore.models.jobModels import (Job, Submission, JobDependency, JobPhase, CertifyHistory,
+                                          CertifiedFilesHistory)
 from dataactcore.models.stagingModels import DetachedAwardFinancialAssistance
 from dataactcore.models.userModel import User, EmailTemplateType, EmailTemplate
 from dataactcore.models.validationModels import RuleSeverity
 from dataactcore.models.lookups import (FILE_TYPE_DICT, FILE_STATUS_DICT, JOB_TYPE_DICT,
                                         JOB_STATUS_DICT, FILE_TYPE_DICT_ID, PUBLISH_STATUS_DICT)
 from dataactcore.interfaces.db import GlobalDB
+from dataactcore.interfaces.job_lanes import estimate_job_rows, send_job_messages
 from dataactvalidator.validation_handlers.validationError import ValidationError
-from dataactcore.aws.sqsHandler import sqs_queue
 
 
 # This is a holding place for functions from a previous iteration of
@@ -290,6 +292,59 @@ def mark_job_status(job_id, status_name, skip_check=False):
         check_job_dependencies(job_id)
 
 
+def start_job_phase(job_id, phase, rows_processed=0):
+    """ Move a job on to its next phase, finishing the one it was in
+
+        Args:
+            job_id: ID of the job
+            phase: name of the phase the job is starting
+            rows_processed: number of rows the phase has already worked through
+    """
+    sess = GlobalDB.db().session
+    now = datetime.utcnow()
+    sess.query(JobPhase).filter(JobPhase.job_id == job_id, JobPhase.end_time.is_(None)).\
+        update({'end_time': now}, synchronize_session=False)
+    sess.add(JobPhase(job_id=job_id, phase=phase, start_time=now, rows_processed=rows_processed))
+    sess.commit()
+
+
+def add_job_phase_rows(job_id, rows):
+    """ Add to the number of rows the phase a job is in has worked through. The count is increased in the database, so
+        several processes working on parts of the same job can each add the rows they've done.
+
+        Args:
+            job_id: ID of the job
+            rows: number of rows worked through since the last time they were added
+    """
+    sess = GlobalDB.db().session
+    sess.query(JobPhase).filter(JobPhase.job_id == job_id, JobPhase.end_time.is_(None)).\
+        update({'rows_processed': JobPhase.rows_processed + rows}, synchronize_session=False)
+    sess.commit()
+
+
+def finish_job_phase(job_id):
+    """ Finish the phase a job is in, once the job is done
+
+        Args:
+            job_id: ID of the job
+    """
+    sess = GlobalDB.db().session
+    sess.query(JobPhase).filter(JobPhase.job_id == job_id, JobPhase.end_time.is_(None)).\
+        update({'end_time': datetime.utcnow()}, synchronize_session=False)
+    sess.commit()
+
+
+def clear_job_phases(job_id):
+    """ Remove the phases of a job's last run before it's run again
+
+        Args:
+            job_id: ID of the job
+    """
+    sess = GlobalDB.db().session
+    sess.query(JobPhase).filter(JobPhase.job_id == job_id).delete(synchronize_session=False)
+    sess.commit()
+
+
 def check_job_dependencies(job_id):
     """ For specified job, check which of its dependencies are ready to be started and add them to the queue
 
@@ -313,35 +368,47 @@ def check_job_dependencies(job_id):
         raise ValueError('Current job not finished, unable to check dependencies')
 
     # get the jobs that are dependent on job_id being finished
-    dependencies = sess.query(JobDependency).filter_by(prerequisite_id=job_id).all()
-    for dependency in dependencies:
-        dep_job_id = dependency.job_id
-        if dependency.dependent_job.job_status_id != JOB_STATUS_DICT['waiting']:
+    dependent_jobs = sess.query(Job).join(JobDependency, JobDependency.job_id == Job.job_id).\
+        filter(JobDependency.prerequisite_id == job_id).all()
+    for dependent_job in dependent_jobs:
+        if dependent_job.job_status_id != JOB_STATUS_DICT['waiting']:
             log_data['message_type'] = 'CoreError'
-            log_data['message'] = "{} (dependency of {}) is not in a 'waiting' state".format(dep_job_id, job_id)
+            log_data['message'] = "{} (dependency of {}) is not in a 'waiting' state".format(dependent_job.job_id,
+                                                                                             job_id)
             logger.error(log_data)
-        else:
-            # find the number of this job's prerequisites that do not have a status of 'finished' or have errors.
-            unfinished_prerequisites = sess.query(JobDependency).\
-                join(Job, JobDependency.prerequisite_job).\
-                filter(or_(Job.job_status_id != JOB_STATUS_DICT['finished'], Job.number_of_errors > 0),
-                       JobDependency.job_id == dep_job_id).\
-                count()
-            if unfinished_prerequisites == 0:
-                # this job has no unfinished prerequisite jobs, so it is eligible to be set to a 'ready' status and
-                # added to the queue
-                mark_job_status(dep_job_id, 'ready')
-
-                # Only want to send validation jobs to the queue, other job types should be forwarded
-                if dependency.dependent_job.job_type_name in ['csv_record_validation', 'validation']:
-                    # add dep_job_id to the SQS job queue
-                    log_data['message_type'] = 'CoreInfo'
-                    log_data['message'] = 'Sending job {} to job manager in sqs'.format(dep_job_id)
-                    logger.info(log_data)
-                    queue = sqs_queue()
-                    response = queue.send_message(MessageBody=str(dep_job_id))
-                    log_data['message'] = 'Send message response: {}'.format(response)
-                    logger.info(log_data)
+
+    # the waiting jobs none of whose prerequisites are unfinished or have errors are eligible to be set to a 'ready'
+    # status and added to the queue, all found in one query
+    prerequisite_dependency = aliased(JobDependency)
+    prerequisite_job = aliased(Job)
+    unfinished_prerequisites = sess.query(prerequisite_dependency).\
+        join(prerequisite_job, prerequisite_dependency.prerequisite_id == prerequisite_job.job_id).\
+        filter(prerequisite_dependency.job_id == Job.job_id,
+               or_(prerequisite_job.job_status_id != JOB_STATUS_DICT['finished'],
+                   prerequisite_job.number_of_errors > 0))
+    ready_jobs = sess.query(Job).join(JobDependency, JobDependency.job_id == Job.job_id).\
+        filter(JobDependency.prerequisite_id == job_id,
+               Job.job_status_id == JOB_STATUS_DICT['waiting'],
+               ~unfinished_prerequisites.exists()).all()
+    if not ready_jobs:
+        return
+
+    # Only want to send validation jobs to the queue, other job types should be forwarded. Their sizes are estimated
+    # before the jobs are marked ready, while they're still loaded
+    queued_jobs = [(ready_job.job_id, estimate_job_rows(ready_job)) for ready_job in ready_jobs
+                   if ready_job.job_type_name in ['csv_record_validation', 'validation']]
+    sess.query(Job).filter(Job.job_id.in_([ready_job.job_id for ready_job in ready_jobs])).\
+        update({'job_status_id': JOB_STATUS_DICT['ready']}, synchronize_session=False)
+    sess.commit()
+
+    if queued_jobs:
+        # add the ready jobs to the SQS job queue
+        log_data['message_type'] = 'CoreInfo'
+        log_data['message'] = 'Sending jobs {} to job manager in sqs'.format([job_id for job_id, _ in queued_jobs])
+        logger.info(log_data)
+        responses = send_job_messages(queued_jobs)
+        log_data['message'] = 'Send messages responses: {}'.format(responses)
+        logger.info(log_data)
 
 
 def create_jobs(upload_files, submission, existing_submission=False):
@@ -364,14 +431,30 @@ def create_jobs(upload_files, submission, existing_submission=False):
     # to ensure that jobs dependent on the awards jobs being present
     # are processed last.
     jobs_required = []
-    upload_dict = {}
+    upload_jobs = {}
     sorted_uploads = sorted(upload_files, key=attrgetter('file_letter'))
 
+    # the jobs of the submission by file and job type, loaded at once for an existing submission and filled in with
+    # the new jobs as they're created otherwise
+    submission_jobs = {}
+    if existing_submission:
+        file_type_ids = [FILE_TYPE_DICT[upload_file.file_type] for upload_file in sorted_uploads]
+        existing_jobs = sess.query(Job).filter(Job.submission_id == submission_id,
+                                               Job.file_type_id.in_(file_type_ids)).all()
+        submission_jobs = {(job.file_type_id, job.job_type_id): job for job in existing_jobs}
+
     for upload_file in sorted_uploads:
-        validation_job_id, upload_job_id = add_jobs_for_uploaded_file(upload_file, submission_id, existing_submission)
-        if validation_job_id:
-            jobs_required.append(validation_job_id)
-        upload_dict[upload_file.file_type] = upload_job_id
+        validation_job, upload_job = add_jobs_for_uploaded_file(upload_file, submission_id, existing_submission,
+                                                                submission_jobs)
+        if validation_job:
+            jobs_required.append(validation_job)
+        upload_jobs[upload_file.file_type] = upload_job
+
+    if existing_submission:
+        # delete file error information that might exist from a previous run of the validation jobs
+        rerun_job_ids = [job.job_id for job in jobs_required]
+        if rerun_job_ids:
+            sess.query(File).filter(File.job_id.in_(rerun_job_ids)).delete(synchronize_session='fetch')
 
     # once single-file upload/validation jobs are created, create the cross-file
     # validation job and dependencies
@@ -393,44 +476,54 @@ def create_jobs(upload_files, submission, existing_submission=False):
             job_type_id=JOB_TYPE_DICT["validation"],
             submission_id=submission_id)
         sess.add(validation_job)
-        sess.flush()
         # create dependencies for validation jobs
-        for job_id in jobs_required:
-            val_dependency = JobDependency(job_id=validation_job.job_id, prerequisite_id=job_id)
-            sess.add(val_dependency)
+        sess.add_all([JobDependency(dependent_job=validation_job, prerequisite_job=job) for job in jobs_required])
 
+    # the new jobs and their dependencies are all inserted in one flush
+    sess.flush()
+    upload_dict = {file_type: upload_job.job_id for file_type, upload_job in upload_jobs.items()}
     sess.commit()
     upload_dict["submission_id"] = submission_id
     return upload_dict
 
 
-def add_jobs_for_uploaded_file(upload_file, submission_id, existing_submission):
-    """ Add upload and validation jobs for a single filetype
+def add_jobs_for_uploaded_file(upload_file, submission_id, existing_submission, submission_jobs=None):
+    """ Add upload and validation jobs for a single filetype. The jobs are added to the session without being flushed,
+        so the jobs of every file of a submission can be inserted together.
 
     Arguments:
         upload_file: UploadFile named tuple
         submission_id: submission ID to attach to jobs
         existing_submission: true if we should update existing jobs rather than creating new ones
+        submission_jobs: the jobs of the submission by file type and job type ID. Existing jobs are looked up in it
+            before they're queried and new jobs are added to it.
 
     Returns:
-        the validation job id for this file type (if any)
-        the upload job id for this file type
+        the validation job for this file type (if any)
+        the upload job for this file type
     """
     sess = GlobalDB.db().session
+    if submission_jobs is None:
+        submission_jobs = {}
+
+    def submission_job(file_type, job_type, required=True):
+        """ Find a job of the submission for a file type, querying for it if it isn't known yet """
+        key = (FILE_TYPE_DICT[file_type], JOB_TYPE_DICT[job_type])
+        if key not in submission_jobs:
+            query = sess.query(Job).filter(Job.submission_id == submission_id, Job.file_type_id == key[0],
+                                           Job.job_type_id == key[1])
+            submission_jobs[key] = query.one() if required else query.one_or_none()
+        return submission_jobs[key]
 
     file_type_id = FILE_TYPE_DICT[upload_file.file_type]
-    validation_job_id = None
+    validation_job = None
 
     # Create a file upload job or, for an existing submission, modify the
     # existing upload job.
 
     if existing_submission:
         # mark existing upload job as running
-        upload_job = sess.query(Job).filter_by(
-            submission_id=submission_id,
-            file_type_id=file_type_id,
-            job_type_id=JOB_TYPE_DICT['file_upload']
-        ).one()
+        upload_job = submission_job(upload_file.file_type, 'file_upload')
         # mark as running and set new file name and path
         upload_job.job_status_id = JOB_STATUS_DICT['running']
         upload_job.original_filename = upload_file.file_name
@@ -455,38 +548,31 @@ def add_jobs_for_uploaded_file(upload_file, submission_id, existing_submission):
             job_type_id=JOB_TYPE_DICT['file_upload'],
             submission_id=submission_id)
         sess.add(upload_job)
-        sess.flush()
+        submission_jobs[(file_type_id, JOB_TYPE_DICT['file_upload'])] = upload_job
 
     if existing_submission:
         # if the file's validation job is attached to an existing submission,
-        # reset its status and delete any validation artifacts (e.g., error metadata) that
-        # might exist from a previous run.
-        val_job = sess.query(Job).filter_by(
-            submission_id=submission_id,
-            file_type_id=file_type_id,
-            job_type_id=JOB_TYPE_DICT['csv_record_validation']
-        ).one()
+        # reset its status. Any validation artifacts (e.g., error metadata) that
+        # might exist from a previous run are deleted by create_jobs.
+        val_job = submission_job(upload_file.file_type, 'csv_record_validation')
         val_job.job_status_id = JOB_STATUS_DICT['waiting']
         val_job.original_filename = upload_file.file_name
         val_job.filename = upload_file.upload_name
         # reset file size and number of rows to be set during validation of new file
         val_job.file_size = None
+        if val_job.number_of_rows is not None:
+            val_job.previous_number_of_rows = val_job.number_of_rows
         val_job.number_of_rows = None
-        # delete error metadata this might exist from a previous run of this validation job
-        sess.query(ErrorMetadata).\
-            filter(ErrorMetadata.job_id == val_job.job_id).\
-            delete(synchronize_session='fetch')
-        # delete file error information that might exist from a previous run of this validation job
-        sess.query(File).filter(File.job_id == val_job.job_id).delete(synchronize_session='fetch')
+        # set aside error metadata that might exist from a previous run of this validation job. The validator puts it
+        # back if the new file is the same as the one that was validated, otherwise it's deleted
+        sess.query(ErrorMetadata).filter(ErrorMetadata.job_id == val_job.job_id).\
+            update({'job_id': None, 'previous_job_id': val_job.job_id}, synchronize_session=False)
+        validation_job = val_job
 
     else:
         # create a new record validation job and add dependencies if necessary
         if upload_file.file_type == "executive_compensation":
-            d1_val_job = sess.query(Job).\
-                filter(Job.submission_id == submission_id,
-                       Job.file_type_id == FILE_TYPE_DICT['award_procurement'],
-                       Job.job_type_id == JOB_TYPE_DICT['csv_record_validation']).\
-                one_or_none()
+            d1_val_job = submission_job('award_procurement', 'csv_record_validation', required=False)
             if d1_val_job is None:
                 logger.error({
                     'message': "Cannot create E job without a D1 job",
@@ -496,16 +582,12 @@ def add_jobs_for_uploaded_file(upload_file, submission_id, existing_submission):
                 })
                 raise Exception("Cannot create E job without a D1 job")
             # Add dependency on D1 validation job
-            d1_dependency = JobDependency(job_id=upload_job.job_id, prerequisite_id=d1_val_job.job_id)
+            d1_dependency = JobDependency(dependent_job=upload_job, prerequisite_job=d1_val_job)
             sess.add(d1_dependency)
 
         elif upload_file.file_type == "sub_award":
             # todo: check for C validation job
-            c_val_job = sess.query(Job).\
-                filter(Job.submission_id == submission_id,
-                       Job.file_type_id == FILE_TYPE_DICT['award_financial'],
-                       Job.job_type_id == JOB_TYPE_DICT['csv_record_validation']).\
-                one_or_none()
+            c_val_job = submission_job('award_financial', 'csv_record_validation', required=False)
             if c_val_job is None:
                 logger.error({
                     'message': "Cannot create F job without a C job",
@@ -515,7 +597,7 @@ def add_jobs_for_uploaded_file(upload_file, submission_id, existing_submission):
                 })
                 raise Exception("Cannot create F job without a C job")
             # add dependency on C validation job
-            c_dependency = JobDependency(job_id=upload_job.job_id, prerequisite_id=c_val_job.job_id)
+            c_dependency = JobDependency(dependent_job=upload_job, prerequisite_job=c_val_job)
             sess.add(c_dependency)
 
         else:
@@ -528,15 +610,13 @@ def add_jobs_for_uploaded_file(upload_file, submission_id, existing_submission):
                 job_type_id=JOB_TYPE_DICT['csv_record_validation'],
                 submission_id=submission_id)
             sess.add(val_job)
-            sess.flush()
+            submission_jobs[(file_type_id, JOB_TYPE_DICT['csv_record_validation'])] = val_job
             # add dependency between file upload job and file validation job
-            upload_dependency = JobDependency(job_id=val_job.job_id, prerequisite_id=upload_job.job_id)
+            upload_dependency = JobDependency(dependent_job=val_job, prerequisite_job=upload_job)
             sess.add(upload_dependency)
-            validation_job_id = val_job.job_id
-
-    sess.commit()
+            validation_job = val_job
 
-    return validation_job_id, upload_job.job_id
+    return validation_job, upload_job
 
 
 def get_lastest_certified_date(submission, is_fabs=False):
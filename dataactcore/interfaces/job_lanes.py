@@ -0,0 +1,145 @@
+""" Routing the jobs sent to the validator into priority lanes by their estimated size.
+
+Every job sent to the validator is tagged with the number of rows it's estimated to work through. When a small job
+queue is configured, jobs estimated at no more than small_job_max_rows rows (e.g. most FABS submissions) are sent to it
+rather than the main queue. The validator works that queue ahead of the main one with worker processes of its own, so a
+small submission isn't held up behind a large D1 generation or cross-file validation. Jobs that can't be estimated
+ahead of time, such as file generations, are sent to the main queue.
+"""
+import logging
+import os
+
+from dataactcore.aws.s3Handler import S3Handler
+from dataactcore.aws.sqsHandler import sqs_queue
+from dataactcore.config import CONFIG_BROKER
+from dataactcore.interfaces.db import GlobalDB
+from dataactcore.models.jobModels import Job
+from dataactcore.models.lookups import JOB_STATUS_DICT, JOB_TYPE_DICT
+
+logger = logging.getLogger(__name__)
+
+# Queue of the small job lane. Every job is sent to the main queue when it isn't set
+SMALL_JOB_QUEUE_NAME = CONFIG_BROKER.get('sqs_small_job_queue_name')
+# Most rows a job can be estimated to have and still be sent to the small job lane
+SMALL_JOB_MAX_ROWS = CONFIG_BROKER.get('small_job_max_rows') or 50000
+# Rough size in bytes of a row of an uploaded file, used to estimate its rows before it's been read
+ESTIMATED_ROW_BYTES = 300
+# Most messages SQS sends in one batch
+SQS_BATCH_SIZE = 10
+
+
+def uploaded_file_size(filename):
+    """ Get the size of an uploaded file
+
+        Args:
+            filename: the name of the file in the submission bucket, or its path when running locally
+
+        Returns:
+            the size of the file in bytes, or None if it can't be found
+    """
+    if not filename:
+        return None
+    if CONFIG_BROKER['use_aws']:
+        return S3Handler.get_file_size(filename) or None
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return None
+
+
+def estimate_job_rows(job):
+    """ Estimate how many rows a job works through. A file's validation is estimated from its number of rows if it's
+        finished validating the file it has now, or else from the size of that file. A cross-file validation is the
+        total of the file validations of its submission.
+
+        Args:
+            job: the Job to estimate
+
+        Returns:
+            the estimated number of rows, or None if the job can't be estimated ahead of time
+    """
+    if job.job_type_id == JOB_TYPE_DICT['csv_record_validation']:
+        # Once a new file is uploaded, the job isn't finished until that file is validated, so until then its number of
+        # rows may still be that of the file it replaced
+        if job.job_status_id == JOB_STATUS_DICT['finished'] and job.number_of_rows is not None:
+            return job.number_of_rows
+        file_size = uploaded_file_size(job.filename) or job.file_size
+        return file_size // ESTIMATED_ROW_BYTES + 1 if file_size else None
+    if job.job_type_id == JOB_TYPE_DICT['validation']:
+        sess = GlobalDB.db().session
+        file_jobs = sess.query(Job).filter(Job.submission_id == job.submission_id,
+                                           Job.job_type_id == JOB_TYPE_DICT['csv_record_validation']).all()
+        estimates = [estimate_job_rows(file_job) for file_job in file_jobs]
+        if not estimates or None in estimates:
+            return None
+        return sum(estimates)
+    return None
+
+
+def job_queue_name(estimated_rows):
+    """ Pick the queue of the lane a job goes in
+
+        Args:
+            estimated_rows: the number of rows the job is estimated to work through, or None if it couldn't be estimated
+
+        Returns:
+            the name of the queue to send the job to
+    """
+    if SMALL_JOB_QUEUE_NAME and estimated_rows is not None and estimated_rows <= SMALL_JOB_MAX_ROWS:
+        return SMALL_JOB_QUEUE_NAME
+    return CONFIG_BROKER['sqs_queue_name']
+
+
+def send_job_message(message_body, message_attributes=None, estimated_rows=None):
+    """ Send a message for the validator to the queue of the lane its job goes in, tagged with its estimated rows
+
+        Args:
+            message_body: the ID of the job or file generation
+            message_attributes: the other attributes of the message
+            estimated_rows: the number of rows the job is estimated to work through, or None if it couldn't be estimated
+
+        Returns:
+            the response of the queue
+    """
+    message_attributes = dict(message_attributes or {})
+    if estimated_rows is not None:
+        message_attributes['estimated_rows'] = {'DataType': 'Number', 'StringValue': str(estimated_rows)}
+    queue_name = job_queue_name(estimated_rows)
+    message = 'Sending message {} with {} estimated rows to queue {}'.format(message_body, estimated_rows, queue_name)
+    logger.debug({'message': message, 'message_type': 'CoreDebug'})
+    queue = sqs_queue(queue_name=queue_name)
+    return queue.send_message(MessageBody=str(message_body), MessageAttributes=message_attributes)
+
+
+def send_job_messages(jobs):
+    """ Send the messages of several jobs for the validator, batched by the queue of the lane each goes in. SQS takes
+        up to 10 messages in each batch.
+
+        Args:
+            jobs: list of tuples of the ID of each job and the number of rows it's estimated to work through, or None
+                if it couldn't be estimated
+
+        Returns:
+            the responses of the queues, one for each batch sent
+    """
+    entries_by_queue = {}
+    for job_id, estimated_rows in jobs:
+        entry = {'Id': str(job_id), 'MessageBody': str(job_id), 'MessageAttributes': {}}
+        if estimated_rows is not None:
+            entry['MessageAttributes']['estimated_rows'] = {'DataType': 'Number', 'StringValue': str(estimated_rows)}
+        entries_by_queue.setdefault(job_queue_name(estimated_rows), []).append(entry)
+
+    responses = []
+    for queue_name, entries in entries_by_queue.items():
+        logger.debug({'message': 'Sending messages {} to queue {}'.format([entry['Id'] for entry in entries],
+                                                                          queue_name),
+                      'message_type': 'CoreDebug'})
+        queue = sqs_queue(queue_name=queue_name)
+        for start in range(0, len(entries), SQS_BATCH_SIZE):
+            response = queue.send_messages(Entries=entries[start:start + SQS_BATCH_SIZE])
+            if response.get('Failed'):
+                logger.error({'message': 'Failed to send messages to queue {}: {}'.format(queue_name,
+                                                                                          response['Failed']),
+                              'message_type': 'CoreError'})
+            responses.append(response)
+    return responses
@@ -0,0 +1,173 @@
+""" Per-submission partitions of the DABS staging tables.
+
+When staging_partitions is turned on, each submission's rows are copied into a child table of the staging table
+(e.g. appropriation_s1234) that inherits from it and is limited to the submission by a CHECK constraint. Queries against
+the parent table still see every submission's rows and skip the children that can't match, while clearing a
+submission becomes a TRUNCATE or DROP of its children instead of a row by row DELETE.
+
+Children are dropped when their submission is deleted, and when it's certified once its rows have been copied to the
+certified tables, so only submissions still being worked on keep them. If a certified submission is validated again,
+the files whose children are gone are loaded again before they're needed.
+
+Creating, truncating, or dropping a child takes an ACCESS EXCLUSIVE lock on the child, and adding it to or removing it
+from the parent locks the parent too. Every query of a parent table opens all of its children, so until the
+transaction ends those locks hold up queries of the parent for any submission, including other validations. Callers
+commit straight after changing children and never do so inside a long-running transaction.
+"""
+import logging
+import re
+
+from sqlalchemy import text
+
+from dataactcore.config import CONFIG_BROKER
+from dataactcore.models.stagingModels import (Appropriation, AwardFinancial, FlexField, FlexFieldRow,
+                                              ObjectClassProgramActivity)
+
+logger = logging.getLogger(__name__)
+
+# Whether the DABS staging tables get a child table per submission
+STAGING_PARTITIONS = CONFIG_BROKER.get('staging_partitions') or False
+# Whether those child tables are UNLOGGED. Their data can be reloaded from the files in S3, so it doesn't need to
+# survive a crash
+UNLOGGED_STAGING_PARTITIONS = CONFIG_BROKER.get('unlogged_staging_partitions') or False
+
+# Staging tables with a child per submission. The flex tables hold every file of the submission, so they get a child
+# per submission and file type
+PARTITIONED_MODELS = {Appropriation: False, ObjectClassProgramActivity: False, AwardFinancial: False,
+                      FlexField: True, FlexFieldRow: True}
+PARTITIONED_TABLE = re.compile(r'\b({})\b'.format('|'.join(model.__tablename__ for model in PARTITIONED_MODELS)),
+                               re.IGNORECASE)
+
+
+def partition_name(model, submission_id, file_type_id=None):
+    """ Get the name of the child table holding a submission's rows of a staging table
+
+        Args:
+            model: the staging model
+            submission_id: the submission the rows belong to
+            file_type_id: the file type of the rows, only used for the flex tables
+
+        Returns:
+            the name of the child table
+    """
+    name = '{}_s{}'.format(model.__tablename__, submission_id)
+    if PARTITIONED_MODELS[model]:
+        name += '_f{}'.format(file_type_id)
+    return name
+
+
+def staging_table_name(model, submission_id, file_type_id=None):
+    """ Get the name of the table a submission's rows should be written to
+
+        Args:
+            model: the staging model
+            submission_id: the submission the rows belong to
+            file_type_id: the file type of the rows, only used for the flex tables
+
+        Returns:
+            the submission's child table if the model is partitioned, otherwise the model's own table
+    """
+    if STAGING_PARTITIONS and model in PARTITIONED_MODELS:
+        return partition_name(model, submission_id, file_type_id)
+    return model.__tablename__
+
+
+def reads_staging_partitions(sql):
+    """ Check whether a query reads any of the staging tables with a child per submission, if they have them.
+        Postgres only skips the children of other submissions when it plans a query with the submission ID it's for,
+        which a generic plan of a prepared statement isn't.
+
+        Args:
+            sql: the query
+
+        Returns:
+            True if staging partitions are turned on and the query names a partitioned staging table
+    """
+    return bool(STAGING_PARTITIONS and PARTITIONED_TABLE.search(sql))
+
+
+def has_staging_partition(sess, model, submission_id, file_type_id=None):
+    """ Check whether a submission's child table of a staging table exists
+
+        Args:
+            sess: the database session to use
+            model: the staging model
+            submission_id: the submission the rows belong to
+            file_type_id: the file type of the rows, only used for the flex tables
+
+        Returns:
+            True if the child table exists
+    """
+    child = partition_name(model, submission_id, file_type_id)
+    return sess.execute(text("SELECT to_regclass(:child) IS NOT NULL"), {'child': child}).scalar()
+
+
+def reset_staging_partition(sess, model, submission_id, file_type_id=None):
+    """ Empty a submission's child table of a staging table, creating it if it doesn't exist yet. Any of the
+        submission's rows that were written to the parent table itself before partitioning was turned on are deleted.
+
+        Args:
+            sess: the database session to use
+            model: the staging model
+            submission_id: the submission to clear
+            file_type_id: the file type to clear, only used for the flex tables
+
+        Returns:
+            the name of the child table
+    """
+    parent = model.__tablename__
+    child = partition_name(model, submission_id, file_type_id)
+    check = 'submission_id = {}'.format(int(submission_id))
+    if PARTITIONED_MODELS[model]:
+        check += ' AND file_type_id = {}'.format(int(file_type_id))
+
+    if has_staging_partition(sess, model, submission_id, file_type_id):
+        sess.execute('TRUNCATE {}'.format(child))
+    else:
+        logger.info({
+            'message': 'Creating staging partition {}'.format(child),
+            'message_type': 'ValidatorInfo',
+            'submission_id': submission_id
+        })
+        # The child shares the parent's defaults (including the id sequence), indexes, and constraints, and only
+        # becomes visible through the parent once it's fully set up
+        sess.execute("""
+            CREATE {unlogged}TABLE {child} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS INCLUDING INDEXES);
+            ALTER TABLE {child} ADD CONSTRAINT {child}_partition_check CHECK ({check});
+            ALTER TABLE {child} INHERIT {parent};
+        """.format(unlogged='UNLOGGED ' if UNLOGGED_STAGING_PARTITIONS else '', child=child, parent=parent,
+                   check=check))
+
+    sess.execute('DELETE FROM ONLY {} WHERE {}'.format(parent, check))
+    return child
+
+
+def drop_submission_partitions(sess, submission_id):
+    """ Drop every staging child table belonging to a submission
+
+        Args:
+            sess: the database session to use
+            submission_id: the submission whose child tables should be dropped
+    """
+    children = sess.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class AS child ON child.oid = pg_inherits.inhrelid
+        JOIN pg_class AS parent ON parent.oid = pg_inherits.inhparent
+        WHERE parent.relname = ANY(:parents)
+            AND child.relname ~ ('^' || parent.relname || '_s' || :submission_id || '(_f[0-9]+)?$')
+    """), {'parents': [model.__tablename__ for model in PARTITIONED_MODELS], 'submission_id': str(submission_id)})
+    for child in children:
+        sess.execute('DROP TABLE {}'.format(child.relname))
+
+
+def release_submission_partitions(sess, submission_id):
+    """ Drop a certified submission's staging child tables, if staging partitions are turned on. Their rows have been
+        copied to the certified tables, and the files are loaded again if the submission is validated again.
+
+        Args:
+            sess: the database session to use
+            submission_id: the submission whose child tables should be dropped
+    """
+    if STAGING_PARTITIONS:
+        drop_submission_partitions(sess, submission_id)
@@ -0,0 +1,41 @@
+"""Store flex_field_row cells as an array of [header, cell] pairs
+
+Revision ID: d5c8a1f3e702
+Revises: b7e4d2a9c613
+Create Date: 2020-03-05 09:47:12.580331
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'd5c8a1f3e702'
+down_revision = 'b7e4d2a9c613'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+
+
+def upgrade(engine_name):
+    globals()["upgrade_%s" % engine_name]()
+
+
+def downgrade(engine_name):
+    globals()["downgrade_%s" % engine_name]()
+
+
+def upgrade_data_broker():
+    op.execute("""
+        UPDATE flex_field_row
+        SET cells = (SELECT COALESCE(JSONB_AGG(JSONB_BUILD_ARRAY(key, value) ORDER BY key), '[]')
+                     FROM JSONB_EACH(cells))
+        WHERE JSONB_TYPEOF(cells) = 'object'
+    """)
+
+
+def downgrade_data_broker():
+    op.execute("""
+        UPDATE flex_field_row
+        SET cells = (SELECT COALESCE(JSONB_OBJECT_AGG(pair ->> 0, pair -> 1), '{}')
+                     FROM JSONB_ARRAY_ELEMENTS(cells) AS pair)
+        WHERE JSONB_TYPEOF(cells) = 'array'
+    """)
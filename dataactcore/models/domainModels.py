@@ -134,6 +134,46 @@ Index("ix_tas",
       TASLookup.internal_end_date)
 
 
+def tas_key(columns):
+    """ A single text key over the TAS components of a table, keeping NULL components apart from empty ones, so TAS can
+        be matched with one indexable equality instead of a comparison per component. The literals are rendered
+        inline so the expression matches the one ix_tas_lookup_tas_key is built on.
+
+        Args:
+            columns: anything with the TAS components as attributes (a model class or a subquery's columns)
+
+        Returns:
+            the key expression
+    """
+    null_marker = sa.literal_column("'~'")
+    separator = sa.literal_column("'|'")
+    key = None
+    for field_name in TAS_COMPONENTS:
+        part = sa.func.coalesce(getattr(columns, field_name), null_marker)
+        key = part if key is None else key.op('||')(separator).op('||')(part)
+    return key
+
+
+def tas_date_range(start_column, end_column):
+    """ The closed range of dates a CARS history entry covers, open ended when it has no end date. Backwards dates are
+        swapped so every entry has a valid range. This is the expression ix_tas_lookup_date_range is built on.
+
+        Args:
+            start_column: the start date of the entry
+            end_column: the end date of the entry
+
+        Returns:
+            the daterange expression
+    """
+    return sa.func.daterange(sa.func.least(start_column, end_column),
+                             sa.case([(end_column.is_(None), None)], else_=sa.func.greatest(start_column, end_column)),
+                             sa.literal_column("'[]'"))
+
+Index("ix_tas_lookup_tas_key", tas_key(TASLookup))
+Index("ix_tas_lookup_date_range", tas_date_range(TASLookup.internal_start_date, TASLookup.internal_end_date),
+      postgresql_using='gist')
+
+
 def is_not_distinct_from(left, right):
     """ Postgres' IS NOT DISTINCT FROM is an equality check that accounts for NULLs. Unfortunately, it doesn't make
         use of indexes. Instead, we'll imitate it here
@@ -165,6 +205,55 @@ def matching_cars_subquery(sess, model_class, start_date, end_date):
     return subquery.as_scalar()
 
 
+def update_matching_cars(sess, model_class, start_date, end_date, *filters):
+    """ Set the tas_id of the filtered rows of a table to their CARS history entry, the same entry
+        matching_cars_subquery would find for each row. Instead of looking the entry up once per row, each distinct
+        TAS of the rows is matched once, by its TAS key and date range, and the rows are updated with a single join.
+
+        Args:
+            sess: the database session to use
+            model_class: the model of the table to update
+            start_date: the start of the period the rows cover
+            end_date: the end of the period the rows cover
+            filters: conditions selecting the rows to update
+    """
+    model_table = model_class.__table__
+    model_components = [model_table.c[field_name] for field_name in TAS_COMPONENTS]
+
+    # Rows that don't match anything keep a NULL tas_id, like the rows the subquery finds nothing for
+    sess.execute(model_table.update().where(sa.and_(*filters)).where(model_table.c.tas_id.isnot(None)).
+                 values(tas_id=None))
+
+    staged = sa.select(model_components).where(sa.and_(*filters)).distinct().alias('staged_tas')
+
+    day_after_end = end_date + timedelta(days=1)
+    model_dates = sa.tuple_(start_date, end_date)
+    tas_dates = sa.tuple_(TASLookup.internal_start_date, sa.func.coalesce(TASLookup.internal_end_date, day_after_end))
+    # The overlap of the date ranges narrows down the entries through ix_tas_lookup_date_range, OVERLAPS makes the
+    # exact comparison
+    period = sa.func.daterange(min(start_date, end_date), max(start_date, end_date), sa.literal_column("'[]'"))
+    in_period = tas_date_range(TASLookup.internal_start_date, TASLookup.internal_end_date).op('&&')(period)
+
+    # See matching_cars_subquery for why min()
+    matches = sa.select([staged.c[field_name] for field_name in TAS_COMPONENTS] +
+                        [sa.func.min(TASLookup.account_num).label('account_num')]).\
+        select_from(staged.join(TASLookup.__table__, sa.and_(
+            tas_key(TASLookup) == tas_key(staged.c),
+            *[is_not_distinct_from(getattr(TASLookup, field_name), staged.c[field_name])
+              for field_name in TAS_COMPONENTS]))).\
+        where(in_period).\
+        where(model_dates.op('OVERLAPS')(tas_dates)).\
+        group_by(*[staged.c[field_name] for field_name in TAS_COMPONENTS]).\
+        alias('matching_tas')
+
+    sess.execute(model_table.update().
+                 where(sa.and_(*filters)).
+                 where(tas_key(model_table.c) == tas_key(matches.c)).
+                 where(sa.and_(*[is_not_distinct_from(model_table.c[field_name], matches.c[field_name])
+                                 for field_name in TAS_COMPONENTS])).
+                 values(tas_id=matches.c.account_num))
+
+
 class CGAC(Base):
     __tablename__ = "cgac"
     cgac_id = Column(Integer, primary_key=True)
@@ -47,7 +47,10 @@ class ErrorMetadata(Base):
 
     error_metadata_id = Column(Integer, primary_key=True)
     job_id = Column(Integer, ForeignKey("job.job_id", name="fk_error_metadata_job", ondelete="CASCADE"))
-    job = relationship("Job", uselist=False, cascade="delete")
+    job = relationship("Job", uselist=False, cascade="delete", foreign_keys=[job_id])
+    # Set instead of job_id for the errors of a job's last completed validation while its file is uploaded again
+    previous_job_id = Column(Integer, ForeignKey("job.job_id", name="fk_error_metadata_previous_job",
+                                                 ondelete="CASCADE"), nullable=True)
     filename = Column(Text, nullable=True)
     field_name = Column(Text)
     error_type_id = Column(Integer, ForeignKey("error_type.error_type_id"), nullable=True)
@@ -111,6 +111,11 @@ class Job(Base):
     file_generation_id = Column(Integer, ForeignKey("file_generation.file_generation_id", ondelete="SET NULL",
                                                     name="fk_file_request_file_generation_id"), nullable=True)
     file_generation = relationship("FileGeneration", uselist=False)
+    # Hashes of the file contents and of the rules/schema it was checked against, set once validation completes
+    file_hash = Column(Text, nullable=True)
+    rule_set_hash = Column(Text, nullable=True)
+    # Row count of the last completed validation, set aside when the file is uploaded again in case it's unchanged
+    previous_number_of_rows = Column(Integer, nullable=True)
 
     @property
     def job_type_name(self):
@@ -135,6 +140,21 @@ class JobDependency(Base):
     prerequisite_job = relationship("Job", foreign_keys=[prerequisite_id], lazy='joined', cascade="delete")
 
 
+class JobPhase(Base):
+    """ Progress of a validation job through one of its phases (staging_load, tas_linkage, sql_rules, cross_file, or
+        finalizing), kept up to date as the job runs
+    """
+    __tablename__ = "job_phase"
+
+    job_phase_id = Column(Integer, primary_key=True)
+    job_id = Column(Integer, ForeignKey("job.job_id", name="fk_job_phase_job_id", ondelete="CASCADE"), nullable=False,
+                    index=True)
+    phase = Column(Text, nullable=False)
+    start_time = Column(DateTime, nullable=False)
+    end_time = Column(DateTime, nullable=True)
+    rows_processed = Column(Integer, nullable=False, default=0, server_default='0')
+
+
 class FileType(Base):
     __tablename__ = "file_type"
     FILE_TYPE_DICT = None
@@ -201,6 +221,7 @@ class SQS(Base):
     sqs_id = Column(Integer, primary_key=True)
     message = Column(Integer, nullable=False)
     attributes = Column(Text, nullable=True)
+    queue_name = Column(Text, nullable=True)
 
 
 class RevalidationThreshold(Base):
@@ -292,3 +313,6 @@ class FileGeneration(Base):
     is_cached_file = Column(Boolean, nullable=False, default=False)
     file_format = Column(Enum('csv', 'txt', name='generation_file_format'), nullable=False, index=True,
                          default='csv', server_default='csv')
+    # Progress of the generation: the number of date ranges it's generated in and how many of them are done
+    shard_count = Column(Integer)
+    shards_generated = Column(Integer)
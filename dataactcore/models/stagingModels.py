@@ -1,4 +1,5 @@
 from sqlalchemy import ARRAY, Boolean, Column, Date, DateTime, ForeignKey, Index, Integer, Numeric, Text, func
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 
 from dataactcore.models.baseModel import Base
@@ -22,6 +23,30 @@ class FlexField(Base):
     file_type_id = Column(Integer)
 
 
+class FlexFieldRow(Base):
+    """ Model for the flex field row table, which holds all the flex cells of a row as one document, an array of
+        [header, cell] pairs
+    """
+    __tablename__ = "flex_field_row"
+
+    flex_field_row_id = Column(Integer, primary_key=True)
+    submission_id = Column(Integer,
+                           ForeignKey("submission.submission_id", ondelete="CASCADE",
+                                      name="fk_flex_field_row_submission_id"),
+                           nullable=False)
+    submission = relationship("Submission", uselist=False, cascade="delete")
+    job_id = Column(Integer, nullable=False, index=True)
+    file_type_id = Column(Integer, nullable=False)
+    row_number = Column(Integer, nullable=False)
+    cells = Column(JSONB, nullable=False)
+
+Index("ix_flex_field_row_submission_file_row",
+      FlexFieldRow.submission_id,
+      FlexFieldRow.file_type_id,
+      FlexFieldRow.row_number,
+      unique=True)
+
+
 class Appropriation(Base):
     """Model for the appropriation table."""
     __tablename__ = "appropriation"
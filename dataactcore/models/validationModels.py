@@ -1,6 +1,6 @@
 """ These classes define the ORM models to be used by sqlalchemy for the job tracker database """
 
-from sqlalchemy import Column, Integer, Text, ForeignKey, Boolean, Enum
+from sqlalchemy import Column, Integer, Text, ForeignKey, Boolean, Enum, Float
 from sqlalchemy.orm import relationship
 from dataactcore.models.baseModel import Base
 
@@ -58,6 +58,8 @@ class RuleSql(Base):
     target_file = relationship("FileType", uselist=False, foreign_keys=[target_file_id])
     query_name = Column(Text)
     expected_value = Column(Text)
+    # Whether the rule is a plain row by row check of its file's staging table that can be run together with others
+    rule_fusable = Column(Boolean, nullable=False, default=False, server_default="False")
 
 
 class ValidationLabel(Base):
@@ -70,3 +72,22 @@ class ValidationLabel(Base):
     file = relationship("FileType", uselist=False, foreign_keys=[file_id])
     column_name = Column(Text)
     label_type = Column(Enum('requirement', 'type', name='label_types'))
+
+
+class RuleExecution(Base):
+    """ Timing and size of a single run of a SQL rule, used to find the rules that need indexes or rewrites """
+    __tablename__ = "rule_execution"
+
+    rule_execution_id = Column(Integer, primary_key=True)
+    rule_label = Column(Text)
+    query_name = Column(Text)
+    submission_id = Column(Integer, ForeignKey("submission.submission_id", name="fk_rule_execution_submission_id",
+                                               ondelete="CASCADE"), index=True)
+    job_id = Column(Integer, ForeignKey("job.job_id", name="fk_rule_execution_job_id", ondelete="CASCADE"))
+    file_type_id = Column(Integer, ForeignKey("file_type.file_type_id", name="fk_rule_execution_file_type_id"))
+    target_file_type_id = Column(Integer, ForeignKey("file_type.file_type_id",
+                                                     name="fk_rule_execution_target_file_type_id"), nullable=True)
+    rows_scanned = Column(Integer)
+    failures = Column(Integer)
+    duration = Column(Float)
+    explain_plan = Column(Text, nullable=True)
@@ -33,15 +33,17 @@ if __name__ == '__main__':
         for submission in commented_submissions:
             # Preparing for the comments files
             filename = 'submission_{}_comments.csv'.format(submission.submission_id)
-            local_file = "".join([CONFIG_BROKER['broker_files'], filename])
-            file_path = local_file if is_local else '{}/{}'.format(str(submission.submission_id), filename)
+            if is_local:
+                file_path = "".join([CONFIG_BROKER['broker_files'], filename])
+            else:
+                file_path = '{}/{}'.format(str(submission.submission_id), filename)
 
             uncertified_query = sess.query(FileType.name, Comment.comment).\
                 join(FileType, Comment.file_type_id == FileType.file_type_id).\
                 filter(Comment.submission_id == submission.submission_id)
 
-            # Generate the file locally, then place in S3
-            write_stream_query(sess, uncertified_query, local_file, file_path, is_local, header=headers)
+            # Generate the file, streaming it to S3 when not local
+            write_stream_query(sess, uncertified_query, file_path, is_local, header=headers)
 
         logger.info('Finished generating uncertified comments files')
 
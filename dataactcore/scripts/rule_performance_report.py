@@ -0,0 +1,79 @@
+import argparse
+import logging
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import func
+
+from dataactcore.interfaces.db import GlobalDB
+from dataactcore.logging import configure_logging
+from dataactcore.models.lookups import FILE_TYPE_DICT_LETTER, FILE_TYPE_DICT_LETTER_ID
+from dataactcore.models.validationModels import RuleExecution
+
+from dataactvalidator.health_check import create_app
+
+logger = logging.getLogger(__name__)
+
+REPORT_HEADERS = ['Rule', 'Query Name', 'File', 'Target File', 'Runs', 'Avg Seconds', 'Max Seconds',
+                  'Avg Rows Scanned', 'Total Failures']
+
+
+def slowest_rules(sess, days=30, limit=25, file_letter=None):
+    """ Rank the SQL rules by how long they took to run on average across recent submissions
+
+        Args:
+            sess: the database session
+            days: how many days of rule runs to include
+            limit: maximum number of rules to return
+            file_letter: only include rules for this file (e.g. A, C, FABS), all rules when not provided
+
+        Returns:
+            list of rows with the rule label, query name, file and target file letters, number of runs, average and
+            maximum duration, average rows scanned, and total failures, slowest first
+    """
+    avg_duration = func.avg(RuleExecution.duration)
+    query = sess.query(RuleExecution.rule_label, RuleExecution.query_name, RuleExecution.file_type_id,
+                       RuleExecution.target_file_type_id, func.count(RuleExecution.rule_execution_id), avg_duration,
+                       func.max(RuleExecution.duration), func.avg(RuleExecution.rows_scanned),
+                       func.sum(RuleExecution.failures)).\
+        filter(RuleExecution.created_at >= datetime.utcnow() - timedelta(days=days))
+    if file_letter:
+        query = query.filter(RuleExecution.file_type_id == FILE_TYPE_DICT_LETTER_ID[file_letter.upper()])
+    query = query.group_by(RuleExecution.rule_label, RuleExecution.query_name, RuleExecution.file_type_id,
+                           RuleExecution.target_file_type_id).\
+        order_by(avg_duration.desc()).limit(limit)
+
+    return [[label, query_name, FILE_TYPE_DICT_LETTER.get(file_type_id, ''),
+             FILE_TYPE_DICT_LETTER.get(target_file_type_id, ''), runs, round(avg_seconds, 3), round(max_seconds, 3),
+             int(avg_rows or 0), int(failures or 0)]
+            for label, query_name, file_type_id, target_file_type_id, runs, avg_seconds, max_seconds, avg_rows,
+            failures in query]
+
+
+def print_report(rows):
+    """ Print the rule rankings as a table
+
+        Args:
+            rows: the rows returned by slowest_rules
+    """
+    table = [REPORT_HEADERS] + [[str(value) if value is not None else '' for value in row] for row in rows]
+    widths = [max(len(row[idx]) for row in table) for idx in range(len(REPORT_HEADERS))]
+    for row in table:
+        print('  '.join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rank the slowest SQL validation rules across recent submissions.')
+    parser.add_argument('-d', '--days', help='Number of days of rule runs to include', type=int, default=30)
+    parser.add_argument('-l', '--limit', help='Number of rules to list', type=int, default=25)
+    parser.add_argument('-f', '--file', help='Only list rules for this file letter (e.g. A, C, FABS)')
+    args = parser.parse_args()
+
+    sess = GlobalDB.db().session
+    print_report(slowest_rules(sess, args.days, args.limit, args.file))
+
+
+if __name__ == '__main__':
+    with create_app().app_context():
+        configure_logging()
+        main()
@@ -10,12 +10,13 @@ from dataactcore.aws.sqsHandler import sqs_queue
 from dataactcore.config import CONFIG_BROKER, CONFIG_SERVICES
 from dataactcore.interfaces.db import GlobalDB
 from dataactcore.interfaces.function_bag import mark_job_status, write_file_error
+from dataactcore.interfaces.job_lanes import SMALL_JOB_QUEUE_NAME
 from dataactcore.logging import configure_logging
 from dataactcore.models.jobModels import Job, FileGeneration
 from dataactcore.models.lookups import JOB_STATUS_DICT
 from dataactcore.utils.responseException import ResponseException
 from dataactcore.utils.statusCode import StatusCode
-from dataactvalidator.sqs_work_dispatcher import SQSWorkDispatcher
+from dataactvalidator.sqs_work_dispatcher import SQSWorkDispatcherPool
 
 from dataactvalidator.validation_handlers.file_generation_manager import FileGenerationManager
 from dataactvalidator.validation_handlers.validationError import ValidationError
@@ -34,6 +35,17 @@ logger = logging.getLogger(__name__)
 READY_STATUSES = [JOB_STATUS_DICT['waiting'], JOB_STATUS_DICT['ready']]
 RUNNING_STATUSES = READY_STATUSES + [JOB_STATUS_DICT['running']]
 
+# Number of jobs the validator works at the same time, each in its own worker process
+VALIDATOR_JOB_WORKERS = CONFIG_BROKER.get('validator_job_workers') or 1
+# Number of jobs from the small job queue the validator works at the same time, on top of validator_job_workers
+VALIDATOR_SMALL_JOB_WORKERS = CONFIG_BROKER.get('validator_small_job_workers') or 1
+# If the worker processes are started ahead of the jobs and reused for job after job, rather than started for each one
+VALIDATOR_WARM_WORKERS = CONFIG_BROKER.get('validator_warm_workers') or False
+# Number of jobs a warm worker process runs before it's replaced by a new one
+VALIDATOR_WORKER_MAX_JOBS = CONFIG_BROKER.get('validator_worker_max_jobs') or 100
+# Memory in MB a warm worker process can be using after a job before it's replaced by a new one
+VALIDATOR_WORKER_MAX_MEMORY_MB = CONFIG_BROKER.get('validator_worker_max_memory_mb') or 2048
+
 
 def create_app():
     return Flask(__name__)
@@ -58,43 +70,71 @@ def run_app():
 
         queue = sqs_queue()
 
-        logger.info("Starting SQS polling")
-        keep_polling = True
-        while keep_polling:
-            # With cleanup handling engaged, allowing retries
-            dispatcher = SQSWorkDispatcher(queue)
-
-            def choose_job_by_message_attributes(message):
-                # Determine if this is a retry of this message, in which case job execution should know so it can
-                # do cleanup before proceeding with the job
-                q_msg_attr = message.attributes  # the non-user-defined (queue-defined) attributes on the message
-                is_retry = False
-                if q_msg_attr.get('ApproximateReceiveCount') is not None:
-                    is_retry = int(q_msg_attr.get('ApproximateReceiveCount')) > 1
-
-                msg_attr = message.message_attributes
-                if msg_attr and msg_attr.get('validation_type', {}).get('StringValue') == 'generation':
-                    # Generating a file
-                    job_signature = {"_job": validator_process_file_generation,
-                                     "file_gen_id": message.body,
-                                     "is_retry": is_retry}
-                else:
-                    # Running validations (or generating a file from a Job)
-                    a_agency_code = msg_attr.get('agency_code', {}).get('StringValue') if msg_attr else None
-                    job_signature = {"_job": validator_process_job,
-                                     "job_id": message.body,
-                                     "agency_code": a_agency_code,
-                                     "is_retry": is_retry}
-                return job_signature
+        if VALIDATOR_WARM_WORKERS:
+            # Load the lookups every validation uses before the warm workers are forked from this process, then close
+            # the database connection used to do so, which the workers can't share
+            ValidationManager.warm_column_mappings()
+            GlobalDB.close()
+
+        # Jobs small enough to be sent to the small job queue are worked ahead of the others, with workers of their own
+        priority_queues = []
+        if SMALL_JOB_QUEUE_NAME:
+            priority_queues.append((sqs_queue(queue_name=SMALL_JOB_QUEUE_NAME), VALIDATOR_SMALL_JOB_WORKERS))
 
+        logger.info("Starting SQS polling")
+        # With cleanup handling engaged, allowing retries
+        dispatcher = SQSWorkDispatcherPool(queue, max_workers=VALIDATOR_JOB_WORKERS, priority_queues=priority_queues,
+                                           warm_workers=VALIDATOR_WARM_WORKERS, worker_initializer=warm_up_worker,
+                                           job_teardown=teardown_worker_job,
+                                           max_jobs_per_worker=VALIDATOR_WORKER_MAX_JOBS,
+                                           max_worker_memory_mb=VALIDATOR_WORKER_MAX_MEMORY_MB)
+
+        def choose_job_by_message_attributes(message):
+            # Determine if this is a retry of this message, in which case job execution should know so it can
+            # do cleanup before proceeding with the job
+            q_msg_attr = message.attributes  # the non-user-defined (queue-defined) attributes on the message
+            is_retry = False
+            if q_msg_attr.get('ApproximateReceiveCount') is not None:
+                is_retry = int(q_msg_attr.get('ApproximateReceiveCount')) > 1
+
+            msg_attr = message.message_attributes
+            if msg_attr and msg_attr.get('validation_type', {}).get('StringValue') == 'generation':
+                # Generating a file
+                job_signature = {"_job": validator_process_file_generation,
+                                 "file_gen_id": message.body,
+                                 "is_retry": is_retry}
+            else:
+                # Running validations (or generating a file from a Job)
+                a_agency_code = msg_attr.get('agency_code', {}).get('StringValue') if msg_attr else None
+                job_signature = {"_job": validator_process_job,
+                                 "job_id": message.body,
+                                 "agency_code": a_agency_code,
+                                 "is_retry": is_retry}
+            return job_signature
+
+        # If this process is exiting, don't poll for more work
+        while not dispatcher.is_exiting:
+            # Keeps receiving messages while there's room for more workers
             found_message = dispatcher.dispatch_by_message_attribute(choose_job_by_message_attributes)
 
-            # When you receive an empty response from the queue, wait before trying again
+            # When you receive an empty response from the queue (or have no room for more work), wait before trying
+            # again
             if not found_message:
                 time.sleep(1)
 
-            # If this process is exiting, don't poll for more work
-            keep_polling = not dispatcher.is_exiting
+
+def warm_up_worker():
+    """ Connect a warm worker process to the database before it's handed its first job, so every job it runs uses the
+        same engine and connection pool
+    """
+    GlobalDB.db()
+
+
+def teardown_worker_job():
+    """ Close the database session after each job of a warm worker process, so it doesn't hold on to the objects the job
+        loaded or sit in an open transaction until its next job. Its connection goes back to the pool for the next job.
+    """
+    GlobalDB.db().session.close()
 
 
 def validator_process_file_generation(file_gen_id, is_retry=False):
@@ -11,16 +11,18 @@ class CsvAbstractWriter(object):
     BUFFER_SIZE = (5 * 1024 ** 2)
     BATCH_SIZE = 100
 
-    def __init__(self, header):
+    def __init__(self, header, lineterminator='\r\n'):
         """
 
         args
 
         filename - string filename and path in the S3 bucket
         header - list of strings for the header
+        lineterminator - string used to end each row
 
         """
         self.rows = []
+        self.lineterminator = lineterminator
         self.write(header)
 
     def write(self, data_list):
@@ -40,10 +42,13 @@ class CsvAbstractWriter(object):
         if len(self.rows) > self.BATCH_SIZE:
             self.finish_batch()
 
+    # Allows the writer to be used in place of a csv.writer
+    writerow = write
+
     def finish_batch(self):
         """ Write the last unfinished batch """
         io_stream = io.StringIO()
-        csv_formatter = csv.writer(io_stream)
+        csv_formatter = csv.writer(io_stream, lineterminator=self.lineterminator)
         csv_formatter.writerows(self.rows)
         self._write(io_stream.getvalue())
         self.rows = []
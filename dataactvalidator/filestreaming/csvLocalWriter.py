@@ -7,7 +7,7 @@ class CsvLocalWriter(CsvAbstractWriter):
     use with the "with" python construct
     """
 
-    def __init__(self, filename, header):
+    def __init__(self, filename, header, lineterminator='\r\n'):
         """
 
         args
@@ -15,10 +15,11 @@ class CsvLocalWriter(CsvAbstractWriter):
         bucket - the string name of the S3 bucket
         filename - string filename and path in the S3 bucket
         header - list of strings for the header
+        lineterminator - string used to end each row
 
         """
         self.stream = open(filename, "w", newline='')
-        super(CsvLocalWriter, self).__init__(header)
+        super(CsvLocalWriter, self).__init__(header, lineterminator)
 
     def _write(self, data):
         """
@@ -38,8 +39,10 @@ class CsvLocalWriter(CsvAbstractWriter):
         value - the value of the error
         traceback - the traceback of the error
 
-        This function calls the smart open exit in the
-        'with' block
+        This function writes any rows left in the last batch
+        and closes the file at the end of the 'with' block
 
         """
+        if error_type is None:
+            self.finish_batch()
         self.stream.close()
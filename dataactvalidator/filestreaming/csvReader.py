@@ -1,4 +1,5 @@
 import csv
+import io
 import os
 import tempfile
 import boto3
@@ -14,9 +15,228 @@ from dataactcore.utils.stringCleaner import StringCleaner
 from dataactvalidator.validation_handlers.validationError import ValidationError
 
 
+# Size of the blocks read from the file at a time
+READ_BUFFER_SIZE = 1024 * 1024
+
+
+class S3StreamReader(io.RawIOBase):
+    """ Read-only, forward-only file object over the body of an S3 object so it can be decoded and parsed as it's
+        downloaded """
+
+    def __init__(self, body):
+        """ Args:
+                body: the StreamingBody returned by get_object
+        """
+        self.body = body
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.body.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.body.close()
+        super(S3StreamReader, self).close()
+
+
+class ByteRangeReader(io.RawIOBase):
+    """ Read-only file object over one byte range of a local file """
+
+    def __init__(self, filename, start, end):
+        """ Args:
+                filename: path of the local file
+                start: offset of the first byte to read
+                end: offset just past the last byte to read
+        """
+        self.file = open(filename, 'rb')
+        self.file.seek(start)
+        self.remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self.file.read(min(len(buffer), self.remaining))
+        self.remaining -= len(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        super(ByteRangeReader, self).close()
+
+
+def ends_in_quotes(line, in_quotes, delimiter):
+    """ Work out whether a line of a CSV file ends inside a quoted field, following the same quoting rules as the
+        reader: a quote only opens a field at the start of it, and two quotes in a row inside one are a literal quote.
+        Only the quotes and delimiters are looked at, so lines without quotes are passed over quickly.
+
+        Args:
+            line: the line, including its line break
+            in_quotes: whether the line starts inside a quoted field, continuing the record of the line before it
+            delimiter: the delimiter of the file
+
+        Returns:
+            True if the line break ending the line is inside a quoted field, so the record carries on to the next line
+    """
+    if not in_quotes and '"' not in line:
+        return False
+    position = 0
+    while True:
+        if not in_quotes:
+            # At the start of a field
+            if line.startswith('"', position):
+                in_quotes = True
+                position += 1
+            else:
+                delimiter_at = line.find(delimiter, position)
+                if delimiter_at < 0:
+                    return False
+                position = delimiter_at + 1
+                continue
+        quote_at = line.find('"', position)
+        if quote_at < 0:
+            return True
+        if line.startswith('"', quote_at + 1):
+            position = quote_at + 2
+            continue
+        # Whatever follows the closing quote up to the next delimiter is part of the same field
+        in_quotes = False
+        delimiter_at = line.find(delimiter, quote_at + 1)
+        if delimiter_at < 0:
+            return False
+        position = delimiter_at + 1
+
+
+def record_starts(lines, delimiter):
+    """ Pair each line of a CSV file with whether a non-blank record starts on it, working out from the quotes and line
+        breaks where each record ends
+
+        Args:
+            lines: iterable of the lines of the file, starting at the start of a record
+            delimiter: the delimiter of the file
+
+        Yields:
+            tuples of the line and True if a non-blank record starts on it
+    """
+    in_quotes = False
+    for line in lines:
+        yield line, not in_quotes and bool(line.strip('\r\n'))
+        in_quotes = ends_in_quotes(line, in_quotes, delimiter)
+
+
+def find_record_start(csv_file, offset, last_start, delimiter):
+    """ Find the first line break at or after an offset of a CSV file that's also the end of a record, without reading
+        the file from the start. The quote state at the line break after the offset isn't known, so the lines after it
+        are followed both as if it's inside a quoted field and as if it isn't, until the two agree. A file that has no
+        quotes since the last record start is never inside a quoted field, whether or not they agree.
+
+        Args:
+            csv_file: the file, opened in binary mode
+            offset: where to start looking
+            last_start: offset of a record start before the offset
+            delimiter: the delimiter of the file
+
+        Returns:
+            the offset of the first record start found, the file size if the records after the offset run to the end of
+            the file, or None if where the records start can't be told apart from quoted line breaks
+    """
+    csv_file.seek(offset - 1)
+    # Move to the start of the next line, which is the offset itself if the byte before it ends a line
+    position = offset - 1 + len(csv_file.readline())
+    line_start = position
+    states = {False, True}
+    while states != {False}:
+        line = csv_file.readline()
+        if not line:
+            return position
+        if len(states) > 1 and position - line_start >= READ_BUFFER_SIZE:
+            break
+        try:
+            text = line.decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+        if '\r' in text.rstrip('\r\n'):
+            # The reader ends lines at a lone carriage return too, so the record may start partway through the line
+            return None
+        states = {ends_in_quotes(text, in_quotes, delimiter) for in_quotes in states}
+        position += len(line)
+    if states == {False}:
+        return position
+
+    # Without any quotes since the last record start, the line after the offset can't be in a quoted field
+    csv_file.seek(last_start)
+    remaining = line_start - last_start
+    while remaining > 0:
+        block = csv_file.read(min(READ_BUFFER_SIZE, remaining))
+        if b'"' in block:
+            return None
+        remaining -= len(block)
+    return line_start
+
+
+def shard_file(filename, delimiter, shard_count):
+    """ Split the records of a local CSV file into byte ranges of about the same size. Rather than reading the whole
+        file, each split seeks to its offset and looks for the start of a record just past it, so quoted line breaks
+        never end up split across shards. The records in each shard are counted by count_shard_records.
+
+        Args:
+            filename: path of the local file
+            delimiter: the delimiter of the file
+            shard_count: how many shards to split the file into
+
+        Returns:
+            list of (start offset, end offset) tuples in file order, or None if the start of a record near a split
+            can't be told apart from a quoted line break, so the file has to be read in order
+    """
+    file_size = os.path.getsize(filename)
+    with open(filename, 'rb') as csv_file:
+        # The header is always a single line
+        starts = [len(csv_file.readline())]
+        target_size = max((file_size - starts[0]) // shard_count, 1)
+        for shard in range(1, shard_count):
+            offset = starts[0] + shard * target_size
+            if offset <= starts[-1]:
+                continue
+            record_start = find_record_start(csv_file, offset, starts[-1], delimiter)
+            if record_start is None:
+                return None
+            if record_start >= file_size:
+                break
+            starts.append(record_start)
+    return list(zip(starts, starts[1:] + [file_size]))
+
+
+def count_shard_records(filename, start, end, delimiter):
+    """ Count the records in one shard of a local CSV file, parsing them the same way the reader does
+
+        Args:
+            filename: path of the local file
+            start: offset of the first record of the shard
+            end: offset just past the last record of the shard
+            delimiter: the delimiter of the file
+
+        Returns:
+            the number of records the reader will read from the shard, or None if the shard doesn't parse, so reading
+            the file in order is needed to report the problem
+    """
+    lines = io.TextIOWrapper(io.BufferedReader(ByteRangeReader(filename, start, end), READ_BUFFER_SIZE),
+                             encoding='utf-8', newline=None)
+    try:
+        # Blank lines are skipped by the reader and don't get a row number
+        return sum(1 for record in csv.reader(lines, quotechar='"', dialect='excel', delimiter=delimiter) if record)
+    except (UnicodeDecodeError, csv.Error):
+        return None
+    finally:
+        lines.close()
+
+
 class CsvReader(object):
     """
-    Reads data from local CSV file (first downloading from S3 if necessary)
+    Reads data from a CSV file, streaming it from S3 if necessary
     """
 
     header_report_headers = ["Error type", "Header name"]
@@ -59,12 +279,10 @@ class CsvReader(object):
                 is_local: Boolean of whether the app is being run locally or not
         """
 
-        if not self.filename:
-            self.get_filename(region, bucket, filename)
-
         self.is_local = is_local
+        self.filename = filename
         try:
-            self.file = open(self.filename, "r", newline=None)
+            self.file = self.open_stream(region, bucket, filename)
         except:
             raise ValueError("".join(["Filename provided not found : ", str(self.filename)]))
 
@@ -72,6 +290,8 @@ class CsvReader(object):
         self.is_finished = False
         self.column_count = 0
         header_line = self.file.readline()
+        # Number of non-blank records read from the file, including the header, to check that every one was processed
+        self.row_count = 1 if header_line.strip('\r\n') else 0
         # make sure we have not finished reading the file
 
         if self.is_finished:
@@ -81,7 +301,8 @@ class CsvReader(object):
                                     ValueError, ValidationError.singleRow)
 
         self.delimiter = "|" if header_line.count("|") > header_line.count(",") else ","
-        self.csv_reader = csv.reader(self.file, quotechar='"', dialect='excel', delimiter=self.delimiter)
+        self.csv_reader = csv.reader(self.count_records(self.file), quotechar='"', dialect='excel',
+                                     delimiter=self.delimiter)
 
         # create the header
         header_row = next(csv.reader([header_line], quotechar='"', dialect='excel', delimiter=self.delimiter))
@@ -96,6 +317,69 @@ class CsvReader(object):
 
         return daims_headers
 
+    def open_shard(self, filename, start, end, delimiter, expected_headers, flex_headers, is_local=False):
+        """ Prepare to read the records in one shard of a local file, using the header information read from the
+            whole file by open_file
+
+            Args:
+                filename: path of the local file
+                start: offset of the first record of the shard
+                end: offset just past the last record of the shard
+                delimiter: the delimiter of the file
+                expected_headers: the expected headers of the file's columns
+                flex_headers: the flex headers of the file's columns
+                is_local: Boolean of whether the app is being run locally or not
+        """
+        self.is_local = is_local
+        self.filename = filename
+        self.file = io.TextIOWrapper(io.BufferedReader(ByteRangeReader(filename, start, end), READ_BUFFER_SIZE),
+                                     encoding='utf-8', newline=None)
+        self.extra_line = False
+        self.is_finished = False
+        self.row_count = 0
+        self.delimiter = delimiter
+        self.csv_reader = csv.reader(self.count_records(self.file), quotechar='"', dialect='excel',
+                                     delimiter=self.delimiter)
+        self.expected_headers = expected_headers
+        self.flex_headers = flex_headers
+        self.column_count = len(expected_headers)
+        self.index_columns()
+
+    def count_records(self, lines):
+        """ Pass the lines of the file on to the parser, adding the non-blank records that start on them to
+            self.row_count. The records are counted from the quotes and line breaks, separately from the parser, so
+            one it drops or runs together with another shows up as a row count error.
+
+            Args:
+                lines: iterable of the lines of the file
+
+            Yields:
+                each of the lines
+        """
+        for line, starts_record in record_starts(lines, self.delimiter):
+            if starts_record:
+                self.row_count += 1
+            yield line
+
+    @staticmethod
+    def open_stream(region, bucket, filename):
+        """ Open the file as UTF-8 text, reading it directly from S3 if a bucket is given. Characters that aren't
+            valid UTF-8 raise a UnicodeDecodeError when they're reached.
+
+            Args:
+                region: AWS region where the bucket is located
+                bucket: Optional parameter; if set, file will be read from S3
+                filename: The file path for the CSV file (local or in S3)
+
+            Returns:
+                text file object for the CSV file
+        """
+        if region and bucket:
+            s3 = boto3.client('s3', region_name=region)
+            raw_file = S3StreamReader(s3.get_object(Bucket=bucket, Key=filename)['Body'])
+            return io.TextIOWrapper(io.BufferedReader(raw_file, READ_BUFFER_SIZE), encoding='utf-8', newline=None)
+        return open(filename, 'r', encoding='utf-8', newline=None, buffering=READ_BUFFER_SIZE)
+
     @staticmethod
     def write_file_level_error(bucket_name, filename, header, error_content, is_local):
         """ Writes file-level errors to an error file
@@ -128,45 +412,30 @@ class CsvReader(object):
 
     def get_next_record(self):
         """
-        Read the next record into a dict and return it
+        Read the next record
         Returns:
-            pair of (dictionary of expected fields, list of FlexFields)
+            pair of (list of the raw cells of the expected columns in the order of self.expected_columns,
+            list of FlexFields)
         """
-        return_dict = {}
-        flex_fields = []
-
         row = self._get_line()
         if len(row) != self.column_count:
             raise ResponseException(
                 "Wrong number of fields in this row, expected %s got %s" %
                 (self.column_count, len(row)), StatusCode.CLIENT_ERROR,
                 ValueError, ValidationError.readError)
-        for idx, cell in enumerate(row):
-            if idx >= self.column_count:
-                raise ResponseException(
-                    "Record contains too many fields", StatusCode.CLIENT_ERROR,
-                    ValueError, ValidationError.readError)
-            # Use None instead of empty strings for sqlalchemy
-            if cell == "":
-                cell = None
-            # self.expected_headers uses the short, machine-readable column names
-            if self.expected_headers[idx] is None and self.flex_headers[idx] is not None:
-                flex_fields.append(FlexField(header=self.flex_headers[idx], cell=cell))
-            # We skip headers which aren't expected and aren't flex
-            elif self.expected_headers[idx] is not None:
-                return_dict[self.expected_headers[idx]] = cell
-        # Sort flex fields so they always come back in the same order
-        flex_fields.sort(key=lambda x: x.header)
-        return return_dict, flex_fields
+        # Use None instead of empty strings for sqlalchemy
+        flex_fields = [FlexField(header=header, cell=row[idx] or None) for idx, header in self.flex_indexes]
+        return [row[idx] for idx in self.expected_indexes], flex_fields
 
     def _get_line(self):
         try:
-            # read next until we get a non-empty line or get an empty string signifying end of file
+            # read next until we get a non-empty line or get an empty string signifying end of file. Anything else
+            # going wrong, such as bad characters or unparseable lines, is a file level error
             line = next(self.csv_reader)
             while line == '\n' or line == []:
                 line = next(self.csv_reader)
-        except:
-            # If we cannot continue, we've reached the end of the file
+        except StopIteration:
+            # We've reached the end of the file
             line = ''
             self.is_finished = True
             self.extra_line = True
@@ -238,13 +507,27 @@ class CsvReader(object):
                 self.flex_headers.append(None)
                 self.expected_headers.append(header_value)
                 expected_fields[header_value] += 1
+        self.index_columns()
         return expected_fields
 
+    def index_columns(self):
+        """ Work out which cells of each row get read as expected columns and which as flex fields, from
+            self.expected_headers and self.flex_headers
+        """
+        # self.expected_headers uses the short, machine-readable column names, we skip headers which aren't expected
+        # and aren't flex
+        self.expected_indexes = [idx for idx, header in enumerate(self.expected_headers) if header is not None]
+        self.expected_columns = [self.expected_headers[idx] for idx in self.expected_indexes]
+        # Sort flex fields so they always come back in the same order
+        self.flex_indexes = sorted(((idx, header) for idx, header in enumerate(self.flex_headers)
+                                    if header is not None and self.expected_headers[idx] is None),
+                                   key=lambda flex: flex[1])
+
     def close(self):
         """Closes file if it exists """
         try:
             self.file.close()
-            if self.has_tempfile:
+            if getattr(self, 'has_tempfile', False):
                 os.remove(self.filename)
         except AttributeError:
             # File does not exist, and so does not need to be closed
@@ -0,0 +1,58 @@
+import boto3
+
+from dataactvalidator.filestreaming.csvAbstractWriter import CsvAbstractWriter
+from dataactvalidator.filestreaming.s3StreamWriter import S3StreamWriter
+
+
+class CsvS3Writer(CsvAbstractWriter):
+    """
+    Writes a CSV to S3 in a steaming manner, uploading it in parts as it's written
+    use with the "with" python construct
+    """
+
+    def __init__(self, region, bucket, filename, header, lineterminator='\r\n'):
+        """
+
+        args
+
+        region - AWS region of the S3 bucket
+        bucket - the string name of the S3 bucket
+        filename - string filename and path in the S3 bucket
+        header - list of strings for the header
+        lineterminator - string used to end each row
+
+        """
+        self.stream = S3StreamWriter(boto3.client('s3', region_name=region), bucket, filename,
+                                     part_size=self.BUFFER_SIZE)
+        super(CsvS3Writer, self).__init__(header, lineterminator)
+
+    def _write(self, data):
+        """
+
+        args
+
+        data -  (string) a string be written to the current file
+
+        Data is held until there's enough for a part of the multipart upload (the minimum part size is 5MB)
+
+        """
+        self.stream.write(data.encode('utf-8'))
+
+    def __exit__(self, error_type, value, traceback):
+        """
+
+        args
+        error_type - the type of error
+        value - the value of the error
+        traceback - the traceback of the error
+
+        This function uploads whatever is left and completes the upload at the end of the 'with' block. Files smaller
+        than a single part are uploaded with a single put. If there was an error, the upload is abandoned.
+
+        """
+        if error_type is not None:
+            self.stream.abort()
+            return
+
+        self.finish_batch()
+        self.stream.close()
@@ -1,13 +1,18 @@
 import csv
+import io
 import logging
 import os
 import boto3
+import shutil
 import tempfile
-import subprocess
 import time
 
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.engine import Connection
+
 from dataactcore.config import CONFIG_BROKER
 from dataactbroker.helpers.generic_helper import generate_raw_quoted_query
+from dataactvalidator.filestreaming.s3StreamWriter import S3StreamWriter
 
 logger = logging.getLogger(__name__)
 
@@ -50,15 +55,14 @@ def write_csv(file_name, upload_name, is_local, header, body):
         os.remove(local_filename)
 
 
-def write_stream_query(sess, query, local_filename, upload_name, is_local, header=None, generate_headers=False,
-                       generate_string=True, is_certified=False, file_format='csv'):
-    """ Write file locally from a query, then stream it to S3
+def write_stream_query(sess, query, upload_name, is_local, header=None, generate_headers=False, generate_string=True,
+                       is_certified=False, file_format='csv'):
+    """ Write a query's results to a file, streaming them straight to S3 unless running locally
 
         Args:
             sess: the database connection
             query: the query object or string
-            local_filename: full path for local file
-            upload_name: file name to be used as S3 key
+            upload_name: file name to be used as S3 key, or the full path of the file when running locally
             is_local: True if in local development, False otherwise
             header: value to write as the first line of the file if provided (default None)
             generate_headers: whether to generate headers based on the query (default False)
@@ -66,17 +70,15 @@ def write_stream_query(sess, query, local_filename, upload_name, is_local, heade
             is_certified: True if writing to the certified bucket, False otherwise (default False)
             file_format: determines if the file generated is a txt or a csv (default csv)
     """
-    if is_local:
-        local_filename = upload_name
-
     logger.debug({
         'message': 'Writing query to {}'.format(file_format),
         'message_type': 'BrokerDebug',
         'upload_name': upload_name
     })
 
-    write_query_to_file(sess, query, local_filename, header=header, generate_headers=generate_headers,
-                        generate_string=generate_string, file_format=file_format)
+    with open_output(upload_name, is_local, is_certified) as output:
+        write_query_to_stream(sess, query, output, header=header, generate_headers=generate_headers,
+                              generate_string=generate_string, file_format=file_format)
 
     logger.debug({
         'message': '{} written from query'.format(file_format.upper()),
@@ -84,13 +86,81 @@ def write_stream_query(sess, query, local_filename, upload_name, is_local, heade
         'upload_name': upload_name
     })
 
-    if not is_local:
-        # stream file to S3
-        with open(local_filename, 'rb') as reader:
-            stream_file_to_s3(upload_name, reader, is_certified)
-        # close and delete local copy
-        reader.close()
-        os.remove(local_filename)
+
+def write_stream_query_shards(engine, queries, upload_name, is_local, header=None, is_certified=False,
+                              file_format='csv', workers=1, shard_written=None):
+    """ Write the results of several queries one after the other to a file with a single header, streaming it straight
+        to S3 unless running locally. The queries are run at the same time, each on its own connection. The first
+        query's results are written straight to the file, while those of the queries after it are spooled to temporary
+        files until every query before them has been written.
+
+        Args:
+            engine: database engine to get the connections from
+            queries: raw SQL strings of the queries, in the order their results go in the file
+            upload_name: file name to be used as S3 key, or the full path of the file when running locally
+            is_local: True if in local development, False otherwise
+            header: value to write as the first line of the file if provided (default None)
+            is_certified: True if writing to the certified bucket, False otherwise (default False)
+            file_format: determines if the file generated is a txt or a csv (default csv)
+            workers: number of queries to run at the same time (default 1)
+            shard_written: function called with the index of each query once its results are copied, from the thread
+                that ran it (default None)
+    """
+    logger.debug({
+        'message': 'Writing {} queries to {}'.format(len(queries), file_format),
+        'message_type': 'BrokerDebug',
+        'upload_name': upload_name
+    })
+
+    with open_output(upload_name, is_local, is_certified) as output:
+        def write_shard(index):
+            stream = output if index == 0 else tempfile.TemporaryFile()
+            with engine.connect() as connection:
+                write_query_to_stream(connection, queries[index], stream, header=header if index == 0 else None,
+                                      generate_string=False, file_format=file_format)
+            if shard_written:
+                shard_written(index)
+            return stream
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(write_shard, index) for index in range(len(queries))]
+            try:
+                # only the first query writes to the file while it runs, the rest are added in order once it's done
+                for future in futures:
+                    stream = future.result()
+                    if stream is not output:
+                        stream.seek(0)
+                        shutil.copyfileobj(stream, output)
+                        stream.close()
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    logger.debug({
+        'message': '{} written from {} queries'.format(file_format.upper(), len(queries)),
+        'message_type': 'BrokerDebug',
+        'upload_name': upload_name
+    })
+
+
+def open_output(upload_name, is_local, is_certified=False):
+    """ Open the file query results are written to, to be used in a "with" block
+
+        Args:
+            upload_name: file name to be used as S3 key, or the full path of the file when running locally
+            is_local: True if in local development, False otherwise
+            is_certified: True if writing to the certified bucket, False otherwise (default False)
+
+        Returns:
+            the local file, or an S3StreamWriter uploading the file in parts as it's written that abandons the upload
+            if there's an error in the block
+    """
+    if is_local:
+        return open(upload_name, 'wb')
+    bucket_name = CONFIG_BROKER['certified_bucket'] if is_certified else CONFIG_BROKER['aws_bucket']
+    s3client = boto3.client('s3', region_name=CONFIG_BROKER['aws_region'])
+    return S3StreamWriter(s3client, bucket_name, upload_name)
 
 
 def write_query_to_file(sess, query, local_filename, header=None, generate_headers=False, generate_string=True,
@@ -106,18 +176,38 @@ def write_query_to_file(sess, query, local_filename, header=None, generate_heade
             generate_string: whether to extract the raw query from the queryset
             file_format: determines if the file generated is a txt or a csv
     """
+    with open(local_filename, 'wb') as local_file:
+        write_query_to_stream(sess, query, local_file, header=header, generate_headers=generate_headers,
+                              generate_string=generate_string, file_format=file_format)
+
+
+def write_query_to_stream(sess, query, stream, header=None, generate_headers=False, generate_string=True,
+                          file_format='csv'):
+    """ Write the results of a query to a binary file object, streamed from the database with COPY
+
+        Args:
+            sess: database session or connection
+            query: query to spit out data
+            stream: file object to write the results to
+            header: value to write as the first line of the file if provided
+            generate_headers: whether to generate headers based on the query
+            generate_string: whether to extract the raw query from the queryset
+            file_format: determines if the file generated is a txt or a csv
 
+        Raises:
+            the database error if the query fails
+    """
     delimiter = ','
     if file_format == 'txt':
         delimiter = '|'
 
-    # write base csv with headers
-    # Note: while psql's copy command supports headers, some header lengths exceed the maximum label length (63)
+    # write headers
+    # Note: while the copy command supports headers, some header lengths exceed the maximum label length (63)
     if header:
-        with open(local_filename, 'w', newline='') as csv_file:
-            # create local file and write headers
-            out_csv = csv.writer(csv_file, delimiter=delimiter, quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
-            out_csv.writerow(header)
+        header_line = io.StringIO()
+        out_csv = csv.writer(header_line, delimiter=delimiter, quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
+        out_csv.writerow(header)
+        stream.write(header_line.getvalue().encode('utf-8'))
 
     # get the raw SQL equivalent
     if generate_string:
@@ -125,15 +215,27 @@ def write_query_to_file(sess, query, local_filename, header=None, generate_heade
     else:
         raw_query = query
 
-    # save psql command with query to a temp file
     # note: if we've been provded a header and wrote it, there's no need to add another
-    temp_sql_file, temp_sql_file_path = generate_temp_query_file(raw_query, header=generate_headers,
-                                                                 delimiter=delimiter)
+    copy_sql = generate_copy_sql(raw_query, header=generate_headers, delimiter=delimiter)
 
-    # run the psql command and cleanup
-    database_string = str(sess.bind.url)
-    execute_psql(temp_sql_file_path, local_filename, database_string)
-    os.remove(temp_sql_file_path)
+    log_time = time.time()
+    # the driver's copy streams the results from the connection as they're sent
+    connection = sess if isinstance(sess, Connection) else sess.connection()
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(copy_sql, stream)
+    except Exception:
+        logger.error({
+            'message': 'Faulty SQL: {}'.format(raw_query),
+            'message_type': 'BrokerError'
+        })
+        raise
+    finally:
+        cursor.close()
+    logger.debug({
+        'message': 'Copied query results, took {} seconds'.format(time.time() - log_time),
+        'message_type': 'BrokerDebug'
+    })
 
 
 def stream_file_to_s3(upload_name, reader, is_certified=False):
@@ -161,58 +263,18 @@ def stream_file_to_s3(upload_name, reader, is_certified=False):
     s3_resource.Object(bucket_name, upload_name).put(Body=reader)
 
 
-def generate_temp_query_file(query, header=True, delimiter=','):
-    """ Generates a temporary file containing the shell command to create the csv
-        Reason for this being that the query can be too long for shell to process via subprocess
+def generate_copy_sql(query, header=True, delimiter=','):
+    """ Generates the COPY command sending the results of a query as a csv
 
         Args:
             query: string query to populate the csv file
             header: include header in csv (includes column names or aliases if provided in query)
             delimiter: determines if the file generated will be comma or pipe delimited
-    """
-    logger.debug('Creating PSQL Query: {}'.format(query))
-
-    # Create a unique temporary file to hold the raw query, using \copy
-    (temp_sql_file, temp_sql_file_path) = tempfile.mkstemp(prefix='b_sql_', dir='/tmp')
-    with open(temp_sql_file_path, 'w') as file:
-        with_header = ' HEADER' if header else ''
-        format_delimiter = 'delimiter \'|\' ' if delimiter == '|' else ''
-        file.write('\copy ({}) To STDOUT with {}CSV{}'.format(query, format_delimiter, with_header))
-
-    return temp_sql_file, temp_sql_file_path
-
 
-def execute_psql(temp_sql_file_path, source_path, database_string):
-    """ Executes the sql located in the temporary sql
-
-        Args:
-            temp_sql_file_path: the file path to temporarily store the copy SQL
-            source_path: output path of the csv
-            database_string: connection string to the database
+        Returns:
+            the COPY command
     """
-    try:
-        log_time = time.time()
-        # open the file to append
-        source_file = open(source_path, 'a')
-        # pass the command to the psql process
-        cat_command = subprocess.Popen(['cat', temp_sql_file_path], stdout=subprocess.PIPE)
-        # psql appends to source_path
-        subprocess.call(['psql', database_string, '-v', 'ON_ERROR_STOP=1'], stdin=cat_command.stdout,
-                        stderr=subprocess.STDOUT, stdout=source_file)
-        source_file.close()
-
-        logger.debug('Wrote {}, took {} seconds'.format(os.path.basename(source_path), time.time() - log_time))
-    except subprocess.CalledProcessError as e:
-        # Not logging the command as it can contain the database connection string
-        e.cmd = '[redacted]'
-        logger.error(e)
-        # temp file contains '\copy ([SQL]) To STDOUT with CSV HEADER' so the SQL is 7 chars in up to the last 27 chars
-        sql = subprocess.check_output(['cat', temp_sql_file_path]).decode()[7:-27]
-        logger.error('Faulty SQL: {}'.format(sql))
-        raise e
-    except Exception as e:
-        logger.error(e)
-        # temp file contains '\copy ([SQL]) To STDOUT with CSV HEADER' so the SQL is 7 chars in up to the last 27 chars
-        sql = subprocess.check_output(['cat', temp_sql_file_path]).decode()[7:-27]
-        logger.error('Faulty SQL: {}'.format(sql))
-        raise e
+    logger.debug('Creating COPY Query: {}'.format(query))
+    with_header = ' HEADER' if header else ''
+    format_delimiter = 'DELIMITER \'|\' ' if delimiter == '|' else ''
+    return 'COPY ({}) TO STDOUT WITH {}CSV{}'.format(query, format_delimiter, with_header)
@@ -162,6 +162,85 @@ class FieldCleaner(StringCleaner):
         else:
             return value
 
+
+class RowCleaner:
+    """ Cleans rows of one file type the same way as FieldCleaner.clean_row, with the key order, numeric types, and pad
+        lengths worked out once from the schema. Rows are lists of cells and are cleaned a batch at a time, a column at
+        a time.
+    """
+    NUMERIC_TYPES = ("INT", "DECIMAL", "LONG")
+
+    def __init__(self, fields, long_to_short_dict, columns):
+        """ Compile the cleaner for a file's columns
+
+        Args:
+            fields: List of FileColumn objects for this file type
+            long_to_short_dict: Maps long column names to short
+            columns: short names of the columns, in the order their cells appear in the rows
+        """
+        field_specs = {}
+        for field in fields:
+            numeric = FIELD_TYPE_DICT_ID[field.field_types_id] in self.NUMERIC_TYPES
+            pad_length = field.length if field.padded_flag and field.length is not None else None
+            field_specs[long_to_short_dict[field.name]] = (numeric, pad_length)
+
+        self.columns = list(columns)
+        # Columns that aren't in the schema are passed through as they are
+        self.column_specs = [field_specs.get(column) for column in self.columns]
+
+    def clean_rows(self, rows):
+        """ Strips whitespace, replaces empty strings with None, and pads fields that need it
+
+        Args:
+            rows: list of rows, each a list of cells in the order of self.columns
+
+        Returns:
+            list of cleaned rows as dicts keyed by short column name
+        """
+        if not self.columns:
+            return [{} for _ in rows]
+
+        cleaned_columns = []
+        for idx, spec in enumerate(self.column_specs):
+            values = [row[idx] for row in rows]
+            cleaned_columns.append(values if spec is None else self.clean_column(values, *spec))
+        columns = self.columns
+        return [dict(zip(columns, cells)) for cells in zip(*cleaned_columns)]
+
+    @staticmethod
+    def clean_column(values, numeric, pad_length):
+        """ Clean every value of a single column
+
+        Args:
+            values: list of cells in the column
+            numeric: whether the column is an INT, DECIMAL, or LONG, which have commas removed
+            pad_length: length to pad the values to with leading zeros, None if they aren't padded
+
+        Returns:
+            list of cleaned values
+        """
+        is_numeric = FieldCleaner.is_numeric
+        cleaned = []
+        for value in values:
+            if value is not None:
+                # Remove extra whitespace
+                value = value.strip()
+                # If field is wrapped in quotes then remove
+                if value[:1] == '"' and value[-1:] == '"':
+                    value = value[1:-1].strip()
+                if numeric and ',' in value:
+                    temp_value = value.replace(",", "")
+                    if is_numeric(temp_value):
+                        value = temp_value
+                if value == "":
+                    # Replace empty strings with null
+                    value = None
+                elif pad_length is not None:
+                    value = value.zfill(pad_length)
+            cleaned.append(value)
+        return cleaned
+
+
 if __name__ == '__main__':
     configure_logging()
     FieldCleaner.clean_file("../config/awardProcurementFieldsRaw.csv", "../config/awardProcurementFields.csv")
@@ -0,0 +1,94 @@
+import io
+
+
+class S3StreamWriter(object):
+    """
+    File-like object that uploads the bytes written to it to S3 as they're written, in the parts of a multipart upload,
+    so a file never has to be held in full in memory or on disk
+    use with the "with" python construct
+    """
+
+    # The minimum part size is 5MB and an upload can have at most 10,000 parts
+    PART_SIZE = (16 * 1024 ** 2)
+
+    def __init__(self, s3client, bucket, key, part_size=None):
+        """
+
+        args
+
+        s3client - boto3 S3 client to upload with
+        bucket - the string name of the S3 bucket
+        key - string filename and path in the S3 bucket
+        part_size - bytes to hold before uploading them as a part, PART_SIZE if not given
+
+        """
+        self.s3client = s3client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size or self.PART_SIZE
+        self.upload_id = None
+        self.parts = []
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        """
+
+        args
+
+        data - (bytes) data to be written to the file
+
+        Data is held until there's enough for a part of the multipart upload
+
+        """
+        self.buffer.write(data)
+        if self.buffer.tell() >= self.part_size:
+            self._upload_part()
+        return len(data)
+
+    def _upload_part(self):
+        """ Upload the buffered data as the next part of the file, starting the multipart upload if needed """
+        if self.upload_id is None:
+            self.upload_id = self.s3client.create_multipart_upload(Bucket=self.bucket, Key=self.key)['UploadId']
+        part_number = len(self.parts) + 1
+        response = self.s3client.upload_part(Bucket=self.bucket, Key=self.key, PartNumber=part_number,
+                                             UploadId=self.upload_id, Body=self.buffer.getvalue())
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+        self.buffer = io.BytesIO()
+
+    def close(self):
+        """ Upload whatever is left and complete the upload. Files smaller than a single part are uploaded with a
+            single put.
+        """
+        if self.upload_id is None:
+            self.s3client.put_object(Bucket=self.bucket, Key=self.key, Body=self.buffer.getvalue())
+        else:
+            if self.buffer.tell():
+                self._upload_part()
+            self.s3client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                                    MultipartUpload={'Parts': self.parts})
+        self.buffer = io.BytesIO()
+
+    def abort(self):
+        """ Abandon the upload, removing any parts already uploaded """
+        if self.upload_id is not None:
+            self.s3client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+        self.buffer = io.BytesIO()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, value, traceback):
+        """
+
+        args
+        error_type - the type of error
+        value - the value of the error
+        traceback - the traceback of the error
+
+        This function completes the upload at the end of the 'with' block, or abandons it if there was an error.
+
+        """
+        if error_type is not None:
+            self.abort()
+        else:
+            self.close()
@@ -4,10 +4,14 @@ import os
 from dataactcore.config import CONFIG_BROKER
 from dataactcore.logging import configure_logging
 from dataactcore.interfaces.db import GlobalDB
-from dataactcore.models.lookups import FILE_TYPE_DICT, RULE_SEVERITY_DICT
+from dataactcore.models.lookups import FILE_TYPE, FILE_TYPE_DICT, RULE_SEVERITY_DICT
 from dataactcore.models.validationModels import RuleSql
 from dataactvalidator.health_check import create_app
 from dataactvalidator.filestreaming.fieldCleaner import FieldCleaner
+from dataactvalidator.validation_handlers.rule_fusion import parse_fusable_rule
+from dataactvalidator.validation_handlers.rule_statements import normalize_rule_sql
+
+FILE_TYPE_TABLES = {file_type.id: file_type.model.__tablename__ for file_type in FILE_TYPE if file_type.model}
 
 
 class SQLLoader:
@@ -17,10 +21,10 @@ class SQLLoader:
 
     @classmethod
     def read_sql_str(cls, filename):
-        """Read and clean lines from a .sql file"""
+        """Read a .sql file, with the submission ID as a :submission_id bind parameter in place of its placeholders"""
         full_path = os.path.join(cls.sql_rules_path, filename + ".sql")
         with open(full_path, 'rU') as f:
-            return f.read()
+            return normalize_rule_sql(f.read())
 
     @classmethod
     def load_sql(cls, filename):
@@ -87,6 +91,9 @@ class SQLLoader:
                     rule_sql.file_id = file_id
                     rule_sql.target_file_id = target_file_id
                     rule_sql.rule_cross_file_flag = cross_file_flag
+                    # Single-file rules that only filter the rows of their staging table can be fused with others
+                    rule_sql.rule_fusable = not cross_file_flag and file_id in FILE_TYPE_TABLES and \
+                        parse_fusable_rule(sql, FILE_TYPE_TABLES[file_id]) is not None
 
                     sess.merge(rule_sql)
             sess.commit()
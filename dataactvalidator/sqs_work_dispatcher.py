@@ -8,6 +8,8 @@ import signal
 import time
 import multiprocessing as mp
 
+from collections import OrderedDict
+
 from botocore.exceptions import ClientError, EndpointConnectionError, NoCredentialsError, NoRegionError
 
 from dataactcore.aws.sqsHandler import sqs_queue
@@ -56,7 +58,7 @@ class SQSWorkDispatcher:
     # So we do NOT want to handle that
 
     def __init__(self, sqs_queue_instance, worker_process_name=None, default_visibility_timeout=60,
-                 long_poll_seconds=None, monitor_sleep_time=5, exit_handling_timeout=30):
+                 long_poll_seconds=None, monitor_sleep_time=5, exit_handling_timeout=30, pooled=False):
         """
             Args:
                 sqs_queue_instance (SQS.Queue): the SQS queue to get work from
@@ -71,6 +73,9 @@ class SQSWorkDispatcher:
                 exit_handling_timeout (int): expected window of time during which cleanup should complete (not
                     guaranteed). This for example would be the time to finish cleanup before the messages is re-queued
                     or DLQ'd
+                pooled (bool): if this dispatcher is one of those of a :class:`SQSWorkDispatcherPool`. A pooled
+                    dispatcher returns as soon as it has started its worker process, leaving the pool to monitor it
+                    through :meth:`check_work_progress`, and leaves handling the :attr:`EXIT_SIGNALS` to the pool
         """
         self.sqs_queue_instance = sqs_queue_instance
         self.worker_process_name = worker_process_name
@@ -85,6 +90,10 @@ class SQSWorkDispatcher:
         self._parent_dispatcher_pid = os.getppid()
         self._sqs_heartbeat_log_period_seconds = 15  # log the heartbeat extension of visibility at most this often
         self._long_poll_seconds = 0  # if nothing is set anywhere, it defaults to 0 (short-polling)
+        self._pooled = pooled
+        self._heartbeats = 0
+        # A pool with warm workers sets the WarmWorkerProcess to hand the job to, in place of starting a new process
+        self._warm_worker = None
 
         if long_poll_seconds:
             self._long_poll_seconds = long_poll_seconds
@@ -105,8 +114,10 @@ class SQSWorkDispatcher:
             raise QueueWorkDispatcherError(msg)
 
         # Map handler functions for each of the exit signals we want to handle on the parent dispatcher process
-        for sig in self.EXIT_SIGNALS:
-            signal.signal(sig, self._handle_exit_signal)
+        # A pool maps its own, which hand the signal on to each of its dispatchers
+        if not self._pooled:
+            for sig in self.EXIT_SIGNALS:
+                signal.signal(sig, self._handle_exit_signal)
 
     @property
     def is_exiting(self):
@@ -148,8 +159,9 @@ class SQSWorkDispatcher:
                 job_kwargs: Zero or many variadic keyword-args that can be passed to the callable job
 
             Returns:
-                bool: True if a message was found on the queue and dispatched to completion, without error. Otherwise it
-                    is an error condition and will raise an exception.
+                bool: True if a message was found on the queue and dispatched to completion (or, when pooled, to the
+                    start of its worker process), without error. Otherwise it is an error condition and will raise an
+                    exception.
 
             Raises:
                 AttributeError: If this is called before setting self._current_sqs_message
@@ -170,6 +182,32 @@ class SQSWorkDispatcher:
         self._job_args = job_args
         self._job_kwargs = job_kwargs
 
+        if self._warm_worker is not None:
+            # Hand the job to a worker process started ahead of it. What it gives back is watched just as the worker
+            # process of the job would be
+            self._worker_process = self._warm_worker.run(job, job_args, job_kwargs)
+            log_job_message(
+                logger=self._logger,
+                message="Job handed to warm worker process named [{}] with process ID [{}]".format(
+                    self._worker_process.name,
+                    self._worker_process.pid
+                ),
+                is_debug=True
+            )
+        else:
+            self._start_worker_process(job, job_args, job_kwargs)
+        if not self._pooled:
+            self._monitor_work_progress()
+        return True
+
+    def _start_worker_process(self, job, job_args, job_kwargs):
+        """ Start a new child worker process to run the job
+
+            Args:
+                job (Callable): Callable to use as the target of the new child process
+                job_args: the args to pass to the job
+                job_kwargs: the keyword-args to pass to the job
+        """
         # Use the 'fork' method to create a new child process.
         # This shares the same python interpreter and memory space and references as the parent process
         # A side-effect of that is that it inherits the signal-handlers of the parent process. So wrap the job to be
@@ -198,8 +236,6 @@ class SQSWorkDispatcher:
             ),
             is_debug=True
         )
-        self._monitor_work_progress()
-        return True
 
     def dispatch(self, job, *additional_job_args, message_transformer=lambda msg: msg.body, worker_process_name=None,
                  exit_handler=None, **additional_job_kwargs):
@@ -338,6 +374,17 @@ class SQSWorkDispatcher:
         if self._current_sqs_message is None:
             return False
 
+        return self._dispatch_current_message_by_attribute(message_transformer, additional_job_args,
+                                                           worker_process_name, additional_job_kwargs)
+
+    def _dispatch_current_message_by_attribute(self, message_transformer, additional_job_args, worker_process_name,
+                                               additional_job_kwargs):
+        """ Dispatch the message in self._current_sqs_message to the job derived from it by the message_transformer,
+            as described in :meth:`dispatch_by_message_attribute`
+
+            Returns:
+                bool: True once the message has been dispatched
+        """
         job_args = ()
         job_kwargs = {}
         results = message_transformer(self._current_sqs_message)
@@ -372,21 +419,42 @@ class SQSWorkDispatcher:
                 wait_time: If no message is readily available, wait for this many seconds for one to arrive before
                     returning
         """
+        # NOTE: Forcing MaxNumberOfMessages=1
+        # This will pull at most 1 message off the queue, or no messages. This dispatcher is built to dispatch
+        # one queue message at a time for work, such that one job at a time is handled by the child worker
+        # process. The best way to then scale up work-throughput is to have multiple consumers (e.g. a
+        # SQSWorkDispatcherPool, multiple parent dispatcher processes on one machine, or multiple machines each running
+        # a parent dispatcher process)
+        # This may not be an ideal configuration for jobs that may expect to complete with sub-second performance,
+        # and handle a massive amount of message-throughput (e.g. 10+ messages/second, or 1M+ messages/day),
+        # where the added latency of connecting to the queue to fetch each message could add up.
+        received_messages = self._receive_messages(wait_time, 1)
+        if received_messages:
+            self._current_sqs_message = received_messages[0]
+            log_job_message(logger=self._logger, message="Message received: {}".format(self._current_sqs_message.body))
+
+    def _receive_messages(self, wait_time, max_messages):
+        """ Attempt to get up to a number of messages from the queue, making them invisible to other consumers for the
+            default_visibility_timeout
+
+            Args:
+                wait_time: If no message is readily available, wait for this many seconds for one to arrive before
+                    returning
+                max_messages: the most messages to receive, from 1 to 10
+
+            Returns:
+                list of the SQS.Messages received, which is empty if there were none
+
+            Raises:
+                SystemExit(1): If it can't connect to the queue or receive messages
+        """
         try:
-            # NOTE: Forcing MaxNumberOfMessages=1
-            # This will pull at most 1 message off the queue, or no messages. This dispatcher is built to dispatch
-            # one queue message at a time for work, such that one job at a time is handled by the child worker
-            # process. The best way to then scale up work-throughput is to have multiple consumers (e.g. multiple
-            # parent dispatcher processes on one machine, or multiple machines each running a parent dispatcher process)
-            # This may not be an ideal configuration for jobs that may expect to complete with sub-second performance,
-            # and handle a massive amount of message-throughput (e.g. 10+ messages/second, or 1M+ messages/day),
-            # where the added latency of connecting to the queue to fetch each message could add up.
-            received_messages = self.sqs_queue_instance.receive_messages(
+            return self.sqs_queue_instance.receive_messages(
                 WaitTimeSeconds=wait_time,
                 AttributeNames=["All"],
                 MessageAttributeNames=["All"],
                 VisibilityTimeout=self._default_visibility_timeout,
-                MaxNumberOfMessages=1,
+                MaxNumberOfMessages=max_messages,
             )
         except (EndpointConnectionError, ClientError, NoCredentialsError, NoRegionError) as conn_exc:
             log_job_message(logger=self._logger, message="SQS connection issue. See Traceback and investigate settings",
@@ -398,10 +466,6 @@ class SQSWorkDispatcher:
                             is_exception=True)
             raise SystemExit(1) from exc
 
-        if received_messages:
-            self._current_sqs_message = received_messages[0]
-            log_job_message(logger=self._logger, message="Message received: {}".format(self._current_sqs_message.body))
-
     def delete_message_from_queue(self):
         """ Deletes the message from SQS. This is usually treated as a *successful* culmination of message handling,
             so long as it was not previously copied to the Dead Letter Queue before deletion
@@ -546,13 +610,30 @@ class SQSWorkDispatcher:
                 Others: Anything raised by :meth:`_set_message_visibility`, :meth:`delete_message_from_queue`,
                     or :meth:`_handle_exit_signal`
         """
-        monitor_process = True
-        heartbeats = 0
-        while monitor_process:
-            monitor_process = False
-            if self._worker_process.is_alive():
-                # Process still working. Send "heartbeat" to SQS so it may continue
-                if (heartbeats * self._monitor_sleep_time) >= self._sqs_heartbeat_log_period_seconds:
+        while self.check_work_progress():
+            time.sleep(self._monitor_sleep_time)
+
+    def check_work_progress(self, heartbeat=True):
+        """ Check once on the running or exit status of the child worker process, handling it in whichever of the
+            scenarios described in :meth:`_monitor_work_progress` it's in.
+
+            Args:
+                heartbeat (bool): if the VisibilityTimeout of the message should be renewed when the child worker
+                    process is still running. Defaults to True.
+
+            Returns:
+                bool: True if the child worker process is still running, otherwise False
+
+            Raises:
+                QueueWorkerProcessError: When the child worker process was found to have exited with a > 0 exit
+                    code.
+                Others: Anything raised by :meth:`_set_message_visibility`, :meth:`delete_message_from_queue`,
+                    or :meth:`_handle_exit_signal`
+        """
+        if self._worker_process.is_alive():
+            # Process still working. Send "heartbeat" to SQS so it may continue
+            if heartbeat:
+                if (self._heartbeats * self._monitor_sleep_time) >= self._sqs_heartbeat_log_period_seconds:
                     log_job_message(
                         logger=self._logger,
                         message="Job worker process with PID [{}] is still running. "
@@ -560,39 +641,39 @@ class SQSWorkDispatcher:
                                                                                   self._default_visibility_timeout),
                         is_debug=True
                     )
-                    heartbeats = 0
+                    self._heartbeats = 0
                 else:
-                    heartbeats += 1
+                    self._heartbeats += 1
                 self._set_message_visibility(self._default_visibility_timeout)
-                time.sleep(self._monitor_sleep_time)
-                monitor_process = True
-            elif self._worker_process.exitcode == 0:
-                # If process exits with 0: success! Remove from queue
-                log_job_message(
-                    logger=self._logger,
-                    message="Job worker process with PID [{}] completed with 0 for exit code (success). Deleting "
-                            "message from the queue".format(self._worker_process.pid)
-                )
-                self.delete_message_from_queue()
-            elif self._worker_process.exitcode > 0:
-                # If process exits with positive code, an ERROR occurred within the worker process.
-                # Don't delete the message, don't force retry, and don't force into dead letter queue.
-                # Let the VisibilityTimeout expire, and the queue will handle whether to retry or put in
-                # the DLQ based on its queue configuration.
-                # Raise an exception to give control back to the caller to allow any error-handling to take place there
-                message = "Job worker process with PID [{}] errored with exit code: {}.".format(
-                    self._worker_process.pid,
-                    self._worker_process.exitcode
-                )
-                log_job_message(logger=self._logger, message=message, is_error=True)
-                raise QueueWorkerProcessError(message)
-            elif self._worker_process.exitcode < 0:
-                # If process exits with a negative code, process was terminated by a signal since
-                # a Python subprocess returns the negative value of the signal.
-                signum = self._worker_process.exitcode * -1
-                # In the rare case where the child worker process's exit signal is detected before its parent
-                # process received the same signal, proceed with handling the child's exit signal
-                self._handle_exit_signal(signum=signum, frame=None, parent_dispatcher_signaled=False)
+            return True
+        elif self._worker_process.exitcode == 0:
+            # If process exits with 0: success! Remove from queue
+            log_job_message(
+                logger=self._logger,
+                message="Job worker process with PID [{}] completed with 0 for exit code (success). Deleting "
+                        "message from the queue".format(self._worker_process.pid)
+            )
+            self.delete_message_from_queue()
+        elif self._worker_process.exitcode > 0:
+            # If process exits with positive code, an ERROR occurred within the worker process.
+            # Don't delete the message, don't force retry, and don't force into dead letter queue.
+            # Let the VisibilityTimeout expire, and the queue will handle whether to retry or put in
+            # the DLQ based on its queue configuration.
+            # Raise an exception to give control back to the caller to allow any error-handling to take place there
+            message = "Job worker process with PID [{}] errored with exit code: {}.".format(
+                self._worker_process.pid,
+                self._worker_process.exitcode
+            )
+            log_job_message(logger=self._logger, message=message, is_error=True)
+            raise QueueWorkerProcessError(message)
+        elif self._worker_process.exitcode < 0:
+            # If process exits with a negative code, process was terminated by a signal since
+            # a Python subprocess returns the negative value of the signal.
+            signum = self._worker_process.exitcode * -1
+            # In the rare case where the child worker process's exit signal is detected before its parent
+            # process received the same signal, proceed with handling the child's exit signal
+            self._handle_exit_signal(signum=signum, frame=None, parent_dispatcher_signaled=False)
+        return False
 
     def _handle_exit_signal(self, signum, frame, parent_dispatcher_signaled=True, is_retry=False):
         """ Attempt to gracefully handle the exiting of the job as a result of receiving an exit signal.
@@ -827,9 +908,10 @@ class SQSWorkDispatcher:
             else:
                 # exit_handler not provided, or processed successfully
                 self._handling_exit_signal = False
-                if self._dispatcher_exiting:
+                if self._dispatcher_exiting and not self._pooled:
                     # An exit signal was received by the parent dispatcher process.
                     # Continue with exiting the parent process, as per the original signal, after having handled it
+                    # (a pool does this itself, once each of its dispatchers has handled the signal)
                     log_job_message(
                         logger=self._logger,
                         message="Exiting from parent dispatcher process with PID [{}] "
@@ -842,7 +924,7 @@ class SQSWorkDispatcher:
                     # and kill the process using that signal to get it to exit as it would if we never handled it
                     signal.signal(signum, signal.SIG_DFL)
                     os.kill(os.getpid(), signum)
-                elif not self.allow_retries:
+                elif not self._dispatcher_exiting and not self.allow_retries:
                     # If only the child process died, but the message it was working was moved to the Dead Letter Queue
                     # because the queue is not configured to allow retries, raise an exception so the caller
                     # might mark the job as failed with its normal error-handling process
@@ -881,6 +963,518 @@ class SQSWorkDispatcher:
             raise QueueWorkDispatcherError(message) from exc
 
 
+class SQSWorkDispatcherPool:
+    """ SQSWorkDispatcherPool object that is used to pull work from an SQS queue, and then dispatch it to be executed
+        on up to a number of child worker processes at the same time, so a long job doesn't hold up the ones queued
+        behind it.
+
+        Each message is dispatched by a pooled :class:`SQSWorkDispatcher` of its own, which starts the child worker
+        process for it. The pool keeps receiving messages while it has room for more workers, and monitors each
+        worker the way a single SQSWorkDispatcher does: extending its message's VisibilityTimeout while it runs,
+        deleting the message when it succeeds, and handling its exit when it fails or is terminated by a signal. A
+        worker failing doesn't stop the others. When the parent dispatcher process receives one of the
+        :attr:`SQSWorkDispatcher.EXIT_SIGNALS`, the exit of each job being worked is handled in turn before the process
+        exits.
+
+        Work can also be taken from ``priority_queues``, which are received from first, each with a most number of
+        workers of its own, so the messages of one queue aren't kept waiting by the workers busy with another's.
+
+        With ``warm_workers``, the worker processes are started ahead of the messages, forked from this parent process
+        with the modules and lookups it has loaded, and each runs job after job as a :class:`WarmWorkerProcess`, so the
+        setup a job's process would otherwise do again for every job (e.g. connecting to the database) is done once
+        per worker. A worker is recycled, returning its memory to the operating system, once it has run
+        ``max_jobs_per_worker`` jobs or grown past ``max_worker_memory_mb``, or when a job fails in it, and another is
+        started in its place.
+    """
+    _logger = logging.getLogger(__name__)
+
+    def __init__(self, sqs_queue_instance, max_workers=1, priority_queues=(), warm_workers=False,
+                 worker_initializer=None, job_teardown=None, max_jobs_per_worker=None, max_worker_memory_mb=None,
+                 **dispatcher_kwargs):
+        """
+            Args:
+                sqs_queue_instance (SQS.Queue): the SQS queue to get work from
+                max_workers (int): the most child worker processes to run at the same time on messages of
+                    sqs_queue_instance
+                priority_queues: (SQS.Queue, int) tuples of other queues to get work from before sqs_queue_instance,
+                    each with the most child worker processes to run at the same time on its own messages. E.g. a
+                    queue of small jobs, so they aren't held up behind large ones
+                warm_workers (bool): if the jobs should be run by worker processes started ahead of them and reused
+                    for job after job, rather than a newly started worker process each. The jobs, and their args, have
+                    to be picklable to be handed to a warm worker, e.g. functions defined at the top level of a module
+                worker_initializer (Callable): a callable run once in each warm worker process before its first job
+                job_teardown (Callable): a callable run in a warm worker process after each job it completes
+                max_jobs_per_worker (int): the most jobs a warm worker process runs before it's recycled. None for no
+                    limit
+                max_worker_memory_mb (int): the most memory (resident set size) in MB a warm worker process can be
+                    using after a job and still be given another. None for no limit
+                dispatcher_kwargs: keyword-args given to the :class:`SQSWorkDispatcher` of each message, e.g.
+                    ``default_visibility_timeout`` or ``monitor_sleep_time``
+        """
+        if max_workers < 1 or any(lane_workers < 1 for _, lane_workers in priority_queues):
+            raise QueueWorkDispatcherError("max_workers must be at least 1")
+        self.sqs_queue_instance = sqs_queue_instance
+        self.max_workers = max_workers
+        self._dispatcher_kwargs = dispatcher_kwargs
+        # The dispatcher of each message being worked, and when its next heartbeat is due
+        self._workers = OrderedDict()
+        self._handling_exit_signal = False
+        self._dispatcher_exiting = False
+        self.warm_workers = warm_workers
+        self._worker_initializer = worker_initializer
+        self._job_teardown = job_teardown
+        self._max_jobs_per_worker = max_jobs_per_worker
+        self._max_worker_memory_mb = max_worker_memory_mb
+        # The warm worker processes waiting for a job
+        self._idle_workers = []
+
+        # Messages are received through a dispatcher of their own, so they're received with the same settings
+        self._receiver = SQSWorkDispatcher(sqs_queue_instance, pooled=True, **dispatcher_kwargs)
+        self.priority_queues = list(priority_queues)
+        self._priority_receivers = [SQSWorkDispatcher(queue, pooled=True, **dispatcher_kwargs)
+                                    for queue, _ in self.priority_queues]
+
+        # Map handler functions for each of the exit signals we want to handle on the parent dispatcher process
+        for sig in SQSWorkDispatcher.EXIT_SIGNALS:
+            signal.signal(sig, self._handle_exit_signal)
+
+        if self.warm_workers:
+            # Pre-fork the workers, so they're warmed up by the time the first messages arrive
+            for _ in range(sum(max_workers for _, max_workers in self._lanes())):
+                self._idle_workers.append(self._start_warm_worker())
+
+    @property
+    def is_exiting(self):
+        """ bool: True when this parent dispatcher process has received a signal that will lead to the process
+            exiting
+        """
+        return self._dispatcher_exiting
+
+    @property
+    def active_workers(self):
+        """ int: The number of child worker processes being monitored """
+        return len(self._workers)
+
+    @property
+    def idle_workers(self):
+        """ int: The number of warm worker processes waiting for a job """
+        return len(self._idle_workers)
+
+    def _start_warm_worker(self):
+        """ Start a warm worker process with the settings of this pool
+
+            Returns:
+                the WarmWorkerProcess started
+        """
+        worker = WarmWorkerProcess(name=self._receiver.worker_process_name, initializer=self._worker_initializer,
+                                   teardown=self._job_teardown, max_jobs=self._max_jobs_per_worker,
+                                   max_memory_mb=self._max_worker_memory_mb)
+        log_job_message(logger=self._logger,
+                        message="Warm worker process started with process ID [{}]".format(worker.pid), is_debug=True)
+        return worker
+
+    def _take_warm_worker(self):
+        """ Take a warm worker process that's waiting for a job, starting a new one if none of them are still alive
+
+            Returns:
+                the WarmWorkerProcess to hand the next job to
+        """
+        while self._idle_workers:
+            worker = self._idle_workers.pop(0)
+            if worker.is_alive():
+                return worker
+            worker.stop()
+        return self._start_warm_worker()
+
+    def _release_warm_worker(self, worker):
+        """ Put a warm worker process whose job is over back to wait for another, or recycle it if it's done running
+            jobs, starting another in its place
+
+            Args:
+                worker: the WarmWorkerProcess whose job is over
+        """
+        if worker.is_alive() and not worker.recycling:
+            self._idle_workers.append(worker)
+            return
+        log_job_message(
+            logger=self._logger,
+            message="Recycling warm worker process with PID [{}] after {} jobs".format(worker.pid, worker.jobs_run),
+            is_debug=True
+        )
+        worker.stop()
+        if not self._dispatcher_exiting:
+            self._idle_workers.append(self._start_warm_worker())
+
+    def dispatch_by_message_attribute(self, message_transformer, *additional_job_args, worker_process_name=None,
+                                      **additional_job_kwargs):
+        """ Check on the child worker processes already running, then receive as many messages as there is room for
+            and dispatch each to a newly started worker process. The arguments are used for each message as they are
+            by :meth:`SQSWorkDispatcher.dispatch_by_message_attribute`.
+
+            While workers are running, the queue is only polled for as long as it can be before their next heartbeat
+            is due.
+
+            Returns:
+                bool: True if at least one message was found on the queue and dispatched, otherwise False if nothing
+                    was on the queue or there was no room for more workers
+
+            Raises:
+                SystemExit(1): If it can't connect to the queue or receive messages
+                QueueWorkDispatcherError: If a message can't be dispatched
+        """
+        self.monitor_workers()
+        dispatched = False
+        in_flight = {dispatcher._current_sqs_message.message_id for dispatcher in self._workers
+                     if dispatcher._current_sqs_message}
+        for receiver, max_workers in self._lanes():
+            queue = receiver.sqs_queue_instance
+            room = max_workers - sum(1 for dispatcher in self._workers if dispatcher.sqs_queue_instance is queue)
+            if room <= 0:
+                continue
+
+            # Long polling one queue would hold up the others, so it's only done when there's just the one
+            wait_time = 0 if self.priority_queues else receiver._long_poll_seconds
+            if self._workers:
+                wait_time = min(wait_time, max(0, int(min(self._workers.values()) - time.time())))
+            # SQS hands out at most 10 messages at a time
+            messages = receiver._receive_messages(wait_time, min(room, 10))
+
+            for message in messages:
+                if message.message_id in in_flight:
+                    # Only a queue that doesn't hide in-flight messages (e.g. the local mock queue) hands them out again
+                    continue
+                log_job_message(logger=self._logger, message="Message received: {}".format(message.body))
+                self._dispatch_message(queue, message, message_transformer, additional_job_args, worker_process_name,
+                                       additional_job_kwargs)
+                in_flight.add(message.message_id)
+                dispatched = True
+        return dispatched
+
+    def _lanes(self):
+        """ The queues worked, each as the dispatcher its messages are received through and the most worker processes
+            to run on its messages at the same time. The priority queues come first.
+
+            Returns:
+                list of (SQSWorkDispatcher, int) tuples
+        """
+        priority_lanes = [(receiver, max_workers) for receiver, (_, max_workers)
+                          in zip(self._priority_receivers, self.priority_queues)]
+        return priority_lanes + [(self._receiver, self.max_workers)]
+
+    def _dispatch_message(self, queue, message, message_transformer, additional_job_args, worker_process_name,
+                          additional_job_kwargs):
+        """ Dispatch a message received from one of the queues to a worker process of its own, monitored by this pool
+
+            Args:
+                queue (SQS.Queue): the queue the message was received from
+                message (SQS.Message): the message
+                others: as given to :meth:`dispatch_by_message_attribute`
+        """
+        dispatcher = SQSWorkDispatcher(queue, pooled=True, **self._dispatcher_kwargs)
+        dispatcher._current_sqs_message = message
+        if self.warm_workers:
+            dispatcher._warm_worker = self._take_warm_worker()
+        try:
+            dispatcher._dispatch_current_message_by_attribute(message_transformer, additional_job_args,
+                                                              worker_process_name, additional_job_kwargs)
+        except Exception:
+            if dispatcher._warm_worker is not None:
+                self._release_warm_worker(dispatcher._warm_worker)
+            raise
+        self._workers[dispatcher] = time.time() + dispatcher._monitor_sleep_time
+
+    def monitor_workers(self):
+        """ Check once on each child worker process, sending the heartbeats that are due and handling the ones that
+            have exited as :meth:`SQSWorkDispatcher.check_work_progress` does. A worker that failed is logged and
+            dropped, leaving its message to the queue to retry or move to the Dead Letter Queue.
+        """
+        for dispatcher, next_heartbeat in list(self._workers.items()):
+            now = time.time()
+            heartbeat = now >= next_heartbeat
+            try:
+                running = dispatcher.check_work_progress(heartbeat=heartbeat)
+            except (QueueWorkerProcessError, QueueWorkDispatcherError):
+                log_job_message(
+                    logger=self._logger,
+                    message="Job worker process with PID [{}] failed. Continuing with the other {} worker "
+                            "processes".format(dispatcher._worker_process.pid, len(self._workers) - 1),
+                    is_exception=True
+                )
+                running = False
+            if not running:
+                del self._workers[dispatcher]
+                if dispatcher._warm_worker is not None:
+                    self._release_warm_worker(dispatcher._warm_worker)
+            elif heartbeat:
+                self._workers[dispatcher] = now + dispatcher._monitor_sleep_time
+
+    def _handle_exit_signal(self, signum, frame):
+        """ Gracefully handle the exit of each job being worked, as :meth:`SQSWorkDispatcher._handle_exit_signal`
+            does for its job, then exit this parent dispatcher process with the signal received.
+
+            Args:
+                signum: number representing the signal received
+                frame: Frame passed in with the signal
+        """
+        # Don't allow the parent dispatcher process to handle more than one exit signal
+        if self._handling_exit_signal:
+            return
+        self._handling_exit_signal = True
+        self._dispatcher_exiting = True
+
+        signal_or_human = BSD_SIGNALS.get(signum, signum)
+        log_job_message(
+            logger=self._logger,
+            message="Parent dispatcher process with PID [{}] received signal [{}] while running. "
+                    "Gracefully stopping the {} jobs being worked".format(os.getpid(), signal_or_human,
+                                                                          len(self._workers)),
+            is_error=True
+        )
+        dispatchers = list(self._workers)
+        for dispatcher in dispatchers:
+            try:
+                dispatcher._handle_exit_signal(signum, frame)
+            except Exception:
+                # Carry on with the other jobs. This one's message is left to the queue to retry or dead letter
+                log_job_message(
+                    logger=self._logger,
+                    message="Exit handling failed for the job of worker process with PID [{}]".format(
+                        dispatcher._worker_process.pid),
+                    is_exception=True
+                )
+        self._workers.clear()
+        # Warm workers not killed with their jobs have no more work to do
+        for worker in self._idle_workers + [dispatcher._warm_worker for dispatcher in dispatchers
+                                            if dispatcher._warm_worker is not None]:
+            worker.stop(timeout=0)
+        self._idle_workers = []
+
+        log_job_message(
+            logger=self._logger,
+            message="Exiting from parent dispatcher process with PID [{}] "
+                    "to culminate exit-handling of signal [{}]".format(os.getpid(), signal_or_human),
+            is_debug=True
+        )
+        # Exit as the process would have if the signal were never handled, as SQSWorkDispatcher does
+        signal.signal(signum, signal.SIG_DFL)
+        os.kill(os.getpid(), signum)
+
+
+class WarmWorkerProcess:
+    """ A child worker process started ahead of the jobs it runs, which runs one job after another as they're handed to
+        it, until it's recycled.
+
+        It's forked from the parent dispatcher process, so it starts with the modules and lookups the parent has
+        already loaded, then runs its initializer once. Jobs are sent to it through a pipe, so they and their args have
+        to be picklable. Each job it's handed is tracked by the :class:`WarmWorkerJob` returned, which reports on the
+        job the way a :class:`multiprocessing.Process` does on a worker process of its own: it's alive while the job
+        runs, has an exitcode of 0 once the job completes, and takes the exitcode of the worker process if the job
+        ends it. A job that raises an exception ends the worker process with an exitcode of 1, so a worker isn't
+        reused after a job fails in it.
+
+        The worker recycles itself, exiting once it's reported its job complete, when it has run ``max_jobs`` jobs or
+        is using more than ``max_memory_mb`` of memory. It also exits if its parent dispatcher process exits or stops
+        it.
+    """
+
+    def __init__(self, name=None, initializer=None, teardown=None, max_jobs=None, max_memory_mb=None):
+        """
+            Args:
+                name (str): the name to give the worker process
+                initializer (Callable): a callable run in the worker process before its first job
+                teardown (Callable): a callable run in the worker process after each job it completes
+                max_jobs (int): the most jobs to run before recycling the worker. None for no limit
+                max_memory_mb (int): the most memory (resident set size) in MB the worker can be using after a job
+                    and not be recycled. None for no limit
+        """
+        ctx = mp.get_context("fork")
+        self._connection, worker_connection = ctx.Pipe()
+        self._process = ctx.Process(
+            name=name,
+            target=_run_warm_worker,
+            args=(worker_connection, os.getpid(), initializer, teardown, max_jobs, max_memory_mb),
+            daemon=True  # daemon=True ensures that if the parent dispatcher dies, it will kill this child worker
+        )
+        self._process.start()
+        worker_connection.close()
+        self.jobs_run = 0
+        # Set once the worker reports it's recycling itself after its last job
+        self.recycling = False
+
+    @property
+    def pid(self):
+        """ int: The process ID of the worker process """
+        return self._process.pid
+
+    @property
+    def name(self):
+        """ str: The name of the worker process """
+        return self._process.name
+
+    @property
+    def exitcode(self):
+        """ int: The exitcode of the worker process, or None if it's still running """
+        return self._process.exitcode
+
+    def is_alive(self):
+        """ bool: True if the worker process is still running """
+        return self._process.is_alive()
+
+    def run(self, job, job_args, job_kwargs):
+        """ Hand a job to the worker process to run
+
+            Args:
+                job (Callable): the picklable callable to run
+                job_args: the args to pass to the job
+                job_kwargs: the keyword-args to pass to the job
+
+            Returns:
+                the WarmWorkerJob tracking the job
+
+            Raises:
+                QueueWorkDispatcherError: If the job can't be handed to the worker process
+        """
+        try:
+            self._connection.send((job, job_args, job_kwargs))
+        except Exception as exc:
+            raise QueueWorkDispatcherError("Unable to hand job to warm worker process with PID [{}]".format(
+                self.pid)) from exc
+        return WarmWorkerJob(self)
+
+    def _receive_job_result(self):
+        """ Receive the report of the job being complete, if the worker process has sent it
+
+            Returns:
+                bool: True if the job is complete, otherwise False
+        """
+        try:
+            if not self._connection.poll():
+                return False
+            self.recycling = self._connection.recv()
+        except (EOFError, OSError):
+            # The worker process exited without completing the job
+            return False
+        self.jobs_run += 1
+        return True
+
+    def stop(self, timeout=5):
+        """ Stop the worker process, killing it if it hasn't exited within the timeout
+
+            Args:
+                timeout: seconds to give the worker process to exit by itself
+        """
+        if self._process.is_alive() and not self.recycling:
+            try:
+                self._connection.send(None)
+            except OSError:
+                pass  # it exited in the meantime
+        self._connection.close()
+        self._process.join(timeout)
+        if self._process.is_alive():
+            ps.Process(self._process.pid).kill()
+            self._process.join()
+
+
+class WarmWorkerJob:
+    """ A job handed to a :class:`WarmWorkerProcess`, which reports on the job like a :class:`multiprocessing.Process`
+        running only that job would, so it can be monitored the same way
+    """
+
+    def __init__(self, worker):
+        """
+            Args:
+                worker: the WarmWorkerProcess running the job
+        """
+        self.worker = worker
+        self._exitcode = None
+
+    @property
+    def pid(self):
+        """ int: The process ID of the worker process running the job """
+        return self.worker.pid
+
+    @property
+    def name(self):
+        """ str: The name of the worker process running the job """
+        return self.worker.name
+
+    @property
+    def exitcode(self):
+        """ int: 0 if the job completed, the exitcode of the worker process if the job ended it, or None if the job is
+            still running
+        """
+        self.is_alive()
+        return self._exitcode
+
+    def is_alive(self):
+        """ bool: True while the job is running """
+        if self._exitcode is None:
+            if self.worker._receive_job_result():
+                self._exitcode = 0
+            elif not self.worker.is_alive():
+                # The job may have been reported complete just before the worker recycled itself
+                self._exitcode = 0 if self.worker._receive_job_result() else self.worker.exitcode
+        return self._exitcode is None
+
+    def join(self, timeout=None):
+        """ Wait for the job to end
+
+            Args:
+                timeout: the most seconds to wait. None to wait until it ends
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while self.is_alive() and (deadline is None or time.time() < deadline):
+            time.sleep(0.05)
+
+
+def _run_warm_worker(connection, parent_pid, initializer, teardown, max_jobs, max_memory_mb):
+    """ Run the jobs handed to a warm worker process one after another, reporting each one complete, until it's
+        recycled or stopped. Runs in the worker process.
+
+        Args:
+            connection: the worker's end of the pipe the jobs are sent through
+            parent_pid: the process ID of the parent dispatcher process
+            initializer: a callable to run before the first job
+            teardown: a callable to run after each job
+            max_jobs: the most jobs to run before recycling
+            max_memory_mb: the most memory in MB the process can be using after a job and not be recycled
+    """
+    # Reset the signal handlers inherited from the parent dispatcher process to their defaults, as the worker process of
+    # a single job does
+    for sig in SQSWorkDispatcher.EXIT_SIGNALS:
+        signal.signal(sig, signal.SIG_DFL)
+    if initializer is not None:
+        initializer()
+
+    jobs_run = 0
+    process = ps.Process()
+    while True:
+        # The workers forked after this one hold the parent's end of this one's pipe too, so the parent exiting isn't
+        # always seen as the pipe closing
+        while not connection.poll(1):
+            if os.getppid() != parent_pid:
+                return
+        try:
+            work = connection.recv()
+        except EOFError:
+            return
+        if work is None:
+            # Stopped by the parent dispatcher process
+            return
+        job, job_args, job_kwargs = work
+        # An exception raised by the job ends the process with an exitcode of 1
+        job(*job_args, **job_kwargs)
+        if teardown is not None:
+            teardown()
+        jobs_run += 1
+
+        recycling = bool(max_jobs and jobs_run >= max_jobs) or \
+            bool(max_memory_mb and process.memory_info().rss > max_memory_mb * 1024 * 1024)
+        connection.send(recycling)
+        if recycling:
+            return
+
+
 class QueueWorkerProcessError(Exception):
     """ Custom exception representing the scenario where the spawned worker process has failed
         with a non-zero exit code, indicating some kind of failure.
@@ -6,6 +6,33 @@ from dataactcore.interfaces.db import GlobalDB
 from dataactcore.models.lookups import ERROR_TYPE_DICT
 
 
+class RowError(object):
+    """ Running count of a single type of error, along with the first row it was found on """
+    __slots__ = ['job_id', 'filename', 'field_name', 'error_type', 'num_errors', 'first_row', 'original_label',
+                 'file_type_id', 'target_file_id', 'severity_id']
+
+    def __init__(self, job_id, filename, field_name, error_type, first_row, original_label, file_type_id,
+                 target_file_id, severity_id, num_errors=1):
+        self.job_id = job_id
+        self.filename = filename
+        self.field_name = field_name
+        self.error_type = error_type
+        self.num_errors = num_errors
+        self.first_row = first_row
+        self.original_label = original_label
+        self.file_type_id = file_type_id
+        self.target_file_id = target_file_id
+        self.severity_id = severity_id
+
+    def copy(self):
+        return RowError(self.job_id, self.filename, self.field_name, self.error_type, self.first_row,
+                        self.original_label, self.file_type_id, self.target_file_id, self.severity_id, self.num_errors)
+
+    def __eq__(self, other):
+        return isinstance(other, RowError) and \
+            all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+
 class ErrorInterface:
     """Manages communication with error database."""
 
@@ -29,15 +56,26 @@ class ErrorInterface:
             target_file_id: Id of target file type
             severity_id: Id of error severity
         """
-        key = "".join([str(job_id), field_name, str(error_type)])
-        if key in self.rowErrors:
-            self.rowErrors[key]["numErrors"] += 1
+        key = (job_id, field_name, error_type)
+        row_error = self.rowErrors.get(key)
+        if row_error is None:
+            self.rowErrors[key] = RowError(job_id, filename, field_name, error_type, row, original_label,
+                                           file_type_id, target_file_id, severity_id)
         else:
-            error_dict = {"filename": filename, "fieldName": field_name, "jobId": job_id, "errorType": error_type,
-                          "numErrors": 1,
-                          "firstRow": row, "originalRuleLabel": original_label, "fileTypeId": file_type_id,
-                          "targetFileId": target_file_id, "severity": severity_id}
-            self.rowErrors[key] = error_dict
+            row_error.num_errors += 1
+
+    def merge(self, other):
+        """ Add the errors recorded by another ErrorInterface to this one, as if they had been recorded here after the
+        errors already present
+
+        Args:
+            other: ErrorInterface whose errors are being added
+        """
+        for key, other_error in other.rowErrors.items():
+            if key in self.rowErrors:
+                self.rowErrors[key].num_errors += other_error.num_errors
+            else:
+                self.rowErrors[key] = other_error.copy()
 
     def write_all_row_errors(self, job_id):
         """ Writes all recorded errors to database
@@ -45,49 +83,52 @@ class ErrorInterface:
         Args:
             job_id: ID to write errors for
         """
-        sess = GlobalDB.db().session
-        for key in self.rowErrors.keys():
-            error_dict = self.rowErrors[key]
-            # Set info for this error
-            this_job = error_dict["jobId"]
-            if int(job_id) != int(this_job):
+        # The error type and message only need to be worked out once for each kind of error
+        error_types = {}
+        error_rows = []
+        for row_error in self.rowErrors.values():
+            if int(job_id) != int(row_error.job_id):
                 # This row is for a different job, skip it
                 continue
-            field_name = error_dict["fieldName"]
-            try:
-                # If last part of key is an int, it's one of our prestored messages
-                error_type = int(error_dict["errorType"])
-            except ValueError:
-                # For rule failures, it will hold the error message
-                error_msg = error_dict["errorType"]
-                if "Field must be no longer than specified limit" in error_msg:
-                    rule_failed_id = ERROR_TYPE_DICT['length_error']
-                else:
-                    rule_failed_id = ERROR_TYPE_DICT['rule_failed']
-                error_row = ErrorMetadata(job_id=this_job, filename=error_dict["filename"], field_name=field_name,
-                                          error_type_id=rule_failed_id, rule_failed=error_msg,
-                                          occurrences=error_dict["numErrors"], first_row=error_dict["firstRow"],
-                                          original_rule_label=error_dict["originalRuleLabel"],
-                                          file_type_id=error_dict["fileTypeId"],
-                                          target_file_type_id=error_dict["targetFileId"],
-                                          severity_id=error_dict["severity"])
-            else:
-                # This happens if cast to int was successful
-                error_string = ValidationError.get_error_type_string(error_type)
-                error_id = ERROR_TYPE_DICT[error_string]
-                # Create error metadata
-                error_row = ErrorMetadata(job_id=this_job, filename=error_dict["filename"], field_name=field_name,
-                                          error_type_id=error_id, occurrences=error_dict["numErrors"],
-                                          first_row=error_dict["firstRow"],
-                                          rule_failed=ValidationError.get_error_message(error_type),
-                                          original_rule_label=error_dict["originalRuleLabel"],
-                                          file_type_id=error_dict["fileTypeId"],
-                                          target_file_type_id=error_dict["targetFileId"],
-                                          severity_id=error_dict["severity"])
-
-            sess.add(error_row)
-
-        # Commit the session to write all rows
+
+            if row_error.error_type not in error_types:
+                error_types[row_error.error_type] = get_error_type(row_error.error_type)
+            error_type_id, rule_failed = error_types[row_error.error_type]
+
+            error_rows.append({
+                'job_id': row_error.job_id, 'filename': row_error.filename, 'field_name': row_error.field_name,
+                'error_type_id': error_type_id, 'rule_failed': rule_failed, 'occurrences': row_error.num_errors,
+                'first_row': row_error.first_row, 'original_rule_label': row_error.original_label,
+                'file_type_id': row_error.file_type_id, 'target_file_type_id': row_error.target_file_id,
+                'severity_id': row_error.severity_id
+            })
+
+        # Write all rows in a single insert
+        sess = GlobalDB.db().session
+        if error_rows:
+            sess.execute(ErrorMetadata.__table__.insert(), error_rows)
         sess.commit()
         # Clear the dictionary
         self.rowErrors = {}
+
+
+def get_error_type(error_type):
+    """ Get the error type ID and message to store for an error
+
+    Args:
+        error_type: ValidationError type for one of our prestored messages, or the message for rule failures
+
+    Returns:
+        tuple of the error type ID and the rule failed message
+    """
+    try:
+        # If it's an int, it's one of our prestored messages
+        error_type = int(error_type)
+    except ValueError:
+        # For rule failures, it will hold the error message
+        if "Field must be no longer than specified limit" in error_type:
+            return ERROR_TYPE_DICT['length_error'], error_type
+        return ERROR_TYPE_DICT['rule_failed'], error_type
+
+    error_string = ValidationError.get_error_type_string(error_type)
+    return ERROR_TYPE_DICT[error_string], ValidationError.get_error_message(error_type)
@@ -1,20 +1,28 @@
 import logging
 
+from datetime import timedelta
+from functools import partial
 from dateutil.relativedelta import relativedelta
 
 from dataactbroker.helpers.generation_helper import a_file_query, d_file_query, copy_file_generation_to_job
+from dataactbroker.helpers.generic_helper import generate_raw_quoted_query
 
 from dataactcore.aws.s3Handler import S3Handler
 from dataactcore.config import CONFIG_BROKER
+from dataactcore.interfaces.db import GlobalDB
 from dataactcore.interfaces.function_bag import mark_job_status
-from dataactcore.models.jobModels import Job
+from dataactcore.models.jobModels import FileGeneration, Job
 from dataactcore.utils import fileA, fileD1, fileD2, fileE_F
 from dataactcore.utils.responseException import ResponseException
 
-from dataactvalidator.filestreaming.csv_selection import write_stream_query
+from dataactvalidator.filestreaming.csv_selection import write_stream_query, write_stream_query_shards
 
 logger = logging.getLogger(__name__)
 
+# Number of months of a D1/D2 file generated at the same time, each on its own database connection (1 generates the
+# whole date range in one query)
+D_FILE_SHARD_WORKERS = CONFIG_BROKER.get('d_file_shard_workers') or 1
+
 GEN_FILENAMES = {
     'A': 'appropriations_data.csv', 'D1': 'd1_{}_{}_{}agency_data.{}', 'D2': 'd2_{}_{}_{}agency_data.{}',
     'E': 'executive_compensation_data.csv', 'F': 'sub_award_data.csv'
@@ -45,6 +53,7 @@ class FileGenerationManager:
         self.file_generation = file_generation
         self.job = job
         self.file_type = job.file_type.letter_name if job else file_generation.file_type
+        self.shard_workers = D_FILE_SHARD_WORKERS
 
     def generate_file(self, agency_code=None):
         """ Generates a file based on the FileGeneration object and updates any Jobs referencing it """
@@ -104,7 +113,6 @@ class FileGenerationManager:
         logger.info(log_data)
 
         original_filename = file_path.split('/')[-1]
-        local_file = "".join([CONFIG_BROKER['d_file_storage_path'], original_filename])
 
         # Prepare file data
         if self.file_type == 'D1':
@@ -126,9 +134,25 @@ class FileGenerationManager:
             "end": self.file_generation.end_date}
         logger.debug({'query_utils': query_utils})
 
-        # Generate the file locally, then place in S3
-        write_stream_query(self.sess, d_file_query(query_utils), local_file, file_path, self.is_local, header=headers,
-                           file_format=self.file_generation.file_format)
+        # Large date ranges are generated a month at a time, several months at once
+        shards = month_ranges(self.file_generation.start_date, self.file_generation.end_date) \
+            if self.shard_workers > 1 else []
+        self.file_generation.shard_count = max(len(shards), 1)
+        self.file_generation.shards_generated = 0
+        self.sess.commit()
+
+        # Generate the file, streaming it to S3 when not local
+        if len(shards) > 1:
+            shard_queries = [generate_raw_quoted_query(d_file_query(dict(query_utils, start=start, end=end)))
+                             for start, end in shards]
+            shard_generated = partial(self.shard_generated, self.file_generation.file_generation_id)
+            write_stream_query_shards(GlobalDB.db().engine, shard_queries, file_path, self.is_local, header=headers,
+                                      file_format=self.file_generation.file_format, workers=self.shard_workers,
+                                      shard_written=shard_generated)
+        else:
+            write_stream_query(self.sess, d_file_query(query_utils), file_path, self.is_local, header=headers,
+                               file_format=self.file_generation.file_format)
+            self.file_generation.shards_generated = 1
 
         log_data['message'] = 'Finished writing {} file {}: {}'.format(self.file_type,
                                                                        self.file_generation.file_format.upper(),
@@ -141,6 +165,25 @@ class FileGenerationManager:
         for job in self.sess.query(Job).filter_by(file_generation_id=self.file_generation.file_generation_id).all():
             copy_file_generation_to_job(job, self.file_generation, self.is_local)
 
+    def shard_generated(self, file_generation_id, shard):
+        """ Count a shard of the D file as generated. Called from the thread that generated it, so the count is
+            increased in the database on a connection of its own rather than through the session.
+
+            Args:
+                file_generation_id: ID of the FileGeneration being generated
+                shard: index of the shard that was generated
+        """
+        file_generation_table = FileGeneration.__table__
+        GlobalDB.db().engine.execute(
+            file_generation_table.update().
+            where(file_generation_table.c.file_generation_id == file_generation_id).
+            values(shards_generated=file_generation_table.c.shards_generated + 1))
+        logger.debug({
+            'message': 'Generated shard {} of file {}'.format(shard, self.file_type),
+            'message_type': 'ValidatorDebug',
+            'file_generation_id': file_generation_id
+        })
+
     def generate_e_file(self):
         """ Write file E to an appropriate CSV. """
         log_data = {'message': 'Starting file E generation', 'message_type': 'ValidatorInfo', 'job_id': self.job.job_id,
@@ -152,8 +195,8 @@ class FileGenerationManager:
         log_data['message'] = 'Writing E file CSV: {}'.format(self.job.original_filename)
         logger.info(log_data)
         # Generate the file and put in S3
-        write_stream_query(self.sess, file_e_sql, self.job.original_filename, self.job.filename, self.is_local,
-                           generate_headers=True, generate_string=False)
+        write_stream_query(self.sess, file_e_sql, self.job.filename, self.is_local, generate_headers=True,
+                           generate_string=False)
 
         log_data['message'] = 'Finished writing E file CSV: {}'.format(self.job.original_filename)
         logger.info(log_data)
@@ -170,8 +213,8 @@ class FileGenerationManager:
         log_data['message'] = 'Writing F file CSV: {}'.format(self.job.original_filename)
         logger.info(log_data)
         # Generate the file and put in S3
-        write_stream_query(self.sess, file_f_sql, self.job.original_filename, self.job.filename, self.is_local,
-                           generate_headers=True, generate_string=False)
+        write_stream_query(self.sess, file_f_sql, self.job.filename, self.is_local, generate_headers=True,
+                           generate_string=False)
 
         log_data['message'] = 'Finished writing F file CSV: {}'.format(self.job.original_filename)
         logger.info(log_data)
@@ -188,7 +231,6 @@ class FileGenerationManager:
                     'filename': self.job.original_filename}
         logger.info(log_data)
 
-        local_file = "".join([CONFIG_BROKER['d_file_storage_path'], self.job.original_filename])
         headers = [key for key in fileA.mapping]
         # add 3 months to account for fiscal year
         period_date = self.job.end_date + relativedelta(months=3)
@@ -201,7 +243,25 @@ class FileGenerationManager:
         logger.debug({'query_utils': query_utils})
 
         # Generate the file and put in S3
-        write_stream_query(self.sess, a_file_query(query_utils), local_file, self.job.filename, self.is_local,
-                           header=headers)
+        write_stream_query(self.sess, a_file_query(query_utils), self.job.filename, self.is_local, header=headers)
         log_data['message'] = 'Finished writing A file CSV: {}'.format(self.job.original_filename)
         logger.info(log_data)
+
+
+def month_ranges(start, end):
+    """ Split a date range into the part of it in each month
+
+        Args:
+            start: first date of the range
+            end: last date of the range
+
+        Returns:
+            list of tuples of the first and last date of the range in each month, in order
+    """
+    ranges = []
+    range_start = start
+    while range_start <= end:
+        next_month = range_start.replace(day=1) + relativedelta(months=1)
+        ranges.append((range_start, min(end, next_month - timedelta(days=1))))
+        range_start = next_month
+    return ranges
@@ -0,0 +1,268 @@
+""" Fusing single-table SQL rules so a group of them is checked in one scan of the staging table.
+
+A rule can be fused when its query is a plain row by row check of one staging table, e.g.
+
+    SELECT row_number, some_column, other_column AS "uniqueid_Key"
+    FROM detached_award_financial_assistance AS dafa
+    WHERE dafa.submission_id = :submission_id
+        AND <predicate>;
+
+Rules reading the same table through the same alias are combined into a single query that evaluates every rule's WHERE
+clause as a flag for each row, returning each rule's select list only for the rows it fails. The rows come back sorted
+by rule and are split back out per rule, with the same columns under the same names the rule's own query would have
+returned.
+"""
+import re
+from collections import namedtuple
+
+FusableRule = namedtuple('FusableRule', ['select_items', 'from_clause', 'qualifier', 'where_clause'])
+SelectItem = namedtuple('SelectItem', ['expression', 'name'])
+
+# Anything making a query more than a filter over the rows of one table
+DISALLOWED_CLAUSES = re.compile(r'\b(group\s+by|having|order\s+by|limit|offset|fetch|union|intersect|except|window|'
+                                r'for\s+update|for\s+share)\b')
+# Functions that would change the number of rows returned if they were in the select list
+DISALLOWED_FUNCTIONS = re.compile(r'\b(count|sum|min|max|avg|array_agg|string_agg|bool_and|bool_or|every|json_agg|'
+                                  r'jsonb_agg|unnest|generate_series|regexp_matches|regexp_split_to_table|json_each|'
+                                  r'jsonb_each|json_each_text|jsonb_each_text|json_array_elements|'
+                                  r'jsonb_array_elements)\s*\(|\bover\b')
+FROM_CLAUSE = re.compile(r'^\s*(\w+)(?:\s+(?:as\s+)?(\w+))?\s*$')
+ALIASED_ITEM = re.compile(r'^(.*\S)\s+as\s+("[^"]*"|\w+)\s*$', re.DOTALL)
+COLUMN_ITEM = re.compile(r'^\s*(?:\w+\.)?([a-z_]\w*)\s*$')
+RESERVED_ALIASES = ('where', 'join', 'inner', 'left', 'right', 'full', 'cross', 'natural', 'on', 'using')
+
+
+def mask_sql(sql, mask_parentheses=True):
+    """ Blank out the comments, quoted strings and identifiers, and parenthesized parts of a query, keeping every other
+        character where it was. Searching the masked query only finds the keywords and punctuation of the query
+        itself, and the positions found can be used to slice the original.
+
+        Args:
+            sql: the query to mask
+            mask_parentheses: whether to blank out the parenthesized parts too, or keep them to search function calls
+                wherever they're nested
+
+        Returns:
+            a tuple of the query with its comments blanked out and the masked, lower case query, both the same length
+            as the original
+    """
+    uncommented = []
+    masked = []
+    depth = 0
+    quote = None
+    i = 0
+    while i < len(sql):
+        char = sql[i]
+        shown = depth == 0 or not mask_parentheses
+        if quote:
+            uncommented.append(char)
+            masked.append(char if char == quote and shown else ' ')
+            if char == quote:
+                # Doubled quotes are escaped quotes within the string or identifier
+                if sql[i + 1:i + 2] == quote:
+                    uncommented.append(quote)
+                    masked.append(' ')
+                    i += 1
+                else:
+                    quote = None
+        elif char == '-' and sql[i + 1:i + 2] == '-':
+            end = sql.find('\n', i)
+            end = len(sql) if end == -1 else end
+            uncommented.append(' ' * (end - i))
+            masked.append(' ' * (end - i))
+            i = end
+            continue
+        elif char in ('\'', '"'):
+            quote = char
+            uncommented.append(char)
+            masked.append(char if shown else ' ')
+        elif char == '(':
+            uncommented.append(char)
+            masked.append(char if shown else ' ')
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            shown = depth == 0 or not mask_parentheses
+            uncommented.append(char)
+            masked.append(char if shown else ' ')
+        else:
+            uncommented.append(char)
+            masked.append(char.lower() if shown else ' ')
+        i += 1
+    return ''.join(uncommented), ''.join(masked)
+
+
+def split_top_level(text, masked, separator):
+    """ Split a query fragment on a separator found outside of any parentheses or quotes
+
+        Args:
+            text: the fragment to split
+            masked: the masked fragment, from mask_sql
+            separator: the character to split on
+
+        Returns:
+            list of tuples of the pieces of the fragment and of the masked fragment
+    """
+    pieces = []
+    start = 0
+    for match in re.finditer(re.escape(separator), masked):
+        pieces.append((text[start:match.start()], masked[start:match.start()]))
+        start = match.end()
+    pieces.append((text[start:], masked[start:]))
+    return pieces
+
+
+def is_single_select(rule_sql):
+    """ Check whether a query is a single SELECT, which is all a server-side cursor can run
+
+        Args:
+            rule_sql: the query to check
+
+        Returns:
+            True if the query is one SELECT (or WITH ... SELECT) statement, False otherwise
+    """
+    _, masked = mask_sql(rule_sql)
+    masked = masked.strip()
+    if masked.endswith(';'):
+        masked = masked[:-1]
+    return ';' not in masked and re.match(r'(select|with)\b', masked) is not None and \
+        not re.search(r'\b(insert|update|delete)\b', masked)
+
+
+def parse_fusable_rule(rule_sql, table_name):
+    """ Break a rule's query into the parts needed to fuse it with other rules, if it's a plain row by row check of
+        the given table
+
+        Args:
+            rule_sql: the query of the rule
+            table_name: the staging table the rule has to read for it to be fused
+
+        Returns:
+            a FusableRule, or None if the rule can't be fused
+    """
+    sql, masked = mask_sql(rule_sql)
+    # Ignore the trailing semicolon
+    end = len(masked.rstrip())
+    if masked[:end].endswith(';'):
+        end -= 1
+    sql, masked = sql[:end], masked[:end]
+    if ';' in masked:
+        return None
+
+    select = re.match(r'\s*select\b', masked)
+    # The select list ends at the first FROM that isn't part of an IS DISTINCT FROM
+    from_keyword = next((match for match in re.finditer(r'\bfrom\b', masked)
+                         if not masked[:match.start()].rstrip().endswith('distinct')), None)
+    if not select or not from_keyword:
+        return None
+    where_keyword = re.compile(r'\bwhere\b').search(masked, from_keyword.end())
+    if not where_keyword:
+        return None
+    if DISALLOWED_CLAUSES.search(masked) or re.match(r'\s*(distinct|all)\b', masked[select.end():]):
+        return None
+
+    from_match = FROM_CLAUSE.match(masked[from_keyword.end():where_keyword.start()])
+    if not from_match or from_match.group(1) != table_name or from_match.group(2) in RESERVED_ALIASES:
+        return None
+    qualifier = from_match.group(2) or from_match.group(1)
+
+    select_list = sql[select.end():from_keyword.start()]
+    masked_select_list = masked[select.end():from_keyword.start()]
+    # Aggregates still collapse the rows when they're nested in another call, e.g. COALESCE(SUM(x), 0)
+    if DISALLOWED_FUNCTIONS.search(mask_sql(select_list, mask_parentheses=False)[1]):
+        return None
+
+    select_items = []
+    for item, masked_item in split_top_level(select_list, masked_select_list, ','):
+        aliased = ALIASED_ITEM.match(masked_item)
+        if aliased:
+            select_items.append(SelectItem(item[:aliased.end(1)].strip(), item[aliased.start(2):aliased.end(2)]))
+            continue
+        # Without an alias, only a column keeps the same name once it's wrapped in a CASE
+        column = COLUMN_ITEM.match(masked_item)
+        if not column or column.group(1) in ('null', 'true', 'false'):
+            return None
+        select_items.append(SelectItem(item.strip(), column.group(1)))
+
+    return FusableRule(select_items, sql[from_keyword.end():where_keyword.start()].strip(), qualifier,
+                       sql[where_keyword.end():].strip())
+
+
+def fused_query(fusable_rules):
+    """ Build the query checking a group of fusable rules on the same table in one scan. The query returns a row for
+        each failure of each rule, sorted by rule and then by the order the table was scanned in, so the failures of a
+        rule come back together in the order its own query would have returned them. Each row has the index of the
+        rule it failed and the order it was scanned in, a flag for each rule, and then each rule's select list, which
+        is NULL unless the row failed that rule. Like the rules, the query takes the submission to check as a
+        :submission_id bind parameter.
+
+        Args:
+            fusable_rules: list of FusableRules sharing the same FROM clause
+
+        Returns:
+            the query
+    """
+    flags = ['COALESCE(({}), FALSE) AS fused_rule_{}'.format(rule.where_clause, index)
+             for index, rule in enumerate(fusable_rules)]
+    flag_columns = ['fused_rule_flags.fused_rule_{}'.format(index) for index in range(len(fusable_rules))]
+    columns = ['ROW_NUMBER() OVER () AS fused_row_order'] + flag_columns
+    for index, rule in enumerate(fusable_rules):
+        columns.extend('CASE WHEN fused_rule_flags.fused_rule_{} THEN {} END AS {}'.format(
+            index, item.expression, item.name) for item in rule.select_items)
+
+    return ('SELECT fused_rule.fused_rule_index, fused_rows.*\n'
+            'FROM (SELECT {columns}\n'
+            '    FROM {from_clause}\n'
+            '    CROSS JOIN LATERAL (SELECT {flags}) AS fused_rule_flags\n'
+            '    WHERE {qualifier}.submission_id = :submission_id\n'
+            '        AND ({any_flag})) AS fused_rows\n'
+            'CROSS JOIN LATERAL (VALUES {rule_indexes}) AS fused_rule (fused_rule_index)\n'
+            'WHERE CASE fused_rule.fused_rule_index {rule_flags} END\n'
+            'ORDER BY fused_rule.fused_rule_index, fused_rows.fused_row_order').format(
+        columns=',\n        '.join(columns), from_clause=fusable_rules[0].from_clause,
+        flags=',\n        '.join(flags), qualifier=fusable_rules[0].qualifier, any_flag=' OR '.join(flag_columns),
+        rule_indexes=', '.join('({})'.format(index) for index in range(len(fusable_rules))),
+        rule_flags=' '.join('WHEN {} THEN fused_rows.fused_rule_{}'.format(index, index)
+                            for index in range(len(fusable_rules))))
+
+
+def fused_columns(fusable_rules, result_keys):
+    """ Find each rule's columns in the results of a fused query
+
+        Args:
+            fusable_rules: the FusableRules the query was built from
+            result_keys: the column names of the query's results
+
+        Returns:
+            list with a tuple for each rule of the position of its first column and the names of its columns
+    """
+    rule_columns = []
+    # The rule index, scan order, and flags come first
+    offset = 2 + len(fusable_rules)
+    for rule in fusable_rules:
+        end = offset + len(rule.select_items)
+        rule_columns.append((offset, list(result_keys[offset:end])))
+        offset = end
+    return rule_columns
+
+
+def split_fused_failures(rule_columns, rows):
+    """ Sort rows returned by a fused query out into the failures of each rule
+
+        Args:
+            rule_columns: the columns of each rule, from fused_columns
+            rows: rows returned by the query, in the order it returned them
+
+        Returns:
+            list of tuples of the index of a rule and a list of its failures, one for each run of rows for the same
+            rule, each failure a dict of the columns the rule's own query would have returned for the row
+    """
+    failures = []
+    for row in rows:
+        row = tuple(row)
+        index = row[0]
+        start, keys = rule_columns[index]
+        if not failures or failures[-1][0] != index:
+            failures.append((index, []))
+        failures[-1][1].append(dict(zip(keys, row[start:start + len(keys)])))
+    return failures
@@ -0,0 +1,90 @@
+""" Running rule queries with the submission they check as a bind parameter.
+
+The rule files mark where the submission ID goes with a {0} placeholder. The SQL loader normalizes them to a
+:submission_id bind parameter, so a rule's SQL is the same whichever submission it checks, e.g.
+
+    WITH appropriation_a18 AS (SELECT ... FROM appropriation WHERE submission_id = :submission_id) ...
+
+A rule with fixed SQL can be PREPAREd once on a database connection and EXECUTEd for every submission after that, so
+Postgres only parses and rewrites it once per connection. Once Postgres settles on a generic plan for it (it tries five
+custom plans first, and keeps planning each execution if the generic plan looks more expensive) it isn't planned again
+either. The prepared statements are tracked in the info of the connection they were prepared on, which the pool keeps
+open between jobs, so each worker process prepares a rule once per pooled connection.
+"""
+import hashlib
+import re
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+SUBMISSION_PARAMETER = 'submission_id'
+# The submission ID appended to a name, e.g. the CTE appropriation_a18_{0}, which only has to be unique in its query
+SUFFIX_PLACEHOLDER = re.compile(r'(?<=\w)_\{0?\}')
+PLACEHOLDER = re.compile(r'\{0?\}')
+# The bind parameter, but not a cast like ::submission_id or part of a longer name
+BIND_PARAMETER = re.compile(r'(?<![:\w]):' + SUBMISSION_PARAMETER + r'\b')
+PREPARED_STATEMENTS = 'prepared_rule_statements'
+
+
+def normalize_rule_sql(rule_sql):
+    """ Replace the submission ID placeholders in a rule's query with a bind parameter. Names with the submission ID
+        appended to them lose it instead. Queries that are already normalized are left as they are.
+
+        Args:
+            rule_sql: the query of the rule
+
+        Returns:
+            the query with a :submission_id bind parameter in place of its placeholders
+    """
+    return PLACEHOLDER.sub(':' + SUBMISSION_PARAMETER, SUFFIX_PLACEHOLDER.sub('', rule_sql))
+
+
+def statement_name(rule_sql):
+    """ Name the prepared statement of a query after its SQL, so a changed rule is prepared again under a new name
+
+        Args:
+            rule_sql: the normalized query
+
+        Returns:
+            the name of the query's prepared statement
+    """
+    return 'rule_' + hashlib.md5(rule_sql.encode('utf-8')).hexdigest()
+
+
+def prepare_rule(connection, rule_sql):
+    """ Prepare a rule's query on a connection, unless it already has been
+
+        Args:
+            connection: the session or connection to prepare the query on
+            rule_sql: the normalized query, which has to be a single SELECT
+
+        Returns:
+            the name of the prepared statement
+    """
+    if not isinstance(connection, Connection):
+        connection = connection.connection()
+    # The info lasts as long as the database connection does, as do the statements prepared on it
+    prepared = connection.info.setdefault(PREPARED_STATEMENTS, set())
+    name = statement_name(rule_sql)
+    if name not in prepared:
+        connection.execute('PREPARE {} (integer) AS\n{}'.format(name, BIND_PARAMETER.sub('$1', rule_sql)))
+        prepared.add(name)
+    return name
+
+
+def execute_prepared_rule(connection, rule_sql, submission_id):
+    """ Run a rule's query for a submission as a prepared statement, preparing it first if it hasn't been yet on the
+        connection. Postgres can't declare a cursor for EXECUTE, so the results can't be read from a server-side cursor
+        and are all sent back at once.
+
+        Args:
+            connection: the session or connection to run the query on
+            rule_sql: the normalized query, which has to be a single SELECT
+            submission_id: the ID of the submission to check
+
+        Returns:
+            the ResultProxy of the query
+    """
+    name = prepare_rule(connection, rule_sql)
+    return connection.execute(text('EXECUTE {} (:{})'.format(name, SUBMISSION_PARAMETER)),
+                              {SUBMISSION_PARAMETER: submission_id})
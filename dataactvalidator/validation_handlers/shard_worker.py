@@ -0,0 +1,86 @@
+""" Clean, check, and stage one shard of a large file in its own process. Started by ValidationManager.load_shards with
+    the path of a pickled task. The shard's records are counted first and the count written to the task's count_fd
+    pipe, then the row number of its first record is read from stdin, since that depends on the shards before it. The
+    results are written next to the task for the parent process to merge.
+"""
+import argparse
+import os
+import pickle
+import sys
+
+from dataactcore.interfaces.db import GlobalDB
+from dataactcore.logging import configure_logging
+from dataactcore.models.jobModels import Job
+
+from dataactvalidator.app import create_app
+from dataactvalidator.filestreaming.csvLocalWriter import CsvLocalWriter
+from dataactvalidator.filestreaming.csvReader import CsvReader, count_shard_records
+from dataactvalidator.filestreaming.fieldCleaner import RowCleaner
+from dataactvalidator.validation_handlers.errorInterface import ErrorInterface
+from dataactvalidator.validation_handlers.validationManager import ValidationManager, get_file_columns
+from dataactvalidator.validation_handlers.validator import FILE_TYPE_MODELS
+
+
+def validate_shard(task):
+    """ Load the rows of one shard into the staging table, writing their errors and warnings to local reports
+
+        Args:
+            task: dict describing the shard, built by ValidationManager.load_shards
+
+        Returns:
+            dict of the row number of the last row loaded, the number of lines read, the row numbers with errors, and
+            the ErrorInterface holding the shard's error counts
+    """
+    sess = GlobalDB.db().session
+    job = sess.query(Job).filter_by(job_id=task['job_id']).one()
+    validation_manager = ValidationManager(task['is_local'], task['directory'])
+
+    fields = get_file_columns(sess, job.file_type.name)
+    csv_schema = {row.name_short: row for row in fields}
+
+    reader = CsvReader()
+    reader.open_shard(task['filename'], task['start'], task['end'], task['delimiter'], task['expected_headers'],
+                      task['flex_headers'], is_local=task['is_local'])
+    row_cleaner = RowCleaner(fields, validation_manager.long_to_short_dict[job.file_type_id], reader.expected_columns)
+    error_list = ErrorInterface()
+
+    try:
+        with CsvLocalWriter(task['error_path'], validation_manager.report_headers, lineterminator='\n') as error_csv,\
+                CsvLocalWriter(task['warning_path'], validation_manager.report_headers,
+                               lineterminator='\n') as warning_csv:
+            row_number, error_rows = validation_manager.load_rows(
+                reader, job, FILE_TYPE_MODELS[job.file_type_id], csv_schema, row_cleaner, task['required_list'],
+                task['type_list'], task['office_list'], error_csv, warning_csv, error_list, task['first_row'] - 1)
+    finally:
+        reader.close()
+
+    return {'row_number': row_number, 'row_count': reader.row_count, 'error_rows': error_rows,
+            'error_list': error_list}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load one shard of a file being validated.')
+    parser.add_argument('task_file', help='Path of the pickled shard task')
+    args = parser.parse_args()
+
+    with open(args.task_file, 'rb') as task_file:
+        task = pickle.load(task_file)
+
+    record_count = count_shard_records(task['filename'], task['start'], task['end'], task['delimiter'])
+    os.write(task['count_fd'], '{}\n'.format(-1 if record_count is None else record_count).encode())
+    os.close(task['count_fd'])
+    # Nothing is sent if the file is going to be read in order instead
+    first_row = sys.stdin.readline().strip()
+    if not first_row:
+        return
+    task['first_row'] = int(first_row)
+
+    result = validate_shard(task)
+    with open(task['result_path'], 'wb') as result_file:
+        pickle.dump(result, result_file)
+
+
+if __name__ == '__main__':
+    with create_app().app_context():
+        configure_logging()
+        main()
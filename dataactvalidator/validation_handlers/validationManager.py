@@ -1,13 +1,25 @@
-import boto3
 import csv
+import hashlib
+import io
+import json
 import logging
 import os
+import pickle
+import psycopg2
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
 import traceback
 
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, func, or_
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import joinedload
 
 from dataactbroker.handlers.submission_handler import populate_submission_error_info
 
@@ -15,16 +27,18 @@ from dataactcore.aws.s3Handler import S3Handler
 from dataactcore.config import CONFIG_BROKER, CONFIG_SERVICES
 
 from dataactcore.interfaces.db import GlobalDB
+from dataactcore.interfaces.staging_partitions import (
+    PARTITIONED_MODELS, STAGING_PARTITIONS, has_staging_partition, reset_staging_partition, staging_table_name)
 from dataactcore.interfaces.function_bag import (
     create_file_if_needed, write_file_error, mark_file_complete, run_job_checks, mark_job_status,
-    populate_job_error_info, get_action_dates
+    populate_job_error_info, get_action_dates, start_job_phase, add_job_phase_rows, finish_job_phase, clear_job_phases
 )
 
-from dataactcore.models.domainModels import matching_cars_subquery, Office
+from dataactcore.models.domainModels import Office, update_matching_cars
 from dataactcore.models.jobModels import Submission
-from dataactcore.models.lookups import FILE_TYPE, FILE_TYPE_DICT, RULE_SEVERITY_DICT
+from dataactcore.models.lookups import FILE_TYPE, FILE_TYPE_DICT, JOB_TYPE_DICT, RULE_SEVERITY_DICT
 from dataactcore.models.validationModels import FileColumn
-from dataactcore.models.stagingModels import DetachedAwardFinancialAssistance, FlexField
+from dataactcore.models.stagingModels import DetachedAwardFinancialAssistance, FlexField, FlexFieldRow
 from dataactcore.models.errorModels import ErrorMetadata
 from dataactcore.models.jobModels import Job
 from dataactcore.models.validationModels import RuleSql, ValidationLabel
@@ -34,16 +48,84 @@ from dataactcore.utils.jsonResponse import JsonResponse
 from dataactcore.utils.report import get_cross_file_pairs, report_file_name
 from dataactcore.utils.statusCode import StatusCode
 
-from dataactvalidator.filestreaming.csvReader import CsvReader
-from dataactvalidator.filestreaming.fieldCleaner import FieldCleaner, StringCleaner
+from dataactvalidator.filestreaming.csvLocalWriter import CsvLocalWriter
+from dataactvalidator.filestreaming.csvReader import CsvReader, shard_file
+from dataactvalidator.filestreaming.csvS3Writer import CsvS3Writer
+from dataactvalidator.filestreaming.fieldCleaner import RowCleaner, StringCleaner
 
 from dataactvalidator.validation_handlers.errorInterface import ErrorInterface
-from dataactvalidator.validation_handlers.validator import Validator, cross_validate_sql, validate_file_by_sql
+from dataactvalidator.validation_handlers.validator import (
+    Validator, cross_validate_sql, save_rule_executions, validate_file_by_sql)
 from dataactvalidator.validation_handlers.validationError import ValidationError
 
 logger = logging.getLogger(__name__)
 
 CHUNK_SIZE = 1024
+# Number of rows that are schema checked together and written to the staging tables in a single COPY (staging_batch_size
+# is its older name)
+VALIDATION_CHUNK_SIZE = (CONFIG_BROKER.get('validation_chunk_size') or CONFIG_BROKER.get('staging_batch_size') or
+                         10000)
+# Number of cross-file pairs validated at the same time, each on its own database connection
+CROSS_FILE_WORKERS = CONFIG_BROKER.get('cross_file_workers') or 4
+# Number of worker processes a single large file is split across to be cleaned, checked, and staged (1 reads it in one
+# process)
+INGEST_WORKERS = CONFIG_BROKER.get('ingest_workers') or 1
+# Files smaller than this many bytes are always read in one process
+INGEST_SHARD_MIN_SIZE = CONFIG_BROKER.get('ingest_shard_min_size') or 100 * 1024 * 1024
+# How flex fields are stored: 'rows' writes one flex_field row per cell, 'json' writes one flex_field_row document
+# holding all the flex cells of a row
+FLEX_FIELD_STORAGE = CONFIG_BROKER.get('flex_field_storage') or 'rows'
+# Reference data tables the single-file SQL rules check files against. Loading any of them that a file type's rules use
+# changes that file type's rule set hash, and tas_lookup is always used to set the TAS IDs of the staging rows
+REFERENCE_TABLES = ('cfda_program', 'cgac', 'city_code', 'country_code', 'county_code', 'duns', 'frec',
+                    'historic_duns', 'object_class', 'office', 'program_activity', 'sf_133', 'state_congressional',
+                    'states', 'sub_tier_agency', 'tas_lookup', 'zip_city', 'zips')
+
+# Stand-in for the execution context SQLAlchemy passes to python-side column defaults (e.g. concat_tas)
+DefaultContext = namedtuple('DefaultContext', ['current_parameters'])
+
+
+def load_column_mappings(sess):
+    """ Load the mappings between the long, short, and DAIMS names of the columns of each file type
+
+        Args:
+            sess: the database session to query the file columns with
+
+        Returns:
+            a tuple of the long to short, short to long, DAIMS to short, and short to DAIMS name dicts, each keyed by
+            file type ID
+    """
+    colnames = sess.query(FileColumn.daims_name, FileColumn.name, FileColumn.name_short, FileColumn.file_id).all()
+
+    long_to_short_dict = {}
+    short_to_long_dict = {}
+    daims_to_short_dict = {}
+    short_to_daims_dict = {}
+
+    # fill in long_to_short and short_to_long dicts
+    for col in colnames:
+        # Get long_to_short_dict filled in
+        if not long_to_short_dict.get(col.file_id):
+            long_to_short_dict[col.file_id] = {}
+        long_to_short_dict[col.file_id][col.name] = col.name_short
+
+        # Get short_to_long_dict filled in
+        if not short_to_long_dict.get(col.file_id):
+            short_to_long_dict[col.file_id] = {}
+        short_to_long_dict[col.file_id][col.name_short] = col.name
+
+        # Get daims_to_short_dict filled in
+        if not daims_to_short_dict.get(col.file_id):
+            daims_to_short_dict[col.file_id] = {}
+        clean_daims = StringCleaner.clean_string(col.daims_name, remove_extras=False)
+        daims_to_short_dict[col.file_id][clean_daims] = col.name_short
+
+        # Get short_to_daims_dict filled in
+        if not short_to_daims_dict.get(col.file_id):
+            short_to_daims_dict[col.file_id] = {}
+        short_to_daims_dict[col.file_id][col.name_short] = col.daims_name
+
+    return long_to_short_dict, short_to_long_dict, daims_to_short_dict, short_to_daims_dict
 
 
 class ValidationManager:
@@ -53,43 +135,45 @@ class ValidationManager:
     cross_file_report_headers = ['Unique ID', 'Source File', 'Source Field Name', 'Target File', 'Target Field Name',
                                  'Error Message', 'Source Value Provided', 'Target Value Provided', 'Difference',
                                  'Source Flex Field', 'Source Row Number', 'Rule Label']
+    # The column name mappings, when loaded ahead of time by warm_column_mappings
+    _warm_column_mappings = None
 
     def __init__(self, is_local=True, directory=""):
         # Initialize instance variables
         self.is_local = is_local
         self.directory = directory
+        self.chunk_size = VALIDATION_CHUNK_SIZE
+        self.cross_file_workers = CROSS_FILE_WORKERS
+        self.ingest_workers = INGEST_WORKERS
+
+        # create long-to-short (and vice-versa) column name mappings, unless they were loaded ahead of time
+        column_mappings = ValidationManager._warm_column_mappings or load_column_mappings(GlobalDB.db().session)
+        self.long_to_short_dict, self.short_to_long_dict, self.daims_to_short_dict, self.short_to_daims_dict = \
+            column_mappings
+
+    @classmethod
+    def warm_column_mappings(cls):
+        """ Load the column name mappings once for every ValidationManager created in this process after, rather than
+            for each one. Worker processes forked after this start with them loaded. They aren't reloaded until the
+            process is restarted.
+        """
+        cls._warm_column_mappings = load_column_mappings(GlobalDB.db().session)
 
-        # create long-to-short (and vice-versa) column name mappings
-        sess = GlobalDB.db().session
-        colnames = sess.query(FileColumn.daims_name, FileColumn.name, FileColumn.name_short, FileColumn.file_id).all()
-
-        self.long_to_short_dict = {}
-        self.short_to_long_dict = {}
-        self.daims_to_short_dict = {}
-        self.short_to_daims_dict = {}
-
-        # fill in long_to_short and short_to_long dicts
-        for col in colnames:
-            # Get long_to_short_dict filled in
-            if not self.long_to_short_dict.get(col.file_id):
-                self.long_to_short_dict[col.file_id] = {}
-            self.long_to_short_dict[col.file_id][col.name] = col.name_short
-
-            # Get short_to_long_dict filled in
-            if not self.short_to_long_dict.get(col.file_id):
-                self.short_to_long_dict[col.file_id] = {}
-            self.short_to_long_dict[col.file_id][col.name_short] = col.name
-
-            # Get daims_to_short_dict filled in
-            if not self.daims_to_short_dict.get(col.file_id):
-                self.daims_to_short_dict[col.file_id] = {}
-            clean_daims = StringCleaner.clean_string(col.daims_name, remove_extras=False)
-            self.daims_to_short_dict[col.file_id][clean_daims] = col.name_short
-
-            # Get short_to_daims_dict filled in
-            if not self.short_to_daims_dict.get(col.file_id):
-                self.short_to_daims_dict[col.file_id] = {}
-            self.short_to_daims_dict[col.file_id][col.name_short] = col.daims_name
+    def report_writer(self, file_name, header):
+        """ Open a writer for an error or warning report, which is streamed to S3 as it's written when not local
+
+            Args:
+                file_name: name of the report
+                header: list of column headers for the report
+
+            Returns:
+                CsvLocalWriter or CsvS3Writer for the report, to be used in a "with" block
+        """
+        if self.is_local:
+            return CsvLocalWriter("".join([CONFIG_SERVICES['error_report_path'], file_name]), header,
+                                  lineterminator='\n')
+        return CsvS3Writer(CONFIG_BROKER['aws_region'], CONFIG_BROKER['aws_bucket'], self.get_file_name(file_name),
+                           header, lineterminator='\n')
 
     def get_file_name(self, path):
         """ Return full path of error report based on provided name """
@@ -98,42 +182,39 @@ class ValidationManager:
         # Forcing forward slash here instead of using os.path to write a valid path for S3
         return "".join(["errors/", path])
 
-    def read_record(self, reader, writer, row_number, job, fields, error_list):
-        """ Read and process the next record
+    def read_record(self, reader, writer, row_number, job, error_list):
+        """ Read the next record
 
         Args:
             reader: CsvReader object
             writer: CsvWriter object
             row_number: Next row number to be read
             job: current job
-            fields: List of FileColumn objects for this file type
             error_list: instance of ErrorInterface to keep track of errors
 
         Returns:
             Tuple with six elements:
-            1. Dict of record after preprocessing
+            1. List of the record's raw cells, in the order of reader.expected_columns
             2. Boolean indicating whether to reduce row count
             3. Boolean indicating whether to skip row
             4. Boolean indicating whether to stop reading
             5. Row error has been found
-            6. Dict of flex columns
+            6. List of flex columns
         """
         reduce_row = False
         row_error_found = False
         job_id = job.job_id
         try:
-            (next_record, flex_fields) = reader.get_next_record()
-            record = FieldCleaner.clean_row(next_record, self.long_to_short_dict[job.file_type_id], fields)
-            record["row_number"] = row_number
+            (cells, flex_fields) = reader.get_next_record()
             for flex_field in flex_fields:
                 flex_field.submission_id = job.submission_id
                 flex_field.job_id = job.job_id
                 flex_field.row_number = row_number
                 flex_field.file_type_id = job.file_type_id
 
-            if reader.is_finished and len(record) < 2:
+            if reader.is_finished and not cells:
                 # This is the last line and is empty, don't record an error
-                return {}, True, True, True, False, []  # Don't count this row
+                return [], True, True, True, False, []  # Don't count this row
         except ResponseException:
             if reader.is_finished and reader.extra_line:
                 # Last line may be blank don't record an error,
@@ -147,8 +228,349 @@ class ValidationManager:
                                             row_number, severity_id=RULE_SEVERITY_DICT['fatal'])
                 row_error_found = True
 
-            return {}, reduce_row, True, False, row_error_found, []
-        return record, reduce_row, False, False, row_error_found, flex_fields
+            return [], reduce_row, True, False, row_error_found, []
+        return cells, reduce_row, False, False, row_error_found, flex_fields
+
+    @staticmethod
+    def clean_chunk(raw_chunk, row_cleaner, file_type, office_list):
+        """ Clean a chunk of rows as read from the file and fill in the fields derived from them
+
+            Args:
+                raw_chunk: list of (row number, raw cells, flex fields) tuples in row order
+                row_cleaner: RowCleaner for the file's columns
+                file_type: name of the file type being validated
+                office_list: dict of office codes to sub tier codes, used for FABS
+
+            Returns:
+                list of (record, flex fields) tuples in row order
+        """
+        records = row_cleaner.clean_rows([cells for _, cells, _ in raw_chunk])
+        for record, (row_number, _, _) in zip(records, raw_chunk):
+            record['row_number'] = row_number
+            if file_type == "fabs":
+                derive_fabs_fields(record, office_list)
+        return [(record, flex_cols) for record, (_, _, flex_cols) in zip(records, raw_chunk)]
+
+    def process_chunk(self, model, chunk, job, csv_schema, required_list, type_list, error_csv, warning_csv,
+                      error_list):
+        """ Run the basic schema checks (e.g., required fields, field length, data type) on a chunk of rows, write the
+            rows that passed the type checks to the staging table along with their flex fields, and record the errors
+            found.
+
+            Args:
+                model: ORM model of the staging table for this file type
+                chunk: list of (record, flex fields) tuples in row order
+                job: current job
+                csv_schema: dict of FileColumn objects for this file type, keyed by short name
+                required_list: dict of labels for required errors, used for FABS
+                type_list: dict of labels for type errors, used for FABS
+                error_csv: csv writer for the error file
+                warning_csv: csv writer for the warning file
+                error_list: instance of ErrorInterface to keep track of errors
+
+            Returns:
+                a list of the row numbers that either could not be written or have fatal errors
+        """
+        file_type = job.file_type.name
+        records = [record for record, _ in chunk]
+
+        # D files are generated from other systems (FABS and FPDS) that perform their own basic
+        # validations, so these validations are not repeated here
+        if file_type in ["award", "award_procurement"]:
+            # Skip basic validations for D files, set as valid to trigger write to staging
+            results = [(True, [], True)] * len(chunk)
+        else:
+            results = Validator.validate_chunk(records, csv_schema, file_type == "fabs", required_list, type_list)
+
+        staging_records = []
+        flex_fields = []
+        for (record, flex_cols), (_, _, valid) in zip(chunk, results):
+            if valid:
+                # todo: update this logic later when we have actual validations
+                if file_type == "fabs":
+                    record["is_valid"] = True
+                record.update(job_id=job.job_id, submission_id=job.submission_id)
+                staging_records.append(record)
+                flex_fields.extend(flex_cols)
+        failed_rows = insert_staging_batch(model, staging_records, flex_fields, job, error_csv, error_list)
+
+        error_rows = []
+        for (record, flex_cols), (passed_validations, failures, _) in zip(chunk, results):
+            row_number = record['row_number']
+            if row_number in failed_rows:
+                error_rows.append(row_number)
+            elif not passed_validations:
+                fatal = write_errors(failures, job, self.short_to_long_dict[job.file_type_id], error_csv,
+                                     warning_csv, row_number, error_list, flex_cols)
+                if fatal:
+                    error_rows.append(row_number)
+        return error_rows
+
+    def load_rows(self, reader, job, model, csv_schema, row_cleaner, required_list, type_list, office_list, error_csv,
+                  warning_csv, error_list, row_number=1):
+        """ Read the rest of the rows from the reader, cleaning, checking, and loading them into the staging table a
+            chunk at a time
+
+            Args:
+                reader: CsvReader positioned at the first row to load
+                job: current job
+                model: ORM model of the staging table for this file type
+                csv_schema: dict of FileColumn objects for this file type, keyed by short name
+                row_cleaner: RowCleaner for the file's columns
+                required_list: dict of labels for required errors, used for FABS
+                type_list: dict of labels for type errors, used for FABS
+                office_list: dict of office codes to sub tier codes, used for FABS
+                error_csv: csv writer for the error file
+                warning_csv: csv writer for the warning file
+                error_list: instance of ErrorInterface to keep track of errors
+                row_number: row number of the row before the first one to load
+
+            Returns:
+                tuple of the row number of the last row loaded and a list of the row numbers that had errors
+        """
+        submission_id = job.submission_id
+        job_id = job.job_id
+        file_type = job.file_type.name
+        log_str = 'on submission_id: {}, job_id: {}, file_type: {}'.format(str(submission_id), str(job_id), file_type)
+        loading_start = datetime.now()
+        error_rows = []
+        # row number up to which the job's progress has been recorded
+        progress_row = row_number
+
+        # rows read but not yet checked and written to the staging table
+        chunk = []
+        while not reader.is_finished:
+            row_number += 1
+
+            if row_number % 100 == 0:
+                elapsed_time = (datetime.now()-loading_start).total_seconds()
+                logger.info({
+                    'message': 'Loading row: {} {}'.format(str(row_number), log_str),
+                    'message_type': 'ValidatorInfo',
+                    'submission_id': submission_id,
+                    'job_id': job_id,
+                    'file_type': file_type,
+                    'action': 'data_loading',
+                    'status': 'loading',
+                    'rows_loaded': row_number,
+                    'start_time': loading_start,
+                    'elapsed_time': elapsed_time
+                })
+
+            # first phase of validations: read record and record a formatting error if there's a problem
+            (cells, reduceRow, skip_row, doneReading, rowErrorHere, flex_cols) = \
+                self.read_record(reader, error_csv, row_number, job, error_list)
+            if reduceRow:
+                row_number -= 1
+            if rowErrorHere:
+                error_rows.append(row_number)
+            if doneReading:
+                # Stop reading from input file
+                break
+            elif skip_row:
+                # Do not write this row to staging, but continue processing future rows
+                continue
+
+            # Rows are cleaned, checked, and loaded a chunk at a time
+            chunk.append((row_number, cells, flex_cols))
+            if len(chunk) >= self.chunk_size:
+                records = self.clean_chunk(chunk, row_cleaner, file_type, office_list)
+                error_rows.extend(self.process_chunk(model, records, job, csv_schema, required_list, type_list,
+                                                     error_csv, warning_csv, error_list))
+                chunk = []
+                add_job_phase_rows(job_id, row_number - progress_row)
+                progress_row = row_number
+
+        # process whatever is left over in the last chunk
+        if chunk:
+            records = self.clean_chunk(chunk, row_cleaner, file_type, office_list)
+            error_rows.extend(self.process_chunk(model, records, job, csv_schema, required_list, type_list, error_csv,
+                                                 warning_csv, error_list))
+        if row_number > progress_row:
+            add_job_phase_rows(job_id, row_number - progress_row)
+
+        return row_number, error_rows
+
+    def load_shards(self, reader, job, shards, required_list, type_list, office_list, error_csv, warning_csv,
+                    error_list):
+        """ Clean, check, and load each shard of a local file in its own worker process, then add their results to
+            this job's in file order. Each worker counts the records of its shard first, and is then told the row
+            number of its first record. If any shard doesn't parse, none of them are loaded.
+
+            Args:
+                reader: CsvReader that read the file's header
+                job: current job
+                shards: list of (start offset, end offset) tuples from shard_file
+                required_list: dict of labels for required errors, used for FABS
+                type_list: dict of labels for type errors, used for FABS
+                office_list: dict of office codes to sub tier codes, used for FABS
+                error_csv: csv writer for the error file
+                warning_csv: csv writer for the warning file
+                error_list: instance of ErrorInterface to keep track of errors
+
+            Returns:
+                tuple of the row number of the last row loaded and a list of the row numbers that had errors, or None
+                if a shard didn't parse, so the file has to be read in order to report the problem
+
+            Raises:
+                ResponseException: the shards didn't read the same rows the file was split into
+                Exception: a worker process failed
+        """
+        logger.info({
+            'message': 'Loading {} shards in separate processes'.format(len(shards)),
+            'message_type': 'ValidatorInfo',
+            'submission_id': job.submission_id,
+            'job_id': job.job_id,
+            'shards': len(shards)
+        })
+        work_dir = tempfile.mkdtemp()
+        try:
+            tasks = []
+            count_files = []
+            for idx, (start, end) in enumerate(shards):
+                count_read, count_write = os.pipe()
+                task = {
+                    'job_id': job.job_id, 'is_local': self.is_local, 'directory': self.directory,
+                    'filename': reader.filename, 'start': start, 'end': end, 'count_fd': count_write,
+                    'delimiter': reader.delimiter, 'expected_headers': reader.expected_headers,
+                    'flex_headers': reader.flex_headers, 'required_list': required_list, 'type_list': type_list,
+                    'office_list': office_list,
+                    'error_path': os.path.join(work_dir, 'shard_{}_errors.csv'.format(idx)),
+                    'warning_path': os.path.join(work_dir, 'shard_{}_warnings.csv'.format(idx)),
+                    'result_path': os.path.join(work_dir, 'shard_{}_result.pickle'.format(idx))
+                }
+                task_path = os.path.join(work_dir, 'shard_{}_task.pickle'.format(idx))
+                with open(task_path, 'wb') as task_file:
+                    pickle.dump(task, task_file)
+                tasks.append((task, subprocess.Popen([sys.executable, '-m',
+                                                      'dataactvalidator.validation_handlers.shard_worker',
+                                                      task_path], stdin=subprocess.PIPE, pass_fds=[count_write])))
+                os.close(count_write)
+                count_files.append(os.fdopen(count_read))
+
+            # The row numbers of each shard follow on from the records counted in the shards before it
+            record_counts = []
+            for count_file in count_files:
+                with count_file:
+                    count = count_file.readline().strip()
+                record_counts.append(int(count) if count else -1)
+            parsed = all(count >= 0 for count in record_counts)
+            first_row = 2
+            for (task, process), record_count in zip(tasks, record_counts):
+                task['first_row'] = first_row
+                first_row += record_count
+                if parsed:
+                    process.stdin.write('{}\n'.format(task['first_row']).encode())
+                process.stdin.close()
+            if not parsed:
+                for _, process in tasks:
+                    process.wait()
+                logger.info({
+                    'message': 'Shards of job {} could not be parsed, reading the file in order'.format(job.job_id),
+                    'message_type': 'ValidatorInfo',
+                    'submission_id': job.submission_id,
+                    'job_id': job.job_id
+                })
+                return None
+
+            # Wait for every shard to land before checking any of them
+            return_codes = [process.wait() for _, process in tasks]
+
+            row_number = 1
+            error_rows = []
+            for (task, _), return_code in zip(tasks, return_codes):
+                if return_code != 0:
+                    raise Exception('Worker loading rows {} onward of job {} exited with code {}'.format(
+                        task['first_row'], job.job_id, return_code))
+                with open(task['result_path'], 'rb') as result_file:
+                    result = pickle.load(result_file)
+                if task['first_row'] != row_number + 1:
+                    raise ResponseException("", StatusCode.CLIENT_ERROR, None, ValidationError.rowCountError)
+
+                row_number = result['row_number']
+                reader.row_count += result['row_count']
+                error_rows.extend(result['error_rows'])
+                error_list.merge(result['error_list'])
+                append_report(task['error_path'], error_csv)
+                append_report(task['warning_path'], warning_csv)
+            return row_number, error_rows
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def open_job_file(self, reader, job, fields, file_size, error_file_name):
+        """ Open a validation job's file and read its header. A file large enough to be split across worker processes
+            is copied locally first, since each worker reads its part of the file from the local copy.
+
+            Args:
+                reader: CsvReader to read the file with
+                job: the validation job whose file is read
+                fields: list of FileColumn objects for the file type
+                file_size: size of the file in bytes
+                error_file_name: name of the error report, which header errors are written to
+
+            Returns:
+                the number of worker processes to split the file across, 1 to read it in this process
+
+            Raises:
+                ResponseException: the file's header is missing or has problems
+        """
+        bucket_name = CONFIG_BROKER['aws_bucket']
+        region_name = CONFIG_BROKER['aws_region']
+
+        shard_workers = self.ingest_workers if file_size >= INGEST_SHARD_MIN_SIZE else 1
+        read_region, read_bucket, read_file_name = region_name, bucket_name, job.filename
+        if shard_workers > 1 and region_name and bucket_name:
+            read_file_name = reader.get_filename(region_name, bucket_name, job.filename)
+            read_region, read_bucket = None, None
+
+        # Pull file and return info on whether it's using short or long col headers. The file is streamed and read
+        # once, non-UTF8 characters throw a File Level Error when they are reached
+        reader.open_file(read_region, read_bucket, read_file_name, fields, bucket_name,
+                         self.get_file_name(error_file_name), self.daims_to_short_dict[job.file_type_id],
+                         self.short_to_daims_dict[job.file_type_id], is_local=self.is_local)
+        return shard_workers
+
+    def load_file(self, reader, job, model, fields, shard_workers, required_list, type_list, office_list, error_csv,
+                  warning_csv, error_list):
+        """ Clean, check, and load the rows of a validation job's file into the staging and flex tables
+
+            Args:
+                reader: CsvReader the file was opened with by open_job_file
+                job: the validation job whose file is loaded
+                model: ORM model of the staging table for the file type
+                fields: list of FileColumn objects for the file type
+                shard_workers: number of worker processes to split the file across, from open_job_file
+                required_list: dict of labels for required errors, used for FABS
+                type_list: dict of labels for type errors, used for FABS
+                office_list: dict of office codes to sub tier codes, used for FABS
+                error_csv: csv writer for the error file
+                warning_csv: csv writer for the warning file
+                error_list: instance of ErrorInterface to keep track of errors
+
+            Returns:
+                tuple of the row number of the last row loaded and a list of the row numbers that had errors
+
+            Raises:
+                ResponseException: the rows loaded don't match the records in the file
+        """
+        # The cleaner is worked out once for the columns this file has
+        row_cleaner = RowCleaner(fields, self.long_to_short_dict[job.file_type_id], reader.expected_columns)
+        csv_schema = {row.name_short: row for row in fields}
+
+        shards = shard_file(reader.filename, reader.delimiter, shard_workers) if shard_workers > 1 else None
+        loaded = None
+        if shards and len(shards) > 1:
+            loaded = self.load_shards(reader, job, shards, required_list, type_list, office_list, error_csv,
+                                      warning_csv, error_list)
+        if loaded is None:
+            loaded = self.load_rows(reader, job, model, csv_schema, row_cleaner, required_list, type_list,
+                                    office_list, error_csv, warning_csv, error_list)
+        row_number, error_rows = loaded
+
+        # Ensure the rows loaded match the number of records counted as the file was read
+        if reader.row_count != row_number:
+            raise ResponseException("", StatusCode.CLIENT_ERROR, None, ValidationError.rowCountError)
+        return row_number, error_rows
 
     def run_validation(self, job):
         """ Run validations for specified job
@@ -181,30 +603,39 @@ class ValidationManager:
         # Get orm model for this file
         model = [ft.model for ft in FILE_TYPE if ft.name == file_type][0]
 
-        # Delete existing file level errors for this submission
-        sess.query(ErrorMetadata).filter(ErrorMetadata.job_id == job_id).delete()
+        # If neither the file nor the rules it's checked against have changed since this job last finished, the
+        # staging rows, error metadata, and error reports from that run are still correct. That's unless the staging
+        # rows were dropped along with the submission's staging partitions when it was certified
+        file_hash = get_file_hash(job.filename)
+        rule_set_hash = get_rule_set_hash(job)
+        if file_type != 'fabs' and file_hash is not None and job.file_hash == file_hash and \
+                job.rule_set_hash == rule_set_hash and not staging_released(sess, model, submission_id):
+            self.reuse_validation(job)
+            return True
+
+        # Clear the hashes and row count of the last run until this one finishes
+        job.file_hash = None
+        job.rule_set_hash = None
+        job.number_of_rows = None
+        job.previous_number_of_rows = None
         sess.commit()
+        clear_job_phases(job_id)
 
-        # Clear existing records for this submission
-        sess.query(model).filter_by(submission_id=submission_id).delete()
+        # Delete existing file level errors for this submission, including any set aside when the file was uploaded
+        sess.query(ErrorMetadata).filter(or_(ErrorMetadata.job_id == job_id, ErrorMetadata.previous_job_id == job_id)).\
+            delete(synchronize_session=False)
         sess.commit()
 
-        # Clear existing flex fields for this job
-        sess.query(FlexField).filter_by(job_id=job_id).delete()
-        sess.commit()
+        clear_staging_data(sess, model, job)
 
         # If local, make the error report directory
         if self.is_local and not os.path.exists(self.directory):
             os.makedirs(self.directory)
-        # Get bucket name and file name
+        # Get file name
         file_name = job.filename
-        bucket_name = CONFIG_BROKER['aws_bucket']
-        region_name = CONFIG_BROKER['aws_region']
 
         error_file_name = report_file_name(job.submission_id, False, job.file_type.name)
-        error_file_path = "".join([CONFIG_SERVICES['error_report_path'], error_file_name])
         warning_file_name = report_file_name(job.submission_id, True, job.file_type.name)
-        warning_file_path = "".join([CONFIG_SERVICES['error_report_path'], warning_file_name])
 
         # Create File Status object
         create_file_if_needed(job_id, file_name)
@@ -220,40 +651,20 @@ class ValidationManager:
         sess.commit()
 
         # Get fields for this file
-        fields = sess.query(FileColumn).filter(FileColumn.file_id == FILE_TYPE_DICT[file_type])\
-            .order_by(FileColumn.daims_name.asc()).all()
-
-        for field in fields:
-            sess.expunge(field)
-
-        csv_schema = {row.name_short: row for row in fields}
+        fields = get_file_columns(sess, file_type)
 
         try:
             extension = os.path.splitext(file_name)[1]
             if not extension or extension.lower() not in ['.csv', '.txt']:
                 raise ResponseException("", StatusCode.CLIENT_ERROR, None, ValidationError.fileTypeError)
 
-            # Count file rows: throws a File Level Error for non-UTF8 characters
-            temp_file = open(reader.get_filename(region_name, bucket_name, file_name), encoding='utf-8')
-            file_row_count = sum(1 for line in csv.reader(temp_file) if line)
-            try:
-                temp_file.close()
-            except AttributeError:
-                # File does not exist, and so does not need to be closed
-                pass
-
-            # Pull file and return info on whether it's using short or long col headers
-            reader.open_file(region_name, bucket_name, file_name, fields, bucket_name,
-                             self.get_file_name(error_file_name), self.daims_to_short_dict[job.file_type_id],
-                             self.short_to_daims_dict[job.file_type_id], is_local=self.is_local)
+            shard_workers = self.open_job_file(reader, job, fields, file_size, error_file_name)
 
             # list to keep track of rows that fail validations
             error_rows = []
 
-            # While not done, pull one row and put it into staging table if it passes
-            # the Validator
-
             loading_start = datetime.now()
+            start_job_phase(job_id, 'staging_load')
             logger.info({
                 'message': 'Beginning data loading {}'.format(log_str),
                 'message_type': 'ValidatorInfo',
@@ -265,123 +676,35 @@ class ValidationManager:
                 'start_time': loading_start
             })
 
-            with open(error_file_path, 'w', newline='') as error_file,\
-                    open(warning_file_path, 'w', newline='') as warning_file:
-                error_csv = csv.writer(error_file, delimiter=',', quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
-                warning_csv = csv.writer(warning_file, delimiter=',', quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
-
-                required_list = None
-                type_list = None
-                office_list = {}
-                if file_type == "fabs":
-                    # create a list of all required/type labels for FABS
-                    labels = sess.query(ValidationLabel).all()
-                    required_list = {}
-                    type_list = {}
-                    for label in labels:
-                        if label.label_type == "requirement":
-                            required_list[label.column_name] = label.label
-                        else:
-                            type_list[label.column_name] = label.label
-
-                    # Create a list of all offices
-                    offices = sess.query(Office.office_code, Office.sub_tier_code).all()
-                    for office in offices:
-                        office_list[office.office_code] = office.sub_tier_code
-
-                    # Clear out office list to save space
-                    del offices
-
-                # write headers to file
-                error_csv.writerow(self.report_headers)
-                warning_csv.writerow(self.report_headers)
-                while not reader.is_finished:
-                    row_number += 1
-
-                    if row_number % 100 == 0:
-                        elapsed_time = (datetime.now()-loading_start).total_seconds()
-                        logger.info({
-                            'message': 'Loading row: {} {}'.format(str(row_number), log_str),
-                            'message_type': 'ValidatorInfo',
-                            'submission_id': submission_id,
-                            'job_id': job_id,
-                            'file_type': file_type,
-                            'action': 'data_loading',
-                            'status': 'loading',
-                            'rows_loaded': row_number,
-                            'start_time': loading_start,
-                            'elapsed_time': elapsed_time
-                        })
-
-                    # first phase of validations: read record and record a formatting error if there's a problem
-                    (record, reduceRow, skip_row, doneReading, rowErrorHere, flex_cols) = \
-                        self.read_record(reader, error_csv, row_number, job, fields, error_list)
-                    if reduceRow:
-                        row_number -= 1
-                    if rowErrorHere:
-                        error_rows.append(row_number)
-                    if doneReading:
-                        # Stop reading from input file
-                        break
-                    elif skip_row:
-                        # Do not write this row to staging, but continue processing future rows
-                        continue
-
-                    # second phase of validations: do basic schema checks (e.g., require fields, field length,
-                    # data type)
-
-                    # D files are generated from other systems (FABS and FPDS) that perform their own basic
-                    # validations, so these validations are not repeated here
-                    if file_type in ["award", "award_procurement"]:
-                        # Skip basic validations for D files, set as valid to trigger write to staging
-                        passed_validations = True
-                        valid = True
+            required_list = None
+            type_list = None
+            office_list = {}
+            if file_type == "fabs":
+                # create a list of all required/type labels for FABS
+                labels = sess.query(ValidationLabel).all()
+                required_list = {}
+                type_list = {}
+                for label in labels:
+                    if label.label_type == "requirement":
+                        required_list[label.column_name] = label.label
                     else:
-                        if file_type == "fabs":
-                            # Derive awarding sub tier agency code if it wasn't provided
-                            if not record.get('awarding_sub_tier_agency_c'):
-                                office_code = record.get('awarding_office_code')
-                                record['awarding_sub_tier_agency_c'] = office_list.get(office_code)
-
-                            # Create afa_generated_unique
-                            record['afa_generated_unique'] = (record['awarding_sub_tier_agency_c'] or '-none-') + "_" +\
-                                                             (record['fain'] or '-none-') + "_" + \
-                                                             (record['uri'] or '-none-') + "_" + \
-                                                             (record['cfda_number'] or '-none-') + "_" + \
-                                                             (record['award_modification_amendme'] or '-none-')
-                            # Create unique_award_key
-                            if str(record['record_type']) == '1':
-                                unique_award_key_list = ['ASST_AGG', record['uri'] or '-none-']
-                            else:
-                                unique_award_key_list = ['ASST_NON', record['fain'] or '-none-']
-                            unique_award_key_list.append(record['awarding_sub_tier_agency_c'] or '-none-')
-
-                            record['unique_award_key'] = '_'.join(unique_award_key_list).upper()
-
-                        passed_validations, failures, valid = Validator.validate(record, csv_schema,
-                                                                                 file_type == "fabs",
-                                                                                 required_list, type_list)
-                    if valid:
-                        # todo: update this logic later when we have actual validations
-                        if file_type == "fabs":
-                            record["is_valid"] = True
-
-                        model_instance = model(job_id=job_id, submission_id=submission_id,
-                                               valid_record=passed_validations, **record)
-                        skip_row = not insert_staging_model(model_instance, job, error_csv, error_list)
-                        if flex_cols:
-                            sess.add_all(flex_cols)
-                            sess.commit()
-
-                        if skip_row:
-                            error_rows.append(row_number)
-                            continue
-
-                    if not passed_validations:
-                        fatal = write_errors(failures, job, self.short_to_long_dict[job.file_type_id], error_csv,
-                                             warning_csv, row_number, error_list, flex_cols)
-                        if fatal:
-                            error_rows.append(row_number)
+                        type_list[label.column_name] = label.label
+
+                # Create a list of all offices
+                offices = sess.query(Office.office_code, Office.sub_tier_code).all()
+                for office in offices:
+                    office_list[office.office_code] = office.sub_tier_code
+
+                # Clear out office list to save space
+                del offices
+
+            # the reports are written out as the rows are checked
+            with self.report_writer(error_file_name, self.report_headers) as error_csv,\
+                    self.report_writer(warning_file_name, self.report_headers) as warning_csv:
+                row_number, load_error_rows = self.load_file(reader, job, model, fields, shard_workers, required_list,
+                                                             type_list, office_list, error_csv, warning_csv,
+                                                             error_list)
+                error_rows.extend(load_error_rows)
 
                 loading_duration = (datetime.now()-loading_start).total_seconds()
                 logger.info({
@@ -399,30 +722,18 @@ class ValidationManager:
                 })
 
                 if file_type in ('appropriations', 'program_activity', 'award_financial'):
+                    start_job_phase(job_id, 'tas_linkage', row_number - 1)
                     update_tas_ids(model, submission_id)
 
                 # third phase of validations: run validation rules as specified in the schema guidance. These
                 # validations are sql-based.
+                start_job_phase(job_id, 'sql_rules', row_number - 1)
                 sql_error_rows = self.run_sql_validations(job, file_type, self.short_to_long_dict[job.file_type_id],
                                                           error_csv, warning_csv, row_number, error_list)
                 error_rows.extend(sql_error_rows)
-            error_file.close()
-            warning_file.close()
-
-            # stream file to S3 when not local
-            if not self.is_local:
-                s3_resource = boto3.resource('s3', region_name=region_name)
-                # stream error file
-                with open(error_file_path, 'rb') as csv_file:
-                    s3_resource.Object(bucket_name, self.get_file_name(error_file_name)).put(Body=csv_file)
-                csv_file.close()
-                os.remove(error_file_path)
-
-                # stream warning file
-                with open(warning_file_path, 'rb') as warning_csv_file:
-                    s3_resource.Object(bucket_name, self.get_file_name(warning_file_name)).put(Body=warning_csv_file)
-                warning_csv_file.close()
-                os.remove(warning_file_path)
+
+                # The reports are finished off along with the rest of the job's results
+                start_job_phase(job_id, 'finalizing', row_number - 1)
 
             # Calculate total number of rows in file
             # that passed validations
@@ -443,13 +754,11 @@ class ValidationManager:
                     update({"reporting_start_date": min_action_date, "reporting_end_date": max_action_date},
                            synchronize_session=False)
 
-            # Ensure validated rows match initial row count
-            if file_row_count != row_number:
-                raise ResponseException("", StatusCode.CLIENT_ERROR, None, ValidationError.rowCountError)
-
             # Update job metadata
             job.number_of_rows = row_number
             job.number_of_rows_valid = valid_rows
+            job.file_hash = file_hash
+            job.rule_set_hash = rule_set_hash
             sess.commit()
 
             error_list.write_all_row_errors(job_id)
@@ -461,6 +770,7 @@ class ValidationManager:
                 populate_submission_error_info(submission_id)
 
             # Mark validation as finished in job tracker
+            finish_job_phase(job_id)
             mark_job_status(job_id, "finished")
             mark_file_complete(job_id, file_name)
 
@@ -473,6 +783,19 @@ class ValidationManager:
                 'file_type': job.file_type.name,
                 'traceback': traceback.format_exc()
             })
+            # The rows are committed as they're loaded, so those loaded before the file turned out to be unreadable
+            # (e.g. bad characters part way through) or before anything else went wrong are removed
+            try:
+                sess.rollback()
+                clear_staging_data(sess, model, job)
+            except SQLAlchemyError:
+                logger.error({
+                    'message': 'Unable to clear the staging rows of a failed validation',
+                    'message_type': 'ValidatorError',
+                    'submission_id': job.submission_id,
+                    'job_id': job.job_id,
+                    'traceback': traceback.format_exc()
+                })
             raise
 
         finally:
@@ -495,6 +818,109 @@ class ValidationManager:
 
         return True
 
+    def reuse_validation(self, job):
+        """ Finish a validation job using the results of its last run, for a file that hasn't changed since then. The
+            staging rows, flex fields, and error reports are left as they are.
+
+            Args:
+                job: Job to be finished
+        """
+        sess = GlobalDB.db().session
+        logger.info({
+            'message': 'File unchanged since last validation, reusing results on submission_id: {}, job_id: {}, '
+                       'file_type: {}'.format(job.submission_id, job.job_id, job.file_type.name),
+            'message_type': 'ValidatorInfo',
+            'submission_id': job.submission_id,
+            'job_id': job.job_id,
+            'file_type': job.file_type.name,
+            'action': 'run_validations',
+            'status': 'reused'
+        })
+
+        # If the file was uploaded again, put back the row count and error metadata that were set aside, under its
+        # new name
+        if job.previous_number_of_rows is not None:
+            job.number_of_rows = job.previous_number_of_rows
+            job.previous_number_of_rows = None
+        sess.query(ErrorMetadata).filter(ErrorMetadata.previous_job_id == job.job_id).\
+            update({'job_id': job.job_id, 'previous_job_id': None}, synchronize_session=False)
+        sess.query(ErrorMetadata).filter(ErrorMetadata.job_id == job.job_id).\
+            update({'filename': job.filename}, synchronize_session=False)
+        if CONFIG_BROKER["use_aws"]:
+            job.file_size = S3Handler.get_file_size(job.filename)
+        else:
+            job.file_size = os.path.getsize(job.filename)
+        sess.commit()
+
+        populate_job_error_info(job)
+        clear_job_phases(job.job_id)
+        start_job_phase(job.job_id, 'finalizing', (job.number_of_rows or 1) - 1)
+        finish_job_phase(job.job_id)
+        mark_job_status(job.job_id, "finished")
+        mark_file_complete(job.job_id, job.filename)
+
+    def reload_released_files(self, submission_id):
+        """ Load the staging rows of the submission's files again if they were dropped along with its staging
+            partitions when it was certified, so the cross-file rules see them. Only the staging and flex tables are
+            reloaded; the file jobs keep their status, hashes, error metadata, and reports from when they were
+            validated.
+
+            Args:
+                submission_id: the submission being cross-file validated
+        """
+        sess = GlobalDB.db().session
+        file_jobs = sess.query(Job).filter(Job.submission_id == submission_id,
+                                           Job.job_type_id == JOB_TYPE_DICT['csv_record_validation']).all()
+        for file_job in file_jobs:
+            model = [ft.model for ft in FILE_TYPE if ft.id == file_job.file_type_id][0]
+            if staging_released(sess, model, submission_id):
+                logger.info({
+                    'message': 'Reloading staging rows dropped after certification on submission_id: {}, job_id: {}, '
+                               'file_type: {}'.format(submission_id, file_job.job_id, file_job.file_type.name),
+                    'message_type': 'ValidatorInfo',
+                    'submission_id': submission_id,
+                    'job_id': file_job.job_id,
+                    'file_type': file_job.file_type.name
+                })
+                self.reload_staging(file_job, model)
+
+    def reload_staging(self, job, model):
+        """ Load a validated file into the staging tables again and link its rows to their TAS, without touching the
+            job's results. The errors found while loading were already reported when the file was validated, so they
+            go to a scratch report that's thrown away.
+
+            Args:
+                job: the finished validation job of the file
+                model: ORM model of the staging table for the file type
+        """
+        sess = GlobalDB.db().session
+        clear_staging_data(sess, model, job)
+        fields = get_file_columns(sess, job.file_type.name)
+        file_size = job.file_size
+        if file_size is None:
+            file_size = S3Handler.get_file_size(job.filename) if CONFIG_BROKER["use_aws"] else \
+                os.path.getsize(job.filename)
+
+        reader = CsvReader()
+        work_dir = tempfile.mkdtemp()
+        try:
+            # The header passed when the file was validated, so any problem with it now goes to a report of its own
+            # rather than replacing the file's error report
+            header_report = 'submission_{}_{}_reload_header_error.csv'.format(job.submission_id, job.file_type.name)
+            shard_workers = self.open_job_file(reader, job, fields, file_size, header_report)
+            with CsvLocalWriter(os.path.join(work_dir, 'errors.csv'), self.report_headers) as error_csv,\
+                    CsvLocalWriter(os.path.join(work_dir, 'warnings.csv'), self.report_headers) as warning_csv:
+                self.load_file(reader, job, model, fields, shard_workers, None, None, {}, error_csv, warning_csv,
+                               ErrorInterface())
+            update_tas_ids(model, job.submission_id)
+        except Exception:
+            sess.rollback()
+            clear_staging_data(sess, model, job)
+            raise
+        finally:
+            reader.close()
+            shutil.rmtree(work_dir, ignore_errors=True)
+
     def run_sql_validations(self, job, file_type, short_colnames, writer, warning_writer, row_number, error_list):
         """ Run all SQL rules for this file type
 
@@ -508,42 +934,47 @@ class ValidationManager:
             error_list: instance of ErrorInterface to keep track of errors
 
         Returns:
-            a list of the row numbers that failed one of the sql-based validations
+            a set of the row numbers that failed one of the sql-based validations
         """
         job_id = job.job_id
-        error_rows = []
-        sql_failures = validate_file_by_sql(job, file_type, self.short_to_long_dict[job.file_type_id])
-        for failure in sql_failures:
-            # convert shorter, machine friendly column names used in the
-            # SQL validation queries back to their long names
-            if failure.field_name in short_colnames:
-                field_name = short_colnames[failure.field_name]
-            else:
-                field_name = failure.field_name
-
-            if failure.severity_id == RULE_SEVERITY_DICT['fatal']:
-                error_rows.append(failure.row)
-
-            try:
-                # If error is an int, it's one of our prestored messages
-                error_type = int(failure.error)
-                error_msg = ValidationError.get_error_message(error_type)
-            except ValueError:
-                # If not, treat it literally
-                error_msg = failure.error
-
-            if failure.severity_id == RULE_SEVERITY_DICT['fatal']:
-                writer.writerow([failure.unique_id, field_name, error_msg, failure.failed_value, failure.expected_value,
-                                 failure.difference, failure.flex_fields, str(failure.row), failure.original_label])
-            elif failure.severity_id == RULE_SEVERITY_DICT['warning']:
-                # write to warnings file
-                warning_writer.writerow([failure.unique_id, field_name, error_msg, failure.failed_value,
-                                         failure.expected_value, failure.difference, failure.flex_fields,
-                                         str(failure.row), failure.original_label])
-            # labeled errors
-            error_list.record_row_error(job_id, job.filename, field_name, failure.error, row_number,
-                                        failure.original_label, failure.file_type_id, failure.target_file_id,
-                                        failure.severity_id)
+        error_rows = set()
+
+        def write_failures(sql_failures):
+            """ Write a chunk of SQL rule failures to the reports as soon as they're read """
+            for failure in sql_failures:
+                # convert shorter, machine friendly column names used in the
+                # SQL validation queries back to their long names
+                if failure.field_name in short_colnames:
+                    field_name = short_colnames[failure.field_name]
+                else:
+                    field_name = failure.field_name
+
+                if failure.severity_id == RULE_SEVERITY_DICT['fatal']:
+                    error_rows.add(failure.row)
+
+                try:
+                    # If error is an int, it's one of our prestored messages
+                    error_type = int(failure.error)
+                    error_msg = ValidationError.get_error_message(error_type)
+                except ValueError:
+                    # If not, treat it literally
+                    error_msg = failure.error
+
+                if failure.severity_id == RULE_SEVERITY_DICT['fatal']:
+                    writer.writerow([failure.unique_id, field_name, error_msg, failure.failed_value,
+                                     failure.expected_value, failure.difference, failure.flex_fields,
+                                     str(failure.row), failure.original_label])
+                elif failure.severity_id == RULE_SEVERITY_DICT['warning']:
+                    # write to warnings file
+                    warning_writer.writerow([failure.unique_id, field_name, error_msg, failure.failed_value,
+                                             failure.expected_value, failure.difference, failure.flex_fields,
+                                             str(failure.row), failure.original_label])
+                # labeled errors
+                error_list.record_row_error(job_id, job.filename, field_name, failure.error, row_number,
+                                            failure.original_label, failure.file_type_id, failure.target_file_id,
+                                            failure.severity_id)
+
+        validate_file_by_sql(job, file_type, self.short_to_long_dict[job.file_type_id], write_failures)
         return error_rows
 
     def run_cross_validation(self, job):
@@ -561,6 +992,7 @@ class ValidationManager:
         error_list = ErrorInterface()
 
         submission_id = job.submission_id
+        self.reload_released_files(submission_id)
         job_start = datetime.now()
         logger.info({
             'message': 'Beginning cross-file validations on submission_id: ' + str(submission_id),
@@ -575,10 +1007,19 @@ class ValidationManager:
         sess.query(ErrorMetadata).filter(ErrorMetadata.job_id == job_id).delete()
         sess.commit()
 
-        # get all cross file rules from db
-        cross_file_rules = sess.query(RuleSql).filter_by(rule_cross_file_flag=True)
+        # The cross-file rules run over the rows of every file in the submission
+        submission_rows = sess.query(func.coalesce(func.sum(Job.number_of_rows - 1), 0)).\
+            filter(Job.submission_id == submission_id, Job.job_type_id == JOB_TYPE_DICT['csv_record_validation']).\
+            scalar()
+        clear_job_phases(job_id)
+        start_job_phase(job_id, 'cross_file', submission_rows)
 
-        # for each cross-file combo, run associated rules and create error report
+        # get all cross file rules from db, along with the file types the workers need for the reports
+        cross_file_rules = sess.query(RuleSql).filter_by(rule_cross_file_flag=True).\
+            options(joinedload(RuleSql.file), joinedload(RuleSql.target_file))
+
+        # gather the rules for each cross-file combo up front so the workers don't need the session
+        pair_rules = []
         for c in get_cross_file_pairs():
             first_file = c[0]
             second_file = c[1]
@@ -587,48 +1028,21 @@ class ValidationManager:
                 RuleSql.target_file_id == second_file.id), and_(
                 RuleSql.file_id == second_file.id,
                 RuleSql.target_file_id == first_file.id)))
-
-            # get error file name/path
-            error_file_name = report_file_name(submission_id, False, first_file.name, second_file.name)
-            error_file_path = "".join([CONFIG_SERVICES['error_report_path'], error_file_name])
-            warning_file_name = report_file_name(submission_id, True, first_file.name, second_file.name)
-            warning_file_path = "".join([CONFIG_SERVICES['error_report_path'], warning_file_name])
-
-            # open error report and gather failed rules within it
-            with open(error_file_path, 'w', newline='') as error_file,\
-                    open(warning_file_path, 'w', newline='') as warning_file:
-                error_csv = csv.writer(error_file, delimiter=',', quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
-                warning_csv = csv.writer(warning_file, delimiter=',', quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
-
-                # write headers to file
-                error_csv.writerow(self.cross_file_report_headers)
-                warning_csv.writerow(self.cross_file_report_headers)
-
-                # send comboRules to validator.crossValidate sql
-                current_cols_short_to_long = self.short_to_long_dict[first_file.id].copy()
-                current_cols_short_to_long.update(self.short_to_long_dict[second_file.id].copy())
-                cross_validate_sql(combo_rules.all(), submission_id, current_cols_short_to_long, job_id, error_csv,
-                                   warning_csv, error_list)
-            # close files
-            error_file.close()
-            warning_file.close()
-
-            # stream file to S3 when not local
-            if not self.is_local:
-                s3_resource = boto3.resource('s3', region_name=CONFIG_BROKER['aws_region'])
-                # stream error file
-                with open(error_file_path, 'rb') as csv_file:
-                    s3_resource.Object(CONFIG_BROKER['aws_bucket'], self.get_file_name(error_file_name)).\
-                        put(Body=csv_file)
-                csv_file.close()
-                os.remove(error_file_path)
-
-                # stream warning file
-                with open(warning_file_path, 'rb') as warning_csv_file:
-                    s3_resource.Object(CONFIG_BROKER['aws_bucket'], self.get_file_name(warning_file_name)).\
-                        put(Body=warning_csv_file)
-                warning_csv_file.close()
-                os.remove(warning_file_path)
+            pair_rules.append((first_file, second_file, combo_rules.all()))
+
+        # the combos are independent, run them concurrently and combine their errors in combo order once they're done
+        engine = GlobalDB.db().engine
+        with ThreadPoolExecutor(max_workers=self.cross_file_workers) as executor:
+            futures = [executor.submit(self.validate_cross_file_pair, first_file, second_file, combo_rules,
+                                       submission_id, job_id, engine)
+                       for first_file, second_file, combo_rules in pair_rules]
+            rule_executions = []
+            for future in futures:
+                pair_errors, pair_executions = future.result()
+                error_list.merge(pair_errors)
+                rule_executions.extend(pair_executions)
+        save_rule_executions(rule_executions)
+        start_job_phase(job_id, 'finalizing', submission_rows)
 
         # write all recorded errors to database
         error_list.write_all_row_errors(job_id)
@@ -636,6 +1050,7 @@ class ValidationManager:
         populate_job_error_info(job)
 
         # mark job status as "finished"
+        finish_job_phase(job_id)
         mark_job_status(job_id, "finished")
         job_duration = (datetime.now()-job_start).total_seconds()
         logger.info({
@@ -661,6 +1076,39 @@ class ValidationManager:
         # Mark validation complete
         mark_file_complete(job_id)
 
+    def validate_cross_file_pair(self, first_file, second_file, rules, submission_id, job_id, engine):
+        """ Run the cross-file rules for one pair of files on its own connection, write the error and warning reports
+            for the pair, streaming them to S3 when not local.
+
+            Args:
+                first_file: FileType of the first file in the pair
+                second_file: FileType of the second file in the pair
+                rules: list of RuleSql objects for the pair
+                submission_id: ID of the submission being validated
+                job_id: ID of the current cross-file job
+                engine: database engine to get a connection from
+
+            Returns:
+                ErrorInterface with the errors recorded for the pair and a list of dicts describing each rule's
+                execution
+        """
+        error_list = ErrorInterface()
+
+        error_file_name = report_file_name(submission_id, False, first_file.name, second_file.name)
+        warning_file_name = report_file_name(submission_id, True, first_file.name, second_file.name)
+
+        # gather failed rules into the reports as they're found
+        with self.report_writer(error_file_name, self.cross_file_report_headers) as error_csv,\
+                self.report_writer(warning_file_name, self.cross_file_report_headers) as warning_csv,\
+                engine.connect() as connection:
+            # send comboRules to validator.crossValidate sql
+            current_cols_short_to_long = self.short_to_long_dict[first_file.id].copy()
+            current_cols_short_to_long.update(self.short_to_long_dict[second_file.id].copy())
+            rule_executions = cross_validate_sql(rules, submission_id, current_cols_short_to_long, job_id, error_csv,
+                                                 warning_csv, error_list, connection)
+
+        return error_list, rule_executions
+
     def validate_job(self, job_id):
         """ Gets file for job, validates each row, and sends valid rows to a staging table
 
@@ -711,40 +1159,359 @@ class ValidationManager:
         return JsonResponse.create(StatusCode.OK, {"message": "Validation complete"})
 
 
+def get_file_hash(file_name):
+    """ Get a hash of the contents of an uploaded file. On AWS the ETag S3 already keeps is used so the file doesn't
+        need to be read.
+
+    Args:
+        file_name: name of the file in the submission bucket or path of the local file
+
+    Returns:
+        the hash of the file, or None if the file doesn't exist
+    """
+    if CONFIG_BROKER["use_aws"]:
+        return S3Handler.get_file_etag(file_name)
+    if not os.path.exists(file_name):
+        return None
+
+    file_hash = hashlib.sha256()
+    with open(file_name, 'rb') as local_file:
+        for block in iter(lambda: local_file.read(CHUNK_SIZE * 1024), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def get_rule_set_hash(job):
+    """ Get a hash of everything other than the file that affects the result of validating it: the schema and
+        single-file SQL rules for the file type, the reference data those rules use, and the submission's reporting
+        period.
+
+    Args:
+        job: the validation job
+
+    Returns:
+        the hash of the rules and schema
+    """
+    sess = GlobalDB.db().session
+    columns = sess.query(FileColumn.name_short, FileColumn.daims_name, FileColumn.field_types_id, FileColumn.required,
+                         FileColumn.padded_flag, FileColumn.length).\
+        filter_by(file_id=job.file_type_id).order_by(FileColumn.file_column_id).all()
+    rules = sess.query(RuleSql.rule_label, RuleSql.query_name, RuleSql.rule_sql, RuleSql.rule_error_message,
+                       RuleSql.rule_severity_id, RuleSql.expected_value).\
+        filter_by(file_id=job.file_type_id, rule_cross_file_flag=False).order_by(RuleSql.rule_sql_id).all()
+    submission = sess.query(Submission).filter_by(submission_id=job.submission_id).one()
+    reference_tables = ['tas_lookup'] + [table for table in REFERENCE_TABLES if table != 'tas_lookup' and any(
+        re.search(r'\b{}\b'.format(table), rule.rule_sql, re.IGNORECASE) for rule in rules)]
+
+    rule_set = [[tuple(column) for column in columns], [tuple(rule) for rule in rules],
+                str(submission.reporting_start_date), str(submission.reporting_end_date),
+                get_reference_data_versions(reference_tables)]
+    return hashlib.sha256(repr(rule_set).encode('utf-8')).hexdigest()
+
+
+def get_reference_data_versions(table_names):
+    """ Get a version of the data in each of the given tables that changes whenever rows are inserted, updated, or
+        deleted, taken from the counts Postgres keeps of each. The counts are read without scanning the tables, which
+        for the likes of zips and duns would take longer than the validations that are skipped. They can be up to a
+        second behind a load, or start over if the statistics are reset, either of which only means a file is
+        revalidated when it didn't need to be.
+
+    Args:
+        table_names: names of the reference data tables
+
+    Returns:
+        list of (table name, rows inserted, rows updated, rows deleted) tuples, ordered by table name
+    """
+    sess = GlobalDB.db().session
+    # Otherwise the counts could come from a snapshot taken earlier in the transaction
+    sess.execute('SELECT pg_stat_clear_snapshot()')
+    versions = sess.execute(
+        'SELECT relname, n_tup_ins, n_tup_upd, n_tup_del FROM pg_stat_user_tables '
+        'WHERE schemaname = current_schema() AND relname = ANY(:table_names) ORDER BY relname',
+        {'table_names': list(table_names)})
+    return [tuple(version) for version in versions]
+
+
+def staging_released(sess, model, submission_id):
+    """ Check whether a submission's staging rows for a file type were dropped with its staging partitions
+
+    Args:
+        sess: the database session
+        model: ORM model of the staging table for the file type
+        submission_id: the submission to check
+
+    Returns:
+        True if the file type's rows are kept in staging partitions and the submission's partition doesn't exist
+    """
+    return STAGING_PARTITIONS and model in PARTITIONED_MODELS and not has_staging_partition(sess, model, submission_id)
+
+
+def clear_staging_data(sess, model, job):
+    """ Remove the staging rows and flex fields loaded from a validation job's file
+
+    Args:
+        sess: the database session
+        model: ORM model of the staging table for the job's file type
+        job: the validation job
+    """
+    if STAGING_PARTITIONS and model in PARTITIONED_MODELS:
+        # Empty (or create) this submission's partitions of the staging and flex tables
+        reset_staging_partition(sess, model, job.submission_id)
+        reset_staging_partition(sess, FlexField, job.submission_id, job.file_type_id)
+        reset_staging_partition(sess, FlexFieldRow, job.submission_id, job.file_type_id)
+        sess.commit()
+    else:
+        # Clear existing records for this submission
+        sess.query(model).filter_by(submission_id=job.submission_id).delete()
+        sess.commit()
+
+        # Clear existing flex fields for this job
+        sess.query(FlexField).filter_by(job_id=job.job_id).delete()
+        sess.query(FlexFieldRow).filter_by(job_id=job.job_id).delete()
+        sess.commit()
+
+
 def update_tas_ids(model_class, submission_id):
     sess = GlobalDB.db().session
     submission = sess.query(Submission).filter_by(submission_id=submission_id).one()
 
-    subquery = matching_cars_subquery(sess, model_class, submission.reporting_start_date, submission.reporting_end_date)
-    sess.query(model_class).filter_by(submission_id=submission_id).\
-        update({getattr(model_class, 'tas_id'): subquery}, synchronize_session=False)
+    update_matching_cars(sess, model_class, submission.reporting_start_date, submission.reporting_end_date,
+                         model_class.submission_id == submission_id)
     sess.commit()
 
 
-def insert_staging_model(model, job, writer, error_list):
-    """ If there is an error during ORM insertion, mark that and continue
+def report_write_error(row_number, job, writer, error_list):
+    """ Report a row that couldn't be written into the staging tables
 
     Args:
-        model: ORM model instance for the current row
+        row_number: the row that couldn't be written
         job: Current job
         writer: CsvWriter object
         error_list: instance of ErrorInterface to keep track of errors
+    """
+    writer.writerow(['Formatting Error', ValidationError.writeErrorMsg, '', '', '', '', row_number, ''])
+    error_list.record_row_error(job.job_id, job.filename, 'Formatting Error', ValidationError.writeError,
+                                row_number, severity_id=RULE_SEVERITY_DICT['fatal'])
+
+
+def get_file_columns(sess, file_type):
+    """ Get the FileColumns of a file type, detached from the session
+
+    Args:
+        sess: the database session to use
+        file_type: name of the file type
 
     Returns:
-        True if insertion was a success, False otherwise
+        list of FileColumn objects ordered by DAIMS name
+    """
+    fields = sess.query(FileColumn).filter(FileColumn.file_id == FILE_TYPE_DICT[file_type])\
+        .order_by(FileColumn.daims_name.asc()).all()
+
+    for field in fields:
+        sess.expunge(field)
+    return fields
+
+
+def append_report(file_name, writer):
+    """ Copy the rows of a local report, without its header, to another report
+
+    Args:
+        file_name: path of the local report
+        writer: csv writer of the report to add the rows to
+    """
+    with open(file_name, newline='') as report:
+        rows = csv.reader(report)
+        next(rows, None)
+        for row in rows:
+            writer.writerow(row)
+
+
+def derive_fabs_fields(record, office_list):
+    """ Fill in the FABS fields that are derived from the rest of a cleaned record
+
+    Args:
+        record: dict of the cleaned record, updated in place
+        office_list: dict of office codes to sub tier codes
+    """
+    # Derive awarding sub tier agency code if it wasn't provided
+    if not record.get('awarding_sub_tier_agency_c'):
+        office_code = record.get('awarding_office_code')
+        record['awarding_sub_tier_agency_c'] = office_list.get(office_code)
+
+    # Create afa_generated_unique
+    record['afa_generated_unique'] = (record['awarding_sub_tier_agency_c'] or '-none-') + "_" + \
+                                     (record['fain'] or '-none-') + "_" + \
+                                     (record['uri'] or '-none-') + "_" + \
+                                     (record['cfda_number'] or '-none-') + "_" + \
+                                     (record['award_modification_amendme'] or '-none-')
+    # Create unique_award_key
+    if str(record['record_type']) == '1':
+        unique_award_key_list = ['ASST_AGG', record['uri'] or '-none-']
+    else:
+        unique_award_key_list = ['ASST_NON', record['fain'] or '-none-']
+    unique_award_key_list.append(record['awarding_sub_tier_agency_c'] or '-none-')
+
+    record['unique_award_key'] = '_'.join(unique_award_key_list).upper()
+
+
+def insert_staging_batch(model, records, flex_fields, job, writer, error_list):
+    """ Write a batch of records and their flex fields to the submission's staging tables using COPY. If either can't
+        be written as a whole, fall back to writing its records one at a time, into the same tables, so the rows that
+        fail are reported.
+
+    Args:
+        model: ORM model of the staging table for this file type
+        records: list of dicts representing the rows to insert
+        flex_fields: list of FlexField objects for all the records in the batch
+        writer: CsvWriter object
+        job: Current job
+        error_list: instance of ErrorInterface to keep track of errors
+
+    Returns:
+        set of the row numbers that could not be written to the staging tables
+    """
+    failed_rows = copy_staging_records(model.__table__, records, staging_table_name(model, job.submission_id), job,
+                                       writer, error_list)
+
+    if FLEX_FIELD_STORAGE == 'json':
+        flex_table = FlexFieldRow.__table__
+        flex_records = flex_field_documents(flex_fields)
+        flex_table_name = staging_table_name(FlexFieldRow, job.submission_id, job.file_type_id)
+    else:
+        flex_table = FlexField.__table__
+        flex_records = [{
+            'submission_id': flex_field.submission_id,
+            'job_id': flex_field.job_id,
+            'row_number': flex_field.row_number,
+            'header': flex_field.header,
+            'cell': flex_field.cell,
+            'file_type_id': flex_field.file_type_id
+        } for flex_field in flex_fields]
+        flex_table_name = staging_table_name(FlexField, job.submission_id, job.file_type_id)
+    failed_rows |= copy_staging_records(flex_table, flex_records, flex_table_name, job, writer, error_list,
+                                        reported_rows=failed_rows)
+    return failed_rows
+
+
+def copy_staging_records(table, records, table_name, job, writer, error_list, reported_rows=frozenset()):
+    """ Copy a batch of records into a staging table and commit them. If the batch can't be written as a whole, fall
+        back to writing the records one at a time, into the same table, so the rows that fail are reported.
+
+    Args:
+        table: the Table the records are for
+        records: list of dicts representing the rows to insert
+        table_name: name of the table to write to, e.g. the submission's partition of the staging table
+        job: Current job
+        writer: CsvWriter object
+        error_list: instance of ErrorInterface to keep track of errors
+        reported_rows: row numbers that were already reported and shouldn't be reported again
+
+    Returns:
+        set of the row numbers that could not be written
     """
     sess = GlobalDB.db().session
+    failed_rows = set()
     try:
-        sess.add(model)
+        copy_records(sess, table, records, table_name)
         sess.commit()
-    except SQLAlchemyError:
+    except (SQLAlchemyError, psycopg2.Error):
         sess.rollback()
-        # Write failed, move to next record
-        writer.writerow(['Formatting Error', ValidationError.writeErrorMsg, '', '', '', '', model.row_number, ''])
-        error_list.record_row_error(job.job_id, job.filename, 'Formatting Error', ValidationError.writeError,
-                                    model.row_number, severity_id=RULE_SEVERITY_DICT['fatal'])
-        return False
-    return True
+        logger.warning({
+            'message': 'Batch insert into {} failed, falling back to single row inserts'.format(table_name),
+            'message_type': 'ValidatorWarning',
+            'submission_id': job.submission_id,
+            'job_id': job.job_id,
+            'rows': len(records)
+        })
+        for record in records:
+            try:
+                copy_records(sess, table, [record], table_name)
+                sess.commit()
+            except (SQLAlchemyError, psycopg2.Error):
+                sess.rollback()
+                # Write failed, move to next record
+                if record['row_number'] not in failed_rows and record['row_number'] not in reported_rows:
+                    report_write_error(record['row_number'], job, writer, error_list)
+                failed_rows.add(record['row_number'])
+    return failed_rows
+
+
+def flex_field_documents(flex_fields):
+    """ Group flex fields into one flex_field_row record per row, with the cells as a JSON array of [header, cell] pairs
+        in column order. A file can have the same flex header more than once, so the cells aren't keyed by header.
+
+    Args:
+        flex_fields: list of FlexField objects
+
+    Returns:
+        list of dicts ready to be copied into the flex_field_row table
+    """
+    documents = OrderedDict()
+    for flex_field in flex_fields:
+        if flex_field.row_number not in documents:
+            documents[flex_field.row_number] = {
+                'submission_id': flex_field.submission_id,
+                'job_id': flex_field.job_id,
+                'file_type_id': flex_field.file_type_id,
+                'row_number': flex_field.row_number,
+                'cells': []
+            }
+        documents[flex_field.row_number]['cells'].append([flex_field.header, flex_field.cell])
+    for document in documents.values():
+        document['cells'] = json.dumps(document['cells'])
+    return list(documents.values())
+
+
+def copy_records(sess, table, records, table_name=None):
+    """ Stream records into a table with COPY. Keys that aren't columns of the table are ignored and python-side column
+        defaults are filled in the same way an ORM insert would.
+
+    Args:
+        sess: the database session to write with, the COPY is part of its current transaction
+        table: the Table to copy the records into
+        records: list of dicts mapping column names to values
+        table_name: name of the table to copy into if it isn't the Table itself (e.g. one of its partitions)
+    """
+    if not records:
+        return
+
+    provided = set().union(*records)
+    columns = [column for column in table.columns if column.name in provided or
+               (column.default is not None and (column.default.is_callable or column.default.is_scalar))]
+
+    copy_buffer = io.StringIO()
+    for record in records:
+        context = DefaultContext(record)
+        row = []
+        for column in columns:
+            if column.name in record:
+                row.append(record[column.name])
+            elif column.default.is_callable:
+                row.append(column.default.arg(context))
+            else:
+                row.append(column.default.arg)
+        copy_buffer.write(','.join(copy_csv_value(value) for value in row))
+        copy_buffer.write('\n')
+    copy_buffer.seek(0)
+
+    cursor = sess.connection().connection.cursor()
+    cursor.copy_expert('COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+        table_name or table.name, ', '.join(column.name for column in columns)), copy_buffer)
+
+
+def copy_csv_value(value):
+    """ Format a value as a field of COPY's csv format. NULLs are written as unquoted empty fields, which COPY reads as
+        NULL, and every other value is quoted, so an empty string stays an empty string.
+
+    Args:
+        value: the value to format
+
+    Returns:
+        the csv field
+    """
+    if value is None:
+        return ''
+    return '"{}"'.format(str(value).replace('"', '""'))
 
 
 def write_errors(failures, job, short_colnames, writer, warning_writer, row_number, error_list, flex_cols):
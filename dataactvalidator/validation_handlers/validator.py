@@ -1,16 +1,46 @@
-from collections import defaultdict, namedtuple
+from collections import defaultdict, namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from decimal import Decimal, DecimalException
 from datetime import datetime
 import logging
+import pickle
+import tempfile
+import threading
 
-from dataactcore.models.lookups import FIELD_TYPE_DICT_ID, FILE_TYPE_DICT, RULE_SEVERITY_DICT
-from dataactcore.models.validationModels import RuleSql
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import SQLAlchemyError
+
+from dataactcore.config import CONFIG_BROKER
+from dataactcore.interfaces.staging_partitions import reads_staging_partitions
+from dataactcore.models.lookups import FIELD_TYPE_DICT_ID, FILE_TYPE, FILE_TYPE_DICT, RULE_SEVERITY_DICT
+from dataactcore.models.validationModels import RuleExecution, RuleSql
 from dataactcore.models.domainModels import concat_display_tas_dict
+from dataactvalidator.validation_handlers.rule_fusion import (fused_columns, fused_query, is_single_select,
+                                                              parse_fusable_rule, split_fused_failures)
+from dataactvalidator.validation_handlers.rule_statements import execute_prepared_rule, SUBMISSION_PARAMETER
 from dataactvalidator.validation_handlers.validationError import ValidationError
 from dataactcore.interfaces.db import GlobalDB
 
 logger = logging.getLogger(__name__)
 
+# Number of single-file SQL rules run at the same time, each on its own database connection. 1 runs them serially
+SQL_RULE_WORKERS = CONFIG_BROKER.get('sql_rule_workers') or 1
+# Whether fusable single-file rules on the same staging table are checked together in one scan of the table
+SQL_RULE_FUSION = CONFIG_BROKER.get('sql_rule_fusion') or False
+# Number of rule failures read from the database, converted, and written to the reports at a time
+SQL_RULE_CHUNK_SIZE = CONFIG_BROKER.get('sql_rule_chunk_size') or 10000
+# Whether single SELECT rules are run as prepared statements, so they're only parsed (and eventually planned) once on
+# each database connection. Their failures are then read all at once instead of through a server-side cursor
+SQL_RULE_PREPARE = CONFIG_BROKER.get('sql_rule_prepare') or False
+# Rules that take at least this many seconds have their EXPLAIN (ANALYZE, BUFFERS) output saved with their timing.
+# When not set no plans are captured
+RULE_EXPLAIN_THRESHOLD = CONFIG_BROKER.get('rule_explain_threshold')
+FILE_TYPE_MODELS = {file_type.id: file_type.model for file_type in FILE_TYPE}
+
 Failure = namedtuple('Failure', ['unique_id', 'field', 'description', 'value', 'label', 'expected', 'severity'])
 ValidationFailure = namedtuple('ValidationFailure', ['unique_id', 'field_name', 'error', 'failed_value',
                                                      'expected_value', 'difference', 'flex_fields', 'row',
@@ -26,6 +56,13 @@ class Validator(object):
                           "object_class_program_activity": "op", "appropriation": "approp"}
     # Set of metadata fields that should not be directly validated
     META_FIELDS = ["row_number", "afa_generated_unique", "unique_award_key"]
+    # Patterns for the common, well-formed numeric values. Anything they don't match is run through check_type so the
+    # chunked checks accept exactly what the single record checks do
+    NUMBER_PATTERNS = {
+        "INT": r"^[+-]?\d+$",
+        "LONG": r"^[+-]?\d+$",
+        "DECIMAL": r"^[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?$"
+    }
 
     @classmethod
     def validate(cls, record, csv_schema, fabs_record=False, required_labels=None, type_labels=None):
@@ -118,6 +155,124 @@ class Validator(object):
             record_type_failure = True
         return (not record_failed), failed_rules, (not record_type_failure)
 
+    @classmethod
+    def validate_chunk(cls, records, csv_schema, fabs_record=False, required_labels=None, type_labels=None):
+        """
+        Run the same required, type, and length checks as validate on a chunk of records at once. The checks are
+        done a column at a time over the whole chunk and the failures are then gathered per record.
+
+        Args:
+        records -- list of dict representations of records, all with the same keys
+        csv_schema -- dict of schema for the current file.
+        fabs_record -- True if the records are FABS records
+        required_labels -- dict of labels for required errors by column, used for FABS records
+        type_labels -- dict of labels for type errors by column, used for FABS records
+
+        Returns:
+        List with one tuple per record, in the same order as records, matching what validate returns for that record
+        """
+        if not records:
+            return []
+
+        field_names = [field_name for field_name in records[0] if field_name not in cls.META_FIELDS]
+        frame = pd.DataFrame.from_records(records, columns=field_names)
+        row_count = len(records)
+
+        failed_rules = [[] for _ in range(row_count)]
+        record_failed = np.zeros(row_count, dtype=bool)
+        record_type_failure = np.zeros(row_count, dtype=bool)
+        blank_fields = np.zeros(row_count, dtype=int)
+
+        for field_name in field_names:
+            current_schema = csv_schema[field_name]
+            # Blanks are filled in before using .str, which older pandas refuses on a column that's entirely None
+            data = frame[field_name].fillna('').astype(object).str.strip()
+            blank = (data.str.len() == 0).values
+            blank_fields += blank
+
+            if current_schema.required and blank.any():
+                if fabs_record and required_labels and current_schema.name_short in required_labels:
+                    label = required_labels[current_schema.name_short]
+                else:
+                    label = ''
+                for idx in np.flatnonzero(blank):
+                    failed_rules[idx].append(Failure(None, field_name, ValidationError.requiredError, '', label,
+                                                     '(not blank)', 'fatal'))
+                record_failed |= blank
+
+            present = ~blank
+            if not present.any():
+                continue
+
+            current_type = FIELD_TYPE_DICT_ID[current_schema.field_types_id]
+            type_failed = np.zeros(row_count, dtype=bool)
+            type_failed[present] = cls._failed_type_checks(data[present], current_type)
+            if type_failed.any():
+                if fabs_record and type_labels and current_schema.name_short in type_labels:
+                    label = type_labels[current_schema.name_short]
+                else:
+                    label = ''
+                expected = 'This field must be a {}'.format(current_type.lower())
+                for idx in np.flatnonzero(type_failed):
+                    failed_rules[idx].append(Failure(None, field_name, ValidationError.typeError, data.iat[idx],
+                                                     label, expected, 'fatal'))
+                record_type_failure |= type_failed
+                record_failed |= type_failed
+
+            if current_schema.length is not None:
+                # Don't check value rules if type failed
+                too_long = present & ~type_failed
+                if too_long.any():
+                    too_long[too_long] = (data[too_long].str.len() > current_schema.length).values
+                if too_long.any():
+                    warning_type = 'fatal' if fabs_record else 'warning'
+                    expected = 'Max length: {}'.format(current_schema.length)
+                    for idx in np.flatnonzero(too_long):
+                        failed_rules[idx].append(Failure(None, field_name, ValidationError.lengthError,
+                                                         data.iat[idx], '', expected, warning_type))
+                    record_failed |= too_long
+
+        # if all columns are blank (empty row), set it so it doesn't add to the error messages or write the line,
+        # just ignore it
+        empty_rows = blank_fields == len(field_names)
+        record_failed[empty_rows] = False
+        record_type_failure[empty_rows] = True
+
+        results = []
+        for idx, record in enumerate(records):
+            failures = failed_rules[idx]
+            if failures:
+                if not fabs_record:
+                    unique_id = 'TAS: {}'.format(concat_display_tas_dict(record))
+                else:
+                    unique_id = 'AssistanceTransactionUniqueKey: {}'.format(record['afa_generated_unique'])
+                failures = [failure._replace(unique_id=unique_id) for failure in failures]
+            results.append((not record_failed[idx], failures, not record_type_failure[idx]))
+        return results
+
+    @classmethod
+    def _failed_type_checks(cls, data, datatype):
+        """ Determine which of a column of non-blank values are not of the correct type
+
+        Args:
+            data: pandas Series of stripped, non-blank values to be checked
+            datatype: Type to check against
+
+        Returns:
+            numpy array of booleans, True where the value is not of the specified type
+        """
+        if datatype is None or datatype == "STRING":
+            return np.zeros(len(data), dtype=bool)
+        if datatype == "BOOLEAN":
+            return (~data.str.upper().isin(cls.BOOLEAN_VALUES)).values
+        if datatype in cls.NUMBER_PATTERNS:
+            failed = ~data.str.contains(cls.NUMBER_PATTERNS[datatype]).values.astype(bool)
+            if failed.any():
+                # Less common spellings (e.g. "1_000" or "NaN") are left to check_type
+                failed[failed] = [not cls.check_type(value, datatype) for value in data[failed]]
+            return failed
+        return np.array([not cls.check_type(value, datatype) for value in data], dtype=bool)
+
     @staticmethod
     def check_type(data, datatype):
         """ Determine whether data is of the correct type
@@ -162,7 +317,8 @@ class Validator(object):
         raise ValueError("".join(["Data Type Error, Type: ", datatype, ", Value: ", data]))
 
 
-def cross_validate_sql(rules, submission_id, short_to_long_dict, job_id, error_csv, warning_csv, error_list):
+def cross_validate_sql(rules, submission_id, short_to_long_dict, job_id, error_csv, warning_csv, error_list,
+                       connection=None):
     """ Evaluate all sql-based rules for cross file validation
 
         Args:
@@ -173,8 +329,14 @@ def cross_validate_sql(rules, submission_id, short_to_long_dict, job_id, error_c
             error_csv: the csv to write errors to
             warning_csv: the csv to write warnings to
             error_list: instance of ErrorInterface to keep track of errors
+            connection: the connection to run the rules on, defaults to the global connection
+
+        Returns:
+            list of dicts describing each rule's execution, to be saved as RuleExecution rows
     """
-    conn = GlobalDB.db().connection
+    conn = connection or GlobalDB.db().connection
+    executions = []
+    rows_scanned = {}
 
     # Put each rule through evaluate, appending all failures into list
     for rule in rules:
@@ -189,17 +351,21 @@ def cross_validate_sql(rules, submission_id, short_to_long_dict, job_id, error_c
             'status': 'start',
             'start': rule_start
         })
-        failed_rows = conn.execute(rule.rule_sql.format(submission_id))
-        logger.info({
-            'message': 'Finished running cross-file rule {} on submission_id: {}.'.format(rule.query_name,
-                                                                                          str(submission_id)) +
-                       'Starting flex field gathering and file writing',
-            'message_type': 'ValidatorInfo',
-            'rule': rule.query_name,
-            'job_id': job_id,
-            'submission_id': submission_id
-        })
-        if failed_rows.rowcount:
+        rule_sql = rule.rule_sql
+        # The flex field lookups share the transaction, so they don't close the cursor the failures are read from
+        with reading_transaction(conn):
+            failed_rows = execute_rule_query(conn, rule_sql, submission_id)
+            query_duration = (datetime.now()-rule_start).total_seconds()
+            failure_count = 0
+            logger.info({
+                'message': 'Finished running cross-file rule {} on submission_id: {}.'.format(rule.query_name,
+                                                                                              str(submission_id)) +
+                           'Starting flex field gathering and file writing',
+                'message_type': 'ValidatorInfo',
+                'rule': rule.query_name,
+                'job_id': job_id,
+                'submission_id': submission_id
+            })
             rule_cols = failed_rows.keys()
             # get list of fields involved in this validation
             source_len = len('source_value_')
@@ -214,31 +380,29 @@ def cross_validate_sql(rules, submission_id, short_to_long_dict, job_id, error_c
             source_headers = [short_to_long_dict.get(field[source_len:], field[source_len:]) for field in source_cols]
             target_headers = [short_to_long_dict.get(field[target_len:], field[target_len:]) for field in target_cols]
 
-            # materialize as we'll iterate over the failed_rows twice
-            failed_rows = list(failed_rows)
-            num_failed_rows = len(failed_rows)
-            slice_start = 0
-            slice_size = 10000
-            while slice_start <= num_failed_rows:
-                # finding out row numbers for logger
-                last_error_curr_slice = slice_start + slice_size
-                failed_row_subset = failed_rows[slice_start:last_error_curr_slice]
-                if last_error_curr_slice > num_failed_rows:
-                    last_error_curr_slice = num_failed_rows
+            # Read the failures a chunk at a time so only one chunk is ever held in memory
+            while True:
+                fetch_start = datetime.now()
+                failed_row_subset = failed_rows.fetchmany(SQL_RULE_CHUNK_SIZE)
+                query_duration += (datetime.now()-fetch_start).total_seconds()
+                if not failed_row_subset:
+                    break
+                slice_start = failure_count
+                failure_count += len(failed_row_subset)
                 logger.info({
                     'message': 'Starting flex field gathering for cross-file rule ' +
                                '{} on submission_id: {} for '.format(rule.query_name, str(submission_id)) +
-                               'failure rows: {}-{}'.format(str(slice_start), str(last_error_curr_slice)),
+                               'failure rows: {}-{}'.format(str(slice_start), str(failure_count)),
                     'message_type': 'ValidatorInfo',
                     'rule': rule.query_name,
                     'job_id': job_id,
                     'submission_id': submission_id
                 })
-                source_flex_data = relevant_cross_flex_data(failed_row_subset, submission_id, rule.file_id)
+                source_flex_data = relevant_cross_flex_data(failed_row_subset, submission_id, rule.file_id, conn)
                 logger.info({
                     'message': 'Finished flex field gathering for cross-file rule ' +
                                '{} on submission_id: {} for '.format(rule.query_name, str(submission_id)) +
-                               'failure rows: {}-{}'.format(str(slice_start), str(last_error_curr_slice)),
+                               'failure rows: {}-{}'.format(str(slice_start), str(failure_count)),
                     'message_type': 'ValidatorInfo',
                     'rule': rule.query_name,
                     'job_id': job_id,
@@ -296,7 +460,13 @@ def cross_validate_sql(rules, submission_id, short_to_long_dict, job_id, error_c
                         warning_csv.writerow(failure[0:12])
                     error_list.record_row_error(job_id, 'cross_file', failure[1], failure[5], failure[10], failure[11],
                                                 failure[12], failure[13], severity_id=failure[14])
-                slice_start = slice_start + slice_size
+            failed_rows.close()
+
+        file_pair = (rule.file_id, rule.target_file_id)
+        if file_pair not in rows_scanned:
+            rows_scanned[file_pair] = count_staging_rows(conn, submission_id, file_pair)
+        executions.append(rule_execution(rule, conn, rule_sql, submission_id, job_id, rows_scanned[file_pair],
+                                         failure_count, query_duration))
 
         rule_duration = (datetime.now()-rule_start).total_seconds()
         logger.info({
@@ -311,17 +481,19 @@ def cross_validate_sql(rules, submission_id, short_to_long_dict, job_id, error_c
             'duration': rule_duration
         })
 
+    return executions
 
-def validate_file_by_sql(job, file_type, short_to_long_dict):
-    """ Check all SQL rules
+
+def validate_file_by_sql(job, file_type, short_to_long_dict, failure_handler, workers=None, fusion=None):
+    """ Check all SQL rules, passing their failures on a chunk at a time as they're read
 
     Args:
         job: the Job which is running
         file_type: file type being checked
         short_to_long_dict: mapping of short to long schema column names
-
-    Returns:
-        List of ValidationFailures
+        failure_handler: function called with each chunk of ValidationFailures, in rule order
+        workers: number of rules to run at the same time, defaults to the sql_rule_workers config setting
+        fusion: whether to check fusable rules together, defaults to the sql_rule_fusion config setting
     """
 
     sql_val_start = datetime.now()
@@ -337,60 +509,42 @@ def validate_file_by_sql(job, file_type, short_to_long_dict):
         'status': 'start',
         'start_time': sql_val_start
     })
-    sess = GlobalDB.db().session
+    db = GlobalDB.db()
+    sess = db.session
 
-    # Pull all SQL rules for this file type
+    # Pull all SQL rules for this file type, in a fixed order so the reports are the same however the rules are run
     file_id = FILE_TYPE_DICT[file_type]
-    rules = sess.query(RuleSql).filter_by(file_id=file_id, rule_cross_file_flag=False)
-    errors = []
+    rules = sess.query(RuleSql).filter_by(file_id=file_id, rule_cross_file_flag=False).\
+        order_by(RuleSql.rule_sql_id).all()
+    fusion = SQL_RULE_FUSION if fusion is None else fusion
+    rule_groups = fuse_rules(rules, file_id) if fusion else [([rule], None) for rule in rules]
+    workers = min(workers or SQL_RULE_WORKERS, len(rule_groups)) or 1
+    rows_scanned = count_staging_rows(sess, job.submission_id, [file_id])
+    failure_writer = OrderedFailureWriter(rules, failure_handler)
 
-    # For each rule, execute sql for rule
-    for rule in rules:
-        rule_start = datetime.now()
-        logger.info({
-            'message': 'Beginning SQL validation rule {} {}'.format(rule.query_name, log_string),
-            'message_type': 'ValidatorInfo',
-            'submission_id': job.submission_id,
-            'job_id': job.job_id,
-            'rule': rule.query_name,
-            'file_type': job.file_type.name,
-            'action': 'run_sql_validation_rule',
-            'status': 'start',
-            'start_time': rule_start
-        })
+    def run_rule_group(rule_group, connection):
+        group_rules, fusable_rules = rule_group
+        if fusable_rules is None:
+            return [run_sql_rule(group_rules[0], job, short_to_long_dict, file_id, log_string, connection,
+                                 rows_scanned, failure_writer)]
+        return run_fused_sql_rules(group_rules, fusable_rules, job, short_to_long_dict, file_id, log_string,
+                                   connection, rows_scanned, failure_writer)
 
-        failures = sess.execute(rule.rule_sql.format(job.submission_id))
-        if failures.rowcount:
-            # Create column list (exclude row_number)
-            cols = []
-            exact_names = ['row_number', 'difference']
-            starting = ('expected_value_', 'uniqueid_')
-            for col in failures.keys():
-                if col not in exact_names and not col.startswith(starting):
-                    cols.append(col)
-            col_headers = [short_to_long_dict.get(field, field) for field in cols]
-
-            # materialize as we'll iterate over the failures twice
-            failures = list(failures)
-            flex_data = relevant_flex_data(failures, job.job_id)
-
-            errors.extend(failure_row_to_tuple(rule, flex_data, cols, col_headers, file_id, failure)
-                          for failure in failures)
-
-        rule_duration = (datetime.now() - rule_start).total_seconds()
-        logger.info({
-            'message': 'Completed SQL validation rule {} {}'.format(rule.query_name, log_string),
-            'message_type': 'ValidatorInfo',
-            'submission_id': job.submission_id,
-            'job_id': job.job_id,
-            'rule': rule.query_name,
-            'file_type': job.file_type.name,
-            'action': 'run_sql_validation_rule',
-            'status': 'finish',
-            'start_time': rule_start,
-            'end_time': datetime.now(),
-            'duration': rule_duration
-        })
+    if workers == 1:
+        group_executions = [run_rule_group(rule_group, sess) for rule_group in rule_groups]
+    else:
+        # The rules are read-only queries against data that has already been committed, so each one can run on its
+        # own connection. The failure writer keeps the failures in rule order regardless of which finishes first.
+        def run_on_own_connection(rule_group):
+            with db.engine.connect() as connection:
+                return run_rule_group(rule_group, connection)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            group_executions = list(executor.map(run_on_own_connection, rule_groups))
+
+    executions_by_rule = {rule.rule_sql_id: execution for (group_rules, _), executions in
+                          zip(rule_groups, group_executions) for rule, execution in zip(group_rules, executions)}
+    save_rule_executions([executions_by_rule[rule.rule_sql_id] for rule in rules])
 
     sql_val_duration = (datetime.now()-sql_val_start).total_seconds()
     logger.info({
@@ -403,65 +557,478 @@ def validate_file_by_sql(job, file_type, short_to_long_dict):
         'status': 'finish',
         'start_time': sql_val_start,
         'end_time': datetime.now(),
-        'duration': sql_val_duration
+        'duration': sql_val_duration,
+        'workers': workers,
+        'rule_groups': len(rule_groups)
+    })
+
+
+class OrderedFailureWriter(object):
+    """ Passes the failures of a set of rules on to a handler in rule order, however the rules are run. The failures of
+        the rule whose turn it is go straight to the handler, while those of rules still waiting for their turn are
+        spooled to temporary files and passed on once every rule before them has finished. The handler is only ever
+        called by one thread at a time.
+    """
+
+    def __init__(self, rules, failure_handler):
+        """ Set up the writer
+
+            Args:
+                rules: the RuleSqls whose failures will be written, in the order they should be handled
+                failure_handler: function called with each chunk of ValidationFailures
+        """
+        self.positions = {rule.rule_sql_id: position for position, rule in enumerate(rules)}
+        self.failure_handler = failure_handler
+        self.next_position = 0
+        self.spools = {}
+        self.finished = set()
+        self.lock = threading.Lock()
+
+    def write(self, rule, failures):
+        """ Hand on or spool a chunk of a rule's failures
+
+            Args:
+                rule: the RuleSql the failures are for
+                failures: list of ValidationFailures
+        """
+        position = self.positions[rule.rule_sql_id]
+        with self.lock:
+            # A rule that started spooling keeps spooling, so its failures stay in order
+            if position == self.next_position and position not in self.spools:
+                self.failure_handler(failures)
+            else:
+                if position not in self.spools:
+                    self.spools[position] = tempfile.TemporaryFile()
+                pickle.dump(failures, self.spools[position], pickle.HIGHEST_PROTOCOL)
+
+    def finish(self, rule):
+        """ Mark a rule as finished, handing on the spooled failures of every rule whose turn has come
+
+            Args:
+                rule: the RuleSql that finished
+        """
+        with self.lock:
+            self.finished.add(self.positions[rule.rule_sql_id])
+            while self.next_position in self.finished:
+                spool = self.spools.pop(self.next_position, None)
+                if spool is not None:
+                    with spool:
+                        spool.seek(0)
+                        while True:
+                            try:
+                                failures = pickle.load(spool)
+                            except EOFError:
+                                break
+                            self.failure_handler(failures)
+                self.next_position += 1
+
+
+def fuse_rules(rules, file_id):
+    """ Group the fusable rules of a file type that read its staging table the same way, so each group can be checked
+        in one scan of the table. Rules that can't be fused are left in groups of their own.
+
+    Args:
+        rules: the RuleSqls to group, in the order they are run
+        file_id: the ID of the file type being checked
+
+    Returns:
+        List of tuples of the rules in each group and their FusableRules, or None when the group is a single rule
+    """
+    model = FILE_TYPE_MODELS.get(file_id)
+    groups = OrderedDict()
+    for rule in rules:
+        fusable_rule = parse_fusable_rule(rule.rule_sql, model.__tablename__) \
+            if rule.rule_fusable and model is not None else None
+        # Rules that can't be fused get a key of their own
+        key = ' '.join(fusable_rule.from_clause.lower().split()) if fusable_rule else rule.rule_sql_id
+        group_rules, fusable_rules = groups.setdefault(key, ([], []))
+        group_rules.append(rule)
+        fusable_rules.append(fusable_rule)
+    return [(group_rules, fusable_rules if len(group_rules) > 1 else None)
+            for group_rules, fusable_rules in groups.values()]
+
+
+def run_sql_rule(rule, job, short_to_long_dict, file_id, log_string, connection, rows_scanned, failure_writer):
+    """ Run a single SQL rule against the staging data for a job, reading its failures a chunk at a time
+
+    Args:
+        rule: the RuleSql to run
+        job: the Job which is running
+        short_to_long_dict: mapping of short to long schema column names
+        file_id: the ID of the file type being checked
+        log_string: submission, job, and file type description used in the log messages
+        connection: the session or connection to run the rule on
+        rows_scanned: number of rows in the staging table for the file
+        failure_writer: the OrderedFailureWriter to write the rule's ValidationFailures to
+
+    Returns:
+        dict describing the rule's execution
+    """
+    rule_start = datetime.now()
+    logger.info({
+        'message': 'Beginning SQL validation rule {} {}'.format(rule.query_name, log_string),
+        'message_type': 'ValidatorInfo',
+        'submission_id': job.submission_id,
+        'job_id': job.job_id,
+        'rule': rule.query_name,
+        'file_type': job.file_type.name,
+        'action': 'run_sql_validation_rule',
+        'status': 'start',
+        'start_time': rule_start
+    })
+
+    rule_sql = rule.rule_sql
+    failure_count = 0
+    with reading_transaction(connection):
+        failures = execute_rule_query(connection, rule_sql, job.submission_id)
+        keys = failures.keys()
+        query_duration = (datetime.now() - rule_start).total_seconds()
+        while True:
+            fetch_start = datetime.now()
+            chunk = failures.fetchmany(SQL_RULE_CHUNK_SIZE)
+            query_duration += (datetime.now() - fetch_start).total_seconds()
+            if not chunk:
+                break
+            failure_count += len(chunk)
+            failure_writer.write(rule, failures_to_tuples(rule, keys, chunk, job.job_id, short_to_long_dict, file_id,
+                                                          connection))
+        failures.close()
+    failure_writer.finish(rule)
+    execution = rule_execution(rule, connection, rule_sql, job.submission_id, job.job_id, rows_scanned,
+                               failure_count, query_duration)
+
+    rule_duration = (datetime.now() - rule_start).total_seconds()
+    logger.info({
+        'message': 'Completed SQL validation rule {} {}'.format(rule.query_name, log_string),
+        'message_type': 'ValidatorInfo',
+        'submission_id': job.submission_id,
+        'job_id': job.job_id,
+        'rule': rule.query_name,
+        'file_type': job.file_type.name,
+        'action': 'run_sql_validation_rule',
+        'status': 'finish',
+        'start_time': rule_start,
+        'end_time': datetime.now(),
+        'duration': rule_duration
     })
-    return errors
+    return execution
+
+
+def run_fused_sql_rules(rules, fusable_rules, job, short_to_long_dict, file_id, log_string, connection, rows_scanned,
+                        failure_writer):
+    """ Run a group of fused SQL rules against the staging data for a job in a single query, reading their failures a
+        chunk at a time
+
+    Args:
+        rules: the RuleSqls to run
+        fusable_rules: the FusableRules of the rules, from fuse_rules
+        job: the Job which is running
+        short_to_long_dict: mapping of short to long schema column names
+        file_id: the ID of the file type being checked
+        log_string: submission, job, and file type description used in the log messages
+        connection: the session or connection to run the rules on
+        rows_scanned: number of rows in the staging table for the file
+        failure_writer: the OrderedFailureWriter to write the rules' ValidationFailures to
+
+    Returns:
+        List of dicts describing each rule's execution, in the same order as the rules
+    """
+    rule_start = datetime.now()
+    query_names = ', '.join(rule.query_name for rule in rules)
+    logger.info({
+        'message': 'Beginning fused SQL validation rules {} {}'.format(query_names, log_string),
+        'message_type': 'ValidatorInfo',
+        'submission_id': job.submission_id,
+        'job_id': job.job_id,
+        'rule': query_names,
+        'file_type': job.file_type.name,
+        'action': 'run_fused_sql_validation_rules',
+        'status': 'start',
+        'start_time': rule_start
+    })
+
+    rule_sql = fused_query(fusable_rules)
+    failure_counts = [0] * len(rules)
+    # The failures come back sorted by rule, so each rule is finished once the failures move past it
+    current_rule = 0
+    with reading_transaction(connection):
+        results = execute_rule_query(connection, rule_sql, job.submission_id)
+        rule_columns = fused_columns(fusable_rules, results.keys())
+        query_duration = (datetime.now() - rule_start).total_seconds()
+        while True:
+            fetch_start = datetime.now()
+            chunk = results.fetchmany(SQL_RULE_CHUNK_SIZE)
+            query_duration += (datetime.now() - fetch_start).total_seconds()
+            if not chunk:
+                break
+            for rule_index, failures in split_fused_failures(rule_columns, chunk):
+                while current_rule < rule_index:
+                    failure_writer.finish(rules[current_rule])
+                    current_rule += 1
+                failure_counts[rule_index] += len(failures)
+                failure_writer.write(rules[rule_index], failures_to_tuples(
+                    rules[rule_index], rule_columns[rule_index][1], failures, job.job_id, short_to_long_dict,
+                    file_id, connection))
+        results.close()
+    for rule in rules[current_rule:]:
+        failure_writer.finish(rule)
+
+    # The rules share the query, so they share its time. Its plan is only captured once, with the first rule
+    executions = [rule_execution(rule, connection, rule_sql, job.submission_id, job.job_id, rows_scanned,
+                                 failure_count, query_duration / len(rules), explain=False)
+                  for rule, failure_count in zip(rules, failure_counts)]
+    executions[0]['explain_plan'] = explain_rule(connection, rule_sql, job.submission_id, query_duration)
+
+    rule_duration = (datetime.now() - rule_start).total_seconds()
+    logger.info({
+        'message': 'Completed fused SQL validation rules {} {}'.format(query_names, log_string),
+        'message_type': 'ValidatorInfo',
+        'submission_id': job.submission_id,
+        'job_id': job.job_id,
+        'rule': query_names,
+        'file_type': job.file_type.name,
+        'action': 'run_fused_sql_validation_rules',
+        'status': 'finish',
+        'start_time': rule_start,
+        'end_time': datetime.now(),
+        'duration': rule_duration
+    })
+    return executions
+
+
+@contextmanager
+def reading_transaction(connection):
+    """ Keep a connection in a single transaction while a rule's failures are read from it. Otherwise the statements
+        run between reads (e.g. creating the flex field lookup's temp table) are autocommitted, which closes the
+        server-side cursor the failures are being read from. Sessions are always in a transaction already.
+
+    Args:
+        connection: the session or connection the rule is run on
+    """
+    if isinstance(connection, Connection) and not connection.in_transaction():
+        with connection.begin():
+            yield
+    else:
+        yield
+
+
+def execute_rule_query(connection, rule_sql, submission_id, prepare=None):
+    """ Run a rule's query for a submission. Single SELECTs are run on a named, server-side cursor, so their results
+        are fetched from the database as they're read instead of all at once, or as prepared statements when
+        sql_rule_prepare is set. Rules that aren't a single SELECT (e.g. ones creating a function first) can be
+        neither, so they're run as usual. Rules reading staging tables with a child per submission aren't prepared,
+        since a generic plan would scan every submission's child.
+
+    Args:
+        connection: the session or connection to run the query on
+        rule_sql: the rule's SQL, with the submission ID as a bind parameter
+        submission_id: the ID of the submission to check
+        prepare: whether to run single SELECTs as prepared statements, defaults to the sql_rule_prepare config setting
+
+    Returns:
+        the ResultProxy of the query
+    """
+    params = {SUBMISSION_PARAMETER: submission_id}
+    if not is_single_select(rule_sql):
+        return connection.execute(text(rule_sql), params)
+    if (SQL_RULE_PREPARE if prepare is None else prepare) and not reads_staging_partitions(rule_sql):
+        return execute_prepared_rule(connection, rule_sql, submission_id)
+    if not isinstance(connection, Connection):
+        connection = connection.connection()
+    return connection.execution_options(stream_results=True).execute(text(rule_sql), params)
 
 
-def relevant_flex_data(failures, job_id):
+def failures_to_tuples(rule, keys, failures, job_id, short_to_long_dict, file_id, connection):
+    """ Convert the failures of a rule into ValidationFailures, along with the flex fields of the rows that failed
+
+    Args:
+        rule: the RuleSql the failures are for
+        keys: the names of the columns the rule returned
+        failures: list of the rows the rule returned
+        job_id: the ID of the job which is running
+        short_to_long_dict: mapping of short to long schema column names
+        file_id: the ID of the file type being checked
+        connection: the session or connection to look up flex fields with
+
+    Returns:
+        List of ValidationFailures
+    """
+    # Create column list (exclude row_number)
+    cols = []
+    exact_names = ['row_number', 'difference']
+    starting = ('expected_value_', 'uniqueid_')
+    for col in keys:
+        if col not in exact_names and not col.startswith(starting):
+            cols.append(col)
+    col_headers = [short_to_long_dict.get(field, field) for field in cols]
+
+    flex_data = relevant_flex_data(failures, job_id, connection)
+    return [failure_row_to_tuple(rule, flex_data, cols, col_headers, file_id, failure) for failure in failures]
+
+
+def count_staging_rows(connection, submission_id, file_type_ids):
+    """ Count the staging rows a rule has to look through for a submission
+
+    Args:
+        connection: the session or connection to count with
+        submission_id: ID of the submission being validated
+        file_type_ids: IDs of the file types the rule checks
+
+    Returns:
+        the total number of rows in the staging tables for the file types
+    """
+    rows = 0
+    for file_type_id in file_type_ids:
+        model = FILE_TYPE_MODELS.get(file_type_id)
+        if model is not None:
+            table = model.__table__
+            rows += connection.execute(select([func.count()]).select_from(table).
+                                       where(table.c.submission_id == submission_id)).scalar()
+    return rows
+
+
+def rule_execution(rule, connection, rule_sql, submission_id, job_id, rows_scanned, failure_count, duration,
+                   explain=True):
+    """ Describe a single run of a rule, capturing its query plan if it was slow
+
+    Args:
+        rule: the RuleSql that was run
+        connection: the session or connection the rule was run on
+        rule_sql: the SQL that was run for the rule
+        submission_id: ID of the submission being validated
+        job_id: ID of the job running the rule
+        rows_scanned: number of staging rows for the file types the rule checks
+        failure_count: number of failures the rule returned
+        duration: number of seconds the rule's query took
+        explain: whether to capture the query plan if the rule was slow
+
+    Returns:
+        dict of the values for a RuleExecution row
+    """
+    explain_plan = explain_rule(connection, rule_sql, submission_id, duration) if explain else None
+
+    return {'rule_label': rule.rule_label, 'query_name': rule.query_name, 'submission_id': submission_id,
+            'job_id': job_id, 'file_type_id': rule.file_id, 'target_file_type_id': rule.target_file_id,
+            'rows_scanned': rows_scanned, 'failures': failure_count, 'duration': duration,
+            'explain_plan': explain_plan}
+
+
+def explain_rule(connection, rule_sql, submission_id, duration):
+    """ Capture the query plan of a rule's query if it took at least rule_explain_threshold seconds. ANALYZE runs the
+    slow query a second time. Only single SELECTs are explained, and a plan that can't be captured is logged and
+    skipped rather than failing the validation.
+
+    Args:
+        connection: the session or connection the rule was run on
+        rule_sql: the SQL that was run for the rule
+        submission_id: ID of the submission the rule was run for
+        duration: number of seconds the rule's query took
+
+    Returns:
+        the EXPLAIN (ANALYZE, BUFFERS) output of the query, or None if it wasn't slow enough to capture or couldn't be
+        explained
+    """
+    if RULE_EXPLAIN_THRESHOLD is None or duration < RULE_EXPLAIN_THRESHOLD or not is_single_select(rule_sql):
+        return None
+    # A failed EXPLAIN only rolls back to the savepoint, leaving the rest of the rule's transaction usable
+    savepoint = connection.begin_nested()
+    try:
+        plan = connection.execute(text('EXPLAIN (ANALYZE, BUFFERS) ' + rule_sql),
+                                  {SUBMISSION_PARAMETER: submission_id})
+        explain_plan = '\n'.join(row[0] for row in plan)
+        savepoint.commit()
+    except SQLAlchemyError as e:
+        savepoint.rollback()
+        logger.warning({
+            'message': 'Could not capture the query plan of a rule for submission {}: {}'.format(submission_id, e),
+            'message_type': 'ValidatorWarning',
+            'submission_id': submission_id
+        })
+        return None
+    return explain_plan
+
+
+def save_rule_executions(executions):
+    """ Write the timings of a set of rule runs to the rule_execution table
+
+    Args:
+        executions: list of dicts from rule_execution
+    """
+    if executions:
+        sess = GlobalDB.db().session
+        sess.execute(RuleExecution.__table__.insert(), executions)
+        sess.commit()
+
+
+def relevant_flex_data(failures, job_id, connection=None):
     """Create a dictionary mapping row numbers of failures to lists of
-    FlexFields"""
-    sess = GlobalDB.db().session
-    flex_data = defaultdict(list)
-    fail_string = "), (".join(str(f['row_number']) for f in failures if f['row_number'])
-    # only do the rest of this gathering if there's any rows to search in the first place, there is at least
-    # one rule that returns NULL for row_number
-    if fail_string:
-        # VALUES and EXISTS are ridiculous in sqlalchemy, using raw sql for this
-        query = (
-            "WITH all_values AS (SELECT * FROM (VALUES (" + fail_string + ")) as all_flexs (row_number)) " +
-            "SELECT * " +
-            "FROM flex_field " +
-            "WHERE job_id=" + str(job_id) +
-            " AND EXISTS (SELECT * FROM all_values WHERE flex_field.row_number = all_values.row_number)"
-            "ORDER BY flex_field.header"
-        )
-        query_result = sess.execute(query)
-        for flex_field in query_result:
-            flex_data[flex_field.row_number].append(flex_field)
-    return flex_data
+    FlexFields, using the given session or connection if there is one"""
+    sess = connection or GlobalDB.db().session
+    # only do the gathering if there's any rows to search in the first place, there is at least one rule that returns
+    # NULL for row_number
+    return flex_fields_for_rows(sess, [f['row_number'] for f in failures if f['row_number']], job_id=job_id)
 
 
-def relevant_cross_flex_data(failed_rows, submission_id, file_id):
+def relevant_cross_flex_data(failed_rows, submission_id, file_id, connection=None):
     """ Create a dictionary mapping row numbers of cross-file failures to lists of FlexFields
 
         Args:
             failed_rows: the subset of rows to get flex fields for
             submission_id: ID of the submission to get flex fields for
             file_id: the source file type ID of the cross-file rule for which to get flex fields
+            connection: the session or connection to query with, defaults to the global session
 
         Returns:
             A dict containing flex data for the source file in a cross-file validation
     """
-    sess = GlobalDB.db().session
+    sess = connection or GlobalDB.db().session
+    return flex_fields_for_rows(sess, [f['source_row_number'] for f in failed_rows if f['source_row_number']],
+                                submission_id=submission_id, file_type_id=file_id)
+
+
+def flex_fields_for_rows(sess, row_numbers, **filters):
+    """ Gather the flex fields of a set of rows, whether they were stored one cell per flex_field row or as one
+        flex_field_row document per row. The row numbers are loaded into a temp table on the connection so the lookup
+        is a single join no matter how many rows failed.
+
+        Args:
+            sess: the session or connection to query with
+            row_numbers: the row numbers to get flex fields for
+            filters: column/value pairs the flex fields must match (e.g. job_id or submission_id and file_type_id)
+
+        Returns:
+            A dict mapping row numbers to lists of results with header, cell, and job_id attributes, ordered by header
+            and then by column for headers that appear more than once
+    """
     flex_data = defaultdict(list)
+    if not row_numbers:
+        return flex_data
 
-    fail_string = '), ('.join(str(f['source_row_number']) for f in failed_rows if f['source_row_number'])
-    # Only do this if we have any row numbers to check
-    if fail_string:
-        # VALUES and EXISTS are ridiculous in sqlalchemy, using raw sql for this
-        query = """
-            WITH all_values AS(SELECT * FROM(VALUES ({})) as all_flexs(row_number))
-            SELECT *
-            FROM flex_field
-            WHERE submission_id = {}
-            AND file_type_id = {}
-            AND EXISTS (SELECT * FROM all_values WHERE flex_field.row_number = all_values.row_number)
-        """
-        query_result = sess.execute(query.format(fail_string, submission_id, file_id))
-        for flex_field in query_result:
-            flex_data[flex_field.row_number].append(flex_field)
+    sess.execute('CREATE TEMPORARY TABLE IF NOT EXISTS flex_lookup_rows (row_number INTEGER PRIMARY KEY)')
+    sess.execute('TRUNCATE flex_lookup_rows')
+    sess.execute(text('INSERT INTO flex_lookup_rows (row_number) '
+                      'SELECT DISTINCT UNNEST(CAST(:row_numbers AS INTEGER[]))'), {'row_numbers': list(row_numbers)})
+
+    def where_clause(table):
+        return ' AND '.join('{table}.{column} = :{column}'.format(table=table, column=column) for column in filters)
 
+    query = """
+        SELECT flex_field.row_number, flex_field.job_id, flex_field.header, flex_field.cell,
+            flex_field.flex_field_id AS position
+        FROM flex_field
+        JOIN flex_lookup_rows ON flex_lookup_rows.row_number = flex_field.row_number
+        WHERE {flex_field_where}
+        UNION ALL
+        SELECT flex_field_row.row_number, flex_field_row.job_id, cells.pair ->> 0 AS header, cells.pair ->> 1 AS cell,
+            cells.position
+        FROM flex_field_row
+        JOIN flex_lookup_rows ON flex_lookup_rows.row_number = flex_field_row.row_number
+        CROSS JOIN LATERAL JSONB_ARRAY_ELEMENTS(flex_field_row.cells) WITH ORDINALITY AS cells (pair, position)
+        WHERE {flex_field_row_where}
+        ORDER BY header, position
+    """.format(flex_field_where=where_clause('flex_field'), flex_field_row_where=where_clause('flex_field_row'))
+    for flex_field in sess.execute(text(query), filters):
+        flex_data[flex_field.row_number].append(flex_field)
     return flex_data
 
 
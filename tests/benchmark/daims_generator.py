@@ -0,0 +1,213 @@
+""" Generate synthetic DAIMS files for benchmarking the validator.
+
+The files follow the schemas in dataactvalidator/config/*Fields.csv, so every row passes the schema checks unless an
+error was put in it on purpose. The A, B, and C files of one run draw their TAS, program activities, and object
+classes from the same small pools, and the C and FABS files their award IDs, so the TAS linkage and cross-file rules
+find matches the way they would in a real submission. The values aren't meant to pass the SQL rules; those fail at
+whatever rate the synthetic data happens to trip them.
+"""
+import csv
+import os
+import random
+import string
+
+from collections import OrderedDict, namedtuple
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'dataactvalidator', 'config')
+
+# Schema of each file type that can be generated
+SCHEMA_FILES = OrderedDict([
+    ('appropriations', 'appropFields.csv'),
+    ('program_activity', 'programActivityFields.csv'),
+    ('award_financial', 'awardFinancialFields.csv'),
+    ('fabs', 'fabsFields.csv')
+])
+
+# Kinds of schema errors put in rows, each applying to some of the columns
+ERROR_TYPES = ('required', 'type', 'length')
+
+TAS_COMPONENTS = ('allocation_transfer_agency', 'agency_identifier', 'beginning_period_of_availa',
+                  'ending_period_of_availabil', 'availability_type_code', 'main_account_code', 'sub_account_code')
+
+SchemaColumn = namedtuple('SchemaColumn', ['daims_name', 'name_short', 'required', 'data_type', 'length', 'padded'])
+
+
+def load_schema(file_type):
+    """ Read the columns of a file type from its schema file
+
+        Args:
+            file_type: name of the file type, one of SCHEMA_FILES
+
+        Returns:
+            list of SchemaColumns in the order they're listed in the schema
+    """
+    with open(os.path.join(CONFIG_PATH, SCHEMA_FILES[file_type]), encoding='utf-8-sig') as schema_file:
+        return [SchemaColumn(record['daimsname'].strip(), record['fieldname_short'].strip().lower(),
+                             record['required'].strip().upper() == 'TRUE', record['data_type'].strip().lower(),
+                             int(record['field_length']) if record['field_length'].strip() else None,
+                             record['padded_flag'].strip().upper() == 'TRUE')
+                for record in csv.DictReader(schema_file)]
+
+
+def digits(rng, length):
+    return ''.join(rng.choice(string.digits) for _ in range(length))
+
+
+def letters(rng, length):
+    return ''.join(rng.choice(string.ascii_uppercase) for _ in range(length))
+
+
+def build_pools(seed=None, tas_count=50, tas_list=None):
+    """ Build the pools of values shared by the files of one run
+
+        Args:
+            seed: seed for the random values, so runs can be repeated
+            tas_count: number of TAS to make up when none are given
+            tas_list: list of dicts of TAS components to use instead of made up ones, e.g. taken from tas_lookup
+
+        Returns:
+            dict of lists of TAS, program activities, object classes, and award IDs
+    """
+    rng = random.Random(seed)
+    if not tas_list:
+        tas_list = []
+        for _ in range(tas_count):
+            beginning = str(rng.randint(2010, 2018))
+            annual = rng.random() < 0.7
+            tas_list.append({
+                'allocation_transfer_agency': digits(rng, 3) if rng.random() < 0.1 else None,
+                'agency_identifier': digits(rng, 3),
+                'beginning_period_of_availa': beginning if annual else None,
+                'ending_period_of_availabil': str(int(beginning) + rng.randint(0, 4)) if annual else None,
+                'availability_type_code': None if annual else 'X',
+                'main_account_code': digits(rng, 4),
+                'sub_account_code': digits(rng, 3)
+            })
+    return {
+        'tas': tas_list,
+        'program_activity': [(digits(rng, 4), 'PROGRAM ACTIVITY ' + letters(rng, 6)) for _ in range(20)],
+        'object_class': ['1100', '1210', '2100', '2500', '2520', '3100', '4100', '4200'],
+        'award': [(letters(rng, 4) + digits(rng, 8), letters(rng, 3) + digits(rng, 10)) for _ in range(200)]
+    }
+
+
+def column_value(rng, column, pools, row_values):
+    """ Make up a value for a column that passes its schema checks
+
+        Args:
+            rng: the random number generator of the run
+            column: SchemaColumn to make the value for
+            pools: pools of shared values, from build_pools
+            row_values: dict of values already chosen for the row, keyed by short name
+
+        Returns:
+            the value as it should be written to the file
+    """
+    name = column.name_short
+    if name in TAS_COMPONENTS:
+        if 'tas' not in row_values:
+            row_values['tas'] = rng.choice(pools['tas'])
+        return row_values['tas'].get(name) or ''
+    if name in ('program_activity_code', 'program_activity_name'):
+        if 'program_activity' not in row_values:
+            row_values['program_activity'] = rng.choice(pools['program_activity'])
+        return row_values['program_activity'][0 if name == 'program_activity_code' else 1]
+    if name == 'object_class':
+        return rng.choice(pools['object_class'])
+    if name in ('fain', 'uri'):
+        if 'award' not in row_values:
+            row_values['award'] = rng.choice(pools['award'])
+        return row_values['award'][0 if name == 'fain' else 1]
+    if name == 'by_direct_reimbursable_fun':
+        return rng.choice(('D', 'R'))
+    if name in ('action_date', 'period_of_performance_star', 'period_of_performance_curr',
+                'general_ledger_post_date'):
+        return '2018{:02d}{:02d}'.format(rng.randint(1, 12), rng.randint(1, 28))
+    if name == 'record_type':
+        return rng.choice(('1', '2'))
+
+    if column.data_type == 'float':
+        return '{:.2f}'.format(rng.uniform(-1000000, 1000000))
+    if column.data_type in ('int', 'long'):
+        return str(rng.randint(0, 10 ** min(column.length or 9, 9) - 1))
+    if column.data_type == 'boolean':
+        return rng.choice(('true', 'false'))
+    if column.padded:
+        return digits(rng, column.length)
+    # Most optional text is left blank, the way it is in real files
+    if not column.required and rng.random() < 0.5:
+        return ''
+    return letters(rng, min(column.length or 20, 20))
+
+
+def corrupt_row(rng, columns, cells):
+    """ Put a schema error in one of the cells of a row
+
+        Args:
+            rng: the random number generator of the run
+            columns: the SchemaColumns of the file
+            cells: the row's cells, changed in place
+    """
+    candidates = []
+    for index, column in enumerate(columns):
+        if column.required:
+            candidates.append(('required', index))
+        if column.data_type in ('float', 'int', 'long'):
+            candidates.append(('type', index))
+        elif column.length:
+            candidates.append(('length', index))
+    error_type, index = rng.choice(candidates)
+    if error_type == 'required':
+        cells[index] = ''
+    elif error_type == 'type':
+        cells[index] = 'NOT A NUMBER'
+    else:
+        cells[index] = digits(rng, columns[index].length + 1)
+
+
+def generate_rows(file_type, count, pools, error_rate=0.0, seed=None):
+    """ Generate the rows of a synthetic file
+
+        Args:
+            file_type: name of the file type, one of SCHEMA_FILES
+            count: number of rows to generate
+            pools: pools of shared values, from build_pools
+            error_rate: share of the rows, from 0 to 1, to put a schema error in
+            seed: seed for the random values, so runs can be repeated
+
+        Yields:
+            tuples of the row's cells, in schema order, and whether an error was put in it
+    """
+    rng = random.Random(seed)
+    columns = load_schema(file_type)
+    for _ in range(count):
+        row_values = {}
+        cells = [column_value(rng, column, pools, row_values) for column in columns]
+        has_error = rng.random() < error_rate
+        if has_error:
+            corrupt_row(rng, columns, cells)
+        yield cells, has_error
+
+
+def write_file(file_type, path, count, pools, error_rate=0.0, seed=None):
+    """ Write a synthetic file, with the DAIMS names of its columns as the header
+
+        Args:
+            file_type: name of the file type, one of SCHEMA_FILES
+            path: path of the file to write
+            count: number of rows to generate
+            pools: pools of shared values, from build_pools
+            error_rate: share of the rows, from 0 to 1, to put a schema error in
+            seed: seed for the random values, so runs can be repeated
+
+        Returns:
+            dict of the number of rows written, the number with errors, and the size of the file in bytes
+    """
+    error_rows = 0
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow([column.daims_name for column in load_schema(file_type)])
+        for cells, has_error in generate_rows(file_type, count, pools, error_rate, seed):
+            writer.writerow(cells)
+            error_rows += has_error
+    return {'rows': count, 'error_rows': error_rows, 'size_bytes': os.path.getsize(path)}
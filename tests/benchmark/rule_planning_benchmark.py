@@ -0,0 +1,163 @@
+""" Benchmark how much planning time running the SQL rules as prepared statements saves.
+
+Runs EXPLAIN (SUMMARY) on each single SELECT rule in the rule_sql table a number of times, once as its plain SQL and
+once as EXECUTE of its prepared statement, and totals the planning time Postgres reports for each along with the time
+each EXPLAIN took end to end, which also counts parsing and rewriting the query. The first few executions of a prepared
+statement are planned like plain queries until Postgres decides whether a generic plan will do, so the savings show up
+with more executions, as they would for a worker validating submission after submission.
+
+The rules are only planned, not run, so the database just needs the SQL rules loaded (e.g. by
+dataactcore/scripts/initialize.py). Plans depend on the table statistics, so for numbers that match production run it
+against a database with realistic staging data.
+
+Usage:
+    python -m tests.benchmark.rule_planning_benchmark --executions 20 --output planning.json
+"""
+import argparse
+import json
+import re
+import time
+
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+from dataactcore.interfaces.db import GlobalDB
+from dataactcore.logging import configure_logging
+from dataactcore.models.lookups import FILE_TYPE_DICT_ID
+from dataactcore.models.validationModels import RuleSql
+
+from dataactvalidator.app import create_app
+from dataactvalidator.validation_handlers.rule_fusion import is_single_select
+from dataactvalidator.validation_handlers.rule_statements import (prepare_rule, PREPARED_STATEMENTS,
+                                                                  SUBMISSION_PARAMETER)
+
+PLANNING_TIME = re.compile(r'^\s*planning time:\s*([\d.]+)\s*ms', re.IGNORECASE)
+
+
+def planning_time(plan):
+    """ Find the planning time in EXPLAIN (SUMMARY) output
+
+        Args:
+            plan: the lines of the EXPLAIN output
+
+        Returns:
+            the planning time in milliseconds, or 0 if the output doesn't include it
+    """
+    for line in plan:
+        match = PLANNING_TIME.match(line)
+        if match:
+            return float(match.group(1))
+    return 0.0
+
+
+def explain(connection, sql, submission_id):
+    """ EXPLAIN a query without running it
+
+        Args:
+            connection: the connection to explain the query on
+            sql: the query, with the submission ID as a bind parameter
+            submission_id: the ID of the submission to plan the query for
+
+        Returns:
+            a tuple of the planning time Postgres reported and the time the EXPLAIN took end to end, in milliseconds
+    """
+    start = time.perf_counter()
+    plan = [row[0] for row in connection.execute(text('EXPLAIN (SUMMARY) ' + sql),
+                                                 {SUBMISSION_PARAMETER: submission_id})]
+    return planning_time(plan), (time.perf_counter() - start) * 1000
+
+
+def benchmark_rule(connection, rule_sql, executions, submission_id):
+    """ Plan a rule a number of times as plain SQL and as a prepared statement
+
+        Args:
+            connection: the connection to plan the rule on
+            rule_sql: the rule's normalized query
+            executions: number of times to plan it each way
+            submission_id: the ID of the submission to plan it for
+
+        Returns:
+            dict of the total planning and end to end milliseconds of each way
+    """
+    plain = [explain(connection, rule_sql, submission_id) for _ in range(executions)]
+    execute_sql = 'EXECUTE {} (:{})'.format(prepare_rule(connection, rule_sql), SUBMISSION_PARAMETER)
+    prepared = [explain(connection, execute_sql, submission_id) for _ in range(executions)]
+    return {
+        'plain_planning_ms': sum(planning for planning, _ in plain),
+        'plain_total_ms': sum(total for _, total in plain),
+        'prepared_planning_ms': sum(planning for planning, _ in prepared),
+        'prepared_total_ms': sum(total for _, total in prepared)
+    }
+
+
+def run_benchmark(executions, submission_id):
+    """ Plan every single SELECT rule both ways
+
+        Args:
+            executions: number of times to plan each rule each way
+            submission_id: the ID of the submission to plan the rules for
+
+        Returns:
+            dict of the results of each rule and their totals
+    """
+    sess = GlobalDB.db().session
+    rules = sess.query(RuleSql).order_by(RuleSql.rule_sql_id).all()
+    results = OrderedDict()
+    skipped = []
+    with GlobalDB.db().engine.connect() as connection:
+        for rule in rules:
+            if not is_single_select(rule.rule_sql):
+                # Rules creating functions first can't be prepared, so they're run as they always were
+                skipped.append(rule.query_name)
+                continue
+            result = benchmark_rule(connection, rule.rule_sql, executions, submission_id)
+            result['file_type'] = FILE_TYPE_DICT_ID[rule.file_id]
+            results[rule.query_name] = result
+        connection.execute('DEALLOCATE ALL')
+        connection.info.pop(PREPARED_STATEMENTS, None)
+
+    totals = {key: sum(result[key] for result in results.values())
+              for key in ('plain_planning_ms', 'plain_total_ms', 'prepared_planning_ms', 'prepared_total_ms')}
+    return {'executions': executions, 'rules': results, 'skipped': skipped, 'totals': totals}
+
+
+def print_results(results):
+    """ Print the totals and the rules whose planning time was cut the most """
+    totals = results['totals']
+    print('{} rules planned {} times each ({} that aren\'t a single SELECT skipped)'.format(
+        len(results['rules']), results['executions'], len(results['skipped'])))
+    print('{:<12}{:>16}{:>16}{:>10}'.format('', 'plain (ms)', 'prepared (ms)', 'saved'))
+    for label, key in (('planning', 'planning_ms'), ('end to end', 'total_ms')):
+        plain, prepared = totals['plain_' + key], totals['prepared_' + key]
+        saved = '{:.0%}'.format(1 - prepared / plain) if plain else '-'
+        print('{:<12}{:>16.1f}{:>16.1f}{:>10}'.format(label, plain, prepared, saved))
+
+    print('\nMost planning time saved:')
+    by_saving = sorted(results['rules'].items(),
+                       key=lambda item: item[1]['plain_planning_ms'] - item[1]['prepared_planning_ms'], reverse=True)
+    for query_name, result in by_saving[:10]:
+        print('{:<60}{:>10.1f} -> {:.1f} ms'.format(query_name, result['plain_planning_ms'],
+                                                    result['prepared_planning_ms']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the planning time saved by preparing the SQL rules.')
+    parser.add_argument('-n', '--executions', help='Number of times to plan each rule each way', type=int,
+                        default=10)
+    parser.add_argument('-s', '--submission-id', help='ID of the submission to plan the rules for', type=int,
+                        default=0)
+    parser.add_argument('-o', '--output', help='Path of the JSON file to write the results to')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.executions, args.submission_id)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    print_results(results)
+
+
+if __name__ == '__main__':
+    with create_app().app_context():
+        configure_logging()
+        main()
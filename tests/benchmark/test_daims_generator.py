@@ -0,0 +1,60 @@
+import csv
+from decimal import Decimal, InvalidOperation
+
+import pytest
+
+from tests.benchmark.daims_generator import SCHEMA_FILES, build_pools, generate_rows, load_schema, write_file
+
+
+def schema_errors(columns, cells):
+    """ List the columns of a row that would fail the basic schema checks """
+    errors = []
+    for column, cell in zip(columns, cells):
+        if not cell:
+            if column.required:
+                errors.append(('required', column.name_short))
+            continue
+        if column.data_type in ('float', 'int', 'long'):
+            try:
+                Decimal(cell)
+            except InvalidOperation:
+                errors.append(('type', column.name_short))
+        elif column.length and len(cell) > column.length:
+            errors.append(('length', column.name_short))
+    return errors
+
+
+@pytest.mark.parametrize('file_type', list(SCHEMA_FILES))
+def test_generated_rows_follow_schema(file_type):
+    """ Rows only fail the schema checks when an error was put in them, and then in exactly one column """
+    columns = load_schema(file_type)
+    pools = build_pools(seed=1)
+    rows = list(generate_rows(file_type, 500, pools, error_rate=0.2, seed=2))
+
+    for cells, has_error in rows:
+        assert len(cells) == len(columns)
+        assert len(schema_errors(columns, cells)) == (1 if has_error else 0)
+    assert 50 < sum(has_error for _, has_error in rows) < 150
+
+    # The same seed makes the same file
+    assert rows == list(generate_rows(file_type, 500, pools, error_rate=0.2, seed=2))
+
+
+def test_files_share_pools(tmpdir):
+    """ The A, B, and C files of a run use the same TAS, so they link to each other and to tas_lookup """
+    tas = {'allocation_transfer_agency': None, 'agency_identifier': '097', 'beginning_period_of_availa': '2017',
+           'ending_period_of_availabil': '2018', 'availability_type_code': None, 'main_account_code': '0100',
+           'sub_account_code': '000'}
+    pools = build_pools(seed=1, tas_list=[tas])
+    for file_type in ('appropriations', 'program_activity', 'award_financial'):
+        path = str(tmpdir.join(file_type + '.csv'))
+        stats = write_file(file_type, path, 20, pools)
+        assert stats['rows'] == 20 and stats['error_rows'] == 0
+
+        with open(path, newline='') as csv_file:
+            reader = csv.DictReader(csv_file)
+            assert reader.fieldnames == [column.daims_name for column in load_schema(file_type)]
+            for row in reader:
+                assert (row['AgencyIdentifier'], row['MainAccountCode'], row['SubAccountCode']) == \
+                    ('097', '0100', '000')
+                assert row['AllocationTransferAgencyIdentifier'] == ''
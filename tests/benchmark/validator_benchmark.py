@@ -0,0 +1,383 @@
+""" Benchmark the validator end to end on synthetic files.
+
+Generates A, B, C, and FABS files of the requested size and error rate with daims_generator, runs
+ValidationManager.validate_job on them against the configured database, and reports how many rows a second each phase
+of the validation got through. The results are written as JSON so runs from different releases can be compared, and
+a run can be checked against an earlier one with --compare.
+
+The database needs the schemas, SQL rules, and lookups loaded (e.g. by dataactcore/scripts/initialize.py). The
+benchmark makes its own submissions and deletes them when it's done. When tas_lookup has rows, the files use TAS
+taken from it so the TAS linkage finds matches.
+
+Usage:
+    python -m tests.benchmark.validator_benchmark --rows 100000 --error-rate 0.05 --output results.json
+"""
+import argparse
+import functools
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import boto3
+
+from dataactbroker.handlers.submission_handler import delete_all_submission_data
+from dataactcore.config import CONFIG_BROKER, CONFIG_SERVICES
+from dataactcore.interfaces import staging_partitions
+from dataactcore.interfaces.db import GlobalDB
+from dataactcore.logging import configure_logging
+from dataactcore.models.domainModels import TASLookup
+from dataactcore.models.jobModels import Job, Submission
+from dataactcore.models.lookups import FILE_TYPE_DICT, JOB_STATUS_DICT, JOB_TYPE_DICT, PUBLISH_STATUS_DICT
+
+from dataactvalidator.app import create_app
+from dataactvalidator.filestreaming.csvLocalWriter import CsvLocalWriter
+from dataactvalidator.filestreaming.csvS3Writer import CsvS3Writer
+from dataactvalidator.validation_handlers import validationManager, validator
+from dataactvalidator.validation_handlers.validationManager import ValidationManager
+from dataactvalidator.validation_handlers.validator import Validator
+
+from tests.benchmark.daims_generator import TAS_COMPONENTS, build_pools, write_file
+
+logger = logging.getLogger(__name__)
+
+# The phases of a validation, in the order they run
+PHASES = ('staging_load', 'schema_checks', 'tas_linkage', 'sql_rules', 'cross_file', 'report_upload')
+
+DABS_FILE_TYPES = ('appropriations', 'program_activity', 'award_financial')
+
+
+class PhaseTimer(object):
+    """ Times the phases of a validation by wrapping the functions that carry them out for as long as the timer is
+        used in a "with" block. A phase's time leaves out any other phase run inside it on the same thread, so the
+        schema checks of each chunk aren't counted again as staging load. Rows loaded by shard worker processes are
+        checked in those processes, so a sharded load counts entirely as staging load.
+    """
+
+    def __init__(self):
+        self.seconds = defaultdict(float)
+        self.open_phases = Counter()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.patches = []
+
+    def __enter__(self):
+        self.wrap(ValidationManager, 'load_rows', 'staging_load')
+        self.wrap(ValidationManager, 'load_shards', 'staging_load')
+        self.wrap(Validator, 'validate_chunk', 'schema_checks')
+        self.wrap(validationManager, 'write_errors', 'schema_checks')
+        self.wrap(validationManager, 'update_tas_ids', 'tas_linkage')
+        self.wrap(ValidationManager, 'run_sql_validations', 'sql_rules')
+        self.wrap(ValidationManager, 'run_cross_validation', 'cross_file')
+        # Closing a report writes out the last of it, finishing the upload when it's streamed to S3. Cross-file reports
+        # are closed by the cross-file workers and count as part of that phase.
+        self.wrap(CsvLocalWriter, '__exit__', 'report_upload', skip_within=('cross_file',))
+        self.wrap(CsvS3Writer, '__exit__', 'report_upload', skip_within=('cross_file',))
+        return self
+
+    def __exit__(self, error_type, value, traceback):
+        for owner, attr, original in reversed(self.patches):
+            setattr(owner, attr, original)
+        self.patches = []
+
+    def wrap(self, owner, attr, phase, skip_within=()):
+        """ Time every call of a function or method as part of a phase
+
+            Args:
+                owner: the class or module the function belongs to
+                attr: name of the function
+                phase: name of the phase the calls count toward
+                skip_within: phases during which the calls aren't timed
+        """
+        original = owner.__dict__[attr] if isinstance(owner, type) else getattr(owner, attr)
+        func = getattr(owner, attr)
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            with self.phase(phase, skip_within):
+                return func(*args, **kwargs)
+
+        # Static and class methods were already bound by getattr, so the wrapper mustn't be bound again
+        setattr(owner, attr, staticmethod(timed) if isinstance(original, (staticmethod, classmethod)) else timed)
+        self.patches.append((owner, attr, original))
+
+    @contextmanager
+    def phase(self, name, skip_within=()):
+        """ Time the code run in the "with" block as part of a phase
+
+            Args:
+                name: name of the phase
+                skip_within: phases during which the block isn't timed
+        """
+        with self.lock:
+            skipped = any(self.open_phases[open_phase] for open_phase in skip_within)
+            if not skipped:
+                self.open_phases[name] += 1
+        if skipped:
+            yield
+            return
+
+        # Each entry of the stack is the time spent in phases nested in the one being timed
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self.lock:
+                self.seconds[name] += elapsed - nested
+                self.open_phases[name] -= 1
+
+
+def phase_rates(seconds, rows):
+    """ Work out how many rows a second each phase got through
+
+        Args:
+            seconds: dict of the seconds spent in each phase
+            rows: number of rows the phases worked through
+
+        Returns:
+            OrderedDict of a dict of the seconds and rows per second of each phase that ran
+    """
+    return OrderedDict((phase, {'seconds': round(seconds[phase], 3),
+                                'rows_per_second': round(rows / seconds[phase], 1) if seconds[phase] else None})
+                       for phase in PHASES if phase in seconds)
+
+
+def existing_tas(sess, limit=50):
+    """ Get the components of some of the TAS in tas_lookup, so the synthetic files link to them
+
+        Args:
+            sess: the database session
+            limit: most TAS to get
+
+        Returns:
+            list of dicts of TAS components, empty if tas_lookup has no rows
+    """
+    columns = [getattr(TASLookup, component) for component in TAS_COMPONENTS]
+    return [dict(zip(TAS_COMPONENTS, row)) for row in sess.query(*columns).distinct().limit(limit)]
+
+
+def create_job(sess, submission, file_type, file_name):
+    """ Create a ready validation job for a file of a submission, putting the file in the submission bucket first when
+        the broker uses S3
+
+        Args:
+            sess: the database session
+            submission: the Submission the job is for
+            file_type: name of the file type, or None for the cross-file job
+            file_name: path of the local file to validate, or None for the cross-file job
+
+        Returns:
+            the Job
+    """
+    filename = file_name
+    if file_name and CONFIG_BROKER['use_aws']:
+        filename = '{}/benchmark_{}'.format(submission.submission_id, os.path.basename(file_name))
+        boto3.client('s3', region_name=CONFIG_BROKER['aws_region']).\
+            upload_file(file_name, CONFIG_BROKER['aws_bucket'], filename)
+    job = Job(submission_id=submission.submission_id, file_type_id=FILE_TYPE_DICT[file_type] if file_type else None,
+              job_type_id=JOB_TYPE_DICT['csv_record_validation' if file_type else 'validation'],
+              job_status_id=JOB_STATUS_DICT['ready'], filename=filename,
+              original_filename=os.path.basename(file_name) if file_name else None)
+    sess.add(job)
+    sess.commit()
+    return job
+
+
+def validate(validation_manager, job, rows):
+    """ Validate a job, timing each phase
+
+        Args:
+            validation_manager: the ValidationManager to validate with
+            job: the Job to validate
+            rows: number of rows the job works through
+
+        Returns:
+            dict of the total seconds the job took and the seconds and rows per second of each phase
+    """
+    with PhaseTimer() as timer:
+        start = time.perf_counter()
+        validation_manager.validate_job(job.job_id)
+        total = time.perf_counter() - start
+    return {'seconds': round(total, 3), 'rows_per_second': round(rows / total, 1) if total else None,
+            'phases': phase_rates(timer.seconds, rows), 'phase_seconds': dict(timer.seconds)}
+
+
+def run_benchmark(rows, error_rate, file_types, seed=None, keep=False):
+    """ Generate the files and validate them, timing each phase
+
+        Args:
+            rows: number of rows in each file
+            error_rate: share of the rows, from 0 to 1, with a schema error
+            file_types: names of the file types to validate, the cross-file rules are also run when A, B, and C are
+                all included
+            seed: seed for the synthetic data, so runs can be repeated
+            keep: whether to keep the submissions and files instead of deleting them
+
+        Returns:
+            dict of the results, ready to be written as JSON
+    """
+    sess = GlobalDB.db().session
+    pools = build_pools(seed, tas_list=existing_tas(sess))
+    directory = tempfile.mkdtemp(prefix='validator_benchmark_')
+    validation_manager = ValidationManager(CONFIG_BROKER['local'], CONFIG_SERVICES['error_report_path'])
+
+    dabs_submission = Submission(reporting_start_date=date(2018, 10, 1), reporting_end_date=date(2018, 12, 31),
+                                 is_quarter_format=True, publish_status_id=PUBLISH_STATUS_DICT['unpublished'])
+    fabs_submission = Submission(d2_submission=True, publish_status_id=PUBLISH_STATUS_DICT['unpublished'])
+    sess.add_all([dabs_submission, fabs_submission])
+    sess.commit()
+
+    jobs = []
+    phase_seconds = defaultdict(float)
+    phase_rows = Counter()
+    try:
+        for index, file_type in enumerate(file_types):
+            file_name = os.path.join(directory, '{}.csv'.format(file_type))
+            file_stats = write_file(file_type, file_name, rows, pools, error_rate,
+                                    None if seed is None else seed + index)
+            submission = fabs_submission if file_type == 'fabs' else dabs_submission
+            job = create_job(sess, submission, file_type, file_name)
+            logger.info('Validating {} rows of {}'.format(rows, file_type))
+            result = validate(validation_manager, job, rows)
+            jobs.append(OrderedDict([('file_type', file_type)] + sorted(file_stats.items()) +
+                                    sorted(result.items())))
+
+        if all(file_type in file_types for file_type in DABS_FILE_TYPES):
+            cross_rows = rows * len(DABS_FILE_TYPES)
+            job = create_job(sess, dabs_submission, None, None)
+            logger.info('Validating cross-file rules')
+            result = validate(validation_manager, job, cross_rows)
+            jobs.append(OrderedDict([('file_type', 'cross_file'), ('rows', cross_rows)] + sorted(result.items())))
+    finally:
+        if not keep:
+            for submission in (dabs_submission, fabs_submission):
+                delete_all_submission_data(submission)
+            sess.commit()
+            shutil.rmtree(directory, ignore_errors=True)
+
+    for job in jobs:
+        for phase, seconds in job.pop('phase_seconds').items():
+            phase_seconds[phase] += seconds
+            phase_rows[phase] += job['rows']
+
+    return OrderedDict([
+        ('created_at', datetime.utcnow().isoformat()),
+        ('git_revision', git_revision()),
+        ('settings', OrderedDict([
+            ('rows', rows),
+            ('error_rate', error_rate),
+            ('seed', seed),
+            ('file_types', list(file_types)),
+            ('validation_chunk_size', validationManager.VALIDATION_CHUNK_SIZE),
+            ('ingest_workers', validationManager.INGEST_WORKERS),
+            ('cross_file_workers', validationManager.CROSS_FILE_WORKERS),
+            ('sql_rule_workers', validator.SQL_RULE_WORKERS),
+            ('sql_rule_fusion', validator.SQL_RULE_FUSION),
+            ('sql_rule_chunk_size', validator.SQL_RULE_CHUNK_SIZE),
+            ('staging_partitions', staging_partitions.STAGING_PARTITIONS),
+            ('use_aws', CONFIG_BROKER['use_aws'])
+        ])),
+        ('jobs', jobs),
+        ('phases', OrderedDict(
+            (phase, {'rows': phase_rows[phase], 'seconds': round(phase_seconds[phase], 3),
+                     'rows_per_second': round(phase_rows[phase] / phase_seconds[phase], 1)
+                     if phase_seconds[phase] else None})
+            for phase in PHASES if phase in phase_seconds))
+    ])
+
+
+def git_revision():
+    """ Get the commit the benchmark was run on, if it's run from a git checkout """
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(baseline, results, tolerance=0.1):
+    """ Compare the rows per second of each phase with an earlier run
+
+        Args:
+            baseline: results of the earlier run
+            results: results of this run
+            tolerance: how much slower, as a share of the earlier rate, a phase can be before it counts as a regression
+
+        Returns:
+            list of tuples of each phase in both runs with its earlier and current rows per second and whether it
+            regressed
+    """
+    comparison = []
+    for phase in PHASES:
+        before = baseline['phases'].get(phase, {}).get('rows_per_second')
+        after = results['phases'].get(phase, {}).get('rows_per_second')
+        if before and after:
+            comparison.append((phase, before, after, after < before * (1 - tolerance)))
+    return comparison
+
+
+def print_results(results, comparison=None):
+    """ Print the rows per second of each phase, and how they compare to an earlier run when given """
+    print('{:<15} {:>10} {:>12} {:>14}'.format('Phase', 'Rows', 'Seconds', 'Rows/second'))
+    for phase, stats in results['phases'].items():
+        print('{:<15} {:>10} {:>12} {:>14}'.format(phase, stats['rows'], stats['seconds'], stats['rows_per_second']))
+    if comparison:
+        print('\n{:<15} {:>14} {:>14} {:>9}'.format('Phase', 'Baseline', 'Current', 'Change'))
+        for phase, before, after, regressed in comparison:
+            print('{:<15} {:>14} {:>14} {:>8.1%}{}'.format(phase, before, after, after / before - 1,
+                                                           '  REGRESSION' if regressed else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the validator on synthetic DAIMS files.')
+    parser.add_argument('-r', '--rows', help='Number of rows in each file', type=int, default=10000)
+    parser.add_argument('-e', '--error-rate', help='Share of rows, from 0 to 1, with a schema error', type=float,
+                        default=0.05)
+    parser.add_argument('-f', '--file-types', help='File types to validate', nargs='+',
+                        choices=DABS_FILE_TYPES + ('fabs',), default=list(DABS_FILE_TYPES + ('fabs',)))
+    parser.add_argument('-s', '--seed', help='Seed for the synthetic data', type=int, default=0)
+    parser.add_argument('-o', '--output', help='Path of the JSON file to write the results to')
+    parser.add_argument('-c', '--compare', help='Path of the JSON results of an earlier run to compare with')
+    parser.add_argument('-t', '--tolerance', help='Slowdown of a phase, from 0 to 1, counted as a regression',
+                        type=float, default=0.1)
+    parser.add_argument('-k', '--keep', help='Keep the submissions and files made for the benchmark',
+                        action='store_true')
+    args = parser.parse_args()
+
+    # The validator logs every hundred rows, which would be timed along with everything else
+    logging.getLogger('dataactvalidator').setLevel(logging.WARNING)
+    logging.getLogger('dataactcore').setLevel(logging.WARNING)
+
+    results = run_benchmark(args.rows, args.error_rate, args.file_types, args.seed, args.keep)
+    comparison = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            comparison = compare_results(json.load(baseline_file), results, args.tolerance)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+    print_results(results, comparison)
+    if comparison and any(regressed for _, _, _, regressed in comparison):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    with create_app().app_context():
+        configure_logging()
+        main()
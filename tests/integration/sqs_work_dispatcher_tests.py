@@ -5,14 +5,16 @@ import multiprocessing as mp
 import os
 import signal
 import psutil as ps
+import tempfile
 
 from random import randint
 from botocore.config import Config
 from botocore.exceptions import EndpointConnectionError, ClientError, NoCredentialsError, NoRegionError
 from dataactcore.aws.sqsHandler import sqs_queue
-from dataactvalidator.sqs_work_dispatcher import SQSWorkDispatcher, QueueWorkerProcessError, QueueWorkDispatcherError
+from dataactvalidator.sqs_work_dispatcher import (SQSWorkDispatcher, SQSWorkDispatcherPool, QueueWorkerProcessError,
+                                                  QueueWorkDispatcherError)
 from tests.integration.baseTestValidator import BaseTestValidator
-from time import sleep
+from time import sleep, time
 
 
 class SQSWorkDispatcherTests(BaseTestValidator):
@@ -530,6 +532,183 @@ class SQSWorkDispatcherTests(BaseTestValidator):
         # Worker process should have a failed (> 0)  exitcode
         self.assertGreater(dispatcher._worker_process.exitcode, 0)
 
+    def _wait_for_pool(self, pool, timeout=5):
+        """ Monitor the workers of a pool until they've all exited, failing if they take longer than the timeout """
+        deadline = time() + timeout
+        while pool.active_workers:
+            if time() > deadline:
+                self.fail("Pool workers did not complete in timeout as expected. Test fails.")
+            pool.monitor_workers()
+            sleep(0.05)
+
+    def test_pool_works_messages_concurrently(self):
+        """ SQSWorkDispatcherPool dispatches as many messages as it has room for, each to its own worker process,
+            and deletes each message once its worker succeeds
+        """
+        queue = sqs_queue()
+        for msg_body in (1111, 2222, 3333):
+            queue.send_message(MessageBody=msg_body)
+
+        pool = SQSWorkDispatcherPool(queue, max_workers=3, worker_process_name="Test Worker Process",
+                                     long_poll_seconds=0, monitor_sleep_time=0.05)
+        wq = mp.Queue()  # work tracking queue
+
+        def do_some_work(task_id, work_tracking_queue):
+            sleep(0.5)
+            work_tracking_queue.put(task_id)
+
+        start = time()
+        self.assertTrue(pool.dispatch_by_message_attribute(
+            lambda msg: {"_job": do_some_work, "task_id": msg.body, "work_tracking_queue": wq}))
+        self.assertEqual(3, pool.active_workers)
+        self._wait_for_pool(pool)
+
+        # The jobs ran at the same time, not one after the other
+        self.assertLess(time() - start, 1.4)
+        self.assertEqual([1111, 2222, 3333], sorted(wq.get(True, 1) for _ in range(3)))
+        self.assertEqual(0, len(queue.receive_messages(WaitTimeSeconds=0, MaxNumberOfMessages=10)))
+
+    def test_pool_keeps_to_max_workers(self):
+        """ SQSWorkDispatcherPool doesn't receive more messages than it has room for, and doesn't dispatch a message
+            that's already being worked again
+        """
+        queue = sqs_queue()
+        queue.send_message(MessageBody=1111)
+        queue.send_message(MessageBody=2222)
+
+        pool = SQSWorkDispatcherPool(queue, max_workers=1, worker_process_name="Test Worker Process",
+                                     long_poll_seconds=0, monitor_sleep_time=0.05)
+        wq = mp.Queue()  # work tracking queue
+
+        def do_some_work(task_id, work_tracking_queue):
+            sleep(0.25)
+            work_tracking_queue.put(task_id)
+
+        def transformer(msg):
+            return {"_job": do_some_work, "task_id": msg.body, "work_tracking_queue": wq}
+
+        self.assertTrue(pool.dispatch_by_message_attribute(transformer))
+        self.assertFalse(pool.dispatch_by_message_attribute(transformer))
+        self.assertEqual(1, pool.active_workers)
+        self._wait_for_pool(pool)
+        self.assertEqual(1111, wq.get(True, 1))
+
+        # With room for more workers, the message being worked is still the only one dispatched
+        pool.max_workers = 2
+        self.assertTrue(pool.dispatch_by_message_attribute(transformer))
+        self.assertFalse(pool.dispatch_by_message_attribute(transformer))
+        self.assertEqual(1, pool.active_workers)
+        self._wait_for_pool(pool)
+        self.assertEqual(2222, wq.get(True, 1))
+
+    def test_pool_continues_after_failed_worker(self):
+        """ A failed worker leaves its message on the queue, without stopping the other workers of the pool """
+        queue = sqs_queue()
+        queue.send_message(MessageBody=1111)
+        queue.send_message(MessageBody=2222)
+
+        pool = SQSWorkDispatcherPool(queue, max_workers=2, worker_process_name="Test Worker Process",
+                                     long_poll_seconds=0, monitor_sleep_time=0.05)
+
+        def fail_at_some_work(task_id):
+            sleep(0.25)
+            if task_id == 1111:
+                raise Exception("failing at this particular job...")
+
+        self.assertTrue(pool.dispatch_by_message_attribute(lambda msg: {"_job": fail_at_some_work,
+                                                                        "task_id": msg.body}))
+        self.assertEqual(2, pool.active_workers)
+        self._wait_for_pool(pool)
+
+        messages = queue.receive_messages(WaitTimeSeconds=0, MaxNumberOfMessages=10)
+        self.assertEqual([1111], [message.body for message in messages])
+
+    def test_pool_works_priority_queue_with_own_workers(self):
+        """ SQSWorkDispatcherPool receives from its priority queues first, and runs their messages on workers of their
+            own, so they don't wait on the workers busy with the main queue
+        """
+        queue = sqs_queue()
+        small_job_queue = sqs_queue(queue_name="small-job-queue")
+        small_job_queue.purge()
+        for msg_body in (1111, 2222):
+            queue.send_message(MessageBody=msg_body)
+        small_job_queue.send_message(MessageBody=3333)
+
+        pool = SQSWorkDispatcherPool(queue, max_workers=1, priority_queues=[(small_job_queue, 1)],
+                                     worker_process_name="Test Worker Process", long_poll_seconds=0,
+                                     monitor_sleep_time=0.05)
+        wq = mp.Queue()  # work tracking queue
+
+        def do_some_work(task_id, work_tracking_queue):
+            sleep(0.25 if task_id == 3333 else 0.5)
+            work_tracking_queue.put(task_id)
+
+        def transformer(msg):
+            return {"_job": do_some_work, "task_id": msg.body, "work_tracking_queue": wq}
+
+        # One worker for each queue, though the main queue has more messages waiting
+        self.assertTrue(pool.dispatch_by_message_attribute(transformer))
+        self.assertEqual(2, pool.active_workers)
+        self.assertFalse(pool.dispatch_by_message_attribute(transformer))
+        self._wait_for_pool(pool)
+        self.assertEqual([3333, 1111], [wq.get(True, 1) for _ in range(2)])
+
+        self.assertEqual(0, len(small_job_queue.receive_messages(WaitTimeSeconds=0, MaxNumberOfMessages=10)))
+        self.assertEqual([2222], [message.body for message in
+                                  queue.receive_messages(WaitTimeSeconds=0, MaxNumberOfMessages=10)])
+
+    def test_pool_reuses_warm_workers(self):
+        """ SQSWorkDispatcherPool with warm workers runs job after job in the same worker process, started before the
+            first message arrived, until the worker has run max_jobs_per_worker jobs and is replaced
+        """
+        queue = sqs_queue()
+        pool = SQSWorkDispatcherPool(queue, max_workers=1, warm_workers=True, max_jobs_per_worker=2,
+                                     worker_process_name="Test Worker Process", long_poll_seconds=0,
+                                     monitor_sleep_time=0.05)
+        self.assertEqual(1, pool.idle_workers)
+        tracking_dir = tempfile.mkdtemp()
+
+        pids = []
+        for msg_body in (1111, 2222, 3333):
+            queue.send_message(MessageBody=msg_body)
+            self.assertTrue(pool.dispatch_by_message_attribute(
+                lambda msg: {"_job": _track_warm_work, "task_id": msg.body, "tracking_dir": tracking_dir}))
+            self._wait_for_pool(pool)
+            with open(os.path.join(tracking_dir, str(msg_body))) as tracking_file:
+                pids.append(int(tracking_file.read()))
+
+        self.assertEqual(pids[0], pids[1])
+        self.assertNotEqual(pids[1], pids[2])
+        self.assertNotIn(os.getpid(), pids)
+        self.assertEqual(1, pool.idle_workers)
+        self.assertEqual(0, len(queue.receive_messages(WaitTimeSeconds=0, MaxNumberOfMessages=10)))
+
+    def test_pool_replaces_warm_worker_after_failed_job(self):
+        """ A job failing in a warm worker leaves its message on the queue, and the next job runs in a new worker """
+        queue = sqs_queue()
+        pool = SQSWorkDispatcherPool(queue, max_workers=1, warm_workers=True, worker_process_name="Test Worker Process",
+                                     long_poll_seconds=0, monitor_sleep_time=0.05)
+        tracking_dir = tempfile.mkdtemp()
+
+        def transformer(msg):
+            return {"_job": _track_warm_work, "task_id": msg.body, "tracking_dir": tracking_dir}
+
+        queue.send_message(MessageBody=1111)
+        self.assertTrue(pool.dispatch_by_message_attribute(transformer))
+        self._wait_for_pool(pool)
+        queue.send_message(MessageBody=-1)
+        self.assertTrue(pool.dispatch_by_message_attribute(transformer))
+        self._wait_for_pool(pool)
+        messages = queue.receive_messages(WaitTimeSeconds=0, MaxNumberOfMessages=10)
+        self.assertEqual([-1], [message.body for message in messages])
+        messages[0].delete()
+
+        queue.send_message(MessageBody=2222)
+        self.assertTrue(pool.dispatch_by_message_attribute(transformer))
+        self._wait_for_pool(pool)
+        with open(os.path.join(tracking_dir, '1111')) as first, open(os.path.join(tracking_dir, '2222')) as second:
+            self.assertNotEqual(first.read(), second.read())
+
     def test_separate_signal_handlers_for_child_process(self):
         """ Demonstrate (via log output) that a forked child process will inherit signal-handling of the parent
             process, but that can be overridden, while maintaining the original signal handling of the parent.
@@ -1317,3 +1496,13 @@ class SQSWorkDispatcherTests(BaseTestValidator):
             fail_with_runaway_proc = True
         if fail_with_runaway_proc:
             self.fail("Worker or its Terminator or the Dispatcher did not complete in timeout as expected. Test fails.")
+
+
+def _track_warm_work(task_id, tracking_dir):
+    """ Job for warm workers, which have to be handed jobs defined at the top level of a module. Records the process
+        that ran it in a file named after the task, failing for negative task IDs
+    """
+    if task_id < 0:
+        raise Exception("failing at this particular job...")
+    with open(os.path.join(tracking_dir, str(task_id)), 'w') as tracking_file:
+        tracking_file.write(str(os.getpid()))
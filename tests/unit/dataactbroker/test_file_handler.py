@@ -12,7 +12,7 @@ from dataactcore.aws.s3Handler import S3Handler
 from dataactbroker.handlers import fileHandler
 from dataactbroker.helpers import filters_helper
 from dataactcore.config import CONFIG_BROKER
-from dataactcore.models.jobModels import CertifiedFilesHistory
+from dataactcore.models.jobModels import CertifiedFilesHistory, JobPhase
 from dataactcore.models.lookups import JOB_STATUS_DICT, JOB_TYPE_DICT, FILE_TYPE_DICT, PUBLISH_STATUS_DICT
 from dataactcore.utils.responseException import ResponseException
 from tests.unit.dataactbroker.utils import add_models, delete_models
@@ -21,6 +21,9 @@ from tests.unit.dataactcore.factories.job import (JobFactory, SubmissionFactory,
                                                   CertifiedFilesHistoryFactory)
 from tests.unit.dataactcore.factories.user import UserFactory
 
+# check_status progress of a file type whose validation hasn't started
+NO_PROGRESS = {'current_phase': '', 'rows_processed': 0, 'elapsed_time': 0}
+
 
 def list_submissions_result(is_fabs=False):
     json_response = fileHandler.list_submissions(1, 10, "mixed", is_fabs=is_fabs)
@@ -757,7 +760,8 @@ def test_get_status_fabs(database):
     json_response = fileHandler.get_status(sub)
     assert json_response.status_code == 200
     json_content = json.loads(json_response.get_data().decode('UTF-8'))
-    assert json_content['fabs'] == {'status': 'finished', 'has_errors': False, 'has_warnings': True, 'message': ''}
+    assert json_content['fabs'] == {'status': 'finished', 'has_errors': False, 'has_warnings': True,
+                                    'message': '', **NO_PROGRESS}
 
 
 @pytest.mark.usefixtures("job_constants")
@@ -829,25 +833,89 @@ def test_get_status_dabs(database):
     json_content = json.loads(json_response.get_data().decode('UTF-8'))
     assert len(json_content) == 8
     assert json_content['appropriations'] == {'status': 'finished', 'has_errors': True, 'has_warnings': True,
-                                              'message': ''}
+                                              'message': '', **NO_PROGRESS}
     assert json_content['program_activity'] == {'status': 'failed', 'has_errors': True, 'has_warnings': False,
-                                                'message': ''}
+                                                'message': '', **NO_PROGRESS}
     assert json_content['award_financial'] == {'status': 'running', 'has_errors': False, 'has_warnings': False,
-                                               'message': ''}
-    assert json_content['award'] == {'status': 'uploading', 'has_errors': False, 'has_warnings': False, 'message': ''}
+                                               'message': '', **NO_PROGRESS}
+    assert json_content['award'] == {'status': 'uploading', 'has_errors': False, 'has_warnings': False,
+                                     'message': '', **NO_PROGRESS}
     assert json_content['award_procurement'] == {'status': 'finished', 'has_errors': True, 'has_warnings': False,
-                                                 'message': ''}
+                                                 'message': '', **NO_PROGRESS}
     assert json_content['executive_compensation'] == {'status': 'failed', 'has_errors': True, 'has_warnings': False,
-                                                      'message': 'test message'}
-    assert json_content['sub_award'] == {'status': 'ready', 'has_errors': False, 'has_warnings': False, 'message': ''}
-    assert json_content['cross'] == {'status': 'ready', 'has_errors': False, 'has_warnings': False, 'message': ''}
+                                                      'message': 'test message', **NO_PROGRESS}
+    assert json_content['sub_award'] == {'status': 'ready', 'has_errors': False, 'has_warnings': False,
+                                         'message': '', **NO_PROGRESS}
+    assert json_content['cross'] == {'status': 'ready', 'has_errors': False, 'has_warnings': False,
+                                     'message': '', **NO_PROGRESS}
 
     # Get just one status (ignore case)
     json_response = fileHandler.get_status(sub, 'awArd')
     assert json_response.status_code == 200
     json_content = json.loads(json_response.get_data().decode('UTF-8'))
     assert len(json_content) == 1
-    assert json_content['award'] == {'status': 'uploading', 'has_errors': False, 'has_warnings': False, 'message': ''}
+    assert json_content['award'] == {'status': 'uploading', 'has_errors': False, 'has_warnings': False,
+                                     'message': '', **NO_PROGRESS}
+
+
+@pytest.mark.usefixtures("job_constants")
+def test_get_status_progress(database):
+    """ Test get status function reporting the phase a validation is in, its rows processed, and time elapsed """
+    sess = database.session
+    now = datetime.utcnow()
+
+    sub = SubmissionFactory(submission_id=1, d2_submission=False)
+    running_job = JobFactory(submission_id=sub.submission_id, job_type_id=JOB_TYPE_DICT['csv_record_validation'],
+                             file_type_id=FILE_TYPE_DICT['appropriations'], job_status_id=JOB_STATUS_DICT['running'],
+                             number_of_errors=0, number_of_warnings=0, error_message=None)
+    finished_job = JobFactory(submission_id=sub.submission_id, job_type_id=JOB_TYPE_DICT['csv_record_validation'],
+                              file_type_id=FILE_TYPE_DICT['program_activity'],
+                              job_status_id=JOB_STATUS_DICT['finished'], number_of_errors=0, number_of_warnings=0,
+                              error_message=None)
+    sess.add_all([sub, running_job, finished_job])
+    sess.commit()
+    sess.add_all([
+        JobPhase(job_id=running_job.job_id, phase='staging_load', start_time=now - timedelta(seconds=100),
+                 end_time=now - timedelta(seconds=40), rows_processed=5000),
+        JobPhase(job_id=running_job.job_id, phase='sql_rules', start_time=now - timedelta(seconds=40),
+                 rows_processed=5000),
+        JobPhase(job_id=finished_job.job_id, phase='staging_load', start_time=now - timedelta(seconds=30),
+                 end_time=now - timedelta(seconds=20), rows_processed=200),
+        JobPhase(job_id=finished_job.job_id, phase='finalizing', start_time=now - timedelta(seconds=20),
+                 end_time=now - timedelta(seconds=15), rows_processed=200)
+    ])
+    sess.commit()
+
+    json_response = fileHandler.get_status(sub)
+    assert json_response.status_code == 200
+    json_content = json.loads(json_response.get_data().decode('UTF-8'))
+    assert json_content['appropriations']['status'] == 'running'
+    assert json_content['appropriations']['current_phase'] == 'sql_rules'
+    assert json_content['appropriations']['rows_processed'] == 5000
+    assert 100 <= json_content['appropriations']['elapsed_time'] < 160
+    assert json_content['program_activity'] == {'status': 'finished', 'has_errors': False, 'has_warnings': False,
+                                                'message': '', 'current_phase': '', 'rows_processed': 200,
+                                                'elapsed_time': 15}
+    assert json_content['award_financial'] == {'status': 'ready', 'has_errors': False, 'has_warnings': False,
+                                               'message': '', **NO_PROGRESS}
+
+
+def test_get_phase_progress():
+    """ Tests the helper function that works out a job's progress from its phases for check_status """
+    start = datetime(2020, 1, 1, 12, 0, 0)
+    phases = [JobPhase(phase='staging_load', start_time=start, end_time=start + timedelta(seconds=10),
+                       rows_processed=100),
+              JobPhase(phase='sql_rules', start_time=start + timedelta(seconds=10), rows_processed=100)]
+
+    assert fileHandler.get_phase_progress([], True, None) == NO_PROGRESS
+
+    # A job that stopped without finishing its phase took until it was last updated
+    assert fileHandler.get_phase_progress(phases, False, start + timedelta(seconds=12.34)) == \
+        {'current_phase': '', 'rows_processed': 100, 'elapsed_time': 12.3}
+
+    progress = fileHandler.get_phase_progress(phases, True, start)
+    assert progress['current_phase'] == 'sql_rules'
+    assert progress['elapsed_time'] > 10
 
 
 def test_process_job_status():
@@ -1,11 +1,14 @@
 import pytest
 
+from collections import namedtuple
 from unittest.mock import patch
 
 from dataactcore.aws.sqsHandler import SQSMockQueue
-from dataactcore.models.jobModels import JobDependency
-from dataactcore.models.lookups import JOB_STATUS_DICT, JOB_TYPE_DICT, FILE_TYPE_DICT
-from dataactcore.interfaces.function_bag import check_job_dependencies
+from dataactcore.models.errorModels import ErrorMetadata
+from dataactcore.models.jobModels import Job, JobDependency, JobPhase, SQS
+from dataactcore.models.lookups import JOB_STATUS_DICT, JOB_TYPE_DICT, FILE_TYPE_DICT, RULE_SEVERITY_DICT
+from dataactcore.interfaces.function_bag import (check_job_dependencies, create_jobs, start_job_phase,
+                                                 add_job_phase_rows, finish_job_phase, clear_job_phases)
 
 from tests.unit.dataactcore.factories.job import JobFactory, SubmissionFactory
 
@@ -75,12 +78,12 @@ def test_check_job_dependencies_prior_dependency_has_errors(database):
     assert job_2.job_status_id == JOB_STATUS_DICT['waiting']
 
 
-@patch('dataactcore.interfaces.function_bag.sqs_queue')
+@patch('dataactcore.interfaces.job_lanes.sqs_queue')
 @pytest.mark.usefixtures("job_constants")
 def test_check_job_dependencies_ready(mock_sqs_queue, database):
     """ Tests check_job_dependencies with a job that can be set to ready """
     # Mock so it always returns the mock queue for the test
-    mock_sqs_queue.return_value = SQSMockQueue
+    mock_sqs_queue.return_value = SQSMockQueue()
     sess = database.session
     sub = SubmissionFactory(submission_id=1)
     job = JobFactory(submission_id=sub.submission_id, job_status_id=JOB_STATUS_DICT['finished'],
@@ -99,3 +102,130 @@ def test_check_job_dependencies_ready(mock_sqs_queue, database):
     check_job_dependencies(job.job_id)
 
     assert job_2.job_status_id == JOB_STATUS_DICT['ready']
+
+
+@patch('dataactcore.interfaces.job_lanes.sqs_queue')
+@pytest.mark.usefixtures("job_constants")
+def test_check_job_dependencies_batch(mock_sqs_queue, database):
+    """ Tests check_job_dependencies readying and queueing every job it was the last prerequisite of at once """
+    mock_sqs_queue.return_value = SQSMockQueue()
+    sess = database.session
+    sub = SubmissionFactory(submission_id=1)
+    job = JobFactory(submission_id=sub.submission_id, job_status_id=JOB_STATUS_DICT['finished'],
+                     job_type_id=JOB_TYPE_DICT['file_upload'], file_type_id=FILE_TYPE_DICT['award'],
+                     number_of_errors=0)
+    other_finished = JobFactory(submission_id=sub.submission_id, job_status_id=JOB_STATUS_DICT['finished'],
+                                job_type_id=JOB_TYPE_DICT['file_upload'], file_type_id=FILE_TYPE_DICT['award'],
+                                number_of_errors=0)
+    running = JobFactory(submission_id=sub.submission_id, job_status_id=JOB_STATUS_DICT['running'],
+                         job_type_id=JOB_TYPE_DICT['file_upload'], file_type_id=FILE_TYPE_DICT['award'])
+    dependents = [JobFactory(submission_id=sub.submission_id, job_status_id=JOB_STATUS_DICT['waiting'],
+                             job_type_id=JOB_TYPE_DICT[job_type], file_type_id=FILE_TYPE_DICT['award'],
+                             number_of_rows=10)
+                  for job_type in ['csv_record_validation', 'csv_record_validation', 'csv_record_validation',
+                                   'file_upload']]
+    sess.add_all([sub, job, other_finished, running] + dependents)
+    sess.commit()
+
+    # The first two validations only wait on finished jobs, the third is still waiting on a running one, and the last
+    # job is ready but isn't a validation so it isn't queued
+    sess.add_all([JobDependency(job_id=dependent.job_id, prerequisite_id=job.job_id) for dependent in dependents])
+    sess.add_all([JobDependency(job_id=dependents[1].job_id, prerequisite_id=other_finished.job_id),
+                  JobDependency(job_id=dependents[2].job_id, prerequisite_id=running.job_id)])
+    sess.commit()
+
+    check_job_dependencies(job.job_id)
+
+    assert [dependent.job_status_id for dependent in dependents] == [JOB_STATUS_DICT['ready'],
+                                                                     JOB_STATUS_DICT['ready'],
+                                                                     JOB_STATUS_DICT['waiting'],
+                                                                     JOB_STATUS_DICT['ready']]
+    assert sorted(sqs.message for sqs in sess.query(SQS)) == [dependents[0].job_id, dependents[1].job_id]
+
+
+@pytest.mark.usefixtures("job_constants")
+def test_create_jobs(database):
+    """ Tests creating the jobs of a new submission and resetting them when the submission is uploaded again """
+    UploadFile = namedtuple('UploadFile', ['file_type', 'upload_name', 'file_name', 'file_letter'])
+    sess = database.session
+    sub = SubmissionFactory(submission_id=1, d2_submission=False)
+    sess.add(sub)
+    sess.commit()
+
+    upload_files = [UploadFile('award_financial', 'c.csv', 'c.csv', 'C'),
+                    UploadFile('appropriations', 'a.csv', 'a.csv', 'A'),
+                    UploadFile('sub_award', 'f.csv', 'f.csv', 'F')]
+    upload_dict = create_jobs(upload_files, sub)
+
+    jobs = {(job.file_type_id, job.job_type_id): job for job in sess.query(Job).filter_by(submission_id=1)}
+    assert len(jobs) == 6
+    c_upload = jobs[(FILE_TYPE_DICT['award_financial'], JOB_TYPE_DICT['file_upload'])]
+    c_validation = jobs[(FILE_TYPE_DICT['award_financial'], JOB_TYPE_DICT['csv_record_validation'])]
+    a_validation = jobs[(FILE_TYPE_DICT['appropriations'], JOB_TYPE_DICT['csv_record_validation'])]
+    f_upload = jobs[(FILE_TYPE_DICT['sub_award'], JOB_TYPE_DICT['file_upload'])]
+    cross_file = jobs[(None, JOB_TYPE_DICT['validation'])]
+    assert upload_dict == {'award_financial': c_upload.job_id, 'submission_id': 1, 'sub_award': f_upload.job_id,
+                           'appropriations': jobs[(FILE_TYPE_DICT['appropriations'],
+                                                   JOB_TYPE_DICT['file_upload'])].job_id}
+    dependencies = {(dep.job_id, dep.prerequisite_id) for dep in sess.query(JobDependency)}
+    assert (c_validation.job_id, c_upload.job_id) in dependencies
+    assert (f_upload.job_id, c_validation.job_id) in dependencies
+    assert (cross_file.job_id, c_validation.job_id) in dependencies
+    assert (cross_file.job_id, a_validation.job_id) in dependencies
+    assert len(dependencies) == 5
+
+    # Uploading again resets the existing jobs rather than creating new ones
+    c_validation.job_status_id = JOB_STATUS_DICT['finished']
+    c_validation.file_size = 100
+    c_validation.number_of_rows = 5
+    cross_file.job_status_id = JOB_STATUS_DICT['finished']
+    sess.add(ErrorMetadata(job_id=c_validation.job_id, filename='c.csv', field_name='tas', occurrences=1, first_row=2,
+                           severity_id=RULE_SEVERITY_DICT['fatal']))
+    sess.commit()
+    upload_dict = create_jobs(upload_files[:1], sub, existing_submission=True)
+    assert upload_dict == {'award_financial': c_upload.job_id, 'submission_id': 1}
+    assert sess.query(Job).filter_by(submission_id=1).count() == 6
+    assert c_upload.job_status_id == JOB_STATUS_DICT['running']
+    assert c_validation.job_status_id == JOB_STATUS_DICT['waiting']
+    assert cross_file.job_status_id == JOB_STATUS_DICT['waiting']
+    # The last validation's results no longer show up for the job, but are kept in case the file is unchanged
+    assert c_validation.file_size is None
+    assert c_validation.number_of_rows is None
+    assert c_validation.previous_number_of_rows == 5
+    assert sess.query(ErrorMetadata).filter_by(job_id=c_validation.job_id).count() == 0
+    assert sess.query(ErrorMetadata).filter_by(previous_job_id=c_validation.job_id).count() == 1
+
+
+@pytest.mark.usefixtures("job_constants")
+def test_job_phases(database):
+    """ Tests recording a job's progress through its phases """
+    sess = database.session
+    sub = SubmissionFactory(submission_id=1)
+    job = JobFactory(submission_id=sub.submission_id, job_status_id=JOB_STATUS_DICT['running'],
+                     job_type_id=JOB_TYPE_DICT['csv_record_validation'], file_type_id=FILE_TYPE_DICT['appropriations'])
+    other_job = JobFactory(submission_id=sub.submission_id, job_status_id=JOB_STATUS_DICT['running'],
+                           job_type_id=JOB_TYPE_DICT['csv_record_validation'],
+                           file_type_id=FILE_TYPE_DICT['program_activity'])
+    sess.add_all([sub, job, other_job])
+    sess.commit()
+
+    start_job_phase(job.job_id, 'staging_load')
+    start_job_phase(other_job.job_id, 'staging_load')
+    add_job_phase_rows(job.job_id, 100)
+    add_job_phase_rows(job.job_id, 50)
+    start_job_phase(job.job_id, 'sql_rules', 150)
+
+    phases = sess.query(JobPhase).filter_by(job_id=job.job_id).order_by(JobPhase.job_phase_id).all()
+    assert [(phase.phase, phase.rows_processed) for phase in phases] == [('staging_load', 150), ('sql_rules', 150)]
+    assert phases[0].end_time == phases[1].start_time
+    assert phases[1].end_time is None
+
+    finish_job_phase(job.job_id)
+    sess.expire_all()
+    assert sess.query(JobPhase).filter_by(job_id=job.job_id, end_time=None).count() == 0
+    # Other jobs' phases are left alone
+    assert sess.query(JobPhase).filter_by(job_id=other_job.job_id, end_time=None).one().rows_processed == 0
+
+    clear_job_phases(job.job_id)
+    assert sess.query(JobPhase).filter_by(job_id=job.job_id).count() == 0
+    assert sess.query(JobPhase).filter_by(job_id=other_job.job_id).count() == 1
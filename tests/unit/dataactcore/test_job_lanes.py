@@ -0,0 +1,97 @@
+import pytest
+
+from dataactcore.aws.sqsHandler import SQSMockQueue
+from dataactcore.config import CONFIG_BROKER
+from dataactcore.interfaces import job_lanes
+from dataactcore.models.jobModels import SQS
+from dataactcore.models.lookups import FILE_TYPE_DICT, JOB_STATUS_DICT, JOB_TYPE_DICT
+
+from tests.unit.dataactcore.factories.job import JobFactory, SubmissionFactory
+
+
+@pytest.mark.usefixtures("job_constants")
+def test_estimate_job_rows(database, monkeypatch, tmpdir):
+    """ File validations are estimated from their rows or file size, cross-file validations from their files, and
+        generations can't be estimated
+    """
+    monkeypatch.setitem(CONFIG_BROKER, 'use_aws', False)
+    sess = database.session
+    upload = tmpdir.join('fabs.csv')
+    upload.write('x' * (job_lanes.ESTIMATED_ROW_BYTES * 10))
+
+    sub = SubmissionFactory()
+    validated = JobFactory(submission=sub, job_type_id=JOB_TYPE_DICT['csv_record_validation'],
+                           job_status_id=JOB_STATUS_DICT['finished'], file_type_id=FILE_TYPE_DICT['appropriations'],
+                           number_of_rows=120, file_size=None)
+    sized = JobFactory(submission=sub, job_type_id=JOB_TYPE_DICT['csv_record_validation'],
+                       job_status_id=JOB_STATUS_DICT['ready'], file_type_id=FILE_TYPE_DICT['program_activity'],
+                       number_of_rows=None, file_size=job_lanes.ESTIMATED_ROW_BYTES * 5)
+    # The rows counted for the file it replaced don't count for a new upload
+    uploaded = JobFactory(submission=sub, job_type_id=JOB_TYPE_DICT['csv_record_validation'],
+                          job_status_id=JOB_STATUS_DICT['ready'], file_type_id=FILE_TYPE_DICT['award_financial'],
+                          number_of_rows=5000, file_size=job_lanes.ESTIMATED_ROW_BYTES * 5000,
+                          filename=str(upload))
+    cross_file = JobFactory(submission=sub, job_type_id=JOB_TYPE_DICT['validation'], file_type_id=None)
+    generation = JobFactory(submission=sub, job_type_id=JOB_TYPE_DICT['file_upload'],
+                            file_type_id=FILE_TYPE_DICT['award'])
+    sess.add_all([sub, validated, sized, uploaded, cross_file, generation])
+    sess.commit()
+
+    assert job_lanes.estimate_job_rows(validated) == 120
+    assert job_lanes.estimate_job_rows(sized) == 6
+    assert job_lanes.estimate_job_rows(uploaded) == 11
+    assert job_lanes.estimate_job_rows(cross_file) == 137
+    assert job_lanes.estimate_job_rows(generation) is None
+
+    # A file that can't be found can't be estimated, and neither can the cross-file validation depending on it
+    uploaded.filename = str(tmpdir.join('missing.csv'))
+    uploaded.file_size = None
+    sess.commit()
+    assert job_lanes.estimate_job_rows(uploaded) is None
+    assert job_lanes.estimate_job_rows(cross_file) is None
+
+
+def test_send_job_message(database, monkeypatch):
+    """ Jobs small enough go to the small job queue, tagged with their estimated rows, and all others to the main
+        queue
+    """
+    sess = database.session
+    # Always use the mock queue for the test
+    monkeypatch.setattr(job_lanes, 'sqs_queue', lambda queue_name: SQSMockQueue(queue_name=queue_name))
+    monkeypatch.setattr(job_lanes, 'SMALL_JOB_QUEUE_NAME', 'small-job-queue')
+    monkeypatch.setattr(job_lanes, 'SMALL_JOB_MAX_ROWS', 100)
+
+    job_lanes.send_job_message(1, estimated_rows=100)
+    job_lanes.send_job_message(2, estimated_rows=101)
+    job_lanes.send_job_message(3, {'validation_type': {'DataType': 'String', 'StringValue': 'generation'}})
+
+    messages = {message.message: message for message in sess.query(SQS)}
+    assert messages[1].queue_name == 'small-job-queue'
+    assert "'StringValue': '100'" in messages[1].attributes
+    assert messages[2].queue_name == CONFIG_BROKER['sqs_queue_name']
+    assert messages[3].queue_name == CONFIG_BROKER['sqs_queue_name']
+    assert 'estimated_rows' not in messages[3].attributes
+
+    # Without a small job queue, every job goes to the main queue
+    monkeypatch.setattr(job_lanes, 'SMALL_JOB_QUEUE_NAME', None)
+    assert job_lanes.job_queue_name(1) == CONFIG_BROKER['sqs_queue_name']
+
+
+def test_send_job_messages(database, monkeypatch):
+    """ Jobs are sent in batches to the queue of their lane """
+    sess = database.session
+    monkeypatch.setattr(job_lanes, 'sqs_queue', lambda queue_name: SQSMockQueue(queue_name=queue_name))
+    monkeypatch.setattr(job_lanes, 'SMALL_JOB_QUEUE_NAME', 'small-job-queue')
+    monkeypatch.setattr(job_lanes, 'SMALL_JOB_MAX_ROWS', 100)
+
+    jobs = [(job_id, 10) for job_id in range(1, 13)] + [(13, 1000), (14, None)]
+    responses = job_lanes.send_job_messages(jobs)
+
+    # 12 small jobs go in batches of 10 and 2, and the other two in one batch to the main queue
+    assert sorted(len(response['Successful']) for response in responses) == [2, 2, 10]
+    messages = {message.message: message for message in sess.query(SQS)}
+    assert len(messages) == 14
+    assert {messages[job_id].queue_name for job_id in range(1, 13)} == {'small-job-queue'}
+    assert "'StringValue': '10'" in messages[1].attributes
+    assert messages[13].queue_name == CONFIG_BROKER['sqs_queue_name']
+    assert messages[14].attributes is None
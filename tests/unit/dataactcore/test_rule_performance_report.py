@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+from dataactcore.models.lookups import FILE_TYPE_DICT_LETTER_ID
+from dataactcore.models.validationModels import RuleExecution
+from dataactcore.scripts.rule_performance_report import slowest_rules
+from tests.unit.dataactcore.factories.job import SubmissionFactory
+
+
+def test_slowest_rules(database):
+    """ Rules are ranked by their average duration across recent runs """
+    sess = database.session
+    sub = SubmissionFactory()
+    sess.add(sub)
+    sess.commit()
+
+    def execution(label, file_letter, duration, created_at=None):
+        return RuleExecution(rule_label=label, query_name=label.lower(), submission_id=sub.submission_id,
+                             file_type_id=FILE_TYPE_DICT_LETTER_ID[file_letter], rows_scanned=100, failures=2,
+                             duration=duration, created_at=created_at or datetime.utcnow())
+
+    sess.add_all([
+        execution('A1', 'A', 1), execution('A1', 'A', 3),
+        execution('A2', 'A', 0.5),
+        execution('C23', 'C', 5),
+        # too old to be included
+        execution('A3', 'A', 100, datetime.utcnow() - timedelta(days=60))
+    ])
+    sess.commit()
+
+    results = slowest_rules(sess, days=30)
+    assert [row[0] for row in results] == ['C23', 'A1', 'A2']
+    assert results[1] == ['A1', 'a1', 'A', '', 2, 2, 3, 100, 4]
+
+    assert [row[0] for row in slowest_rules(sess, days=30, limit=1)] == ['C23']
+    assert [row[0] for row in slowest_rules(sess, days=30, file_letter='a')] == ['A1', 'A2']
+    assert [row[0] for row in slowest_rules(sess, days=90, file_letter='A')] == ['A3', 'A1', 'A2']
@@ -0,0 +1,95 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from dataactcore.interfaces import staging_partitions
+from dataactcore.models.stagingModels import Appropriation, FlexField
+from tests.unit.dataactcore.factories.job import SubmissionFactory
+from tests.unit.dataactcore.factories.staging import AppropriationFactory
+
+
+def table_exists(sess, name):
+    return sess.execute("SELECT to_regclass('{}') IS NOT NULL".format(name)).scalar()
+
+
+def test_staging_table_name(monkeypatch):
+    """ Rows only go to a partition when partitioning is turned on and the table is partitioned """
+    assert staging_partitions.staging_table_name(Appropriation, 12) == 'appropriation'
+
+    monkeypatch.setattr(staging_partitions, 'STAGING_PARTITIONS', True)
+    assert staging_partitions.staging_table_name(Appropriation, 12) == 'appropriation_s12'
+    assert staging_partitions.staging_table_name(FlexField, 12, 3) == 'flex_field_s12_f3'
+
+
+def test_reset_and_drop_staging_partition(database):
+    """ A submission's partition is created on demand, emptied on reset, and dropped with the submission """
+    sess = database.session
+    sub = SubmissionFactory()
+    other_sub = SubmissionFactory()
+    sess.add_all([sub, other_sub])
+    sess.commit()
+    # Rows written to the parent table before the submission had a partition
+    sess.add_all([AppropriationFactory(submission_id=sub.submission_id),
+                  AppropriationFactory(submission_id=other_sub.submission_id)])
+    sess.commit()
+
+    child = staging_partitions.reset_staging_partition(sess, Appropriation, sub.submission_id)
+    sess.commit()
+    assert child == 'appropriation_s{}'.format(sub.submission_id)
+    assert sess.query(Appropriation).filter_by(submission_id=sub.submission_id).count() == 0
+    assert sess.query(Appropriation).filter_by(submission_id=other_sub.submission_id).count() == 1
+
+    # Rows in the partition are visible through the parent and get their ids from its sequence
+    sess.execute('INSERT INTO {} (submission_id, job_id, row_number) VALUES ({}, 1, 2), ({}, 1, 3)'.format(
+        child, sub.submission_id, sub.submission_id))
+    sess.commit()
+    rows = sess.query(Appropriation).filter_by(submission_id=sub.submission_id).all()
+    assert sorted(row.row_number for row in rows) == [2, 3]
+    assert all(row.appropriation_id is not None for row in rows)
+
+    # Rows for other submissions can't end up in the partition
+    with pytest.raises(IntegrityError):
+        sess.execute('INSERT INTO {} (submission_id, job_id, row_number) VALUES ({}, 1, 2)'.format(
+            child, other_sub.submission_id))
+    sess.rollback()
+
+    # The flex tables get a partition per submission and file type
+    flex_child = staging_partitions.reset_staging_partition(sess, FlexField, sub.submission_id, 1)
+    sess.commit()
+    assert flex_child == 'flex_field_s{}_f1'.format(sub.submission_id)
+
+    staging_partitions.reset_staging_partition(sess, Appropriation, sub.submission_id)
+    sess.commit()
+    assert sess.query(Appropriation).filter_by(submission_id=sub.submission_id).count() == 0
+
+    staging_partitions.drop_submission_partitions(sess, sub.submission_id)
+    sess.commit()
+    assert not table_exists(sess, child)
+    assert not table_exists(sess, flex_child)
+    assert sess.query(Appropriation).filter_by(submission_id=other_sub.submission_id).count() == 1
+
+
+def test_release_submission_partitions(database, monkeypatch):
+    """ A certified submission's partitions are only dropped when partitioning is turned on """
+    sess = database.session
+    sub = SubmissionFactory()
+    sess.add(sub)
+    sess.commit()
+    assert not staging_partitions.has_staging_partition(sess, Appropriation, sub.submission_id)
+
+    child = staging_partitions.reset_staging_partition(sess, Appropriation, sub.submission_id)
+    flex_child = staging_partitions.reset_staging_partition(sess, FlexField, sub.submission_id, 1)
+    sess.commit()
+    assert staging_partitions.has_staging_partition(sess, Appropriation, sub.submission_id)
+    assert staging_partitions.has_staging_partition(sess, FlexField, sub.submission_id, 1)
+    assert not staging_partitions.has_staging_partition(sess, FlexField, sub.submission_id, 2)
+
+    staging_partitions.release_submission_partitions(sess, sub.submission_id)
+    sess.commit()
+    assert table_exists(sess, child)
+
+    monkeypatch.setattr(staging_partitions, 'STAGING_PARTITIONS', True)
+    staging_partitions.release_submission_partitions(sess, sub.submission_id)
+    sess.commit()
+    assert not table_exists(sess, child)
+    assert not table_exists(sess, flex_child)
+    assert not staging_partitions.has_staging_partition(sess, Appropriation, sub.submission_id)
@@ -1,5 +1,7 @@
 import csv
 
+import pytest
+
 from unittest.mock import Mock
 
 from dataactvalidator.filestreaming import csvReader
@@ -23,9 +25,11 @@ def test_get_next_record_flex():
     reader.column_count = 6
     reader.expected_headers = ['a', 'b', 'c', None, None, None]
     reader.flex_headers = [None, None, None, 'flex_d', 'flex_e', None]
+    reader.index_columns()
     reader.csv_reader = csv.reader(['A,"B\n",C,D,E,F'], dialect='excel', delimiter=',')
-    return_dict, flex_fields = reader.get_next_record()
-    assert return_dict == {'a': 'A', 'b': 'B\n', 'c': 'C'}
+    cells, flex_fields = reader.get_next_record()
+    assert reader.expected_columns == ['a', 'b', 'c']
+    assert cells == ['A', 'B\n', 'C']
     assert len(flex_fields) == 2
     assert flex_fields[0].header == 'flex_d'
     assert flex_fields[0].cell == 'D'
@@ -91,3 +95,138 @@ def test_normalize_headers():
 
     result = csvReader.normalize_headers(headers, False, mapping)
     assert list(result) == headers
+
+
+def test_open_file_streams_and_counts_rows(tmpdir):
+    """ The file is read in one pass, counting the non-blank lines as they're read """
+    csv_file = tmpdir.join('file.csv')
+    csv_file.write_binary('some_col,other\r\na,"b\r\nc"\r\n\r\nd,e\r\n'.encode('utf-8'))
+    reader = csvReader.CsvReader()
+    reader.open_file(None, None, str(csv_file), [Mock(name_short='some_col'), Mock(name_short='other')], None, None,
+                     {}, {}, is_local=True)
+    assert reader.row_count == 1
+
+    records = []
+    while not reader.is_finished:
+        records.append(reader._get_line())
+    reader.close()
+    assert records == [['a', 'b\nc'], ['d', 'e'], '']
+    assert reader.row_count == 3
+
+
+def test_open_file_bad_encoding(tmpdir):
+    """ Characters that aren't UTF-8 raise an error when they're reached instead of ending the file early """
+    csv_file = tmpdir.join('file.csv')
+    csv_file.write_binary(b'some_col,other\na,b\n' + b'x,y\n' * 5000 + b'\xff\xfe,c\n')
+    reader = csvReader.CsvReader()
+    reader.open_file(None, None, str(csv_file), [Mock(name_short='some_col'), Mock(name_short='other')], None, None,
+                     {}, {}, is_local=True)
+    with pytest.raises(UnicodeDecodeError):
+        while not reader.is_finished:
+            reader._get_line()
+    reader.close()
+
+
+def test_ends_in_quotes():
+    """ Quoted line breaks are found the same way the reader finds them """
+    assert not csvReader.ends_in_quotes('a,b\n', False, ',')
+    assert csvReader.ends_in_quotes('a,"b\n', False, ',')
+    assert not csvReader.ends_in_quotes('c",d\n', True, ',')
+    # Doubled quotes are part of the quoted field, and quotes inside an unquoted field don't start one
+    assert csvReader.ends_in_quotes('a,"b"",c\n', False, ',')
+    assert not csvReader.ends_in_quotes('a,b"c,d\n', False, ',')
+    assert not csvReader.ends_in_quotes('a,"b"c,"d"\n', False, ',')
+    assert csvReader.ends_in_quotes('a|"b,c\n', False, '|')
+
+
+def test_row_count_independent_of_parser(tmpdir):
+    """ Records the parser doesn't return are still counted, and errors other than reaching the end of the file
+        aren't taken as the end of it
+    """
+    csv_file = tmpdir.join('file.csv')
+    csv_file.write_binary('some_col,other\na,b\nc,d\n'.encode('utf-8'))
+    reader = csvReader.CsvReader()
+    reader.open_file(None, None, str(csv_file), [Mock(name_short='some_col'), Mock(name_short='other')], None, None,
+                     {}, {}, is_local=True)
+    lines = reader.csv_reader
+    reader.csv_reader = (row for row in lines if row != ['a', 'b'])
+    assert reader._get_line() == ['c', 'd']
+    assert reader.row_count == 3
+    reader.close()
+
+    def failing_rows():
+        raise ValueError('Something else went wrong')
+        yield
+    reader.csv_reader = failing_rows()
+    with pytest.raises(ValueError):
+        reader._get_line()
+    assert not reader.is_finished
+
+
+def test_shard_file_splits_on_record_boundaries(tmpdir):
+    """ Shards never split a quoted line break and each knows the row number of its first record """
+    lines = ['a,b']
+    for idx in range(40):
+        lines.append('{},"multi\nline {}"'.format(idx, idx) if idx % 3 == 0 else '{},plain'.format(idx))
+        if idx % 7 == 0:
+            lines.append('')
+    csv_file = tmpdir.join('shard.csv')
+    csv_file.write_binary('\r\n'.join(lines).encode('utf-8') + b'\r\n')
+
+    whole_reader = csvReader.CsvReader()
+    whole_reader.open_file(None, None, str(csv_file), [Mock(name_short='a'), Mock(name_short='b')], None, None, {},
+                           {}, is_local=True)
+    expected = []
+    while True:
+        row = whole_reader._get_line()
+        if whole_reader.is_finished:
+            break
+        expected.append(row)
+    whole_reader.close()
+
+    shards = csvReader.shard_file(str(csv_file), ',', 4)
+    assert len(shards) == 4
+    rows = []
+    for start, end in shards:
+        record_count = csvReader.count_shard_records(str(csv_file), start, end, ',')
+        shard_start = len(rows)
+        reader = csvReader.CsvReader()
+        reader.open_shard(str(csv_file), start, end, ',', ['a', 'b'], [None, None])
+        while True:
+            cells, _ = reader.get_next_record()
+            if reader.is_finished:
+                break
+            rows.append(cells)
+        reader.close()
+        assert len(rows) - shard_start == record_count
+    assert rows == expected
+    assert rows[0] == ['0', 'multi\nline 0']
+
+
+def test_shard_file_ambiguous_quotes(monkeypatch, tmpdir):
+    """ Files are only split where a record is sure to start, even when there are no quotes nearby to tell """
+    monkeypatch.setattr(csvReader, 'READ_BUFFER_SIZE', 64)
+    plain_lines = '\n'.join('{},plain'.format(idx) for idx in range(40))
+
+    # Without any quotes before the split, a line can't be inside a quoted field
+    csv_file = tmpdir.join('plain.csv')
+    csv_file.write_binary('a,b\n{}\n0,"x"\n'.format(plain_lines).encode('utf-8'))
+    shards = csvReader.shard_file(str(csv_file), ',', 2)
+    assert len(shards) == 2
+    assert sum(csvReader.count_shard_records(str(csv_file), start, end, ',') for start, end in shards) == 41
+
+    # Once there's a quote before it, a split among many lines without quotes could be inside a quoted field
+    csv_file = tmpdir.join('quoted.csv')
+    csv_file.write_binary('a,b\n0,"x"\n{}\n'.format(plain_lines).encode('utf-8'))
+    assert csvReader.shard_file(str(csv_file), ',', 2) is None
+    csv_file.write_binary('a,b\n0,"multi\n{}"\n'.format(plain_lines).encode('utf-8'))
+    assert csvReader.shard_file(str(csv_file), ',', 2) is None
+
+
+def test_shard_file_unparseable(tmpdir):
+    """ Shards that can't be parsed aren't counted, so reading the file in order can report the problem """
+    csv_file = tmpdir.join('bad.csv')
+    csv_file.write_binary('a,b\n1,2\n3,4\n5,\xe9\n'.encode('latin-1'))
+    assert csvReader.shard_file(str(csv_file), ',', 2) is None
+    assert csvReader.count_shard_records(str(csv_file), 4, 8, ',') == 1
+    assert csvReader.count_shard_records(str(csv_file), 8, 16, ',') is None
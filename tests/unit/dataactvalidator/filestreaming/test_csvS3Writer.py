@@ -0,0 +1,58 @@
+from unittest.mock import patch
+
+import pytest
+
+from dataactvalidator.filestreaming.csvS3Writer import CsvS3Writer
+
+
+@patch('dataactvalidator.filestreaming.csvS3Writer.boto3')
+def test_small_file_single_put(boto3):
+    """ Files smaller than a single part are uploaded in one put """
+    s3client = boto3.client.return_value
+    with CsvS3Writer('us-gov-west-1', 'bucket', 'errors/report.csv', ['a', 'b'], lineterminator='\n') as writer:
+        writer.writerow(['1', None])
+        writer.writerow(['x,y', 2])
+
+    s3client.put_object.assert_called_once_with(Bucket='bucket', Key='errors/report.csv',
+                                                Body=b'a,b\n1,\n"x,y",2\n')
+    assert not s3client.create_multipart_upload.called
+
+
+@patch('dataactvalidator.filestreaming.csvS3Writer.boto3')
+def test_large_file_multipart(boto3, monkeypatch):
+    """ Larger files are uploaded in parts as they're written """
+    monkeypatch.setattr(CsvS3Writer, 'BUFFER_SIZE', 1000)
+    s3client = boto3.client.return_value
+    s3client.create_multipart_upload.return_value = {'UploadId': 'upload'}
+    s3client.upload_part.side_effect = [{'ETag': 'tag{}'.format(idx)} for idx in range(1, 10)]
+
+    with CsvS3Writer('us-gov-west-1', 'bucket', 'errors/report.csv', ['a', 'b']) as writer:
+        for idx in range(500):
+            writer.writerow([idx, 'value'])
+        # some of the file has been uploaded before it's finished
+        assert s3client.upload_part.called
+
+    uploaded = b''.join(part_call[1]['Body'] for part_call in s3client.upload_part.call_args_list)
+    assert uploaded == b'a,b\r\n' + b''.join('{},value\r\n'.format(idx).encode() for idx in range(500))
+    parts = s3client.complete_multipart_upload.call_args[1]['MultipartUpload']['Parts']
+    assert [part['PartNumber'] for part in parts] == list(range(1, len(parts) + 1))
+    assert parts[0]['ETag'] == 'tag1'
+    assert not s3client.put_object.called
+
+
+@patch('dataactvalidator.filestreaming.csvS3Writer.boto3')
+def test_error_aborts_upload(boto3, monkeypatch):
+    """ The upload is abandoned if there's an error while writing """
+    monkeypatch.setattr(CsvS3Writer, 'BUFFER_SIZE', 10)
+    s3client = boto3.client.return_value
+    s3client.create_multipart_upload.return_value = {'UploadId': 'upload'}
+
+    with pytest.raises(ValueError):
+        with CsvS3Writer('us-gov-west-1', 'bucket', 'errors/report.csv', ['a', 'b']) as writer:
+            for idx in range(200):
+                writer.writerow([idx, 'value'])
+            raise ValueError('failed')
+
+    s3client.abort_multipart_upload.assert_called_once_with(Bucket='bucket', Key='errors/report.csv',
+                                                            UploadId='upload')
+    assert not s3client.complete_multipart_upload.called
@@ -0,0 +1,53 @@
+from unittest.mock import patch
+
+import psycopg2
+import pytest
+
+from dataactcore.config import CONFIG_BROKER
+from dataactvalidator.filestreaming import csv_selection
+
+QUERY = "SELECT 1 AS number, 'x,y' AS text UNION ALL SELECT 2, NULL ORDER BY number"
+
+
+def test_write_stream_query_local(database, tmpdir):
+    """ Query results are copied into a local file after the header """
+    sess = database.session
+    file_path = str(tmpdir.join('results.csv'))
+    csv_selection.write_stream_query(sess, QUERY, file_path, True, header=['Number', 'Text'], generate_string=False)
+    with open(file_path) as results:
+        assert results.read() == 'Number,Text\n1,"x,y"\n2,\n'
+
+    csv_selection.write_stream_query(sess, QUERY, file_path, True, generate_headers=True, generate_string=False,
+                                     file_format='txt')
+    with open(file_path) as results:
+        assert results.read() == 'number|text\n1|x,y\n2|\n'
+
+
+@patch('dataactvalidator.filestreaming.csv_selection.boto3')
+def test_write_stream_query_s3(boto3, database, monkeypatch):
+    """ Query results are streamed straight to S3 without a local copy """
+    monkeypatch.setitem(CONFIG_BROKER, 'aws_bucket', 'bucket')
+    s3client = boto3.client.return_value
+    csv_selection.write_stream_query(database.session, QUERY, '1/results.csv', False, header=['Number', 'Text'],
+                                     generate_string=False)
+
+    s3client.put_object.assert_called_once_with(Bucket='bucket', Key='1/results.csv',
+                                                Body=b'Number,Text\n1,"x,y"\n2,\n')
+
+
+@patch('dataactvalidator.filestreaming.csv_selection.boto3')
+def test_write_stream_query_error(boto3, database, monkeypatch):
+    """ A failing query raises its error rather than leaving a partial file in S3 """
+    monkeypatch.setattr(csv_selection.S3StreamWriter, 'PART_SIZE', 5)
+    s3client = boto3.client.return_value
+    s3client.create_multipart_upload.return_value = {'UploadId': 'upload'}
+    s3client.upload_part.return_value = {'ETag': 'tag'}
+
+    with pytest.raises(psycopg2.ProgrammingError):
+        csv_selection.write_stream_query(database.session, 'SELECT missing_column FROM submission', '1/results.csv',
+                                         False, header=['Missing Column'], generate_string=False)
+    database.session.rollback()
+
+    s3client.abort_multipart_upload.assert_called_once_with(Bucket=CONFIG_BROKER['aws_bucket'], Key='1/results.csv',
+                                                            UploadId='upload')
+    assert not s3client.complete_multipart_upload.called
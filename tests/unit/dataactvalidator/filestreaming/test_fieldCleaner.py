@@ -0,0 +1,30 @@
+from dataactcore.models.lookups import FIELD_TYPE_DICT
+from dataactcore.models.validationModels import FileColumn
+from dataactvalidator.filestreaming.fieldCleaner import FieldCleaner, RowCleaner
+
+
+def test_row_cleaner_matches_clean_row():
+    """ The compiled cleaner cleans a batch of list rows the same way clean_row cleans each dict row """
+    fields = [
+        FileColumn(name='Amount Long', field_types_id=FIELD_TYPE_DICT['DECIMAL'], padded_flag=False, length=None),
+        FileColumn(name='Code Long', field_types_id=FIELD_TYPE_DICT['STRING'], padded_flag=True, length=3),
+        FileColumn(name='Text Long', field_types_id=FIELD_TYPE_DICT['STRING'], padded_flag=False, length=None)
+    ]
+    long_to_short_dict = {'Amount Long': 'amount', 'Code Long': 'code', 'Text Long': 'text'}
+    columns = ['text', 'amount', 'code', 'extra']
+    rows = [
+        [' "quoted" ', '1,234.5', '7', ' as is '],
+        ['1,2,3', ' "12,3" ', ' ', None],
+        [None, '1,2a', '""', ''],
+        ['', '', '1234', 'x']
+    ]
+
+    cleaner = RowCleaner(fields, long_to_short_dict, columns)
+    expected = [FieldCleaner.clean_row(dict(zip(columns, row)), long_to_short_dict, fields) for row in rows]
+    assert cleaner.clean_rows(rows) == expected
+    assert expected[0] == {'text': 'quoted', 'amount': '1234.5', 'code': '007', 'extra': ' as is '}
+    assert expected[1] == {'text': '1,2,3', 'amount': '123', 'code': None, 'extra': None}
+    assert expected[2]['amount'] == '1,2a'
+
+    # A file without any of the expected columns still gets a record per row
+    assert RowCleaner(fields, long_to_short_dict, []).clean_rows([[], []]) == [{}, {}]
@@ -1,6 +1,8 @@
 from datetime import datetime
 from random import randint
 
+from sqlalchemy import text
+
 from dataactcore.models.jobModels import Submission
 from dataactvalidator.filestreaming.sqlLoader import SQLLoader
 from dataactcore.models.jobModels import PublishStatus
@@ -24,14 +26,14 @@ def error_rows(rule_file, staging_db, submission=None, models=None, assert_num=N
         models = []
 
     submission_id = insert_submission(staging_db, submission)
-    sql = SQLLoader.read_sql_str(rule_file).format(submission_id)
+    sql = SQLLoader.read_sql_str(rule_file)
 
     for model in models:
         model.submission_id = submission_id
         staging_db.session.add(model)
 
     staging_db.session.commit()
-    result = staging_db.connection.execute(sql).fetchall()
+    result = staging_db.connection.execute(text(sql), submission_id=submission_id).fetchall()
 
     if assert_num is not None:
         assert(len(result) == assert_num)
@@ -44,8 +46,8 @@ def number_of_errors(rule_file, staging_db, submission=None, models=None, assert
 
 
 def query_columns(rule_file, staging_db):
-    sql = SQLLoader.read_sql_str(rule_file).format(randint(1, 9999))
-    return staging_db.connection.execute(sql).keys()
+    sql = SQLLoader.read_sql_str(rule_file)
+    return staging_db.connection.execute(text(sql), submission_id=randint(1, 9999)).keys()
 
 
 def populate_publish_status(database):
@@ -3,7 +3,7 @@ import os
 import re
 import pytest
 
-from datetime import datetime
+from datetime import date, datetime
 from unittest.mock import Mock
 
 from dataactbroker.helpers import generation_helper
@@ -444,6 +444,43 @@ def test_generate_txt_d1(database):
     assert expected2 in file_rows
 
 
+@pytest.mark.usefixtures("job_constants", "broker_files_tmp_dir")
+def test_generate_sharded_d1(database):
+    """ A D1 file generated a month at a time has its months in order under a single header """
+    sess = database.session
+    dap_model = DetachedAwardProcurementFactory
+    dap_1 = dap_model(awarding_agency_code='123', action_date='20170331', detached_award_proc_unique='unique1')
+    dap_2 = dap_model(awarding_agency_code='123', action_date='20170110', detached_award_proc_unique='unique2')
+    dap_3 = dap_model(awarding_agency_code='123', action_date='20170201', detached_award_proc_unique='unique3')
+    dap_4 = dap_model(awarding_agency_code='123', action_date='20170109', detached_award_proc_unique='unique4')
+    dap_5 = dap_model(awarding_agency_code='234', action_date='20170115', detached_award_proc_unique='unique5')
+    file_gen = FileGenerationFactory(request_date=datetime.now().date(), start_date='01/10/2017', end_date='03/31/2017',
+                                     file_type='D1', agency_code='123', agency_type='awarding', is_cached_file=True,
+                                     file_path=None, file_format='csv')
+    sess.add_all([dap_1, dap_2, dap_3, dap_4, dap_5, file_gen])
+    sess.commit()
+
+    file_gen_manager = FileGenerationManager(sess, CONFIG_BROKER['local'], file_generation=file_gen)
+    file_gen_manager.shard_workers = 2
+    file_gen_manager.generate_file()
+
+    file_rows = read_file_rows(file_gen.file_path)
+    assert file_rows[0] == [key for key in file_generation_manager.fileD1.mapping]
+    unique_index = file_generation_manager.fileD1.db_columns.index('detached_award_proc_unique')
+    assert [row[unique_index] for row in file_rows[1:]] == ['unique2', 'unique3', 'unique1']
+    assert file_gen.shard_count == 3
+    assert file_gen.shards_generated == 3
+
+
+def test_month_ranges():
+    """ A date range is split at the end of each month """
+    assert file_generation_manager.month_ranges(date(2017, 1, 10), date(2017, 3, 15)) == [
+        (date(2017, 1, 10), date(2017, 1, 31)), (date(2017, 2, 1), date(2017, 2, 28)),
+        (date(2017, 3, 1), date(2017, 3, 15))]
+    assert file_generation_manager.month_ranges(date(2016, 12, 5), date(2016, 12, 5)) == [
+        (date(2016, 12, 5), date(2016, 12, 5))]
+
+
 @pytest.mark.usefixtures("job_constants", "broker_files_tmp_dir")
 def test_generate_file_updates_jobs(monkeypatch, database):
     sess = database.session
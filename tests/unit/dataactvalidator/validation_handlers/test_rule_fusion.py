@@ -0,0 +1,85 @@
+from dataactvalidator.validation_handlers.rule_fusion import (fused_columns, fused_query, parse_fusable_rule,
+                                                              SelectItem, split_fused_failures)
+
+
+def test_parse_fusable_rule():
+    """ A plain filter over the rows of the table is split into its select list, FROM clause, and WHERE clause """
+    sql = """-- Comment with a FROM, WHERE, and GROUP BY in it
+        SELECT row_number,
+            dafa.fain,
+            CAST(COALESCE(amount, '0') AS NUMERIC) AS "amount, as a number",
+            afa_generated_unique AS "uniqueid_AssistanceTransactionUniqueKey"
+        FROM detached_award_financial_assistance AS dafa
+        WHERE dafa.submission_id = :submission_id
+            AND fain IS DISTINCT FROM 'a''b;'
+            AND NOT EXISTS (SELECT 1 FROM cfda_program GROUP BY program_number);
+    """
+    rule = parse_fusable_rule(sql, 'detached_award_financial_assistance')
+    assert rule.select_items == [
+        SelectItem('row_number', 'row_number'),
+        SelectItem('dafa.fain', 'fain'),
+        SelectItem("CAST(COALESCE(amount, '0') AS NUMERIC)", '"amount, as a number"'),
+        SelectItem('afa_generated_unique', '"uniqueid_AssistanceTransactionUniqueKey"')
+    ]
+    assert rule.from_clause == 'detached_award_financial_assistance AS dafa'
+    assert rule.qualifier == 'dafa'
+    assert rule.where_clause.startswith('dafa.submission_id = :submission_id')
+    assert rule.where_clause.endswith('GROUP BY program_number)')
+
+
+def test_parse_fusable_rule_rejects():
+    """ Anything that isn't a row by row check of the table can't be fused """
+    where = ' FROM appropriation WHERE submission_id = :submission_id'
+    assert parse_fusable_rule('SELECT row_number' + where, 'appropriation') is not None
+    # Another table
+    assert parse_fusable_rule('SELECT row_number' + where, 'award_financial') is None
+    # Joins
+    assert parse_fusable_rule('SELECT row_number FROM appropriation JOIN tas_lookup USING (tas_id) '
+                              'WHERE submission_id = :submission_id', 'appropriation') is None
+    assert parse_fusable_rule('SELECT row_number FROM appropriation, tas_lookup WHERE submission_id = :submission_id',
+                              'appropriation') is None
+    # Aggregates and anything else changing the rows returned
+    assert parse_fusable_rule('SELECT SUM(budget_authority_unobligat_fyb) AS total' + where, 'appropriation') is None
+    assert parse_fusable_rule('SELECT COALESCE(SUM(budget_authority_unobligat_fyb), 0) AS difference' + where,
+                              'appropriation') is None
+    assert parse_fusable_rule('SELECT row_number, UPPER(UNNEST(ARRAY[tas])) AS tas' + where, 'appropriation') is None
+    # Function names in strings, quoted names, and comments don't matter
+    assert parse_fusable_rule("SELECT row_number, 'sum(' AS note, \"count(\" AS counted -- max(\n" + where,
+                              'appropriation') is not None
+    assert parse_fusable_rule('SELECT DISTINCT row_number' + where, 'appropriation') is None
+    assert parse_fusable_rule('SELECT row_number' + where + ' GROUP BY row_number', 'appropriation') is None
+    assert parse_fusable_rule('SELECT row_number' + where + ' ORDER BY row_number', 'appropriation') is None
+    # An expression without a name of its own
+    assert parse_fusable_rule('SELECT row_number + 1' + where, 'appropriation') is None
+    # Subqueries and more than one statement
+    assert parse_fusable_rule('SELECT row_number FROM (SELECT * FROM appropriation) AS approp '
+                              'WHERE submission_id = :submission_id', 'appropriation') is None
+    assert parse_fusable_rule('SELECT 1; SELECT row_number' + where, 'appropriation') is None
+
+
+def test_fused_query_and_failures():
+    """ Each rule's columns only come back for the rows it fails, and are sorted back out under the rule's own names """
+    rules = [parse_fusable_rule('SELECT row_number, tas AS "uniqueid_TAS" FROM appropriation '
+                                'WHERE submission_id = :submission_id AND tas IS NULL', 'appropriation'),
+             parse_fusable_rule('SELECT row_number, adjustments_to_unobligated_cpe FROM appropriation '
+                                'WHERE submission_id = :submission_id AND adjustments_to_unobligated_cpe < 0',
+                                'appropriation')]
+    sql = fused_query(rules)
+    assert 'CASE WHEN fused_rule_flags.fused_rule_0 THEN tas END AS "uniqueid_TAS"' in sql
+    assert 'WHERE appropriation.submission_id = :submission_id' in sql
+    assert 'COALESCE((submission_id = :submission_id AND tas IS NULL), FALSE) AS fused_rule_0' in sql
+
+    assert 'ORDER BY fused_rule.fused_rule_index, fused_rows.fused_row_order' in sql
+
+    keys = ['fused_rule_index', 'fused_row_order', 'fused_rule_0', 'fused_rule_1', 'row_number', 'uniqueid_TAS',
+            'row_number', 'adjustments_to_unobligated_cpe']
+    rule_columns = fused_columns(rules, keys)
+    assert rule_columns == [(4, ['row_number', 'uniqueid_TAS']), (6, ['row_number', 'adjustments_to_unobligated_cpe'])]
+    rows = [(0, 1, True, False, 2, None, None, None), (0, 2, True, True, 3, None, 3, -1),
+            (1, 2, True, True, 3, None, 3, -1), (1, 3, False, True, None, None, 4, -2)]
+    assert split_fused_failures(rule_columns, rows[:1]) == [(0, [{'row_number': 2, 'uniqueid_TAS': None}])]
+    assert split_fused_failures(rule_columns, rows[1:]) == [
+        (0, [{'row_number': 3, 'uniqueid_TAS': None}]),
+        (1, [{'row_number': 3, 'adjustments_to_unobligated_cpe': -1},
+             {'row_number': 4, 'adjustments_to_unobligated_cpe': -2}])
+    ]
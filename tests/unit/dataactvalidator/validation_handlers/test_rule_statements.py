@@ -0,0 +1,50 @@
+import os
+
+from dataactvalidator.filestreaming.sqlLoader import SQLLoader
+from dataactvalidator.validation_handlers.rule_statements import (execute_prepared_rule, normalize_rule_sql,
+                                                                  statement_name)
+from tests.unit.dataactcore.factories.job import SubmissionFactory
+from tests.unit.dataactcore.factories.staging import AppropriationFactory
+
+
+def test_normalize_rule_sql():
+    """ Placeholders become a bind parameter, and names with the submission ID appended lose it """
+    sql = ('WITH appropriation_a18_{0} AS (SELECT row_number, tas FROM appropriation WHERE submission_id={0})\n'
+           'SELECT approp.row_number::text FROM appropriation_a18_{0} AS approp\n'
+           'JOIN tas_lookup ON tas_lookup.submission_id = {}')
+    normalized = normalize_rule_sql(sql)
+    assert normalized == ('WITH appropriation_a18 AS (SELECT row_number, tas FROM appropriation '
+                          'WHERE submission_id=:submission_id)\n'
+                          'SELECT approp.row_number::text FROM appropriation_a18 AS approp\n'
+                          'JOIN tas_lookup ON tas_lookup.submission_id = :submission_id')
+    assert normalize_rule_sql(normalized) == normalized
+
+
+def test_rule_files_normalized():
+    """ None of the rule files are left with a placeholder once they're read """
+    for file_name in os.listdir(SQLLoader.sql_rules_path):
+        if file_name.endswith('.sql'):
+            sql = SQLLoader.read_sql_str(file_name[:-len('.sql')])
+            assert '{' not in sql and '}' not in sql, file_name
+            assert ':submission_id' in sql, file_name
+
+
+def test_execute_prepared_rule(database):
+    """ A rule is prepared once on a connection and can then be run for any submission """
+    sess = database.session
+    submissions = [SubmissionFactory(), SubmissionFactory()]
+    sess.add_all(submissions)
+    sess.commit()
+    sess.add_all([AppropriationFactory(submission_id=submission.submission_id, row_number=row_number)
+                  for index, submission in enumerate(submissions) for row_number in range(2, 4 + index)])
+    sess.commit()
+
+    rule_sql = 'SELECT row_number FROM appropriation WHERE submission_id = :submission_id ORDER BY row_number'
+    with database.engine.connect() as connection:
+        assert [row['row_number'] for row in
+                execute_prepared_rule(connection, rule_sql, submissions[0].submission_id)] == [2, 3]
+        assert [row['row_number'] for row in
+                execute_prepared_rule(connection, rule_sql, submissions[1].submission_id)] == [2, 3, 4]
+        prepared = connection.execute('SELECT name FROM pg_prepared_statements WHERE name = %s',
+                                      statement_name(rule_sql)).fetchall()
+        assert len(prepared) == 1
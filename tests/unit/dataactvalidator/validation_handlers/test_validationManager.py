@@ -1,12 +1,25 @@
+import json
+
+from collections import namedtuple
 from datetime import date
 from unittest.mock import Mock
 
 import pytest
 
 from dataactcore.config import CONFIG_BROKER
+from dataactcore.interfaces import staging_partitions
+from dataactcore.models.errorModels import ErrorMetadata
+from dataactcore.models.jobModels import Job, JobPhase
+from dataactcore.models.lookups import (ERROR_TYPE_DICT, FIELD_TYPE_DICT, FILE_TYPE_DICT, JOB_STATUS_DICT,
+                                        JOB_TYPE_DICT, RULE_SEVERITY_DICT)
+from dataactcore.models.stagingModels import (Appropriation, DetachedAwardFinancialAssistance, FlexField,
+                                              FlexFieldRow)
+from dataactcore.models.validationModels import FileColumn, RuleSql
+from dataactcore.scripts import setup_error_db
 from dataactcore.utils.responseException import ResponseException
 from dataactvalidator.validation_handlers import validationManager
 from dataactvalidator.validation_handlers.errorInterface import ErrorInterface
+from dataactvalidator.validation_handlers.validationError import ValidationError
 
 from tests.unit.dataactcore.factories.domain import TASFactory
 from tests.unit.dataactcore.factories.job import JobFactory, SubmissionFactory
@@ -99,21 +112,179 @@ def test_update_tas_ids_bad_dates(database, factory):
     assert model.tas_id is None
 
 
-@pytest.mark.usefixtures('database')
-def test_insert_staging_model_failure():
+def test_update_tas_ids_null_components(database):
+    """ NULL TAS components only match NULLs, the oldest of several matching entries is used, and rows that no longer
+        match lose their old tas_id """
+    sess = database.session
+    submission = SubmissionFactory(reporting_start_date=date(2010, 10, 1), reporting_end_date=date(2010, 12, 31))
+    other_submission = SubmissionFactory(reporting_start_date=date(2010, 10, 1), reporting_end_date=date(2010, 12, 31))
+    sess.add_all([submission, other_submission])
+    sess.flush()
+    tas = TASFactory(account_num=20, allocation_transfer_agency=None, internal_start_date=date(2010, 9, 1))
+    older_tas = TASFactory(account_num=10, internal_start_date=date(2010, 1, 1), **tas.component_dict())
+    blank_tas = TASFactory(account_num=30, internal_start_date=date(2010, 9, 1),
+                           **dict(tas.component_dict(), allocation_transfer_agency=''))
+    null_row = AppropriationFactory(submission_id=submission.submission_id, **tas.component_dict())
+    blank_row = AppropriationFactory(submission_id=submission.submission_id, **blank_tas.component_dict())
+    stale_row = AppropriationFactory(submission_id=submission.submission_id, tas_id=99)
+    other_row = AppropriationFactory(submission_id=other_submission.submission_id, tas_id=99,
+                                     **tas.component_dict())
+    sess.add_all([tas, older_tas, blank_tas, null_row, blank_row, stale_row, other_row])
+    sess.commit()
+
+    validationManager.update_tas_ids(Appropriation, submission.submission_id)
+
+    sess.expire_all()
+    assert null_row.tas_id == 10
+    assert blank_row.tas_id == 30
+    assert stale_row.tas_id is None
+    # Other submissions aren't touched
+    assert other_row.tas_id == 99
+
+
+def test_insert_staging_batch(database):
+    """ A batch of good rows is copied in as a whole, along with its flex fields """
+    sess = database.session
+    submission = SubmissionFactory()
+    sess.add(submission)
+    sess.commit()
+    job = JobFactory(submission_id=submission.submission_id)
     writer = Mock()
     error_list = ErrorInterface()
-    model = AppropriationFactory(row_number=1234, adjustments_to_unobligated_cpe='shoulda-been-a-number')
-    job = JobFactory()
-    assert not validationManager.insert_staging_model(model, job, writer, error_list)
+    records = [{'submission_id': submission.submission_id, 'job_id': 1, 'row_number': row_number,
+                'afa_generated_unique': 'unique_{}'.format(row_number), 'federal_action_obligation': '12.5',
+                'fain': None, 'uri': '', 'is_valid': True} for row_number in range(2, 5)]
+    flex_fields = [FlexField(submission_id=submission.submission_id, job_id=1, row_number=2, header='flex_a',
+                             cell='a', file_type_id=8)]
+
+    failed_rows = validationManager.insert_staging_batch(DetachedAwardFinancialAssistance, records, flex_fields, job,
+                                                         writer, error_list)
+    assert failed_rows == set()
+    assert writer.writerow.call_count == 0
+
+    staged = sess.query(DetachedAwardFinancialAssistance).order_by(DetachedAwardFinancialAssistance.row_number).all()
+    assert [model.row_number for model in staged] == [2, 3, 4]
+    assert staged[0].fain is None
+    assert staged[0].uri == ''
+    assert staged[0].is_valid is True
+    assert staged[0].created_at is not None
+    assert sess.query(FlexField).one().cell == 'a'
+
+
+def test_insert_staging_batch_flex_documents(database, monkeypatch):
+    """ With json flex field storage, all the flex cells of a row are written as a single document """
+    monkeypatch.setattr(validationManager, 'FLEX_FIELD_STORAGE', 'json')
+    sess = database.session
+    submission = SubmissionFactory()
+    sess.add(submission)
+    sess.commit()
+    job = JobFactory(submission_id=submission.submission_id)
+    records = [{'submission_id': submission.submission_id, 'job_id': 1, 'row_number': row_number,
+                'afa_generated_unique': 'unique_{}'.format(row_number)} for row_number in range(2, 4)]
+    flex_fields = [FlexField(submission_id=submission.submission_id, job_id=1, row_number=row_number, header=header,
+                             cell=cell, file_type_id=8)
+                   for row_number in range(2, 4) for header, cell in (('flex_a', 'a'), ('flex_b', None))]
+
+    validationManager.insert_staging_batch(DetachedAwardFinancialAssistance, records, flex_fields, job, Mock(),
+                                           ErrorInterface())
+    assert sess.query(FlexField).count() == 0
+    documents = sess.query(FlexFieldRow).order_by(FlexFieldRow.row_number).all()
+    assert [document.row_number for document in documents] == [2, 3]
+    assert documents[0].cells == [['flex_a', 'a'], ['flex_b', None]]
+    assert documents[0].file_type_id == 8
+
+
+def test_flex_field_documents_duplicate_headers():
+    """ A flex header that appears more than once keeps all of its cells, in column order """
+    flex_fields = [FlexField(submission_id=1, job_id=2, row_number=3, header=header, cell=cell, file_type_id=1)
+                   for header, cell in (('flex_a', 'first'), ('flex_a', 'second'), ('flex_b', None))]
+    documents = validationManager.flex_field_documents(flex_fields)
+    assert len(documents) == 1
+    assert json.loads(documents[0]['cells']) == [['flex_a', 'first'], ['flex_a', 'second'], ['flex_b', None]]
+
+
+def test_insert_staging_batch_failure(database):
+    """ If one row of the batch can't be written, the rest of the batch is still loaded and the bad row reported """
+    sess = database.session
+    submission = SubmissionFactory()
+    sess.add(submission)
+    sess.commit()
+    job = JobFactory(submission_id=submission.submission_id)
+    writer = Mock()
+    error_list = ErrorInterface()
+    records = [{'submission_id': submission.submission_id, 'job_id': 1, 'row_number': row_number,
+                'afa_generated_unique': 'unique_{}'.format(row_number), 'federal_action_obligation': '12.5'}
+               for row_number in range(2, 5)]
+    records[1]['federal_action_obligation'] = 'shoulda-been-a-number'
+
+    failed_rows = validationManager.insert_staging_batch(DetachedAwardFinancialAssistance, records, [], job, writer,
+                                                         error_list)
+    assert failed_rows == {3}
     assert writer.writerow.call_args[0] == (
-        ['Formatting Error', 'Could not write this record into the staging table.', '', '', '', '', 1234, ''],
+        ['Formatting Error', 'Could not write this record into the staging table.', '', '', '', '', 3, ''],
     )
+    assert sess.query(DetachedAwardFinancialAssistance).count() == 2
     assert len(error_list.rowErrors) == 1
     error = list(error_list.rowErrors.values())[0]
-    assert error['firstRow'] == 1234
-    assert error['fieldName'] == 'Formatting Error'
-    assert error['filename'] == job.filename
+    assert error.first_row == 3
+    assert error.field_name == 'Formatting Error'
+    assert error.filename == job.filename
+
+
+def test_copy_records_nulls(database):
+    """ NULLs and empty strings stay distinct when copied, and NULLs can be copied into numeric columns """
+    sess = database.session
+    submission = SubmissionFactory()
+    sess.add(submission)
+    sess.commit()
+    records = [{'submission_id': submission.submission_id, 'job_id': 1, 'row_number': 2, 'agency_identifier': None,
+                'main_account_code': '', 'sub_account_code': 'say "001", then a\nnewline',
+                'adjustments_to_unobligated_cpe': None, 'borrowing_authority_amount_cpe': 12.5}]
+
+    validationManager.copy_records(sess, Appropriation.__table__, records)
+    sess.commit()
+
+    staged = sess.query(Appropriation).one()
+    assert staged.agency_identifier is None
+    assert staged.main_account_code == ''
+    assert staged.sub_account_code == 'say "001", then a\nnewline'
+    assert staged.adjustments_to_unobligated_cpe is None
+    assert staged.borrowing_authority_amount_cpe == 12.5
+
+
+def test_insert_staging_batch_failure_partitioned(database, monkeypatch):
+    """ Rows of a failed batch, and their flex fields, are still written to the submission's partitions """
+    monkeypatch.setattr(staging_partitions, 'STAGING_PARTITIONS', True)
+    sess = database.session
+    submission = SubmissionFactory()
+    sess.add(submission)
+    sess.commit()
+    job = JobFactory(submission_id=submission.submission_id, file_type_id=FILE_TYPE_DICT['appropriations'])
+    sess.add(job)
+    sess.commit()
+    child = staging_partitions.reset_staging_partition(sess, Appropriation, submission.submission_id)
+    flex_child = staging_partitions.reset_staging_partition(sess, FlexField, submission.submission_id,
+                                                            job.file_type_id)
+    sess.commit()
+
+    records = [{'submission_id': submission.submission_id, 'job_id': job.job_id, 'row_number': row_number,
+                'adjustments_to_unobligated_cpe': '12.5'} for row_number in range(2, 5)]
+    records[1]['adjustments_to_unobligated_cpe'] = 'shoulda-been-a-number'
+    flex_fields = [FlexField(submission_id=submission.submission_id, job_id=job.job_id, row_number=row_number,
+                             header='flex_a', cell='a', file_type_id=job.file_type_id) for row_number in range(2, 5)]
+    flex_fields[0].file_type_id = None
+    writer = Mock()
+    error_list = ErrorInterface()
+
+    failed_rows = validationManager.insert_staging_batch(Appropriation, records, flex_fields, job, writer,
+                                                         error_list)
+    # the bad staging row and the row whose flex field breaks its partition's check both fail, each reported once
+    assert failed_rows == {2, 3}
+    assert writer.writerow.call_count == 2
+    assert sess.execute('SELECT COUNT(*) FROM ONLY appropriation').scalar() == 0
+    assert sess.execute('SELECT row_number FROM {} ORDER BY row_number'.format(child)).fetchall() == [(2,), (4,)]
+    assert sess.execute('SELECT COUNT(*) FROM ONLY flex_field').scalar() == 0
+    assert sess.execute('SELECT COUNT(*) FROM {}'.format(flex_child)).scalar() == 2
 
 
 @pytest.mark.usefixtures('database')
@@ -127,3 +298,213 @@ def test_attempt_validate_deleted_job():
 
     assert error is not None
     assert str(error) == 'Job ID 12345678901234567890 not found in database'
+
+
+def test_error_interface_merge():
+    """ Merging the errors recorded for separate cross-file pairs gives the same counts as recording them together """
+    combined = ErrorInterface()
+    first = ErrorInterface()
+    second = ErrorInterface()
+    for error_list, row in ((combined, 2), (first, 2), (combined, 5), (second, 5), (combined, 7), (second, 7)):
+        error_list.record_row_error(1, 'cross_file', 'appropriations', 'Rule failed', row, 'A1', 1, 2, 2)
+    combined.record_row_error(1, 'cross_file', 'award_financial', 'Other rule failed', 9, 'C1', 3, 4, 1)
+    second.record_row_error(1, 'cross_file', 'award_financial', 'Other rule failed', 9, 'C1', 3, 4, 1)
+
+    merged = ErrorInterface()
+    merged.merge(first)
+    merged.merge(second)
+    assert merged.rowErrors == combined.rowErrors
+    assert merged.rowErrors[(1, 'appropriations', 'Rule failed')].num_errors == 3
+    assert merged.rowErrors[(1, 'appropriations', 'Rule failed')].first_row == 2
+
+
+@pytest.mark.usefixtures('job_constants', 'validation_constants')
+def test_run_validation_reuses_unchanged_file(database, monkeypatch, tmpdir):
+    """ A file that hasn't changed since its job last finished keeps its staging rows and errors """
+    monkeypatch.setitem(CONFIG_BROKER, 'use_aws', False)
+    # Other tests' loads of reference data could still be reaching the table statistics
+    monkeypatch.setattr(validationManager, 'get_reference_data_versions', lambda table_names: [])
+    sess = database.session
+    setup_error_db.insert_codes(sess)
+    upload = tmpdir.join('appropriations.csv')
+    upload.write('allocationtransferagencyidentifier,agencyidentifier\n,097\n')
+
+    sub = SubmissionFactory(reporting_start_date=date(2019, 10, 1), reporting_end_date=date(2019, 12, 31))
+    sess.add(sub)
+    sess.commit()
+    job = JobFactory(submission_id=sub.submission_id, file_type_id=FILE_TYPE_DICT['appropriations'],
+                     job_type_id=JOB_TYPE_DICT['csv_record_validation'], job_status_id=JOB_STATUS_DICT['running'],
+                     filename=str(upload), number_of_rows=None, previous_number_of_rows=2)
+    sess.add(job)
+    sess.commit()
+    # The row count and error metadata of the last validation were set aside when the file was uploaded again
+    sess.add_all([
+        AppropriationFactory(submission_id=sub.submission_id, job_id=job.job_id, row_number=2),
+        ErrorMetadata(previous_job_id=job.job_id, filename='old_name.csv', field_name='agencyidentifier',
+                      occurrences=1, first_row=2, severity_id=RULE_SEVERITY_DICT['fatal'])
+    ])
+    job.file_hash = validationManager.get_file_hash(str(upload))
+    job.rule_set_hash = validationManager.get_rule_set_hash(job)
+    sess.commit()
+
+    validation_manager = validationManager.ValidationManager(is_local=True, directory=str(tmpdir))
+    assert validation_manager.run_validation(job)
+
+    job = sess.query(Job).filter_by(job_id=job.job_id).one()
+    assert job.job_status_id == JOB_STATUS_DICT['finished']
+    assert job.number_of_rows == 2
+    assert job.previous_number_of_rows is None
+    assert job.number_of_errors == 1
+    assert sess.query(Appropriation).filter_by(submission_id=sub.submission_id).count() == 1
+    assert sess.query(ErrorMetadata).filter_by(job_id=job.job_id).one().filename == str(upload)
+    phase = sess.query(JobPhase).filter_by(job_id=job.job_id).one()
+    assert (phase.phase, phase.rows_processed) == ('finalizing', 1)
+    assert phase.end_time is not None
+
+    # Changing the reporting period changes the rule set hash, so the file would be validated again
+    old_hash = job.rule_set_hash
+    sub.reporting_end_date = date(2020, 3, 31)
+    sess.commit()
+    assert validationManager.get_rule_set_hash(job) != old_hash
+
+
+@pytest.mark.usefixtures('job_constants', 'validation_constants')
+def test_cross_validation_reloads_certified_files(database, monkeypatch, tmpdir):
+    """ Cross-file validation of a certified submission loads the staging rows dropped with its partitions again,
+        leaving the file jobs' results as they were
+    """
+    monkeypatch.setitem(CONFIG_BROKER, 'use_aws', False)
+    monkeypatch.setattr(staging_partitions, 'STAGING_PARTITIONS', True)
+    monkeypatch.setattr(validationManager, 'STAGING_PARTITIONS', True)
+    sess = database.session
+    setup_error_db.insert_codes(sess)
+    sess.add_all([FileColumn(file_id=FILE_TYPE_DICT['appropriations'], field_types_id=FIELD_TYPE_DICT['STRING'],
+                             daims_name=name, name=name, name_short=name, required=False, length=3)
+                  for name in ('allocationtransferagencyidentifier', 'agencyidentifier')])
+    upload = tmpdir.join('appropriations.csv')
+    upload.write('allocationtransferagencyidentifier,agencyidentifier\n,097\n,0970\n')
+
+    sub = SubmissionFactory(reporting_start_date=date(2019, 10, 1), reporting_end_date=date(2019, 12, 31))
+    sess.add(sub)
+    sess.commit()
+    file_job = JobFactory(submission_id=sub.submission_id, file_type_id=FILE_TYPE_DICT['appropriations'],
+                          job_type_id=JOB_TYPE_DICT['csv_record_validation'],
+                          job_status_id=JOB_STATUS_DICT['finished'], filename=str(upload), number_of_rows=3,
+                          file_size=upload.size(), file_hash='file-hash', rule_set_hash='rule-set-hash')
+    cross_job = JobFactory(submission_id=sub.submission_id, file_type_id=None, job_type_id=JOB_TYPE_DICT['validation'],
+                           job_status_id=JOB_STATUS_DICT['running'])
+    sess.add_all([file_job, cross_job])
+    sess.commit()
+    sess.add(ErrorMetadata(job_id=file_job.job_id, filename=str(upload), field_name='agencyidentifier',
+                           occurrences=1, first_row=3, severity_id=RULE_SEVERITY_DICT['fatal']))
+    sess.commit()
+    assert not staging_partitions.has_staging_partition(sess, Appropriation, sub.submission_id)
+
+    validation_manager = validationManager.ValidationManager(is_local=True, directory=str(tmpdir))
+    validation_manager.run_cross_validation(cross_job)
+
+    # The rows are back, including the one whose agency identifier is too long
+    assert staging_partitions.has_staging_partition(sess, Appropriation, sub.submission_id)
+    assert sess.query(Appropriation).filter_by(submission_id=sub.submission_id).count() == 2
+    file_job = sess.query(Job).filter_by(job_id=file_job.job_id).one()
+    assert file_job.job_status_id == JOB_STATUS_DICT['finished']
+    assert (file_job.number_of_rows, file_job.file_hash, file_job.rule_set_hash) == (3, 'file-hash', 'rule-set-hash')
+    error = sess.query(ErrorMetadata).filter_by(job_id=file_job.job_id).one()
+    assert (error.field_name, error.first_row) == ('agencyidentifier', 3)
+    assert sess.query(JobPhase).filter_by(job_id=file_job.job_id).count() == 0
+
+
+@pytest.mark.usefixtures('job_constants', 'validation_constants')
+def test_rule_set_hash_reference_data(database, monkeypatch):
+    """ Loading the reference data used by a file type's rules changes its rule set hash """
+    sess = database.session
+    sub = SubmissionFactory()
+    sess.add(sub)
+    sess.commit()
+    job = JobFactory(submission_id=sub.submission_id, file_type_id=FILE_TYPE_DICT['appropriations'],
+                     job_type_id=JOB_TYPE_DICT['csv_record_validation'])
+    sess.add_all([
+        job,
+        RuleSql(rule_sql='SELECT row_number FROM appropriation AS approp JOIN SF_133 AS sf ON sf.tas = approp.tas',
+                rule_label='A1', rule_error_message='', query_name='a1', file_id=FILE_TYPE_DICT['appropriations'],
+                rule_severity_id=RULE_SEVERITY_DICT['fatal'], rule_cross_file_flag=False)
+    ])
+    sess.commit()
+
+    # The versions come from the table statistics, without reading the tables
+    assert [version[0] for version in validationManager.get_reference_data_versions(['sf_133', 'tas_lookup'])] == \
+        ['sf_133', 'tas_lookup']
+
+    versions = {'sf_133': 1, 'tas_lookup': 1, 'zips': 1}
+    requested = []
+
+    def reference_data_versions(table_names):
+        requested.append(table_names)
+        return [(table, versions[table]) for table in sorted(table_names)]
+    monkeypatch.setattr(validationManager, 'get_reference_data_versions', reference_data_versions)
+
+    old_hash = validationManager.get_rule_set_hash(job)
+    assert requested == [['tas_lookup', 'sf_133']]
+    versions['zips'] = 2
+    assert validationManager.get_rule_set_hash(job) == old_hash
+    versions['sf_133'] = 2
+    assert validationManager.get_rule_set_hash(job) != old_hash
+
+
+@pytest.mark.usefixtures('job_constants', 'validation_constants')
+def test_write_all_row_errors(database):
+    """ All of a job's recorded errors are written in one go, and only that job's """
+    sess = database.session
+    setup_error_db.insert_codes(sess)
+    sub = SubmissionFactory()
+    sess.add(sub)
+    sess.commit()
+    job, other_job = JobFactory(submission_id=sub.submission_id), JobFactory(submission_id=sub.submission_id)
+    sess.add_all([job, other_job])
+    sess.commit()
+
+    error_list = ErrorInterface()
+    for row in (2, 3, 4):
+        error_list.record_row_error(job.job_id, 'file.csv', 'Formatting Error', ValidationError.readError, row,
+                                    severity_id=RULE_SEVERITY_DICT['fatal'])
+    error_list.record_row_error(job.job_id, 'file.csv', 'amount', 'Amount must be positive', 5, 'A1', 1, None,
+                                RULE_SEVERITY_DICT['warning'])
+    error_list.record_row_error(job.job_id, 'file.csv', 'name', 'Field must be no longer than specified limit (5)',
+                                6, severity_id=RULE_SEVERITY_DICT['warning'])
+    error_list.record_row_error(other_job.job_id, 'other.csv', 'amount', 'Amount must be positive', 2)
+    error_list.write_all_row_errors(job.job_id)
+
+    errors = {error.field_name: error for error in sess.query(ErrorMetadata).filter_by(job_id=job.job_id)}
+    assert set(errors) == {'Formatting Error', 'amount', 'name'}
+    assert errors['Formatting Error'].occurrences == 3
+    assert errors['Formatting Error'].first_row == 2
+    assert errors['Formatting Error'].error_type_id == ERROR_TYPE_DICT['read_error']
+    assert errors['Formatting Error'].rule_failed == ValidationError.readErrorMsg
+    assert errors['amount'].error_type_id == ERROR_TYPE_DICT['rule_failed']
+    assert errors['amount'].rule_failed == 'Amount must be positive'
+    assert errors['amount'].original_rule_label == 'A1'
+    assert errors['name'].error_type_id == ERROR_TYPE_DICT['length_error']
+    assert sess.query(ErrorMetadata).filter_by(job_id=other_job.job_id).count() == 0
+    assert error_list.rowErrors == {}
+
+
+def test_warm_column_mappings(monkeypatch):
+    """ Column name mappings loaded ahead of time are used by every ValidationManager created after, without being
+        queried again
+    """
+    column = namedtuple('Column', ['daims_name', 'name', 'name_short', 'file_id'])
+    sess = Mock()
+    sess.query.return_value.all.return_value = [column('AgencyIdentifier', 'agency identifier', 'agency_identifier',
+                                                       FILE_TYPE_DICT['appropriations'])]
+    monkeypatch.setattr(validationManager.GlobalDB, 'db', lambda: Mock(session=sess))
+    monkeypatch.setattr(validationManager.ValidationManager, '_warm_column_mappings', None)
+
+    validationManager.ValidationManager.warm_column_mappings()
+    managers = [validationManager.ValidationManager(), validationManager.ValidationManager()]
+
+    assert sess.query.call_count == 1
+    for manager in managers:
+        assert manager.long_to_short_dict == {FILE_TYPE_DICT['appropriations']: {
+            'agency identifier': 'agency_identifier'}}
+        assert manager.daims_to_short_dict == {FILE_TYPE_DICT['appropriations']: {
+            'agencyidentifier': 'agency_identifier'}}
@@ -2,9 +2,13 @@ import pytest
 
 from unittest.mock import Mock
 
-from dataactcore.models.stagingModels import FlexField
+from dataactcore.interfaces import staging_partitions
+from dataactcore.models.lookups import FILE_TYPE_DICT, RULE_SEVERITY_DICT
+from dataactcore.models.stagingModels import FlexField, FlexFieldRow
+from dataactcore.models.validationModels import RuleExecution, RuleSql
 from dataactvalidator.validation_handlers import validator
 from tests.unit.dataactcore.factories.job import JobFactory, SubmissionFactory
+from tests.unit.dataactcore.factories.staging import AppropriationFactory
 
 
 @pytest.mark.usefixtures("job_constants")
@@ -38,6 +42,41 @@ def test_relevant_flex_data(database):
     assert result[7][0].cell == 'cell' * 7
 
 
+@pytest.mark.usefixtures("job_constants")
+def test_relevant_flex_data_documents(database):
+    """ Flex fields stored as one document per row come back the same way as ones stored one cell per row """
+    sess = database.session
+    sub = SubmissionFactory()
+    sess.add(sub)
+    sess.commit()
+    jobs = [JobFactory(submission_id=sub.submission_id, file_type_id=file_type_id) for file_type_id in (1, 2)]
+    sess.add_all(jobs)
+    sess.commit()
+    sess.add_all([
+        FlexFieldRow(submission_id=sub.submission_id, job_id=job.job_id, file_type_id=job.file_type_id,
+                     row_number=row_number,
+                     cells=[['flex_b', 'b' * row_number], ['flex_a', None], ['flex_c', 'c'], ['flex_a', 'a']])
+        for job in jobs for row_number in range(1, 6)
+    ])
+    sess.commit()
+
+    result = validator.relevant_flex_data([{'row_number': 2}, {'row_number': None}, {'row_number': 4},
+                                           {'row_number': 4}], jobs[0].job_id)
+    assert {2, 4} == set(result.keys())
+    # a header repeated in the file keeps each of its cells, in column order
+    assert [(flex.header, flex.cell) for flex in result[2]] == [('flex_a', None), ('flex_a', 'a'), ('flex_b', 'bb'),
+                                                                ('flex_c', 'c')]
+    assert result[4][0].job_id == jobs[0].job_id
+
+    # a second lookup on the same connection only sees its own rows
+    result = validator.relevant_cross_flex_data([{'source_row_number': 5}], sub.submission_id, 2)
+    assert list(result.keys()) == [5]
+    assert [flex.cell for flex in result[5]] == [None, 'a', 'bbbbb', 'c']
+    assert result[5][0].job_id == jobs[1].job_id
+
+    assert validator.relevant_flex_data([{'row_number': None}], jobs[0].job_id) == {}
+
+
 def test_failure_row_to_tuple_flex():
     """ Verify that flex data gets included in the failure row info """
     flex_data = {
@@ -49,3 +88,233 @@ def test_failure_row_to_tuple_flex():
     assert result.field_name == ''
     assert result.flex_fields == 'A: a, B: b, C: '
     assert result.failed_value == ''
+
+
+def test_validate_chunk_matches_validate():
+    """ Verify that checking a chunk of records gives the same results as checking each record on its own """
+    csv_schema = {
+        'name': Mock(name_short='name', required=True, field_types_id=4, length=5),
+        'amount': Mock(name_short='amount', required=False, field_types_id=2, length=None),
+        'count': Mock(name_short='count', required=False, field_types_id=1, length=3),
+        'flag': Mock(name_short='flag', required=False, field_types_id=3, length=None),
+    }
+    records = [
+        {'name': 'abc', 'amount': '12.50', 'count': '7', 'flag': 'true', 'row_number': 2},
+        {'name': ' ', 'amount': '1e5', 'count': '-12', 'flag': None, 'row_number': 3},
+        {'name': 'abcdefg', 'amount': 'abc', 'count': '1.5', 'flag': 'maybe', 'row_number': 4},
+        {'name': None, 'amount': '', 'count': None, 'flag': ' ', 'row_number': 5},
+        {'name': 'abc', 'amount': ' .5 ', 'count': '1234', 'flag': 'N', 'row_number': 6},
+        {'name': 'abc', 'amount': 'NaN', 'count': '+0', 'flag': 'FALSE', 'row_number': 7},
+    ]
+
+    expected = [validator.Validator.validate(record, csv_schema) for record in records]
+    assert validator.Validator.validate_chunk(records, csv_schema) == expected
+    assert validator.Validator.validate_chunk([], csv_schema) == []
+
+
+def test_validate_chunk_blank_column():
+    """ Verify that a column left blank in every record of a chunk is checked like any other """
+    csv_schema = {
+        'name': Mock(name_short='name', required=True, field_types_id=4, length=5),
+        'amount': Mock(name_short='amount', required=False, field_types_id=2, length=None),
+        'flag': Mock(name_short='flag', required=False, field_types_id=3, length=4),
+    }
+    records = [
+        {'name': None, 'amount': None, 'flag': None, 'row_number': 2},
+        {'name': None, 'amount': None, 'flag': None, 'row_number': 3},
+        {'name': 'abc', 'amount': None, 'flag': None, 'row_number': 4},
+    ]
+
+    expected = [validator.Validator.validate(record, csv_schema) for record in records]
+    assert validator.Validator.validate_chunk(records, csv_schema) == expected
+
+
+def sql_failures(job, **kwargs):
+    """ Run the SQL rules for an appropriations job, returning all of their failures """
+    failures = []
+    validator.validate_file_by_sql(job, 'appropriations', {'tas': 'TAS'}, failures.extend, **kwargs)
+    return failures
+
+
+@pytest.mark.usefixtures("job_constants", "validation_constants")
+def test_validate_file_by_sql_workers(database):
+    """ Verify that running the SQL rules concurrently gives the same errors, in the same order, as running them
+        serially """
+    sess = database.session
+    sub = SubmissionFactory()
+    sess.add(sub)
+    sess.commit()
+    job = JobFactory(submission_id=sub.submission_id, file_type_id=FILE_TYPE_DICT['appropriations'])
+    sess.add(job)
+    sess.commit()
+    sess.add_all([AppropriationFactory(submission_id=sub.submission_id, job_id=job.job_id, row_number=row_number)
+                  for row_number in range(2, 6)])
+    sess.add_all([
+        RuleSql(rule_sql='SELECT row_number, tas FROM appropriation '
+                'WHERE submission_id = :submission_id AND row_number > ' + str(min_row),
+                rule_label='A{}'.format(min_row), rule_error_message='', query_name='a' + str(min_row),
+                file_id=FILE_TYPE_DICT['appropriations'], rule_severity_id=RULE_SEVERITY_DICT['fatal'],
+                rule_cross_file_flag=False)
+        for min_row in range(5)
+    ])
+    sess.commit()
+
+    serial = sql_failures(job, workers=1)
+    concurrent = sql_failures(job, workers=3)
+    assert len(serial) == 4 + 4 + 3 + 2 + 1
+    assert [error.original_label for error in serial][:5] == ['A0', 'A0', 'A0', 'A0', 'A1']
+    assert concurrent == serial
+
+    # Each run of each rule is timed
+    executions = sess.query(RuleExecution).filter_by(submission_id=sub.submission_id).all()
+    assert len(executions) == 10
+    assert {execution.rows_scanned for execution in executions} == {4}
+    assert sorted(execution.failures for execution in executions if execution.job_id == job.job_id) == \
+        [1, 1, 2, 2, 3, 3, 4, 4, 4, 4]
+
+
+@pytest.mark.usefixtures("job_constants", "validation_constants")
+def test_validate_file_by_sql_fusion(database):
+    """ Verify that checking the fusable rules together gives the same errors, in the same order, as running each rule
+        on its own """
+    sess = database.session
+    sub = SubmissionFactory()
+    sess.add(sub)
+    sess.commit()
+    job = JobFactory(submission_id=sub.submission_id, file_type_id=FILE_TYPE_DICT['appropriations'])
+    sess.add(job)
+    sess.commit()
+    sess.add_all([AppropriationFactory(submission_id=sub.submission_id, job_id=job.job_id, row_number=row_number,
+                                       adjustments_to_unobligated_cpe=row_number - 4)
+                  for row_number in range(2, 8)])
+    rule_sqls = [
+        'SELECT row_number, tas, adjustments_to_unobligated_cpe AS "expected_value_Adjustments" FROM appropriation '
+        'WHERE submission_id = :submission_id AND row_number > 3',
+        # Can't be fused, so it's run on its own between the fused rules
+        'SELECT NULL AS row_number, SUM(adjustments_to_unobligated_cpe) AS difference FROM appropriation '
+        'WHERE submission_id = :submission_id',
+        'SELECT approp.row_number, approp.tas AS "uniqueid_TAS" FROM appropriation AS approp '
+        'WHERE approp.submission_id = :submission_id AND approp.adjustments_to_unobligated_cpe < 0',
+        'SELECT row_number, adjustments_to_unobligated_cpe, tas FROM appropriation '
+        'WHERE submission_id = :submission_id AND adjustments_to_unobligated_cpe = 0',
+        'SELECT row_number, tas FROM appropriation WHERE submission_id = :submission_id AND row_number > 100'
+    ]
+    sess.add_all([
+        RuleSql(rule_sql=rule_sql, rule_label='A{}'.format(index), rule_error_message='', query_name='a' + str(index),
+                file_id=FILE_TYPE_DICT['appropriations'], rule_severity_id=RULE_SEVERITY_DICT['fatal'],
+                rule_cross_file_flag=False, rule_fusable='SUM' not in rule_sql)
+        for index, rule_sql in enumerate(rule_sqls)
+    ])
+    sess.commit()
+
+    rules = sess.query(RuleSql).order_by(RuleSql.rule_sql_id).all()
+    rule_groups = validator.fuse_rules(rules, FILE_TYPE_DICT['appropriations'])
+    assert [[rule.rule_label for rule in group_rules] for group_rules, _ in rule_groups] == \
+        [['A0', 'A3', 'A4'], ['A1'], ['A2']]
+    assert rule_groups[1][1] is None and rule_groups[2][1] is None
+
+    separate = sql_failures(job, workers=1, fusion=False)
+    fused = sql_failures(job, workers=1, fusion=True)
+    fused_concurrent = sql_failures(job, workers=2, fusion=True)
+    assert [error.original_label for error in separate] == ['A0'] * 4 + ['A1'] + ['A2'] * 2 + ['A3']
+    assert fused == separate
+    assert fused_concurrent == separate
+
+    # Each fused rule still gets its own execution
+    executions = sess.query(RuleExecution).filter_by(submission_id=sub.submission_id).all()
+    assert sorted(execution.failures for execution in executions if execution.query_name == 'a0') == [4, 4, 4]
+    assert sorted(execution.failures for execution in executions if execution.query_name == 'a4') == [0, 0, 0]
+
+
+@pytest.mark.usefixtures("job_constants", "validation_constants")
+def test_validate_file_by_sql_chunks(database, monkeypatch):
+    """ Verify that rule failures are handed on a chunk at a time, in rule order, however the rules are run """
+    sess = database.session
+    sub = SubmissionFactory()
+    sess.add(sub)
+    sess.commit()
+    job = JobFactory(submission_id=sub.submission_id, file_type_id=FILE_TYPE_DICT['appropriations'])
+    sess.add(job)
+    sess.commit()
+    sess.add_all([AppropriationFactory(submission_id=sub.submission_id, job_id=job.job_id, row_number=row_number)
+                  for row_number in range(2, 7)])
+    sess.add_all([
+        RuleSql(rule_sql='SELECT row_number, tas FROM appropriation '
+                'WHERE submission_id = :submission_id AND row_number > ' + str(min_row),
+                rule_label='A{}'.format(min_row), rule_error_message='', query_name='a' + str(min_row),
+                file_id=FILE_TYPE_DICT['appropriations'], rule_severity_id=RULE_SEVERITY_DICT['fatal'],
+                rule_cross_file_flag=False, rule_fusable=True)
+        for min_row in range(4)
+    ])
+    sess.commit()
+    unchunked = sql_failures(job, workers=1)
+
+    monkeypatch.setattr(validator, 'SQL_RULE_CHUNK_SIZE', 2)
+    for kwargs in ({'workers': 1}, {'workers': 3}, {'workers': 1, 'fusion': True}):
+        chunks = []
+        validator.validate_file_by_sql(job, 'appropriations', {'tas': 'TAS'}, chunks.append, **kwargs)
+        assert max(len(chunk) for chunk in chunks) == 2
+        assert [failure for chunk in chunks for failure in chunk] == unchunked
+    assert [failure.original_label for failure in unchunked] == ['A0'] * 5 + ['A1'] * 4 + ['A2'] * 3 + ['A3'] * 2
+
+    # Prepared statements give the same failures, fused or not
+    monkeypatch.setattr(validator, 'SQL_RULE_PREPARE', True)
+    assert sql_failures(job, workers=1) == unchunked
+    assert sql_failures(job, workers=3, fusion=True) == unchunked
+
+
+def test_execute_rule_query_partitioned(monkeypatch):
+    """ Rules reading partitioned staging tables aren't prepared, so each is planned for the submission it checks """
+    prepared = Mock()
+    monkeypatch.setattr(validator, 'execute_prepared_rule', prepared)
+    connection = Mock()
+    approp_sql = 'SELECT row_number FROM appropriation WHERE submission_id = :submission_id'
+    fabs_sql = 'SELECT row_number FROM detached_award_financial_assistance WHERE submission_id = :submission_id'
+
+    validator.execute_rule_query(connection, approp_sql, 1, prepare=True)
+    assert prepared.call_count == 1
+
+    monkeypatch.setattr(staging_partitions, 'STAGING_PARTITIONS', True)
+    validator.execute_rule_query(connection, approp_sql, 1, prepare=True)
+    assert prepared.call_count == 1
+    validator.execute_rule_query(connection, fabs_sql, 1, prepare=True)
+    assert prepared.call_count == 2
+
+
+def test_explain_rule(database, monkeypatch):
+    """ Only slow single SELECTs are explained, and one that can't be explained doesn't break the transaction """
+    sess = database.session
+    rule_sql = 'SELECT row_number FROM appropriation WHERE submission_id = :submission_id'
+    assert validator.explain_rule(sess, rule_sql, 1, 100) is None
+
+    monkeypatch.setattr(validator, 'RULE_EXPLAIN_THRESHOLD', 10)
+    assert validator.explain_rule(sess, rule_sql, 1, 5) is None
+    assert 'appropriation' in validator.explain_rule(sess, rule_sql, 1, 10)
+    assert validator.explain_rule(sess, 'CREATE OR REPLACE FUNCTION pg_temp.is_zero(numeric) RETURNS boolean AS $$ '
+                                        'SELECT $1 = 0 $$ LANGUAGE SQL; ' + rule_sql, 1, 10) is None
+    assert validator.explain_rule(sess, 'SELECT missing_column FROM appropriation WHERE submission_id = '
+                                        ':submission_id', 1, 10) is None
+    assert sess.execute('SELECT 1').scalar() == 1
+
+
+def test_ordered_failure_writer():
+    """ Failures of rules that finish before their turn are held back until every rule before them has finished """
+    rules = [RuleSql(rule_sql_id=rule_sql_id) for rule_sql_id in (10, 20, 30)]
+    handled = []
+    writer = validator.OrderedFailureWriter(rules, handled.append)
+
+    writer.write(rules[2], ['c1'])
+    writer.write(rules[0], ['a1'])
+    writer.write(rules[1], ['b1'])
+    writer.finish(rules[2])
+    assert handled == [['a1']]
+
+    writer.write(rules[0], ['a2'])
+    writer.finish(rules[0])
+    assert handled == [['a1'], ['a2']]
+
+    # Once a rule has started spooling, the rest of its failures are spooled behind it even when it's its turn
+    writer.write(rules[1], ['b2'])
+    assert handled == [['a1'], ['a2']]
+    writer.finish(rules[1])
+    assert handled == [['a1'], ['a2'], ['b1'], ['b2'], ['c1']]